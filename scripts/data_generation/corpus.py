@@ -0,0 +1,313 @@
+"""
+Compact on-disk corpus for generated reports: zstd-compressed, sharded NDJSON.
+
+A corpus directory holds part-00000.ndjson.zst, part-00001.ndjson.zst, ...
+with one JSON record per line, plus index.json, the offset index. Each shard
+is a run of independent zstd frames of FRAME_RECORDS records, so a reader can
+seek straight to any frame without decompressing what comes before it.
+
+index.json lists every record in write order with its id, branch_id, the
+writer's extra key fields (e.g. date), where it lives (shard, frame, line)
+and the sha256 of its line, which the ingest manifest uses as its content
+hash. Planning an incremental ingest therefore reads only the index; the
+shards are decompressed frame by frame as documents are needed.
+
+Writers build the corpus in a temporary directory and swap it in on close,
+so a crashed generator never leaves a half-written corpus behind. What a
+crashed run did generate is kept in a GenerationJournal next to the corpus
+(reports.journal.ndjson): every finished record, appended as soon as it
+exists. The next run takes records from it instead of generating them
+again, and drops them from it once the new corpus is published.
+
+A generator run limited to a few branches regenerates only those and carries
+the rest over from the corpus it replaces (keep_other_branches), so the
+published corpus is always complete.
+
+Usage:
+    with CorpusWriter(REPORTS_CORPUS, key_fields=["date"]) as corpus:
+        corpus.write(report)
+
+    reader = CorpusReader(REPORTS_CORPUS)
+    for record in reader.iter_records():
+        ...
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import defaultdict
+from pathlib import Path
+from typing import Iterator
+
+import zstandard
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+CORPUS_DIR = PROJECT_ROOT / "data" / "generated" / "corpus"
+REPORTS_CORPUS = CORPUS_DIR / "reports"
+FINANCIAL_CORPUS = CORPUS_DIR / "financial"
+
+INDEX_NAME = "index.json"
+FORMAT_VERSION = 1
+
+# Records per zstd frame (the unit of random access) and per shard file
+FRAME_RECORDS = 64
+SHARD_RECORDS = 2048
+
+COMPRESSION_LEVEL = 10
+
+
+def shard_name(number: int) -> str:
+    return f"part-{number:05d}.ndjson.zst"
+
+
+def record_line(record: dict) -> bytes:
+    return json.dumps(record, ensure_ascii=False).encode() + b"\n"
+
+
+def record_sha256(record: dict) -> str:
+    """sha256 of a record's corpus line, as CorpusWriter.write() puts in its index entry."""
+    return hashlib.sha256(record_line(record)).hexdigest()
+
+
+class CorpusWriter:
+    """Appends records to a new corpus; close() (or leaving the with block) publishes it."""
+
+    def __init__(
+        self,
+        root: Path,
+        key_fields: list[str] | None = None,
+        shard_records: int = SHARD_RECORDS,
+        frame_records: int = FRAME_RECORDS,
+    ):
+        self.root = root
+        self.key_fields = key_fields or []
+        self.shard_records = shard_records
+        self.frame_records = frame_records
+        self.records: list[dict] = []
+        self.shards: list[dict] = []
+
+        self._staging = root.with_name(root.name + ".tmp")
+        shutil.rmtree(self._staging, ignore_errors=True)
+        self._staging.mkdir(parents=True)
+        self._compressor = zstandard.ZstdCompressor(level=COMPRESSION_LEVEL)
+        self._file = None
+        self._frame: list[bytes] = []
+        self._shard_count = 0
+
+    def __enter__(self) -> "CorpusWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def write(self, record: dict) -> dict:
+        """Append a record; returns its index entry (with the sha256 of its line)."""
+        line = record_line(record)
+        if self._file is None:
+            self.shards.append({"name": shard_name(len(self.shards)), "frames": []})
+            self._file = open(self._staging / self.shards[-1]["name"], "wb")
+            self._shard_count = 0
+
+        entry = {"id": record["id"], "branch_id": record.get("branch_id")}
+        entry.update({field: record.get(field) for field in self.key_fields})
+        entry.update({
+            "shard": len(self.shards) - 1,
+            "frame": len(self.shards[-1]["frames"]),
+            "line": len(self._frame),
+            "sha256": hashlib.sha256(line).hexdigest(),
+        })
+        self.records.append(entry)
+        self._frame.append(line)
+        self._shard_count += 1
+
+        if len(self._frame) >= self.frame_records:
+            self._flush_frame()
+        if self._shard_count >= self.shard_records:
+            self._close_shard()
+        return entry
+
+    def keep_other_branches(self, branch_ids: set[str]) -> int:
+        """Copy every record of the published corpus whose branch isn't in `branch_ids`.
+
+        A run limited to a few branches calls this so the corpus it publishes
+        still holds every other branch, instead of just the ones regenerated.
+        Returns the number of records kept.
+        """
+        if not CorpusReader.exists(self.root):
+            return 0
+        previous = CorpusReader(self.root)
+        keep = {entry["id"] for entry in previous.records if entry["branch_id"] not in branch_ids}
+        for record in previous.iter_records(keep):
+            self.write(record)
+        return len(keep)
+
+    def _flush_frame(self) -> None:
+        if not self._frame:
+            return
+        data = self._compressor.compress(b"".join(self._frame))
+        offset = self._file.tell()
+        self._file.write(data)
+        self.shards[-1]["frames"].append([offset, len(data), len(self._frame)])
+        self._frame = []
+
+    def _close_shard(self) -> None:
+        if self._file is None:
+            return
+        self._flush_frame()
+        self._file.close()
+        self._file = None
+
+    def close(self) -> None:
+        """Write the index and replace whatever corpus was at `root` with this one."""
+        self._close_shard()
+        with open(self._staging / INDEX_NAME, "w") as f:
+            json.dump({"format": FORMAT_VERSION, "shards": self.shards, "records": self.records}, f)
+
+        previous = self.root.with_name(self.root.name + ".old")
+        shutil.rmtree(previous, ignore_errors=True)
+        if self.root.exists():
+            os.replace(self.root, previous)
+        os.replace(self._staging, self.root)
+        shutil.rmtree(previous, ignore_errors=True)
+
+    def abort(self) -> None:
+        """Drop the staged corpus, leaving the published one untouched."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        shutil.rmtree(self._staging, ignore_errors=True)
+
+
+class CorpusReader:
+    """Streams or looks up records of a published corpus."""
+
+    def __init__(self, root: Path):
+        self.root = root
+        with open(root / INDEX_NAME) as f:
+            index = json.load(f)
+        if index.get("format") != FORMAT_VERSION:
+            raise ValueError(f"{root} has corpus format {index.get('format')}, expected {FORMAT_VERSION}")
+        self.shards: list[dict] = index["shards"]
+        self.records: list[dict] = index["records"]
+        self._by_id = {entry["id"]: entry for entry in self.records}
+        self._decompressor = zstandard.ZstdDecompressor()
+
+    @staticmethod
+    def exists(root: Path) -> bool:
+        return (root / INDEX_NAME).exists()
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def _read_frame(self, f, shard: int, frame: int) -> list[bytes]:
+        offset, length, _ = self.shards[shard]["frames"][frame]
+        f.seek(offset)
+        return self._decompressor.decompress(f.read(length)).splitlines()
+
+    def iter_records(self, ids: set[str] | None = None) -> Iterator[dict]:
+        """Yield records in write order, decompressing one frame at a time.
+
+        With `ids`, only the frames holding those records are read.
+        """
+        wanted: dict[int, set[int]] | None = None
+        if ids is not None:
+            wanted = defaultdict(set)
+            for entry in self.records:
+                if entry["id"] in ids:
+                    wanted[entry["shard"]].add(entry["frame"])
+
+        for shard_no, shard in enumerate(self.shards):
+            if wanted is not None and shard_no not in wanted:
+                continue
+            with open(self.root / shard["name"], "rb") as f:
+                for frame_no in range(len(shard["frames"])):
+                    if wanted is not None and frame_no not in wanted[shard_no]:
+                        continue
+                    for line in self._read_frame(f, shard_no, frame_no):
+                        record = json.loads(line)
+                        if ids is None or record["id"] in ids:
+                            yield record
+
+    def get(self, record_id: str) -> dict:
+        """One record by id, decompressing only its frame."""
+        entry = self._by_id[record_id]
+        with open(self.root / self.shards[entry["shard"]]["name"], "rb") as f:
+            return json.loads(self._read_frame(f, entry["shard"], entry["frame"])[entry["line"]])
+
+
+def journal_path(root: Path) -> Path:
+    return root.with_name(root.name + ".journal.ndjson")
+
+
+class GenerationJournal:
+    """Finished records of an unfinished generator run, keyed by id, for resuming it.
+
+    record() may be called from several threads; each record is flushed to
+    disk before it returns. A torn last line (from a crash mid-write) is dropped.
+    """
+
+    def __init__(self, path: Path, fresh: bool = False):
+        self.path = path
+        self.records: dict[str, dict] = {}
+        if fresh:
+            path.unlink(missing_ok=True)
+        elif path.exists():
+            good = 0
+            with open(path, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        break
+                    self.records[record["id"]] = record
+                    good += len(line)
+            # Drop a torn last line so appends start on a fresh one
+            os.truncate(path, good)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(path, "ab")
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def get(self, record_id: str) -> dict | None:
+        return self.records.get(record_id)
+
+    def record(self, record: dict) -> None:
+        line = json.dumps(record, ensure_ascii=False).encode() + b"\n"
+        with self._lock:
+            self.records[record["id"]] = record
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        self._file.close()
+
+    def finish(self, written: set[str]) -> None:
+        """The run published its corpus: drop the records in it.
+
+        Records of other branches (e.g. left by an interrupted full run when
+        this one was limited to a few branches) stay for a later run; the
+        journal is deleted once none are left.
+        """
+        self.close()
+        remaining = [record for record_id, record in self.records.items() if record_id not in written]
+        if not remaining:
+            self.path.unlink(missing_ok=True)
+            return
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            for record in remaining:
+                f.write(json.dumps(record, ensure_ascii=False).encode() + b"\n")
+        os.replace(tmp, self.path)
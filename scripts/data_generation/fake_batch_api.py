@@ -0,0 +1,260 @@
+"""
+Local stand-in for the Anthropic Messages API, for running the report
+generators offline (and for free) against a fake Claude:
+
+  - POST /v1/messages answers right away.
+  - Message Batches: POST /v1/messages/batches, GET /v1/messages/batches/<id>,
+    GET .../<id>/results (JSONL) and POST .../<id>/cancel. A batch stays
+    in_progress for --processing-time seconds, then ends; --error-rate and
+    --expire-rate of its requests come back errored or expired, to exercise
+    the generators' fallbacks.
+  - GET /_stats: messages answered, batches and batched requests.
+
+Answers are deterministic in the prompt: a weekly report email for a weekly
+report prompt, the narrative JSON for a quarterly one. Requests are checked
+the way the real API checks them (custom_id format and uniqueness,
+model/max_tokens/messages present), answering 400 otherwise.
+
+Usage:
+    uv run python scripts/data_generation/fake_batch_api.py [--port 8765] [--processing-time 5]
+        [--error-rate 0.01] [--expire-rate 0.0] [--seed N]
+
+Then point a generator at it:
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8765 ANTHROPIC_API_KEY=fake \\
+        uv run python scripts/data_generation/quarterly_reports.py --batch --llm-cache off
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from aiohttp import web
+
+CUSTOM_ID = re.compile(r"^[a-zA-Z0-9_-]{1,64}$")
+
+# How long an unfinished batch lives before its requests expire (as in the real API)
+BATCH_LIFETIME = timedelta(hours=24)
+
+WEEKLY_LINES = [
+    "Sales were steady this week, mornings busier than usual.",
+    "The grinder acted up again on Tuesday, we got it working by lunch.",
+    "Short a person on the weekend shift but we made it work.",
+    "Oat milk delivery came in late so we ran low Thursday.",
+    "Had a customer complain about wait times during the rush.",
+    "Weather kept foot traffic down a bit midweek.",
+    "The new seasonal drink is selling well, people keep asking for it.",
+]
+
+
+def _rng(prompt: str) -> random.Random:
+    return random.Random(hashlib.sha256(prompt.encode()).digest())
+
+
+def _tag(pattern: str, prompt: str, default: str) -> str:
+    m = re.search(pattern, prompt, re.DOTALL)
+    return m.group(1).strip() if m else default
+
+
+def fake_completion(prompt: str) -> str:
+    """A plausible answer to a generator prompt, the same every time for the same prompt."""
+    rng = _rng(prompt)
+    if "quarterly business review" in prompt:
+        branch = _tag(r"Branch: ([^(\n]+)", prompt, "the branch")
+        return json.dumps({
+            "labor_manager_narrative": f"Labor held up at {branch} this quarter. {rng.choice(WEEKLY_LINES)}",
+            "inventory_manager_narrative": f"Waste was about where we expected. {rng.choice(WEEKLY_LINES)}",
+            "notes": f"{rng.choice(WEEKLY_LINES)} More of the same next quarter.",
+        })
+    manager = _tag(r"<manager>\s*<name>(.*?)</name>", prompt, "Manager")
+    email = _tag(r"(?m)^From: (\S+)$", prompt, "manager@beanstack.example")
+    body = " ".join(rng.sample(WEEKLY_LINES, 2))
+    return f"Subject: {rng.choice(['Weekly update', 'This week', 'Quick update'])}\nFrom: {email}\n\n{body}\n\n{manager.split()[0]}"
+
+
+def _message(model: str, text: str) -> dict:
+    return {
+        "id": f"msg_{uuid.uuid4().hex[:24]}",
+        "type": "message",
+        "role": "assistant",
+        "model": model,
+        "content": [{"type": "text", "text": text}],
+        "stop_reason": "end_turn",
+        "stop_sequence": None,
+        "usage": {"input_tokens": 0, "output_tokens": 0},
+    }
+
+
+def _error(status: int, kind: str, message: str) -> web.Response:
+    return web.json_response({"type": "error", "error": {"type": kind, "message": message}}, status=status)
+
+
+def _params_error(params) -> str | None:
+    if not isinstance(params, dict):
+        return "params: expected an object"
+    for key in ("model", "max_tokens", "messages"):
+        if key not in params:
+            return f"params.{key}: Field required"
+    if not params["messages"]:
+        return "params.messages: at least one message is required"
+    return None
+
+
+def _iso(t: datetime | None) -> str | None:
+    return t.isoformat().replace("+00:00", "Z") if t else None
+
+
+class Batch:
+    """One submitted batch and, once ended, its results."""
+
+    def __init__(self, requests: list[dict], processing_time: float, fates: list[str]):
+        self.id = f"msgbatch_{uuid.uuid4().hex[:24]}"
+        self.requests = requests
+        self.fates = fates   # per request: succeeded, errored or expired
+        self.created = datetime.now(timezone.utc)
+        self.ends_at = time.monotonic() + processing_time
+        self.ended: datetime | None = None
+        self.cancel_requested: datetime | None = None
+        self.results: list[dict] = []
+
+    def _finish(self) -> None:
+        self.ended = datetime.now(timezone.utc)
+        for request, fate in zip(self.requests, self.fates):
+            if self.cancel_requested:
+                fate = "canceled"
+            result = {"type": fate}
+            if fate == "succeeded":
+                params = request["params"]
+                result["message"] = _message(params["model"], fake_completion(params["messages"][0]["content"]))
+            elif fate == "errored":
+                result["error"] = {"type": "error", "error": {"type": "api_error", "message": "Internal server error"}}
+            self.results.append({"custom_id": request["custom_id"], "result": result})
+
+    def to_json(self, base_url: str) -> dict:
+        if self.ended is None and (self.cancel_requested or time.monotonic() >= self.ends_at):
+            self._finish()
+        counts = {"processing": 0, "succeeded": 0, "errored": 0, "canceled": 0, "expired": 0}
+        if self.ended is None:
+            counts["processing"] = len(self.requests)
+        else:
+            for entry in self.results:
+                counts[entry["result"]["type"]] += 1
+        status = "ended" if self.ended else ("canceling" if self.cancel_requested else "in_progress")
+        return {
+            "id": self.id,
+            "type": "message_batch",
+            "processing_status": status,
+            "request_counts": counts,
+            "created_at": _iso(self.created),
+            "expires_at": _iso(self.created + BATCH_LIFETIME),
+            "ended_at": _iso(self.ended),
+            "cancel_initiated_at": _iso(self.cancel_requested),
+            "archived_at": None,
+            "results_url": f"{base_url}/v1/messages/batches/{self.id}/results" if self.ended else None,
+        }
+
+
+def create_app(processing_time: float = 5.0, error_rate: float = 0.0, expire_rate: float = 0.0,
+               seed: int | None = None) -> web.Application:
+    """Build the fake API app. `processing_time` is how long every batch takes, in seconds."""
+    app = web.Application(client_max_size=256 * 1024 * 1024)
+    batches: dict[str, Batch] = {}
+    stats = {"messages": 0, "batches": 0, "batched_requests": 0}
+    rng = random.Random(seed)
+
+    def fate() -> str:
+        roll = rng.random()
+        if roll < error_rate:
+            return "errored"
+        if roll < error_rate + expire_rate:
+            return "expired"
+        return "succeeded"
+
+    def base_url(request: web.Request) -> str:
+        return f"{request.scheme}://{request.host}"
+
+    def find(request: web.Request) -> Batch:
+        batch = batches.get(request.match_info["batch_id"])
+        if batch is None:
+            raise web.HTTPNotFound(
+                text=json.dumps({"type": "error", "error": {"type": "not_found_error", "message": "Batch not found"}}),
+                content_type="application/json",
+            )
+        return batch
+
+    async def messages(request: web.Request) -> web.Response:
+        params = await request.json()
+        if problem := _params_error(params):
+            return _error(400, "invalid_request_error", problem)
+        stats["messages"] += 1
+        return web.json_response(_message(params["model"], fake_completion(params["messages"][0]["content"])))
+
+    async def create_batch(request: web.Request) -> web.Response:
+        body = await request.json()
+        requests = body.get("requests") or []
+        if not requests:
+            return _error(400, "invalid_request_error", "requests: at least one request is required")
+        seen = set()
+        for i, entry in enumerate(requests):
+            custom_id = entry.get("custom_id", "")
+            if not CUSTOM_ID.match(custom_id):
+                return _error(400, "invalid_request_error", f"requests.{i}.custom_id: invalid {custom_id!r}")
+            if custom_id in seen:
+                return _error(400, "invalid_request_error", f"requests.{i}.custom_id: duplicate {custom_id!r}")
+            seen.add(custom_id)
+            if problem := _params_error(entry.get("params")):
+                return _error(400, "invalid_request_error", f"requests.{i}.{problem}")
+        batch = Batch(requests, processing_time, [fate() for _ in requests])
+        batches[batch.id] = batch
+        stats["batches"] += 1
+        stats["batched_requests"] += len(requests)
+        return web.json_response(batch.to_json(base_url(request)))
+
+    async def get_batch(request: web.Request) -> web.Response:
+        return web.json_response(find(request).to_json(base_url(request)))
+
+    async def cancel_batch(request: web.Request) -> web.Response:
+        batch = find(request)
+        if batch.ended is None and batch.cancel_requested is None:
+            batch.cancel_requested = datetime.now(timezone.utc)
+        return web.json_response(batch.to_json(base_url(request)))
+
+    async def batch_results(request: web.Request) -> web.Response:
+        batch = find(request)
+        if batch.ended is None:
+            return _error(404, "not_found_error", "Batch results are not available until processing ends")
+        body = "".join(json.dumps(entry) + "\n" for entry in batch.results)
+        return web.Response(text=body, content_type="application/binary")
+
+    async def get_stats(request: web.Request) -> web.Response:
+        return web.json_response(stats)
+
+    app.router.add_post("/v1/messages", messages)
+    app.router.add_post("/v1/messages/batches", create_batch)
+    app.router.add_get("/v1/messages/batches/{batch_id}", get_batch)
+    app.router.add_post("/v1/messages/batches/{batch_id}/cancel", cancel_batch)
+    app.router.add_get("/v1/messages/batches/{batch_id}/results", batch_results)
+    app.router.add_get("/_stats", get_stats)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake Anthropic Messages + Message Batches API")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--processing-time", type=float, default=5.0, help="seconds until a batch ends")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of batch requests that error")
+    parser.add_argument("--expire-rate", type=float, default=0.0, help="fraction of batch requests that expire")
+    parser.add_argument("--seed", type=int, help="seed for picking failed requests")
+    args = parser.parse_args()
+
+    app = create_app(args.processing_time, args.error_rate, args.expire_rate, args.seed)
+    print(f"Fake Anthropic API: ANTHROPIC_BASE_URL=http://127.0.0.1:{args.port}")
+    web.run_app(app, host="127.0.0.1", port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
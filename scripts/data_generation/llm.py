@@ -0,0 +1,333 @@
+"""
+Shared Claude client for the report generators: rate-limited, thread-safe calls.
+
+The generators run many LLM calls in parallel (--workers). LLMClient keeps
+them inside the API key's rate limits with token buckets for requests,
+input tokens and output tokens. The buckets start unlimited and are resynced
+from the anthropic-ratelimit-* headers of every response, so they follow
+the real limits, including what other clients on the same key use up. A
+429 pauses every worker for its retry-after; rate limits, overloads and
+dropped connections are retried with backoff.
+
+With a ResponseCache (see response_cache.py), prompts already answered are
+served from disk without touching the API or the rate limits.
+
+complete_batch() sends many independent prompts through the Message
+Batches API instead (half the price, and no per-minute limits to pace):
+one batch per MAX_BATCH_REQUESTS prompts, polled until it ends. Results
+come back in input order; a request that errored or expired in the batch
+is returned as a BatchRequestFailed for the caller's usual fallback. A
+batch still running when the caller is interrupted is canceled.
+
+map_ordered() runs the calls on a thread pool and hands results back in
+input order, so reports are written (and numbered) exactly as in a serial
+run however the calls finish.
+
+Usage:
+    llm = LLMClient()
+    text = llm.complete(prompt, max_tokens=250)
+
+    for result in map_ordered(generate_branch, branches, workers=8):
+        ...
+
+    texts = llm.complete_batch([(prompt, 250) for prompt in prompts])
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator
+
+import anthropic
+
+from response_cache import ResponseCache
+
+MODEL = "claude-haiku-4-5-20251001"
+
+DEFAULT_WORKERS = 8
+
+# Retries per call on rate limits, overloads and connection errors
+MAX_RETRIES = 6
+
+# Rough prompt size estimate for the input-token bucket
+CHARS_PER_TOKEN = 4
+
+# Bucket names as they appear in anthropic-ratelimit-<name>-limit/-remaining
+BUCKETS = ("requests", "input-tokens", "output-tokens")
+
+# Requests per submitted batch (the API allows 100,000 or 256 MB, whichever comes first)
+MAX_BATCH_REQUESTS = 10_000
+
+# Seconds between batch status polls: doubles from the first up to the second
+BATCH_POLL_INTERVAL = (2.0, 60.0)
+
+# Backoff jitter has its own generator, so retries don't disturb the seeded global one
+_jitter = random.Random()
+
+
+def backoff_delay(attempt: int, retry_after: str | None = None, base: float = 1.0, cap: float = 60) -> float:
+    """Seconds to wait before retry `attempt`: Retry-After if given, else jittered exponential."""
+    if retry_after:
+        try:
+            return min(cap, float(retry_after))
+        except ValueError:
+            pass
+    return _jitter.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class BatchRequestFailed(Exception):
+    """A Message Batches request that errored, was canceled or expired."""
+
+
+class TokenBucket:
+    """Refills at `capacity` per minute; unlimited until the first sync()."""
+
+    def __init__(self):
+        self.capacity: float | None = None
+        self.level = 0.0
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        if self.capacity:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / 60)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` is available (0 if it is now)."""
+        self._refill(now)
+        if not self.capacity:
+            return 0.0
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) * 60 / self.capacity
+
+    def take(self, amount: float) -> None:
+        if self.capacity:
+            self.level -= amount
+
+    def sync(self, limit: float, remaining: float) -> None:
+        """Adopt the server's view: its limit, and at most what it says is left."""
+        first = self.capacity is None
+        self.capacity = limit
+        self.level = remaining if first else min(self.level, remaining)
+
+
+class RateLimiter:
+    """Request and token buckets shared by all worker threads."""
+
+    def __init__(self):
+        self.buckets = {name: TokenBucket() for name in BUCKETS}
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, costs: dict[str, float]) -> None:
+        """Block until every bucket can cover its cost, then take it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = max(
+                    [self.paused_until - now]
+                    + [bucket.wait_time(costs.get(name, 0), now) for name, bucket in self.buckets.items()]
+                )
+                if wait <= 0:
+                    for name, bucket in self.buckets.items():
+                        bucket.take(costs.get(name, 0))
+                    return
+            time.sleep(min(wait, 1.0))
+
+    def update(self, headers) -> None:
+        with self._lock:
+            for name, bucket in self.buckets.items():
+                limit = headers.get(f"anthropic-ratelimit-{name}-limit")
+                remaining = headers.get(f"anthropic-ratelimit-{name}-remaining")
+                if limit and remaining:
+                    bucket.sync(float(limit), float(remaining))
+
+    def pause(self, seconds: float) -> None:
+        """Hold back every worker for `seconds` (after a 429)."""
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class LLMClient:
+    """Thread-safe, rate-limited wrapper around anthropic.Anthropic().messages.create."""
+
+    def __init__(
+        self,
+        client: anthropic.Anthropic | None = None,
+        limiter: RateLimiter | None = None,
+        cache: ResponseCache | None = None,
+    ):
+        # Retries are ours, so a 429 pauses every worker rather than just one
+        self.client = client or anthropic.Anthropic(max_retries=0)
+        self.limiter = limiter or RateLimiter()
+        self.cache = cache
+        self.calls = 0
+        self.retries = 0
+        self.batches = 0
+        self.batched = 0
+        # The counters are bumped from every worker thread
+        self._counter_lock = threading.Lock()
+
+    def _count(self, counter: str, amount: int = 1) -> None:
+        with self._counter_lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    def stats(self) -> str:
+        line = f"{self.calls} API calls ({self.retries} retried)"
+        if self.batches:
+            line += f", {self.batched} batched requests in {self.batches} batches"
+        if self.cache is not None and self.cache.mode != "off":
+            line += f", {self.cache.hits} from cache, {self.cache.stored} newly cached"
+        return line
+
+    def complete(self, prompt: str, max_tokens: int, model: str = MODEL) -> str:
+        """Text of a single-turn completion of `prompt`.
+
+        Raises CacheMiss for an uncached prompt when the cache is replay-only.
+        """
+        if self.cache is not None:
+            cached = self.cache.get(model, max_tokens, prompt)
+            if cached is not None:
+                return cached
+        costs = {"requests": 1, "input-tokens": len(prompt) / CHARS_PER_TOKEN, "output-tokens": max_tokens}
+        attempt = 0
+        while True:
+            self.limiter.acquire(costs)
+            try:
+                raw = self.client.messages.with_raw_response.create(
+                    model=model,
+                    max_tokens=max_tokens,
+                    messages=[{"role": "user", "content": prompt}],
+                )
+            except (anthropic.RateLimitError, anthropic.InternalServerError, anthropic.APIConnectionError) as e:
+                if attempt >= MAX_RETRIES:
+                    raise
+                response = getattr(e, "response", None)
+                retry_after = response.headers.get("retry-after") if response is not None else None
+                delay = backoff_delay(attempt, retry_after)
+                if isinstance(e, anthropic.RateLimitError):
+                    self.limiter.update(response.headers)
+                    self.limiter.pause(delay)
+                else:
+                    time.sleep(delay)
+                attempt += 1
+                self._count("retries")
+                continue
+            self.limiter.update(raw.headers)
+            self._count("calls")
+            text = raw.parse().content[0].text
+            if self.cache is not None:
+                self.cache.put(model, max_tokens, prompt, text)
+            return text
+
+    def _with_retries(self, call: Callable):
+        """call() retried with backoff on rate limits, overloads and connection errors."""
+        attempt = 0
+        while True:
+            try:
+                return call()
+            except (anthropic.RateLimitError, anthropic.InternalServerError, anthropic.APIConnectionError) as e:
+                if attempt >= MAX_RETRIES:
+                    raise
+                response = getattr(e, "response", None)
+                time.sleep(backoff_delay(attempt, response.headers.get("retry-after") if response is not None else None))
+                attempt += 1
+                self._count("retries")
+
+    def complete_batch(self, requests: list[tuple[str, int]], model: str = MODEL) -> list[str | BatchRequestFailed]:
+        """Texts of single-turn completions of (prompt, max_tokens) requests, via Message Batches.
+
+        Returns one entry per request, in input order: the text, or a
+        BatchRequestFailed. Cached prompts aren't submitted; raises
+        CacheMiss for an uncached one when the cache is replay-only.
+        """
+        results: list[str | BatchRequestFailed | None] = [None] * len(requests)
+        pending = []
+        for i, (prompt, max_tokens) in enumerate(requests):
+            cached = self.cache.get(model, max_tokens, prompt) if self.cache is not None else None
+            if cached is None:
+                pending.append(i)
+            else:
+                results[i] = cached
+        if not pending:
+            return results
+
+        running = {}   # batch id -> request indices, by custom id
+        try:
+            for start in range(0, len(pending), MAX_BATCH_REQUESTS):
+                chunk = pending[start:start + MAX_BATCH_REQUESTS]
+                batch = self._with_retries(lambda: self.client.messages.batches.create(requests=[
+                    {
+                        "custom_id": f"req-{i}",
+                        "params": {
+                            "model": model,
+                            "max_tokens": requests[i][1],
+                            "messages": [{"role": "user", "content": requests[i][0]}],
+                        },
+                    }
+                    for i in chunk
+                ]))
+                running[batch.id] = chunk
+                self._count("batches")
+                self._count("batched", len(chunk))
+                print(f"  Submitted batch {batch.id} ({len(chunk)} requests)")
+
+            delay, max_delay = BATCH_POLL_INTERVAL
+            while running:
+                time.sleep(delay)
+                delay = min(max_delay, delay * 2)
+                for batch_id in list(running):
+                    batch = self._with_retries(lambda: self.client.messages.batches.retrieve(batch_id))
+                    if batch.processing_status != "ended":
+                        continue
+                    counts = batch.request_counts
+                    print(f"  Batch {batch_id} ended: {counts.succeeded} succeeded, {counts.errored} errored, "
+                          f"{counts.expired} expired, {counts.canceled} canceled")
+                    for entry in self._with_retries(lambda: list(self.client.messages.batches.results(batch_id))):
+                        i = int(entry.custom_id.removeprefix("req-"))
+                        result = entry.result
+                        if result.type == "succeeded":
+                            text = result.message.content[0].text
+                            results[i] = text
+                            if self.cache is not None:
+                                self.cache.put(model, requests[i][1], requests[i][0], text)
+                        elif result.type == "errored":
+                            results[i] = BatchRequestFailed(f"{result.error.error.type}: {result.error.error.message}")
+                        else:
+                            results[i] = BatchRequestFailed(result.type)
+                    del running[batch_id]
+        except BaseException:
+            # Don't leave batches running (and billed) that nobody will collect
+            for batch_id in running:
+                try:
+                    self.client.messages.batches.cancel(batch_id)
+                    print(f"  Canceled batch {batch_id}")
+                except anthropic.APIError as e:
+                    print(f"  Could not cancel batch {batch_id}: {e}")
+            raise
+
+        return [BatchRequestFailed("no result returned") if r is None else r for r in results]
+
+
+def map_ordered(fn: Callable, items: Iterable, workers: int = DEFAULT_WORKERS) -> Iterator:
+    """fn(item) for each item on a thread pool, yielding results in input order.
+
+    Closing the iterator early (an error downstream, Ctrl+C) cancels the
+    calls that haven't started.
+    """
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="llm")
+    try:
+        futures = [pool.submit(fn, item) for item in items]
+        for future in futures:
+            yield future.result()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def workers_from_argv(argv: list[str]) -> int:
+    """--workers N, or DEFAULT_WORKERS."""
+    for i, arg in enumerate(argv):
+        if arg == "--workers" and i + 1 < len(argv):
+            return max(1, int(argv[i + 1]))
+    return DEFAULT_WORKERS
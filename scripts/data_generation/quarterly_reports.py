@@ -18,8 +18,44 @@ Performance distribution:
 Quarters: Q1-2023 through Q4-2025 (3 years, 12 quarters)
 Submission: ~1 month after quarter end ±3 days
 
+Reports are written to the compressed corpus in data/generated/corpus/financial
+(see corpus.py), which 04_ingest_financial.py streams. --export-files writes
+the per-report JSON tree and its index.json from the corpus instead of
+generating, e.g. for the demo.
+
+Numbers are computed for every report first; the narrative calls, which
+don't depend on each other, then run in parallel (--workers N, default 8,
+within the API rate limits; see llm.py). Reports are written in branch and
+quarter order regardless of when their calls finish.
+
+--batch sends all the narrative prompts through the Message Batches API
+instead (see LLMClient.complete_batch): cheaper, and not paced by the
+per-minute limits, but results only arrive when a batch ends. A request
+that fails in the batch gets the template narratives, like an unparseable
+answer does.
+
+Finished reports are appended to a progress journal next to the corpus
+(see corpus.GenerationJournal), so a rerun after a crash only generates the
+(branch, period) reports that are missing. Reports that fell back to the
+template narratives aren't journaled, so a rerun asks Claude for them again.
+--fresh discards the journal.
+
+Claude's responses are kept in a record/replay cache (see response_cache.py):
+--llm-cache replay regenerates offline from it, --llm-cache off bypasses it.
+
+--stream also indexes each report into beanstack-financial-reports as soon
+as it is generated (see es_setup/stream_ingest.py). Only the corpus waits for
+branch and quarter order; the stream takes reports as their calls finish, so
+one slow call doesn't hold back the reports generated after it.
+
+Listing branch ids regenerates only those branches; every other branch is
+carried over from the existing corpus, so it stays complete (and an
+incremental ingest doesn't delete the other branches' reports).
+
 Usage:
-    uv run python scripts/data_generation/quarterly_reports.py [branch-001 branch-002 ...]
+    uv run python scripts/data_generation/quarterly_reports.py [branch-001 branch-002 ...] [--workers N | --batch] [--fresh]
+        [--llm-cache record|replay|off] [--stream [--queue-size N]]
+    uv run python scripts/data_generation/quarterly_reports.py --export-files
 """
 
 import calendar
@@ -30,10 +66,14 @@ import sys
 from collections import Counter
 from datetime import datetime, timedelta
 from pathlib import Path
+from typing import Iterator
 
-import anthropic
 from dotenv import load_dotenv
 
+from corpus import FINANCIAL_CORPUS, CorpusReader, CorpusWriter, GenerationJournal, journal_path, record_sha256
+from llm import DEFAULT_WORKERS, BatchRequestFailed, LLMClient, map_ordered, workers_from_argv
+from response_cache import cache_from_argv
+
 load_dotenv()
 
 random.seed(42)
@@ -98,6 +138,9 @@ NARRATIVE_SATISFACTION_BONUS = {
     "aspiring_artists": 0.05,
 }
 
+# Response limit of a narrative call (part of the response cache key)
+NARRATIVE_MAX_TOKENS = 300
+
 TOP_SELLING_ITEMS_POOL = {
     1: [  # Q1 winter
         "House Blend Drip", "Vanilla Latte", "Hot Chocolate",
@@ -153,8 +196,7 @@ def jitter(base: float, pct: float, seed: str) -> float:
     return base * (1 + pct * (2 * h - 1))
 
 
-def generate_narratives_with_llm(
-    client: anthropic.Anthropic,
+def build_narrative_prompt(
     branch: dict,
     manager: dict,
     narrative: dict,
@@ -169,9 +211,8 @@ def generate_narratives_with_llm(
     turnover: list[dict],
     employee_count: int,
     satisfaction: float,
-) -> dict:
-    """Generate the 3 narrative fields via Claude Haiku. Returns dict with keys:
-    labor_manager_narrative, inventory_manager_narrative, notes."""
+) -> str:
+    """Prompt for the 3 narrative fields of one report."""
 
     season = SEASON_LABELS[qnum]
     turnover_names = [t["name"].split()[0] for t in turnover]
@@ -180,7 +221,7 @@ def generate_narratives_with_llm(
 
     narrative_tone = narrative.get("narrative_tone", "matter-of-fact")
 
-    prompt = f"""Write 3 short narrative fields for a coffee shop quarterly business review (QBR) form.
+    return f"""Write 3 short narrative fields for a coffee shop quarterly business review (QBR) form.
 The manager is filling these out quickly — keep each one 1-2 sentences, direct and specific to the data below.
 
 <numbers>
@@ -213,13 +254,37 @@ Rules:
 - Match the manager's writing tone from <branch_narrative>.
 - Write like a busy manager, not a report. Casual american english."""
 
-    message = client.messages.create(
-        model="claude-haiku-4-5-20251001",
-        max_tokens=300,
-        messages=[{"role": "user", "content": prompt}],
-    )
 
-    raw = message.content[0].text.strip()
+def template_narratives(
+    branch: dict,
+    manager: dict,
+    narrative: dict,
+    period: str,
+    qnum: int,
+    tier: str,
+    revenue: float,
+    labor_cost_pct: float,
+    waste_pct: float,
+    top_items: list[str],
+    equipment_issues: int,
+    turnover: list[dict],
+    employee_count: int,
+    satisfaction: float,
+) -> dict:
+    """Fallback narratives for when Claude's answer is unusable (same arguments as build_narrative_prompt)."""
+    season = SEASON_LABELS[qnum]
+    turnover_names = [t["name"].split()[0] for t in turnover]
+    narrative_desc = narrative.get("narrative_description", "Normal operations")
+    return {
+        "labor_manager_narrative": f"Labor at {labor_cost_pct}% of revenue. {f'{turnover_names[0]} left this quarter.' if turnover_names else 'Team was stable.'}",
+        "inventory_manager_narrative": f"Waste at {waste_pct}%. {top_items[0]} and {top_items[1]} led sales.",
+        "notes": f"{season.capitalize()} quarter. {narrative_desc}",
+    }
+
+
+def parse_narratives(raw: str) -> dict | None:
+    """The narrative fields from Claude's JSON answer, None if it isn't valid JSON."""
+    raw = raw.strip()
     # Strip markdown fences if present
     if raw.startswith("```"):
         raw = raw.split("\n", 1)[1]
@@ -230,15 +295,31 @@ Rules:
     try:
         return json.loads(raw)
     except json.JSONDecodeError:
-        # Fallback to template narratives
-        return {
-            "labor_manager_narrative": f"Labor at {labor_cost_pct}% of revenue. {f'{turnover_names[0]} left this quarter.' if turnover_names else 'Team was stable.'}",
-            "inventory_manager_narrative": f"Waste at {waste_pct}%. {top_items[0]} and {top_items[1]} led sales.",
-            "notes": f"{season.capitalize()} quarter. {narrative_desc}",
-        }
+        return None
+
+
+def generate_narratives_with_llm(llm: LLMClient, *narrative_args) -> dict | None:
+    """Generate the 3 narrative fields via Claude Haiku. Returns dict with keys:
+    labor_manager_narrative, inventory_manager_narrative, notes; None if
+    Claude's answer can't be parsed (the caller falls back to templates).
+
+    `narrative_args` are the build_narrative_prompt arguments.
+    """
+    return parse_narratives(llm.complete(build_narrative_prompt(*narrative_args), max_tokens=NARRATIVE_MAX_TOKENS))
+
+
+NARRATIVE_FIELDS = ("labor_manager_narrative", "inventory_manager_narrative", "notes")
 
 
-def generate_quarterly_reports(branch_ids: list[str] | None = None):
+def generate_quarterly_reports(
+    corpus: CorpusWriter,
+    branch_ids: list[str] | None = None,
+    stream=None,
+    workers: int = DEFAULT_WORKERS,
+    journal: GenerationJournal | None = None,
+    llm: LLMClient | None = None,
+    batch: bool = False,
+):
     with open(DATA_DIR / "branches.json") as f:
         branches = json.load(f)
     if branch_ids:
@@ -249,7 +330,7 @@ def generate_quarterly_reports(branch_ids: list[str] | None = None):
     with open(DATA_DIR / "branch_narratives.json") as f:
         narratives = json.load(f)
 
-    client = anthropic.Anthropic()
+    llm = llm or LLMClient()
 
     # Index staff by branch
     staff_by_branch: dict[str, list[dict]] = {}
@@ -263,8 +344,8 @@ def generate_quarterly_reports(branch_ids: list[str] | None = None):
         if s["role"] == "Manager":
             managers[s["branch_id"]] = s
 
-    reports = []
-    total_llm_calls = 0
+    # (report without narratives, generate_narratives_with_llm arguments) in output order
+    jobs = []
 
     for branch in branches:
         bid = branch["id"]
@@ -284,7 +365,7 @@ def generate_quarterly_reports(branch_ids: list[str] | None = None):
         if branch.get("closed_date"):
             closed = datetime.strptime(branch["closed_date"], "%Y-%m-%d")
 
-        branch_reports = []
+        quarters = 0
         for period, q_start, q_end, sub_base in QUARTERS:
             # Skip if branch wasn't open during this quarter
             if opened > q_end:
@@ -394,10 +475,9 @@ def generate_quarterly_reports(branch_ids: list[str] | None = None):
             if qnum in (1, 4):
                 equipment_issues += rng2.randint(0, 1)
 
-            # ---- LLM-generated narratives ----
-            total_llm_calls += 1
-            narr = generate_narratives_with_llm(
-                client, branch, manager, narrative, period, qnum, tier,
+            # ---- LLM-generated narratives (filled in below) ----
+            narrative_args = (
+                branch, manager, narrative, period, qnum, tier,
                 quarterly_revenue, labor_cost_pct, waste_pct, top_items,
                 equipment_issues, turnover_this_q, employee_count, satisfaction,
             )
@@ -424,34 +504,87 @@ def generate_quarterly_reports(branch_ids: list[str] | None = None):
                 "avg_ticket": avg_ticket,
                 "labor_hours": labor_hours,
                 "labor_cost_pct": labor_cost_pct,
-                "labor_manager_narrative": narr.get("labor_manager_narrative", ""),
+                "labor_manager_narrative": "",
                 "inventory_waste_pct": waste_pct,
                 "top_selling_items": top_items,
-                "inventory_manager_narrative": narr.get("inventory_manager_narrative", ""),
+                "inventory_manager_narrative": "",
                 "customer_satisfaction": satisfaction,
                 "employee_count": employee_count,
                 "turnover_count": turnover_count,
                 "equipment_issues": equipment_issues,
-                "notes": narr.get("notes", ""),
+                "notes": "",
             }
-            branch_reports.append(report)
-            save_report_to_file(report, submitted_at)
+            jobs.append((report, narrative_args))
+            quarters += 1
+
+        if quarters:
+            print(f"  {branch['name']}: {quarters} quarters")
+
+    def fill_narratives(report: dict, narr: dict | None, narrative_args: tuple, journaled: bool) -> dict:
+        """Fill in `narr`, or the template narratives if it is None; template reports aren't journaled."""
+        placeholder = narr is None
+        if placeholder:
+            narr = template_narratives(*narrative_args)
+        for field in NARRATIVE_FIELDS:
+            report[field] = narr.get(field, "")
+        if not journaled and not placeholder and journal is not None:
+            journal.record(report)
+        if stream is not None:
+            # From the worker that finished it, not when the corpus gets to it
+            stream.submit(report, record_sha256(report))
+        return report
+
+    def add_narratives(job: tuple[dict, tuple]) -> dict:
+        report, narrative_args = job
+        done = journal.get(report["id"]) if journal is not None else None
+        if done is not None:
+            # Generated by an earlier, interrupted run
+            return fill_narratives(report, done, narrative_args, journaled=True)
+        narr = generate_narratives_with_llm(llm, *narrative_args)
+        return fill_narratives(report, narr, narrative_args, journaled=False)
+
+    def add_batch_narratives(jobs: list[tuple[dict, tuple]]) -> Iterator[dict]:
+        """All prompts up front as Message Batches, then the reports in job order."""
+        pending = [(report, args) for report, args in jobs if journal is None or journal.get(report["id"]) is None]
+        print(f"  Submitting {len(pending)} narrative prompts as message batches "
+              f"({len(jobs) - len(pending)} already generated)...")
+        responses = llm.complete_batch([(build_narrative_prompt(*args), NARRATIVE_MAX_TOKENS) for _, args in pending])
+        answers = {report["id"]: response for (report, _), response in zip(pending, responses)}
+        for report, narrative_args in jobs:
+            if report["id"] not in answers:
+                yield add_narratives((report, narrative_args))
+                continue
+            response = answers[report["id"]]
+            narr = None
+            if isinstance(response, BatchRequestFailed):
+                print(f"  Error generating narratives for {report['id']}: {response}")
+            else:
+                narr = parse_narratives(response)
+            fill_narratives(report, narr, narrative_args, journaled=False)
+            yield report
+
+    if batch:
+        results = add_batch_narratives(jobs)
+    else:
+        print(f"  Generating narratives for {len(jobs)} reports ({workers} in parallel)...")
+        results = map_ordered(add_narratives, jobs, workers)
 
-            if total_llm_calls % 50 == 0:
-                print(f"  Progress: {total_llm_calls} reports generated...")
+    reports = []
+    for report in results:
+        reports.append(report)
+        corpus.write(report)
 
-        if branch_reports:
-            print(f"  {branch['name']}: {len(branch_reports)} quarters")
-        reports.extend(branch_reports)
+        if len(reports) % 50 == 0:
+            print(f"  Progress: {len(reports)}/{len(jobs)} reports generated...")
 
-    print(f"\n  Total LLM calls: {total_llm_calls}")
+    print(f"\n  LLM: {llm.stats()}")
     return reports
 
 
 FINANCIAL_REPORTS_DIR = DATA_DIR / "financial-reports"
 
 
-def save_report_to_file(report: dict, submitted_at: datetime) -> str:
+def save_report_to_file(report: dict) -> str:
     """Save a QBR to data/generated/financial-reports/<branch-id>/<year>/<month>/fin-report-<period>.txt"""
     bid = report["branch_id"]
     period = report["period"]
@@ -466,22 +599,12 @@ def save_report_to_file(report: dict, submitted_at: datetime) -> str:
     return str(file_path)
 
 
-def main():
-    branch_ids = [a for a in sys.argv[1:] if not a.startswith("--")] or None
-    print("Generating quarterly reports (with LLM narratives)...")
-
-    out_path = DATA_DIR / "quarterly_reports.json"
-    reports = generate_quarterly_reports(branch_ids=branch_ids)
-    print(f"  Generated {len(reports)} quarterly reports")
-
-    # Save JSON
-    with open(out_path, "w") as f:
-        json.dump(reports, f, indent=2)
-    print(f"  Saved to {out_path}")
-
-    # Save index for file references
+def export_files() -> None:
+    """Write the corpus out as the per-report JSON tree plus its index.json."""
+    reader = CorpusReader(FINANCIAL_CORPUS)
     index = []
-    for r in reports:
+    for r in reader.iter_records():
+        save_report_to_file(r)
         q_year = r["period"].split("-")[1]
         file_path = f"data/generated/financial-reports/{r['branch_id']}/{q_year}/fin-report-{r['period']}.json"
         index.append({
@@ -495,8 +618,56 @@ def main():
     index_path.parent.mkdir(parents=True, exist_ok=True)
     with open(index_path, "w") as f:
         json.dump(index, f, indent=2)
+    print(f"  Exported {len(index)} quarterly reports")
     print(f"  Index saved to {index_path}")
 
+
+def main():
+    if "--export-files" in sys.argv:
+        export_files()
+        return
+
+    branch_ids = [a for a in sys.argv[1:] if a.startswith("branch-")] or None
+    print("Generating quarterly reports (with LLM narratives)...")
+
+    out_path = DATA_DIR / "quarterly_reports.json"
+    stream = None
+    if "--stream" in sys.argv:
+        # Streaming indexes through the es_setup ingest code (needs ES credentials)
+        sys.path.insert(0, str(PROJECT_ROOT / "scripts" / "es_setup"))
+        from stream_ingest import stream_from_argv
+        stream = stream_from_argv("financial", sys.argv)
+
+    journal = GenerationJournal(journal_path(FINANCIAL_CORPUS), fresh="--fresh" in sys.argv)
+    if len(journal):
+        print(f"  Resuming: {len(journal)} reports already generated ({journal.path.name})")
+
+    cache = cache_from_argv(sys.argv)
+    try:
+        with CorpusWriter(FINANCIAL_CORPUS, key_fields=["period", "submitted_at"]) as corpus:
+            reports = generate_quarterly_reports(
+                corpus, branch_ids=branch_ids, stream=stream, workers=workers_from_argv(sys.argv), journal=journal,
+                llm=LLMClient(cache=cache), batch="--batch" in sys.argv,
+            )
+            if branch_ids:
+                kept = corpus.keep_other_branches(set(branch_ids))
+                print(f"  Kept {kept} reports of other branches from the previous corpus")
+        journal.finish({report["id"] for report in reports})
+    finally:
+        journal.close()
+        cache.close()
+        if stream is not None:
+            # Whatever was generated is indexed, even if the run failed
+            stream.close()
+            stream.print_stats()
+    print(f"  Generated {len(reports)} quarterly reports")
+    print(f"  Corpus saved to {FINANCIAL_CORPUS} ({len(corpus.shards)} shards)")
+
+    # Save JSON
+    with open(out_path, "w") as f:
+        json.dump(reports, f, indent=2)
+    print(f"  Saved to {out_path}")
+
     # Stats
     periods = Counter(r["period"] for r in reports)
     print("\nReports by quarter:")
@@ -0,0 +1,168 @@
+"""
+Record/replay cache of LLM responses for the report generators.
+
+Every completion LLMClient gets from the API is stored under
+sha256(model, max_tokens, prompt), so regenerating the dataset after a code
+change only calls Claude for prompts that actually changed, and a run with
+an unchanged prompt set is fully deterministic and works offline.
+
+  - responses.log is append-only: a file header, then one record per
+    response: the 32-byte key, a 4-byte length and the response text as an
+    independent zstd frame. A crash loses at most the record being written
+    (a torn tail is cut off on open in record mode, and ignored in replay
+    mode, which never writes to the cache).
+  - The in-memory index maps key -> (offset, length) and is rebuilt on
+    open by walking the record headers, without decompressing anything.
+
+Modes (--llm-cache):
+  - record (default): answer from the cache, call the API on a miss and
+    store the response.
+  - replay: cache only; a miss raises CacheMiss instead of calling the API.
+  - off: passthrough, the cache is neither read nor written.
+
+Usage:
+    cache = ResponseCache.open(mode="record")
+    llm = LLMClient(cache=cache)
+"""
+
+import hashlib
+import os
+import struct
+import threading
+from pathlib import Path
+
+import zstandard
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+CACHE_DIR = PROJECT_ROOT / "data" / "llm-cache"
+LOG_NAME = "responses.log"
+
+MODES = ("record", "replay", "off")
+DEFAULT_MODE = "record"
+
+MAGIC = b"BEANSTACK-LLM-CACHE 1\n"
+RECORD_HEADER = struct.Struct(">32sI")   # key, compressed length
+
+COMPRESSION_LEVEL = 10
+
+
+class CacheMiss(Exception):
+    """A replay-only cache has no response for a prompt."""
+
+
+def response_key(model: str, max_tokens: int, prompt: str) -> bytes:
+    digest = hashlib.sha256()
+    for part in (model, str(max_tokens), prompt):
+        data = part.encode()
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.digest()
+
+
+class ResponseCache:
+    """Append-only, zstd-compressed response log with an in-memory key index. Thread-safe."""
+
+    def __init__(self, path: Path, mode: str = DEFAULT_MODE):
+        if mode not in MODES:
+            raise ValueError(f"Unknown LLM cache mode {mode!r}; expected one of {', '.join(MODES)}")
+        self.path = path
+        self.mode = mode
+        self.hits = 0
+        self.stored = 0
+        self._index: dict[bytes, tuple[int, int]] = {}
+        self._lock = threading.Lock()
+        self._compressor = zstandard.ZstdCompressor(level=COMPRESSION_LEVEL)
+        self._decompressor = zstandard.ZstdDecompressor()
+        self._file = None
+        if mode == "record":
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(path, "a+b")
+            self._load_index()
+        elif mode == "replay" and path.exists():
+            self._file = open(path, "rb")
+            self._load_index()
+
+    @classmethod
+    def open(cls, mode: str = DEFAULT_MODE, root: Path = CACHE_DIR) -> "ResponseCache":
+        return cls(root / LOG_NAME, mode)
+
+    def _load_index(self) -> None:
+        f = self._file
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        if size == 0:
+            if self.mode == "record":
+                f.write(MAGIC)
+                f.flush()
+            return
+        f.seek(0)
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{self.path} is not an LLM response cache")
+        offset = len(MAGIC)
+        while offset + RECORD_HEADER.size <= size:
+            f.seek(offset)
+            key, length = RECORD_HEADER.unpack(f.read(RECORD_HEADER.size))
+            end = offset + RECORD_HEADER.size + length
+            if end > size:
+                break
+            self._index[key] = (offset + RECORD_HEADER.size, length)
+            offset = end
+        if offset < size and self.mode == "record":
+            # Torn record from a crash mid-append (replay just leaves it unindexed)
+            f.truncate(offset)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def get(self, model: str, max_tokens: int, prompt: str) -> str | None:
+        """The stored response, None on a miss in record mode (and always when off)."""
+        if self.mode == "off":
+            return None
+        key = response_key(model, max_tokens, prompt)
+        # The file position and the zstd contexts are shared, so all of it under the lock
+        with self._lock:
+            location = self._index.get(key)
+            if location is not None:
+                offset, length = location
+                self._file.seek(offset)
+                text = self._decompressor.decompress(self._file.read(length)).decode()
+                self.hits += 1
+        if location is None:
+            if self.mode == "replay":
+                raise CacheMiss(f"No cached response for a {model} prompt ({len(prompt)} chars); "
+                                f"rerun with --llm-cache record")
+            return None
+        return text
+
+    def put(self, model: str, max_tokens: int, prompt: str, text: str) -> None:
+        if self.mode != "record":
+            return
+        key = response_key(model, max_tokens, prompt)
+        with self._lock:
+            if key in self._index:
+                return
+            data = self._compressor.compress(text.encode())
+            f = self._file
+            f.seek(0, os.SEEK_END)
+            offset = f.tell()
+            f.write(RECORD_HEADER.pack(key, len(data)) + data)
+            f.flush()
+            self._index[key] = (offset + RECORD_HEADER.size, len(data))
+            self.stored += 1
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def cache_from_argv(argv: list[str]) -> ResponseCache:
+    """--llm-cache record|replay|off (default record)."""
+    mode = DEFAULT_MODE
+    for i, arg in enumerate(argv):
+        if arg == "--llm-cache" and i + 1 < len(argv):
+            mode = argv[i + 1]
+    cache = ResponseCache.open(mode)
+    if mode != "off":
+        print(f"LLM response cache: {mode} mode, {len(cache)} responses in {cache.path}")
+    return cache
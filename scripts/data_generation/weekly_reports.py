@@ -1,6 +1,54 @@
 """
 Generate weekly reports for BeanStack coffee chain using Claude Haiku.
 90% normal operations, 10% branch narrative sprinkled in.
+
+Reports are written to the compressed corpus in data/generated/corpus/reports
+(see corpus.py), which 03_ingest_reports.py streams. --export-files writes
+the per-report .txt tree and its index.json from the corpus, without
+generating anything, e.g. for the demo.
+
+Branches are generated in parallel (--workers N, default 8): only reports of
+the same branch depend on each other, through previous_reports. Calls stay
+within the API rate limits (see llm.py).
+
+--batch generates through the Message Batches API instead (see
+LLMClient.complete_batch), in waves: step k submits the k-th report of
+every branch as one batch, since those only depend on earlier steps. A
+branch's prompts, and so its reports, are the same as in a parallel run. A
+request that fails in the batch gets the usual placeholder report. With
+--stream, each step's reports are indexed as soon as the step ends; the
+corpus itself is only written once every step is done.
+
+Every random decision (report dates, the narrative coin flip, timestamps)
+comes from a stream seeded by (branch_id, purpose), and report ids are
+derived from (branch_id, date). A branch's reports are therefore the same
+whether it is generated alone, with others, serially or in parallel.
+
+Each finished report is also appended to a progress journal next to the
+corpus (see corpus.GenerationJournal). If a run dies, the next one takes
+the (branch, date) reports it already has from the journal, including as
+previous_reports context, and only calls the LLM for the rest, ending with
+the same corpus an uninterrupted run would have written. Placeholder reports
+(the LLM call failed) aren't journaled, so a rerun tries them again.
+--fresh discards the journal and starts over.
+
+Claude's responses are kept in a record/replay cache (see response_cache.py),
+so a rerun only calls the API for prompts it hasn't seen. --llm-cache replay
+runs fully offline and fails on an unseen prompt; --llm-cache off bypasses it.
+
+--stream also indexes each report into beanstack-reports as soon as it is
+generated (see es_setup/stream_ingest.py), so reports are searchable while
+the run is still going; generation pauses when indexing falls behind. Only
+the corpus waits for branch order; the stream takes reports as they finish.
+
+Listing branch ids regenerates only those branches; every other branch is
+carried over from the existing corpus, so it stays complete (and an
+incremental ingest doesn't delete the other branches' reports).
+
+Usage:
+    uv run python scripts/data_generation/weekly_reports.py [branch-001 branch-002 ...] [--workers N | --batch] [--fresh]
+        [--llm-cache record|replay|off] [--stream [--queue-size N]]
+    uv run python scripts/data_generation/weekly_reports.py --export-files
 """
 
 import json
@@ -10,18 +58,28 @@ import sys
 from collections import Counter
 from pathlib import Path
 from datetime import datetime, timedelta
+from typing import Callable
 
-import anthropic
 from dotenv import load_dotenv
 
+from corpus import REPORTS_CORPUS, CorpusReader, CorpusWriter, GenerationJournal, journal_path, record_sha256
+from llm import DEFAULT_WORKERS, BatchRequestFailed, LLMClient, map_ordered, workers_from_argv
+from response_cache import CacheMiss, cache_from_argv
+
 load_dotenv()
 
 random.seed(42)
 
+# Seed of the per-branch random streams (see branch_rng)
+SEED = 42
+
 # Date range for reports
 START_DATE = datetime(2025, 8, 1)
 END_DATE = datetime(2026, 1, 31)
 
+# Response limit of a report call (part of the response cache key)
+MAX_TOKENS = 250
+
 # Manager personalities
 PERSONALITIES = ["casual", "terse", "formal", "verbose", "upbeat", "dry_humor", "anxious"]
 
@@ -32,6 +90,20 @@ def get_personality(manager_name: str) -> str:
     return PERSONALITIES[hash_val % len(PERSONALITIES)]
 
 
+def branch_rng(branch_id: str, purpose: str) -> random.Random:
+    """Random stream for one kind of decision about one branch.
+
+    Independent of every other branch and of call order, like
+    deterministic_hash in quarterly_reports.py.
+    """
+    seed = int(hashlib.sha256(f"{SEED}-{purpose}-{branch_id}".encode()).hexdigest(), 16)
+    return random.Random(seed)
+
+
+def report_id(branch_id: str, date: datetime) -> str:
+    return f"report-{branch_id}-{date.strftime('%Y-%m-%d')}"
+
+
 def get_season_context(date: datetime) -> str:
     """Get seasonal context for a date."""
     month = date.month
@@ -178,15 +250,59 @@ From: {manager["email"]}
     return prompt
 
 
+def parse_report(raw_output: str, branch: dict) -> tuple[str, str]:
+    """(subject, body) of a report email as Claude wrote it."""
+    lines = raw_output.strip().split('\n')
+    subject = ""
+    body_lines = []
+    in_header = True
+
+    for line in lines:
+        if in_header:
+            if line.lower().startswith('subject:'):
+                subject = line.split(':', 1)[1].strip()
+            elif line.lower().startswith('from:'):
+                continue  # Skip the from line
+            elif line.strip() == '':
+                in_header = False
+            else:
+                # Start of body without blank line separator
+                in_header = False
+                body_lines.append(line)
+        else:
+            body_lines.append(line)
+
+    body = '\n'.join(body_lines).strip()
+
+    # Fallback subject if not found
+    if not subject:
+        subject = f"Weekly update - {branch['name'].replace('BeanStack ', '')}"
+
+    return subject, body
+
+
+def placeholder_report(branch: dict, manager: dict) -> tuple[str, str]:
+    """(subject, body) standing in for a report the LLM failed to write."""
+    subject = f"Weekly update - {branch['name'].replace('BeanStack ', '')}"
+    text = f"Weekly update from {branch['name']}. Operations normal this week. - {manager['name'].split()[0]}"
+    return subject, text
+
 
 class ReportGenerator:
-    def __init__(self, branches: list[dict], staff: list[dict], narratives: dict):
+    def __init__(
+        self,
+        branches: list[dict],
+        staff: list[dict],
+        narratives: dict,
+        journal: GenerationJournal | None = None,
+        llm: LLMClient | None = None,
+    ):
         self.branches = {b["id"]: b for b in branches}
         self.staff_by_branch = self._group_staff_by_branch(staff)
         self.managers_by_branch = self._get_managers(staff)
         self.narratives = narratives
-        self.client = anthropic.Anthropic()
-        self.report_counter = 0
+        self.llm = llm or LLMClient()
+        self.journal = journal
 
     def _group_staff_by_branch(self, staff: list[dict]) -> dict:
         grouped = {}
@@ -211,58 +327,22 @@ class ReportGenerator:
         staff: list[dict],
         narrative: dict,
         date: datetime,
-        previous_reports: list[str]
+        previous_reports: list[str],
+        include_narrative: bool
     ) -> tuple[str, str]:
         """Generate report text using Claude Haiku. Returns (subject, body)."""
         print(f"Generating report for {branch['name']} on {date.strftime('%Y-%m-%d')}...")
-        # 10% chance to include narrative element
-        
-        include_narrative = random.random() < 0.10
 
         prompt = build_prompt(
             branch, manager, staff, narrative,
             date, previous_reports, include_narrative
         )
 
-        message = self.client.messages.create(
-            model="claude-haiku-4-5-20251001",
-            max_tokens=250,
-            messages=[{"role": "user", "content": prompt}]
-        )
-
-        raw_output = message.content[0].text
-
-        # Parse subject and body from output
-        lines = raw_output.strip().split('\n')
-        subject = ""
-        body_lines = []
-        in_header = True
-
-        for line in lines:
-            if in_header:
-                if line.lower().startswith('subject:'):
-                    subject = line.split(':', 1)[1].strip()
-                elif line.lower().startswith('from:'):
-                    continue  # Skip the from line
-                elif line.strip() == '':
-                    in_header = False
-                else:
-                    # Start of body without blank line separator
-                    in_header = False
-                    body_lines.append(line)
-            else:
-                body_lines.append(line)
-
-        body = '\n'.join(body_lines).strip()
-
-        # Fallback subject if not found
-        if not subject:
-            subject = f"Weekly update - {branch['name'].replace('BeanStack ', '')}"
-
-        return subject, body
+        return parse_report(self.llm.complete(prompt, max_tokens=MAX_TOKENS), branch)
 
     def _build_report_dates(self, branch: dict, manager: dict) -> list[datetime]:
         """Build a sorted list of report dates for a branch."""
+        rng = branch_rng(branch["id"], "dates")
         start, end = get_report_date_range(branch, manager)
         if start >= end:
             return []
@@ -276,8 +356,8 @@ class ReportGenerator:
                 dates.append(report_date)
 
                 # 8% chance of extra mid-week report
-                if random.random() < 0.08:
-                    mid_week = report_date - timedelta(days=random.randint(2, 4))
+                if rng.random() < 0.08:
+                    mid_week = report_date - timedelta(days=rng.randint(2, 4))
                     if mid_week >= start:
                         dates.append(mid_week)
 
@@ -286,77 +366,219 @@ class ReportGenerator:
         dates.sort()
         return dates
 
-    def generate_all_reports(self) -> list[dict]:
-        """Generate all weekly reports, one branch at a time."""
-        all_reports = []
-        total_generated = 0
-
-        # Count total for progress reporting
-        total_expected = sum(
-            len(self._build_report_dates(branch, self.managers_by_branch[bid]))
-            for bid, branch in self.branches.items()
-            if bid in self.managers_by_branch
-        )
-
-        # Reset seed so date generation is deterministic on second pass
-        random.seed(42)
+    def plan_reports(self) -> list[tuple[str, list[dict]]]:
+        """Make every random decision for every report, from per-branch streams.
 
+        Returns (branch_id, plans) per branch; each plan has the report's id,
+        date, timestamp and whether it includes the branch narrative.
+        """
+        plans = []
         for branch_id, branch in self.branches.items():
             manager = self.managers_by_branch.get(branch_id)
             if not manager:
                 continue
 
-            staff = self.staff_by_branch.get(branch_id, [])
-            narrative = self.narratives.get(branch_id, {})
             report_dates = self._build_report_dates(branch, manager)
-
             if not report_dates:
                 continue
 
-            print(f"\n--- {branch['name']} ({branch_id}): {len(report_dates)} reports ---")
-
-            previous_reports: list[str] = []
-
+            narrative_rng = branch_rng(branch_id, "narrative")
+            time_rng = branch_rng(branch_id, "timestamp")
+            branch_plans = []
             for date in report_dates:
+                # 10% chance to include narrative element
+                include_narrative = narrative_rng.random() < 0.10
+                hour = time_rng.randint(7, 20)
+                minute = time_rng.randint(0, 59)
+                branch_plans.append({
+                    "id": report_id(branch_id, date),
+                    "date": date,
+                    "timestamp": date.replace(hour=hour, minute=minute),
+                    "include_narrative": include_narrative,
+                })
+            plans.append((branch_id, branch_plans))
+        return plans
+
+    def generate_branch_reports(
+        self, branch_id: str, plans: list[dict], on_report: Callable[[dict], None] | None = None
+    ) -> list[dict]:
+        """Generate one branch's reports in date order (each sees the previous two).
+
+        `on_report(report)` runs on each report as soon as it is done.
+        """
+        branch = self.branches[branch_id]
+        manager = self.managers_by_branch[branch_id]
+        staff = self.staff_by_branch.get(branch_id, [])
+        narrative = self.narratives.get(branch_id, {})
+
+        print(f"\n--- {branch['name']} ({branch_id}): {len(plans)} reports ---")
+
+        reports = []
+        previous_reports: list[str] = []
+
+        for plan in plans:
+            date = plan["date"]
+            done = self.journal.get(plan["id"]) if self.journal is not None else None
+            placeholder = False
+            if done is not None:
+                # Generated by an earlier, interrupted run
+                subject, text = done["subject"], done["text"]
+            else:
                 try:
                     subject, text = self.generate_report_with_llm(
                         branch, manager, staff, narrative,
-                        date, previous_reports
+                        date, previous_reports, plan["include_narrative"]
                     )
+                except CacheMiss:
+                    # Replay-only: a placeholder report would hide the changed prompt
+                    raise
                 except Exception as e:
                     print(f"  Error generating report for {branch_id} on {date}: {e}")
-                    subject = f"Weekly update - {branch['name'].replace('BeanStack ', '')}"
-                    text = f"Weekly update from {branch['name']}. Operations normal this week. - {manager['name'].split()[0]}"
-
-                # Keep last 2 reports for continuity
-                previous_reports.append(text)
-                if len(previous_reports) > 2:
-                    previous_reports.pop(0)
-
-                self.report_counter += 1
-
-                hour = random.randint(7, 20)
-                minute = random.randint(0, 59)
-                timestamp = date.replace(hour=hour, minute=minute)
-
-                report = {
-                    "id": f"report-{self.report_counter:05d}",
-                    "branch_id": branch_id,
-                    "branch_name": branch["name"],
-                    "sender_email": manager["email"],
-                    "subject": subject,
-                    "text": text,
-                    "date": date.strftime("%Y-%m-%d"),
-                    "timestamp": timestamp.strftime("%Y-%m-%dT%H:%M:%SZ")
-                }
-
-                save_report_to_file(report)
+                    subject, text = placeholder_report(branch, manager)
+                    placeholder = True
+
+            report = self._finish_report(
+                branch_id, plan, subject, text, previous_reports, journaled=done is not None, placeholder=placeholder
+            )
+            if on_report is not None:
+                on_report(report)
+            reports.append(report)
+
+        return reports
+
+    def _finish_report(
+        self,
+        branch_id: str,
+        plan: dict,
+        subject: str,
+        text: str,
+        previous_reports: list[str],
+        journaled: bool,
+        placeholder: bool = False,
+    ) -> dict:
+        """The report record; also keeps `previous_reports` current and journals new reports.
+
+        A placeholder report isn't journaled, so a resumed run asks the LLM again.
+        """
+        branch = self.branches[branch_id]
+        manager = self.managers_by_branch[branch_id]
+
+        # Keep last 2 reports for continuity
+        previous_reports.append(text)
+        if len(previous_reports) > 2:
+            previous_reports.pop(0)
+
+        report = {
+            "id": plan["id"],
+            "branch_id": branch_id,
+            "branch_name": branch["name"],
+            "sender_email": manager["email"],
+            "subject": subject,
+            "text": text,
+            "date": plan["date"].strftime("%Y-%m-%d"),
+            "timestamp": plan["timestamp"].strftime("%Y-%m-%dT%H:%M:%SZ")
+        }
+        if not journaled and not placeholder and self.journal is not None:
+            self.journal.record(report)
+        return report
+
+    def generate_reports_in_waves(
+        self, plans: list[tuple[str, list[dict]]], on_report: Callable[[dict], None] | None = None
+    ) -> list[list[dict]]:
+        """Generate every branch's reports one generation step at a time, each step as Message Batches.
+
+        Step k is the k-th report of every branch: it only needs the reports
+        of earlier steps as previous_reports, so its prompts are all built
+        up front and submitted together. Returns each branch's reports, in
+        `plans` order; `on_report(report)` runs on each report as soon as its
+        step is done.
+        """
+        results = [[] for _ in plans]
+        previous = [[] for _ in plans]
+        steps = max((len(branch_plans) for _, branch_plans in plans), default=0)
+
+        for step in range(steps):
+            pending = []   # (branch index, plan, prompt)
+            journaled = 0
+            for n, (branch_id, branch_plans) in enumerate(plans):
+                if step >= len(branch_plans):
+                    continue
+                plan = branch_plans[step]
+                done = self.journal.get(plan["id"]) if self.journal is not None else None
+                if done is not None:
+                    # Generated by an earlier, interrupted run
+                    report = self._finish_report(
+                        branch_id, plan, done["subject"], done["text"], previous[n], journaled=True
+                    )
+                    if on_report is not None:
+                        on_report(report)
+                    results[n].append(report)
+                    journaled += 1
+                    continue
+                prompt = build_prompt(
+                    self.branches[branch_id], self.managers_by_branch[branch_id],
+                    self.staff_by_branch.get(branch_id, []), self.narratives.get(branch_id, {}),
+                    plan["date"], previous[n], plan["include_narrative"]
+                )
+                pending.append((n, plan, prompt))
+
+            print(f"\n--- Step {step + 1}/{steps}: {len(pending)} reports to generate, {journaled} from the journal ---")
+            if not pending:
+                continue
+            responses = self.llm.complete_batch([(prompt, MAX_TOKENS) for _, _, prompt in pending])
+            for (n, plan, _), response in zip(pending, responses):
+                branch_id = plans[n][0]
+                branch = self.branches[branch_id]
+                placeholder = isinstance(response, BatchRequestFailed)
+                if placeholder:
+                    print(f"  Error generating report for {branch_id} on {plan['date']}: {response}")
+                    subject, text = placeholder_report(branch, self.managers_by_branch[branch_id])
+                else:
+                    subject, text = parse_report(response, branch)
+                report = self._finish_report(
+                    branch_id, plan, subject, text, previous[n], journaled=False, placeholder=placeholder
+                )
+                if on_report is not None:
+                    on_report(report)
+                results[n].append(report)
+
+        return results
+
+    def generate_all_reports(
+        self, corpus: CorpusWriter, stream=None, workers: int = DEFAULT_WORKERS, batch: bool = False
+    ) -> list[dict]:
+        """Generate all weekly reports, `workers` branches at a time (or in batched
+        steps), writing each to `corpus` in branch order.
+
+        When streaming, each report goes to `stream` for indexing as soon as
+        it is generated, from the worker that generated it, rather than when
+        its branch comes up for the corpus (which waits for every branch
+        before it).
+        """
+        all_reports = []
+
+        def submit(report: dict) -> None:
+            stream.submit(report, record_sha256(report))
+
+        on_report = submit if stream is not None else None
+
+        plans = self.plan_reports()
+        total_expected = sum(len(branch_plans) for _, branch_plans in plans)
+        if batch:
+            print(f"Generating {total_expected} reports for {len(plans)} branches (message batches per step)")
+            results = self.generate_reports_in_waves(plans, on_report)
+        else:
+            print(f"Generating {total_expected} reports for {len(plans)} branches ({workers} in parallel)")
+            results = map_ordered(lambda plan: self.generate_branch_reports(*plan, on_report), plans, workers)
+        for branch_reports in results:
+            for report in branch_reports:
+                corpus.write(report)
                 all_reports.append(report)
-                total_generated += 1
 
-                if total_generated % 100 == 0:
-                    print(f"  Progress: {total_generated}/{total_expected} reports...")
+                if len(all_reports) % 100 == 0:
+                    print(f"  Progress: {len(all_reports)}/{total_expected} reports...")
 
+        print(f"  LLM: {self.llm.stats()}")
         return all_reports
 
 
@@ -388,7 +610,33 @@ Branch: {report["branch_name"]}
     return str(file_path)
 
 
+def export_files(base_path: str = "data/generated/reports") -> None:
+    """Write the corpus out as the per-report .txt tree plus its index.json."""
+    reader = CorpusReader(REPORTS_CORPUS)
+    index = []
+    for report in reader.iter_records():
+        file_path = save_report_to_file(report, base_path)
+        index.append({
+            "id": report["id"],
+            "branch_id": report["branch_id"],
+            "date": report["date"],
+            "file_path": file_path,
+        })
+
+    index_path = f"{base_path}/index.json"
+    with open(index_path, "w") as f:
+        json.dump(index, f, indent=2)
+
+    print(f"Exported {len(index)} weekly reports")
+    print(f"Saved to {base_path}/<branch-id>/<year>/<month>/weekly-report-YYYY-MM-DD.txt")
+    print(f"Index saved to {index_path}")
+
+
 def main():
+    if "--export-files" in sys.argv:
+        export_files()
+        return
+
     # Load data
     with open("data/generated/branches.json", "r") as f:
         branches = json.load(f)
@@ -401,39 +649,42 @@ def main():
 
     # Optional: limit to specific branch(es)
     # Usage: python weekly_reports.py branch-001 branch-002
-    if len(sys.argv) > 1:
-        branch_ids = sys.argv[1:]
+    branch_ids = [a for a in sys.argv[1:] if a.startswith("branch-")]
+    if branch_ids:
         branches = [b for b in branches if b["id"] in branch_ids]
         print(f"Limiting to branches: {branch_ids}")
 
-    # Generate reports (saves to disk immediately)
-    generator = ReportGenerator(branches, staff, narratives)
-    reports = generator.generate_all_reports()
-
-    # Build index for reference
-    base_path = "data/generated/reports"
-    index = []
-
-    for report in reports:
-        date = report["date"]
-        year = date[:4]
-        month = date[5:7]
-        file_path = f"{base_path}/{report['branch_id']}/{year}/{month}/weekly-report-{date}.txt"
-        index.append({
-            "id": report["id"],
-            "branch_id": report["branch_id"],
-            "date": report["date"],
-            "file_path": file_path
-        })
-
-    # Save index
-    index_path = f"{base_path}/index.json"
-    with open(index_path, "w") as f:
-        json.dump(index, f, indent=2)
+    stream = None
+    if "--stream" in sys.argv:
+        # Streaming indexes through the es_setup ingest code (needs ES credentials)
+        sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "es_setup"))
+        from stream_ingest import stream_from_argv
+        stream = stream_from_argv("reports", sys.argv)
+
+    journal = GenerationJournal(journal_path(REPORTS_CORPUS), fresh="--fresh" in sys.argv)
+    if len(journal):
+        print(f"Resuming: {len(journal)} reports already generated ({journal.path.name})")
+
+    # Generate reports (streamed into the corpus as they're written)
+    cache = cache_from_argv(sys.argv)
+    generator = ReportGenerator(branches, staff, narratives, journal, LLMClient(cache=cache))
+    try:
+        with CorpusWriter(REPORTS_CORPUS, key_fields=["date"]) as corpus:
+            reports = generator.generate_all_reports(corpus, stream, workers_from_argv(sys.argv), "--batch" in sys.argv)
+            if branch_ids:
+                kept = corpus.keep_other_branches(set(branch_ids))
+                print(f"Kept {kept} reports of other branches from the previous corpus")
+        journal.finish({report["id"] for report in reports})
+    finally:
+        journal.close()
+        cache.close()
+        if stream is not None:
+            # Whatever was generated is indexed, even if the run failed
+            stream.close()
+            stream.print_stats()
 
     print(f"\nGenerated {len(reports)} weekly reports")
-    print(f"Saved to {base_path}/<branch-id>/<year>/<month>/weekly-report-YYYY-MM-DD.txt")
-    print(f"Index saved to {index_path}")
+    print(f"Saved to {REPORTS_CORPUS} ({len(corpus.shards)} shards)")
 
     # Stats
     months = Counter(r["date"][:7] for r in reports)
@@ -10,16 +10,16 @@ Env vars:
   SMTP_FROM               - Sender email address
   SMTP_USER               - SMTP username
   SMTP_PASSWORD            - SMTP password
+
+See kibana_client.py for the optional retry, gzip and timing env vars.
 """
 
 import os
 
-import requests
-
-from kibana_client import EMAIL_CONNECTOR_ID, get_headers, get_kibana_base_url
+from kibana_client import EMAIL_CONNECTOR_ID, KibanaClient, get_kibana_client
 
 
-def enable_features(base_url: str, headers: dict) -> None:
+def enable_features(client: KibanaClient) -> None:
     """Enable Agent Builder, Workflows UI, and set default AI connector."""
     payload = {
         "changes": {
@@ -28,7 +28,7 @@ def enable_features(base_url: str, headers: dict) -> None:
             "genAiSettings:defaultAIConnector": "Anthropic-Claude-Sonnet-4-5",
         }
     }
-    resp = requests.post(f"{base_url}/api/kibana/settings", headers=headers, json=payload)
+    resp = client.post("/api/kibana/settings", json=payload)
     if resp.status_code == 200:
         print("  Agent Builder enabled.")
         print("  Workflows UI enabled.")
@@ -65,7 +65,7 @@ def _build_email_connector_config() -> dict | None:
     }
 
 
-def setup_email_connector(base_url: str, headers: dict) -> None:
+def setup_email_connector(client: KibanaClient) -> None:
     """Create or update the BeanStack email connector."""
     connector_config = _build_email_connector_config()
     if connector_config is None:
@@ -73,16 +73,16 @@ def setup_email_connector(base_url: str, headers: dict) -> None:
         print("  Skipping email connector setup. Set these env vars and re-run.")
         return
 
-    url = f"{base_url}/api/actions/connector/{EMAIL_CONNECTOR_ID}"
-    resp = requests.get(url, headers=headers)
+    path = f"/api/actions/connector/{EMAIL_CONNECTOR_ID}"
+    resp = client.get(path)
 
     if resp.status_code == 200:
         print(f"  Email connector '{EMAIL_CONNECTOR_ID}' already exists, updating...")
-        resp = requests.put(url, headers=headers, json=connector_config)
+        resp = client.put(path, json=connector_config)
     else:
         print(f"  Creating email connector '{EMAIL_CONNECTOR_ID}'...")
         connector_config["connector_type_id"] = ".email"
-        resp = requests.post(url, headers=headers, json=connector_config)
+        resp = client.post(path, json=connector_config)
 
     if resp.status_code in (200, 201):
         smtp_from = connector_config["config"]["from"]
@@ -92,14 +92,13 @@ def setup_email_connector(base_url: str, headers: dict) -> None:
 
 
 def main():
-    base_url = get_kibana_base_url()
-    headers = get_headers()
+    client = get_kibana_client()
 
     print("Step 1: Enabling features...")
-    enable_features(base_url, headers)
+    enable_features(client)
 
     print("\nStep 2: Setting up email connector...")
-    setup_email_connector(base_url, headers)
+    setup_email_connector(client)
 
     print("\nDone!")
 
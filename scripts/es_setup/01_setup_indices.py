@@ -2,6 +2,15 @@
 Set up Elasticsearch indices for BeanStack coffee chain data.
 Creates indices for branches, staff, weekly reports, and financial reports.
 Reports index includes a semantic_text field for Cohere embed-english-v4 embeddings.
+
+Each index name is an alias over a versioned physical index
+(beanstack-reports -> beanstack-reports-v1, see index_versions.py).
+--force points the alias at a new, empty version and deletes the old one;
+to rebuild without the index ever being empty, use 05_rebuild_index.py.
+
+--precomputed-embeddings creates the reports and financial indices with the
+legacy semantic_text format, so the ingest scripts can send cached vectors
+(--precomputed) instead of having Elasticsearch call the inference endpoint.
 """
 
 import json
@@ -20,6 +29,7 @@ from es_client import (
     get_es_client,
     print_connection_info,
 )
+from index_versions import create_version, gc_versions, list_versions, live_index, swap_alias
 
 MAPPINGS_DIR = Path(__file__).parent / "mappings"
 
@@ -62,19 +72,42 @@ def load_mapping(filename: str) -> dict:
     return json.loads(raw)
 
 
-def create_index(es: Elasticsearch, name: str, mappings: dict, force: bool = False) -> None:
-    """Create an index. Skips if it already exists unless force=True."""
-    if es.indices.exists(index=name):
-        if force:
-            print(f"  Index '{name}' exists, deleting (--force)...")
-            es.indices.delete(index=name)
-        else:
+def index_settings(name: str, precomputed: bool = False) -> dict | None:
+    """Index settings for `name`; precomputed switches semantic_text to the legacy format."""
+    if precomputed and name in (INDEX_REPORTS, INDEX_FINANCIAL):
+        return {"index.mapping.semantic_text.use_legacy_format": True}
+    return None
+
+
+def create_index(
+    es: Elasticsearch, name: str, mappings: dict, force: bool = False, settings: dict | None = None,
+) -> None:
+    """Create a versioned index behind alias `name`. Skips if it already exists unless force=True."""
+    live = live_index(es, name)
+    if live is not None:
+        if not force:
             print(f"  Index '{name}' already exists, skipping. Use --force to recreate.")
             return
+        print(f"  Index '{name}' exists, replacing it with an empty version (--force)...")
 
     print(f"  Creating index '{name}'...")
-    es.indices.create(index=name, mappings=mappings)
-    print(f"  Done: Index '{name}' created.")
+    physical = create_version(es, name, mappings, settings)
+    swap_alias(es, name, physical)
+    gc_versions(es, name, keep=0)
+    print(f"  Done: Index '{name}' created ({physical}).")
+
+
+def delete_index(es: Elasticsearch, name: str) -> None:
+    """Delete alias `name` and every version behind it (or a pre-versioning plain index)."""
+    doomed = [physical for _, physical in list_versions(es, name)]
+    if live_index(es, name) == name:
+        doomed.append(name)
+    if not doomed:
+        print(f"  '{name}' does not exist, skipping.")
+        return
+    for physical in doomed:
+        es.indices.delete(index=physical)
+    print(f"  Done: Deleted '{name}' ({', '.join(doomed)})")
 
 
 ALL_INDICES = {
@@ -88,6 +121,7 @@ ALL_INDICES = {
 def main():
     delete_only = "--delete" in sys.argv
     force = "--force" in sys.argv
+    precomputed = "--precomputed-embeddings" in sys.argv
     requested = [a for a in sys.argv[1:] if not a.startswith("--")]
     if requested:
         indices = {k: v for k, v in ALL_INDICES.items() if k in requested}
@@ -106,11 +140,7 @@ def main():
     if delete_only:
         print("Deleting indices...")
         for name, (idx, _) in indices.items():
-            if es.indices.exists(index=idx):
-                es.indices.delete(index=idx)
-                print(f"  Done: Deleted '{idx}'")
-            else:
-                print(f"  '{idx}' does not exist, skipping.")
+            delete_index(es, idx)
         return
 
     if not requested:
@@ -121,7 +151,7 @@ def main():
     print("Creating indices...")
     for name, (idx, mapping_file) in indices.items():
         mappings = load_mapping(mapping_file)
-        create_index(es, idx, mappings, force=force)
+        create_index(es, idx, mappings, force=force, settings=index_settings(idx, precomputed))
 
     print("\nDone! Indices ready:")
     for name, (idx, _) in indices.items():
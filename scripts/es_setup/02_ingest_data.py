@@ -1,22 +1,62 @@
 """
 Ingest branches and staff data into Elasticsearch.
-Reads from data/generated/ JSON files and bulk-indexes into ES.
+Reads from data/generated/ JSON files and syncs them into ES.
+
+The sync is change-aware: the current documents are read back from the
+index (a few hundred, so this is cheap) and only new or changed ones are
+indexed, and ones that disappeared from the JSON are deleted. Re-running
+over unchanged data sends nothing.
+
+The branch region enrich policy (used by ES|QL ENRICH in
+revenue_by_region) is only rebuilt when a branch's region, city or state
+changed, or a branch was added or removed. A rebuild creates and executes
+a new policy version and switches the agent's tools to it before the old
+one is deleted (see enrich_policies.py), so the tool never sees a missing
+policy.
+
+Usage:
+    uv run python scripts/es_setup/02_ingest_data.py [branches] [staff] [--enrich]
+
+--enrich rebuilds the enrich policy even if no region data changed.
 """
 
 import json
 import sys
+from dataclasses import dataclass, field
 
-from elasticsearch import Elasticsearch
-from elasticsearch.helpers import bulk
+import requests
+from elasticsearch import Elasticsearch, NotFoundError
+from elasticsearch.helpers import bulk, scan
 
+from enrich_policies import create_policy_version, gc_policies, live_policy, point_tools_at_policy
 from es_client import (
     DATA_DIR,
     ENRICH_BRANCH_REGION,
     INDEX_BRANCHES,
     INDEX_STAFF,
+    bump_data_version,
     get_es_client,
     print_connection_info,
 )
+from kibana_client import get_kibana_client
+from tools import ALL_TOOLS
+
+# Branch fields copied into documents by the enrich policy
+ENRICH_FIELDS = ["region", "city", "state"]
+
+
+@dataclass
+class SyncStats:
+    added: int = 0
+    updated: int = 0
+    deleted: int = 0
+    unchanged: int = 0
+    errors: int = 0
+    changed_fields: set[str] = field(default_factory=set)   # fields that differ in any added/updated/deleted doc
+
+    @property
+    def changed(self) -> int:
+        return self.added + self.updated + self.deleted
 
 
 def load_json(filename: str) -> list[dict]:
@@ -26,45 +66,96 @@ def load_json(filename: str) -> list[dict]:
         return json.load(f)
 
 
-def ingest_branches(es: Elasticsearch) -> None:
-    """Bulk-index branches into ES."""
-    branches = load_json("branches.json")
-
-    def gen_actions():
-        for branch in branches:
-            doc = dict(branch)
-            if not doc.get("closed_date"):
-                doc.pop("closed_date", None)
-            yield {
-                "_index": INDEX_BRANCHES,
-                "_id": doc["id"],
-                "_source": doc,
-            }
-
-    success, errors = bulk(es, gen_actions())
-    print(f"  Branches: {success} indexed, {len(errors)} errors")
-    if errors:
-        for e in errors[:5]:
-            print(f"    {e}")
-
-
-def ingest_staff(es: Elasticsearch) -> None:
-    """Bulk-index staff into ES."""
-    staff = load_json("staff.json")
-
-    def gen_actions():
-        for person in staff:
-            yield {
-                "_index": INDEX_STAFF,
-                "_id": person["id"],
-                "_source": person,
-            }
-
-    success, errors = bulk(es, gen_actions())
-    print(f"  Staff: {success} indexed, {len(errors)} errors")
-    if errors:
+def branch_docs() -> list[dict]:
+    docs = []
+    for branch in load_json("branches.json"):
+        doc = dict(branch)
+        if not doc.get("closed_date"):
+            doc.pop("closed_date", None)
+        docs.append(doc)
+    return docs
+
+
+def staff_docs() -> list[dict]:
+    return load_json("staff.json")
+
+
+def existing_docs(es: Elasticsearch, index: str) -> dict[str, dict]:
+    """id -> _source of every document currently in `index`."""
+    try:
+        return {hit["_id"]: hit["_source"] for hit in scan(es, index=index, query={"query": {"match_all": {}}})}
+    except NotFoundError:
+        return {}
+
+
+def sync_index(es: Elasticsearch, index: str, docs: list[dict], label: str) -> SyncStats:
+    """Index new and changed docs, delete ones no longer in `docs`, leave the rest alone."""
+    current = existing_docs(es, index)
+    stats = SyncStats()
+    actions = []
+    for doc in docs:
+        old = current.pop(doc["id"], None)
+        if old == doc:
+            stats.unchanged += 1
+            continue
+        if old is None:
+            stats.added += 1
+            stats.changed_fields.update(doc)
+        else:
+            stats.updated += 1
+            stats.changed_fields.update(k for k in doc.keys() | old.keys() if doc.get(k) != old.get(k))
+        actions.append({"_index": index, "_id": doc["id"], "_source": doc})
+    for doc_id, old in current.items():
+        stats.deleted += 1
+        stats.changed_fields.update(old)
+        actions.append({"_op_type": "delete", "_index": index, "_id": doc_id})
+
+    if actions:
+        _, errors = bulk(es, actions, raise_on_error=False)
+        stats.errors = len(errors)
         for e in errors[:5]:
             print(f"    {e}")
+    print(f"  {label}: {stats.added} added, {stats.updated} updated, {stats.deleted} deleted, "
+          f"{stats.unchanged} unchanged, {stats.errors} errors")
+    return stats
+
+
+def ingest_branches(es: Elasticsearch, index: str = INDEX_BRANCHES) -> SyncStats:
+    """Sync branches.json into ES."""
+    return sync_index(es, index, branch_docs(), "Branches")
+
+
+def ingest_staff(es: Elasticsearch, index: str = INDEX_STAFF) -> SyncStats:
+    """Sync staff.json into ES."""
+    return sync_index(es, index, staff_docs(), "Staff")
+
+
+def setup_enrich_policy(es: Elasticsearch) -> str:
+    """Create and execute a new version of the branch region enrich policy, then swap it in.
+
+    The agent's ES|QL tools are pointed at the new version before older
+    versions are deleted. If Kibana can't be reached, the older versions
+    are kept (the tools still use one) until 11_setup_agent.py switches them.
+    """
+    print(f"\nSetting up enrich policy '{ENRICH_BRANCH_REGION}'...")
+    policy = create_policy_version(
+        es, ENRICH_BRANCH_REGION,
+        {"indices": INDEX_BRANCHES, "match_field": "id", "enrich_fields": ENRICH_FIELDS},
+    )
+    print(f"  Enrich policy '{policy}' created and executed.")
+    try:
+        with get_kibana_client() as kibana:
+            switched = point_tools_at_policy(kibana, ALL_TOOLS, ENRICH_BRANCH_REGION, policy)
+    except (ValueError, RuntimeError, requests.RequestException) as e:
+        print(f"  Could not switch the agent's tools to it ({e}).")
+        print(f"  Older policy versions kept; run 11_setup_agent.py to switch.")
+        return policy
+    if switched:
+        print(f"  Switched tools: {', '.join(switched)}")
+    deleted = gc_policies(es, ENRICH_BRANCH_REGION, keep=policy)
+    if deleted:
+        print(f"  Deleted old policies: {', '.join(deleted)}")
+    return policy
 
 
 ALL_INGESTORS = {
@@ -89,35 +180,37 @@ def main():
     print_connection_info(es)
     print()
 
+    results = {}
     for name, (index_name, ingest_fn) in ingestors.items():
-        print(f"Ingesting {name}...")
-        ingest_fn(es)
+        print(f"Syncing {name}...")
+        results[name] = ingest_fn(es)
 
-    indices = ",".join(idx for idx, _ in ingestors.values())
-    es.indices.refresh(index=indices)
+    if any(stats.changed for stats in results.values()):
+        indices = ",".join(idx for idx, _ in ingestors.values())
+        es.indices.refresh(index=indices)
     print(f"\nIndex counts:")
     for name, (index_name, _) in ingestors.items():
         count = es.count(index=index_name)["count"]
         print(f"  {index_name}: {count}")
 
-    # Create enrich policy for branch region lookups (used by ES|QL tools)
+    # Rebuild the enrich policy for branch region lookups (used by ES|QL tools)
+    # only when the data it copies changed
+    rebuilt = False
     if "branches" in ingestors:
-        print(f"\nSetting up enrich policy '{ENRICH_BRANCH_REGION}'...")
-        try:
-            es.enrich.delete_policy(name=ENRICH_BRANCH_REGION)
-            print(f"  Deleted existing policy.")
-        except Exception:
-            pass
-        es.enrich.put_policy(
-            name=ENRICH_BRANCH_REGION,
-            match={
-                "indices": INDEX_BRANCHES,
-                "match_field": "id",
-                "enrich_fields": ["region", "city", "state"],
-            },
-        )
-        es.enrich.execute_policy(name=ENRICH_BRANCH_REGION)
-        print(f"  Enrich policy '{ENRICH_BRANCH_REGION}' created and executed.")
+        # Added or removed branches show up as a changed "id"
+        region_changed = results["branches"].changed_fields & {"id", *ENRICH_FIELDS}
+        live = live_policy(es, ENRICH_BRANCH_REGION)
+        if region_changed or live is None or "--enrich" in sys.argv:
+            setup_enrich_policy(es)
+            rebuilt = True
+        else:
+            print(f"\nEnrich policy '{live}' is current (no region changes).")
+
+    if rebuilt or any(stats.changed for stats in results.values()):
+        version = bump_data_version(es, source=",".join(ingestors))
+        print(f"\nData version bumped to {version} (Slack bot answer cache invalidated)")
+    else:
+        print("\nNothing changed.")
 
     print("\nDone!")
 
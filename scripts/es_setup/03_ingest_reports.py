@@ -1,39 +1,88 @@
 """
 Ingest weekly reports into Elasticsearch.
-Reads report text files referenced by data/generated/reports/index.json,
-parses email-style headers, and bulk-indexes into the beanstack-reports index.
+Streams reports out of the compressed corpus in data/generated/corpus/reports
+(see data_generation/corpus.py) and bulk-indexes them into the beanstack-reports
+index. Without a corpus, it reads the report text files referenced by
+data/generated/reports/index.json (weekly_reports.py --export-files) and
+parses their email-style headers instead.
 
 The text_embedding (semantic_text) field is populated by copying the text field,
-which triggers the Cohere inference endpoint configured on the index.
+which triggers the Cohere inference endpoint configured on the index. Several
+bulk requests run at once (--concurrency) and the batch size adapts to bulk
+latency and rejections, starting from --batch-size (see bulk_ingest.py).
+
+Ingest is incremental: corpus/reports.manifest.json records a content hash
+per indexed report, so only new or changed reports are sent and reports that
+left the corpus are deleted. --full re-sends everything (and still deletes
+reports that left the corpus).
+
+Progress is checkpointed after every bulk request, so rerunning after a crash
+or network drop continues where the last run stopped. Rate-limited and timed
+out documents are retried with backoff; documents that fail for good go to
+corpus/reports.dead-letter.ndjson, and --replay-dead-letter sends just those again.
+
+--bulk-load turns off refresh and replicas on the index while loading and
+restores them afterwards (--force-merge also merges it down to one segment);
+the throughput line says which mode a run used, for comparison.
+
+--precomputed embeds the text locally through a cached provider and sends
+the vectors along, so Elasticsearch doesn't call the inference endpoint
+(see embedding_cache.py).
 
 Usage:
-    uv run python scripts/es_setup/03_ingest_reports.py [--batch-size N]
+    uv run python scripts/es_setup/03_ingest_reports.py [--batch-size N] [--concurrency N] [--full]
+        [--bulk-load [--force-merge]] [--replay-dead-letter]
+        [--precomputed [--provider inference|fake] [--cache-dtype float32|int8]]
 """
 
 import json
 import re
 import sys
+from contextlib import nullcontext
+from itertools import islice
 from pathlib import Path
+from typing import Iterable, Iterator
 
 from elasticsearch import Elasticsearch
-from elasticsearch.helpers import bulk
 
+from bulk_ingest import (
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_CONCURRENCY,
+    BulkIndexer,
+    BulkStats,
+    DeadLetterQueue,
+    bulk_load_mode,
+    print_stats,
+)
 from es_client import (
     DATA_DIR,
     INDEX_REPORTS,
     PROJECT_ROOT,
+    bump_data_version,
     get_es_client,
     print_connection_info,
 )
+from embedding_cache import EMBED_BATCH_SIZE, CachedEmbedder, add_precomputed_embeddings, embedder_from_argv
+from ingest_manifest import IngestManifest, content_hash, index_uuid, manifest_hooks, replay_dead_letter
 
-INDEX_FILE = DATA_DIR / "reports" / "index.json"
+# The corpus format lives with the generators that write it
+sys.path.insert(0, str(PROJECT_ROOT / "scripts" / "data_generation"))
 
-DEFAULT_BATCH_SIZE = 50
+from corpus import REPORTS_CORPUS, CorpusReader
+
+INDEX_FILE = DATA_DIR / "reports" / "index.json"
+# Next to the corpus: data/generated/reports/ only exists after --export-files
+DEAD_LETTER_FILE = REPORTS_CORPUS.with_name(REPORTS_CORPUS.name + ".dead-letter.ndjson")
+MANIFEST_FILE = REPORTS_CORPUS.with_name(REPORTS_CORPUS.name + ".manifest.json")
 
 
 def parse_report_file(file_path: Path) -> dict:
     """Parse a report .txt file into structured fields."""
-    content = file_path.read_text(encoding="utf-8")
+    return parse_report_text(file_path.read_text(encoding="utf-8"))
+
+
+def parse_report_text(content: str) -> dict:
+    """Parse the email-style text of a report into structured fields."""
     lines = content.split("\n")
 
     headers = {}
@@ -67,86 +116,162 @@ def load_index() -> list[dict]:
         return json.load(f)
 
 
-def ingest_reports(es: Elasticsearch, batch_size: int) -> tuple[int, int]:
-    """Bulk-index reports in batches to avoid overwhelming the inference endpoint."""
-    index_entries = load_index()
-    total = len(index_entries)
-    print(f"  Found {total} reports in index.json")
-
-    success_total = 0
-    error_total = 0
-
-    for batch_start in range(0, total, batch_size):
-        batch_entries = index_entries[batch_start : batch_start + batch_size]
-        batch_num = batch_start // batch_size + 1
-        batch_count = len(batch_entries)
-
-        actions = []
-        for entry in batch_entries:
-            report_id = entry["id"]
-            branch_id = entry["branch_id"]
-            file_path = PROJECT_ROOT / entry["file_path"]
-
-            if not file_path.exists():
-                print(f"    WARNING: File not found: {file_path}")
-                continue
-
-            parsed = parse_report_file(file_path)
-            doc = {
-                "id": report_id,
-                "branch_id": branch_id,
-                "branch_name": parsed["branch_name"],
-                "sender_email": parsed["sender_email"],
-                "subject": parsed["subject"],
-                "text": parsed["text"],
-                "text_embedding": parsed["text"],
-                "date": parsed["date"],
-                "timestamp": f"{parsed['date']}T09:00:00Z" if parsed["date"] else None,
-            }
-            actions.append({
-                "_index": INDEX_REPORTS,
-                "_id": report_id,
-                "_source": doc,
-            })
+def open_corpus() -> CorpusReader | None:
+    """The compressed corpus, or None to fall back to the exported file tree."""
+    return CorpusReader(REPORTS_CORPUS) if CorpusReader.exists(REPORTS_CORPUS) else None
+
 
-        if not actions:
+def load_entries(corpus: CorpusReader | None) -> list[dict]:
+    """One entry per report: the corpus offset index, or index.json of the file tree."""
+    return corpus.records if corpus is not None else load_index()
+
+
+def plan_reports(index_entries: list[dict], manifest: IngestManifest) -> tuple[list[tuple[dict, str]], list[str]]:
+    """Split the corpus against the manifest. Returns ([(entry, sha256)] to send, ids to delete)."""
+    changed = []
+    for entry in index_entries:
+        if "sha256" in entry:
+            # Corpus entries carry the hash of their record: no need to read the shards
+            if not manifest.is_current(entry["id"], entry["sha256"]):
+                changed.append((entry, entry["sha256"]))
+            continue
+        file_path = PROJECT_ROOT / entry["file_path"]
+        if not file_path.exists():
+            print(f"    WARNING: File not found: {file_path}")
             continue
+        digest = content_hash(entry["branch_id"], file_path.read_bytes())
+        if not manifest.is_current(entry["id"], digest):
+            changed.append((entry, digest))
+    removed = manifest.stale_ids({entry["id"] for entry in index_entries})
+    return changed, removed
 
-        success, errors = bulk(es, actions, raise_on_error=False)
-        success_total += success
-        error_count = len(errors) if isinstance(errors, list) else 0
-        error_total += error_count
 
-        print(
-            f"  Batch {batch_num}: {success}/{batch_count} indexed"
-            + (f", {error_count} errors" if error_count else "")
-        )
-        if errors and isinstance(errors, list):
-            for e in errors[:3]:
-                print(f"    {e}")
+def build_report_doc(entry: dict) -> dict:
+    """Document for a corpus record, or for an index.json entry (parsing its file)."""
+    parsed = entry if "text" in entry else parse_report_file(PROJECT_ROOT / entry["file_path"])
+    return {
+        "id": entry["id"],
+        "branch_id": entry["branch_id"],
+        "branch_name": parsed["branch_name"],
+        "sender_email": parsed["sender_email"],
+        "subject": parsed["subject"],
+        "text": parsed["text"],
+        "text_embedding": parsed["text"],
+        "date": parsed["date"],
+        "timestamp": f"{parsed['date']}T09:00:00Z" if parsed["date"] else None,
+    }
 
-    return success_total, error_total
+
+def report_docs(changed: list[tuple[dict, str]], corpus: CorpusReader | None) -> Iterator[dict]:
+    """Documents for the changed entries, streamed out of the corpus frame by frame, or parsed from files."""
+    if corpus is None:
+        return (build_report_doc(entry) for entry, _ in changed)
+    return (build_report_doc(record) for record in corpus.iter_records({entry["id"] for entry, _ in changed}))
+
+
+def report_actions(
+    docs: Iterable[dict],
+    removed: list[str],
+    embedder: CachedEmbedder | None = None,
+    index: str = INDEX_REPORTS,
+):
+    """Yield a bulk action per document, building documents as the indexer asks for them."""
+    docs = iter(docs)
+    while chunk := list(islice(docs, EMBED_BATCH_SIZE)):
+        if embedder is not None:
+            add_precomputed_embeddings(chunk, ["text_embedding"], embedder)
+        for doc in chunk:
+            yield {
+                "_index": index,
+                "_id": doc["id"],
+                "_source": doc,
+            }
+    for report_id in removed:
+        yield {"_op_type": "delete", "_index": index, "_id": report_id}
+
+
+def ingest_reports(
+    es: Elasticsearch,
+    batch_size: int,
+    concurrency: int,
+    full: bool = False,
+    embedder: CachedEmbedder | None = None,
+    dead_letter: DeadLetterQueue | None = None,
+    bulk_load: bool = False,
+    force_merge: bool = False,
+    index: str = INDEX_REPORTS,
+) -> BulkStats:
+    """Bulk-index new and changed reports with a few requests in flight, sized to what inference keeps up with."""
+    corpus = open_corpus()
+    index_entries = load_entries(corpus)
+    source = f"corpus ({len(corpus.shards)} shards)" if corpus is not None else "index.json"
+    print(f"  Found {len(index_entries)} reports in {source}")
+
+    manifest = IngestManifest.load(MANIFEST_FILE, index_uuid(es, index), full=full)
+    changed, removed = plan_reports(index_entries, manifest)
+    print(f"  {len(changed)} new or changed, {len(removed)} removed, "
+          f"{len(index_entries) - len(changed)} unchanged")
+    if not changed and not removed:
+        return BulkStats()
+
+    digests = {entry["id"]: digest for entry, digest in changed}
+    hooks = manifest_hooks(manifest, digests, dead_letter)
+    indexer = BulkIndexer(es, concurrency=concurrency, batch_size=batch_size, **hooks)
+    load_mode = bulk_load_mode(es, index, force_merge) if bulk_load else nullcontext()
+    try:
+        with load_mode:
+            return indexer.run(report_actions(report_docs(changed, corpus), removed, embedder, index))
+    finally:
+        manifest.save()
 
 
 def main():
     batch_size = DEFAULT_BATCH_SIZE
+    concurrency = DEFAULT_CONCURRENCY
     for i, arg in enumerate(sys.argv):
         if arg == "--batch-size" and i + 1 < len(sys.argv):
             batch_size = int(sys.argv[i + 1])
+        elif arg == "--concurrency" and i + 1 < len(sys.argv):
+            concurrency = int(sys.argv[i + 1])
+    full = "--full" in sys.argv
+    replay = "--replay-dead-letter" in sys.argv
+    bulk_load = "--bulk-load" in sys.argv
+    force_merge = "--force-merge" in sys.argv
 
     print("Connecting to Elasticsearch...")
     es = get_es_client()
     print_connection_info(es)
     print()
 
-    print(f"Ingesting reports (batch size: {batch_size})...")
-    success, errors = ingest_reports(es, batch_size)
+    print(f"Ingesting reports (batch size: {batch_size}, concurrency: {concurrency}"
+          f"{', full' if full else ''})...")
+    dead_letter = DeadLetterQueue(DEAD_LETTER_FILE)
+    if replay:
+        stats = replay_dead_letter(
+            es, INDEX_REPORTS, MANIFEST_FILE, dead_letter, concurrency=concurrency, batch_size=batch_size,
+        )
+    else:
+        embedder = embedder_from_argv(es, sys.argv, INDEX_REPORTS)
+        stats = ingest_reports(
+            es, batch_size, concurrency, full, embedder, dead_letter, bulk_load, force_merge,
+        )
+        if embedder is not None:
+            print(f"  Embeddings: {embedder.hits} from cache, {embedder.misses} computed")
+            embedder.close()
+    if not stats.requests:
+        print("\nNothing changed since the last ingest.")
+        return
+    print_stats(stats, "bulk-load mode" if bulk_load and not replay else "default settings")
 
     es.indices.refresh(index=INDEX_REPORTS)
     count = es.count(index=INDEX_REPORTS)["count"]
     print(f"\nDone! {INDEX_REPORTS}: {count} documents indexed")
-    if errors:
-        print(f"  ({errors} errors occurred)")
+    if stats.failed:
+        print(f"  ({stats.failed} errors occurred; written to {DEAD_LETTER_FILE.relative_to(PROJECT_ROOT)}, "
+              f"retry them with --replay-dead-letter)")
+
+    version = bump_data_version(es, source="reports")
+    print(f"  Data version bumped to {version} (Slack bot answer cache invalidated)")
 
 
 if __name__ == "__main__":
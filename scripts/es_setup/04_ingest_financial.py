@@ -1,32 +1,64 @@
 """
 Ingest financial reports (quarterly/yearly) into Elasticsearch.
-Reads JSON report files referenced by data/generated/financial-reports/index.json
-and bulk-indexes into the beanstack-financial-reports index.
+Streams reports out of the compressed corpus in data/generated/corpus/financial
+and bulk-indexes into the beanstack-financial-reports index. Without a corpus,
+it reads the JSON report files referenced by
+data/generated/financial-reports/index.json (quarterly_reports.py --export-files).
 
 The *_embedding (semantic_text) fields are populated by copying the narrative text,
-which triggers the Cohere inference endpoint configured on the index.
+which triggers the Cohere inference endpoint configured on the index. Bulk
+requests run concurrently with adaptive batch sizes (see bulk_ingest.py).
+
+Like 03_ingest_reports.py, ingest is incremental against a content-hash
+manifest (corpus/financial.manifest.json); --full re-sends everything,
+and --precomputed sends locally cached embeddings (see embedding_cache.py).
+Runs are checkpointed and resumable, and permanent failures go to
+corpus/financial.dead-letter.ndjson for --replay-dead-letter. --bulk-load
+and --force-merge work as in 03_ingest_reports.py.
 
 Usage:
-    uv run python scripts/es_setup/04_ingest_financial.py [--batch-size N]
+    uv run python scripts/es_setup/04_ingest_financial.py [--batch-size N] [--concurrency N] [--full]
+        [--bulk-load [--force-merge]] [--replay-dead-letter]
+        [--precomputed [--provider inference|fake] [--cache-dtype float32|int8]]
 """
 
 import json
 import sys
+from contextlib import nullcontext
+from itertools import islice
+from typing import Iterable, Iterator
 
 from elasticsearch import Elasticsearch
-from elasticsearch.helpers import bulk
 
+from bulk_ingest import (
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_CONCURRENCY,
+    BulkIndexer,
+    BulkStats,
+    DeadLetterQueue,
+    bulk_load_mode,
+    print_stats,
+)
 from es_client import (
     DATA_DIR,
     INDEX_FINANCIAL,
     PROJECT_ROOT,
+    bump_data_version,
     get_es_client,
     print_connection_info,
 )
+from embedding_cache import EMBED_BATCH_SIZE, CachedEmbedder, add_precomputed_embeddings, embedder_from_argv
+from ingest_manifest import IngestManifest, content_hash, index_uuid, manifest_hooks, replay_dead_letter
 
-INDEX_FILE = DATA_DIR / "financial-reports" / "index.json"
+# The corpus format lives with the generators that write it
+sys.path.insert(0, str(PROJECT_ROOT / "scripts" / "data_generation"))
 
-DEFAULT_BATCH_SIZE = 50
+from corpus import FINANCIAL_CORPUS, CorpusReader
+
+INDEX_FILE = DATA_DIR / "financial-reports" / "index.json"
+# Next to the corpus: data/generated/financial-reports/ only exists after --export-files
+DEAD_LETTER_FILE = FINANCIAL_CORPUS.with_name(FINANCIAL_CORPUS.name + ".dead-letter.ndjson")
+MANIFEST_FILE = FINANCIAL_CORPUS.with_name(FINANCIAL_CORPUS.name + ".manifest.json")
 
 
 def load_index() -> list[dict]:
@@ -34,79 +66,169 @@ def load_index() -> list[dict]:
         return json.load(f)
 
 
-def ingest_financial(es: Elasticsearch, batch_size: int) -> tuple[int, int]:
-    """Bulk-index financial reports in batches."""
-    index_entries = load_index()
-    total = len(index_entries)
-    print(f"  Found {total} financial reports in index.json")
+def open_corpus() -> CorpusReader | None:
+    """The compressed corpus, or None to fall back to the exported file tree."""
+    return CorpusReader(FINANCIAL_CORPUS) if CorpusReader.exists(FINANCIAL_CORPUS) else None
 
-    success_total = 0
-    error_total = 0
 
-    for batch_start in range(0, total, batch_size):
-        batch_entries = index_entries[batch_start : batch_start + batch_size]
-        batch_num = batch_start // batch_size + 1
+def load_entries(corpus: CorpusReader | None) -> list[dict]:
+    """One entry per report: the corpus offset index, or index.json of the file tree."""
+    return corpus.records if corpus is not None else load_index()
 
-        actions = []
-        for entry in batch_entries:
-            file_path = PROJECT_ROOT / entry["file_path"]
 
-            if not file_path.exists():
-                print(f"    WARNING: File not found: {file_path}")
-                continue
-
-            with open(file_path) as f:
-                doc = json.load(f)
-
-            # Copy narrative text into embedding fields for semantic search
-            doc["labor_manager_narrative_embedding"] = doc.get("labor_manager_narrative", "")
-            doc["inventory_manager_narrative_embedding"] = doc.get("inventory_manager_narrative", "")
-            doc["notes_embedding"] = doc.get("notes", "")
-
-            actions.append({
-                "_index": INDEX_FINANCIAL,
+def plan_financial(index_entries: list[dict], manifest: IngestManifest) -> tuple[list[tuple[dict, str]], list[str]]:
+    """Split the corpus against the manifest. Returns ([(entry, sha256)] to send, ids to delete)."""
+    changed = []
+    for entry in index_entries:
+        if "sha256" in entry:
+            if not manifest.is_current(entry["id"], entry["sha256"]):
+                changed.append((entry, entry["sha256"]))
+            continue
+        file_path = PROJECT_ROOT / entry["file_path"]
+        if not file_path.exists():
+            print(f"    WARNING: File not found: {file_path}")
+            continue
+        digest = content_hash(file_path.read_bytes())
+        if not manifest.is_current(entry["id"], digest):
+            changed.append((entry, digest))
+    removed = manifest.stale_ids({entry["id"] for entry in index_entries})
+    return changed, removed
+
+
+EMBEDDING_FIELDS = [
+    "labor_manager_narrative_embedding",
+    "inventory_manager_narrative_embedding",
+    "notes_embedding",
+]
+
+
+def build_financial_doc(entry: dict) -> dict:
+    """Document for a corpus record, or for an index.json entry (loading its file)."""
+    if "file_path" in entry:
+        with open(PROJECT_ROOT / entry["file_path"]) as f:
+            doc = json.load(f)
+    else:
+        doc = dict(entry)
+
+    # Copy narrative text into embedding fields for semantic search
+    doc["labor_manager_narrative_embedding"] = doc.get("labor_manager_narrative", "")
+    doc["inventory_manager_narrative_embedding"] = doc.get("inventory_manager_narrative", "")
+    doc["notes_embedding"] = doc.get("notes", "")
+    return doc
+
+
+def financial_docs(changed: list[tuple[dict, str]], corpus: CorpusReader | None) -> Iterator[dict]:
+    """Documents for the changed entries, streamed out of the corpus frame by frame, or loaded from files."""
+    if corpus is None:
+        return (build_financial_doc(entry) for entry, _ in changed)
+    return (build_financial_doc(record) for record in corpus.iter_records({entry["id"] for entry, _ in changed}))
+
+
+def financial_actions(
+    docs: Iterable[dict],
+    removed: list[str],
+    embedder: CachedEmbedder | None = None,
+    index: str = INDEX_FINANCIAL,
+):
+    """Yield a bulk action per financial report document."""
+    # Each report has three fields to embed
+    chunk_size = max(1, EMBED_BATCH_SIZE // len(EMBEDDING_FIELDS))
+    docs = iter(docs)
+    while chunk := list(islice(docs, chunk_size)):
+        if embedder is not None:
+            add_precomputed_embeddings(chunk, EMBEDDING_FIELDS, embedder)
+        for doc in chunk:
+            yield {
+                "_index": index,
                 "_id": doc["id"],
                 "_source": doc,
-            })
-
-        if not actions:
-            continue
-
-        success, errors = bulk(es, actions, raise_on_error=False)
-        success_total += success
-        error_count = len(errors) if isinstance(errors, list) else 0
-        error_total += error_count
-
-        print(
-            f"  Batch {batch_num}: {success}/{len(batch_entries)} indexed"
-            + (f", {error_count} errors" if error_count else "")
-        )
-        if errors and isinstance(errors, list):
-            for e in errors[:3]:
-                print(f"    {e}")
-
-    return success_total, error_total
+            }
+    for report_id in removed:
+        yield {"_op_type": "delete", "_index": index, "_id": report_id}
+
+
+def ingest_financial(
+    es: Elasticsearch,
+    batch_size: int,
+    concurrency: int,
+    full: bool = False,
+    embedder: CachedEmbedder | None = None,
+    dead_letter: DeadLetterQueue | None = None,
+    bulk_load: bool = False,
+    force_merge: bool = False,
+    index: str = INDEX_FINANCIAL,
+) -> BulkStats:
+    """Bulk-index new and changed financial reports concurrently."""
+    corpus = open_corpus()
+    index_entries = load_entries(corpus)
+    source = f"corpus ({len(corpus.shards)} shards)" if corpus is not None else "index.json"
+    print(f"  Found {len(index_entries)} financial reports in {source}")
+
+    manifest = IngestManifest.load(MANIFEST_FILE, index_uuid(es, index), full=full)
+    changed, removed = plan_financial(index_entries, manifest)
+    print(f"  {len(changed)} new or changed, {len(removed)} removed, "
+          f"{len(index_entries) - len(changed)} unchanged")
+    if not changed and not removed:
+        return BulkStats()
+
+    digests = {entry["id"]: digest for entry, digest in changed}
+    hooks = manifest_hooks(manifest, digests, dead_letter)
+    indexer = BulkIndexer(es, concurrency=concurrency, batch_size=batch_size, **hooks)
+    load_mode = bulk_load_mode(es, index, force_merge) if bulk_load else nullcontext()
+    try:
+        with load_mode:
+            return indexer.run(financial_actions(financial_docs(changed, corpus), removed, embedder, index))
+    finally:
+        manifest.save()
 
 
 def main():
     batch_size = DEFAULT_BATCH_SIZE
+    concurrency = DEFAULT_CONCURRENCY
     for i, arg in enumerate(sys.argv):
         if arg == "--batch-size" and i + 1 < len(sys.argv):
             batch_size = int(sys.argv[i + 1])
+        elif arg == "--concurrency" and i + 1 < len(sys.argv):
+            concurrency = int(sys.argv[i + 1])
+    full = "--full" in sys.argv
+    replay = "--replay-dead-letter" in sys.argv
+    bulk_load = "--bulk-load" in sys.argv
+    force_merge = "--force-merge" in sys.argv
 
     print("Connecting to Elasticsearch...")
     es = get_es_client()
     print_connection_info(es)
     print()
 
-    print(f"Ingesting financial reports (batch size: {batch_size})...")
-    success, errors = ingest_financial(es, batch_size)
+    print(f"Ingesting financial reports (batch size: {batch_size}, concurrency: {concurrency}"
+          f"{', full' if full else ''})...")
+    dead_letter = DeadLetterQueue(DEAD_LETTER_FILE)
+    if replay:
+        stats = replay_dead_letter(
+            es, INDEX_FINANCIAL, MANIFEST_FILE, dead_letter, concurrency=concurrency, batch_size=batch_size,
+        )
+    else:
+        embedder = embedder_from_argv(es, sys.argv, INDEX_FINANCIAL)
+        stats = ingest_financial(
+            es, batch_size, concurrency, full, embedder, dead_letter, bulk_load, force_merge,
+        )
+        if embedder is not None:
+            print(f"  Embeddings: {embedder.hits} from cache, {embedder.misses} computed")
+            embedder.close()
+    if not stats.requests:
+        print("\nNothing changed since the last ingest.")
+        return
+    print_stats(stats, "bulk-load mode" if bulk_load and not replay else "default settings")
 
     es.indices.refresh(index=INDEX_FINANCIAL)
     count = es.count(index=INDEX_FINANCIAL)["count"]
     print(f"\nDone! {INDEX_FINANCIAL}: {count} documents indexed")
-    if errors:
-        print(f"  ({errors} errors occurred)")
+    if stats.failed:
+        print(f"  ({stats.failed} errors occurred; written to {DEAD_LETTER_FILE.relative_to(PROJECT_ROOT)}, "
+              f"retry them with --replay-dead-letter)")
+
+    version = bump_data_version(es, source="financial")
+    print(f"  Data version bumped to {version} (Slack bot answer cache invalidated)")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,144 @@
+"""
+Rebuild a BeanStack index without downtime.
+
+Creates the next physical version behind the index alias (see
+index_versions.py), loads everything into it while the current version keeps
+serving queries, checks the new version holds every source document, and
+then points the alias at it in one atomic update. The agent's ES|QL tools and
+index_search patterns only ever see the alias, so they switch over between
+two queries. Use it for mapping or analyzer changes, or to move between
+inference-time and --precomputed embeddings.
+
+If loading fails or the document count is off, the alias is left alone and
+the new version is kept for inspection (the next rebuild deletes it).
+Otherwise versions older than the previous one are deleted; --keep N keeps
+N previous versions around for rollback (default 1).
+
+Reports and financial rebuilds rewrite the ingest manifest for the new
+version, so later incremental runs of 03/04 pick up from the rebuilt index.
+
+Usage:
+    uv run python scripts/es_setup/05_rebuild_index.py reports|financial|branches|staff
+        [--keep N] [--batch-size N] [--concurrency N] [--bulk-load [--force-merge]]
+        [--precomputed [--provider inference|fake] [--cache-dtype float32|int8]]
+"""
+
+import importlib
+import sys
+
+from elasticsearch import Elasticsearch
+
+from bulk_ingest import DEFAULT_BATCH_SIZE, DEFAULT_CONCURRENCY, print_stats
+from embedding_cache import embedder_from_argv
+from es_client import bump_data_version, get_es_client, print_connection_info
+from index_versions import create_version, gc_versions, live_index, swap_alias
+
+setup_indices = importlib.import_module("01_setup_indices")
+ingest_data = importlib.import_module("02_ingest_data")
+ingest_reports = importlib.import_module("03_ingest_reports")
+ingest_financial = importlib.import_module("04_ingest_financial")
+
+
+def load_branches(es: Elasticsearch, index: str, args: dict) -> tuple[int, int]:
+    """Returns (source documents, failed)."""
+    stats = ingest_data.ingest_branches(es, index)
+    return len(ingest_data.load_json("branches.json")), stats.errors
+
+
+def load_staff(es: Elasticsearch, index: str, args: dict) -> tuple[int, int]:
+    stats = ingest_data.ingest_staff(es, index)
+    return len(ingest_data.load_json("staff.json")), stats.errors
+
+
+def load_reports(es: Elasticsearch, index: str, args: dict) -> tuple[int, int]:
+    stats = ingest_reports.ingest_reports(es, full=True, index=index, **args)
+    print_stats(stats)
+    return len(ingest_reports.load_entries(ingest_reports.open_corpus())), stats.failed
+
+
+def load_financial(es: Elasticsearch, index: str, args: dict) -> tuple[int, int]:
+    stats = ingest_financial.ingest_financial(es, full=True, index=index, **args)
+    print_stats(stats)
+    return len(ingest_financial.load_entries(ingest_financial.open_corpus())), stats.failed
+
+
+LOADERS = {
+    "branches": load_branches,
+    "staff": load_staff,
+    "reports": load_reports,
+    "financial": load_financial,
+}
+
+
+def main():
+    requested = [a for a in sys.argv[1:] if a in LOADERS]
+    if len(requested) != 1:
+        print(f"Usage: 05_rebuild_index.py {{{'|'.join(LOADERS)}}} [--keep N] ...")
+        return
+
+    name = requested[0]
+    keep = 1
+    batch_size = DEFAULT_BATCH_SIZE
+    concurrency = DEFAULT_CONCURRENCY
+    for i, arg in enumerate(sys.argv):
+        if arg == "--keep" and i + 1 < len(sys.argv):
+            keep = int(sys.argv[i + 1])
+        elif arg == "--batch-size" and i + 1 < len(sys.argv):
+            batch_size = int(sys.argv[i + 1])
+        elif arg == "--concurrency" and i + 1 < len(sys.argv):
+            concurrency = int(sys.argv[i + 1])
+    precomputed = "--precomputed" in sys.argv
+    alias, mapping_file = setup_indices.ALL_INDICES[name]
+
+    print("Connecting to Elasticsearch...")
+    es = get_es_client()
+    print_connection_info(es)
+    print()
+
+    print(f"Rebuilding {alias} (currently {live_index(es, alias) or 'missing'})...")
+    deleted = gc_versions(es, alias, keep=keep)
+    if deleted:
+        print(f"  Deleted leftover versions: {', '.join(deleted)}")
+    mappings = setup_indices.load_mapping(mapping_file)
+    staged = create_version(es, alias, mappings, setup_indices.index_settings(alias, precomputed))
+    print(f"  Created {staged}")
+
+    args = {}
+    embedder = None
+    if name in ("reports", "financial"):
+        embedder = embedder_from_argv(es, sys.argv, staged)
+        args = {
+            "batch_size": batch_size,
+            "concurrency": concurrency,
+            "embedder": embedder,
+            "bulk_load": "--bulk-load" in sys.argv,
+            "force_merge": "--force-merge" in sys.argv,
+        }
+    try:
+        expected, failed = LOADERS[name](es, staged, args)
+    finally:
+        if embedder is not None:
+            embedder.close()
+
+    es.indices.refresh(index=staged)
+    count = es.count(index=staged)["count"]
+    print(f"  {staged}: {count} of {expected} documents, {failed} failed")
+    if failed or count != expected:
+        print(f"\nNot switching {alias}: {staged} is incomplete and was left for inspection.")
+        sys.exit(1)
+
+    previous = swap_alias(es, alias, staged)
+    print(f"\n  {alias} -> {staged} (was {previous or 'missing'})")
+    if name == "branches":
+        ingest_data.setup_enrich_policy(es)
+    deleted = gc_versions(es, alias, keep=keep)
+    if deleted:
+        print(f"  Deleted old versions: {', '.join(deleted)}")
+
+    version = bump_data_version(es, source=f"rebuild:{name}")
+    print(f"  Data version bumped to {version} (Slack bot answer cache invalidated)")
+    print("\nDone!")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,10 +9,9 @@ Run 00_init_es.py first if not already done.
 import json
 from pathlib import Path
 
-import requests
 import yaml
 
-from kibana_client import get_headers, get_kibana_base_url
+from kibana_client import KibanaClient, get_kibana_client
 
 WORKFLOWS_DIR = Path(__file__).parent / "workflows"
 WORKFLOW_IDS_FILE = Path(__file__).parent / "workflow_ids.json"
@@ -30,7 +29,7 @@ def load_workflow_files() -> list[tuple[str, str]]:
     return workflows
 
 
-def delete_old_workflows(base_url: str, headers: dict) -> None:
+def delete_old_workflows(client: KibanaClient) -> None:
     """Delete previously deployed workflows using the saved ID mapping."""
     if not WORKFLOW_IDS_FILE.exists():
         print("  No previous workflow_ids.json found, skipping cleanup.")
@@ -40,8 +39,7 @@ def delete_old_workflows(base_url: str, headers: dict) -> None:
         print("  No previous workflows to delete.")
         return
     for name, wf_id in old_mapping.items():
-        url = f"{base_url}/api/workflows/{wf_id}"
-        resp = requests.delete(url, headers=headers)
+        resp = client.delete(f"/api/workflows/{wf_id}")
         if resp.status_code in (200, 204):
             print(f"    Deleted old workflow '{name}' ({wf_id})")
         elif resp.status_code == 404:
@@ -50,7 +48,7 @@ def delete_old_workflows(base_url: str, headers: dict) -> None:
             print(f"    WARNING: Failed to delete '{name}': {resp.status_code}")
 
 
-def deploy_workflow(base_url: str, headers: dict, filename: str, raw_yaml: str) -> str | None:
+def deploy_workflow(client: KibanaClient, filename: str, raw_yaml: str) -> str | None:
     """Deploy a single workflow via Kibana API.
 
     Two-step process:
@@ -61,10 +59,8 @@ def deploy_workflow(base_url: str, headers: dict, filename: str, raw_yaml: str)
     name = parsed.get("name", filename)
     description = parsed.get("description", "").strip()
 
-    api_url = f"{base_url}/api/workflows"
-
     # Step 1: Create the workflow
-    resp = requests.post(api_url, headers=headers, json={"yaml": raw_yaml})
+    resp = client.post("/api/workflows", json={"yaml": raw_yaml})
 
     if resp.status_code not in (200, 201):
         print(f"    FAILED to create workflow '{name}': {resp.status_code} - {resp.text}")
@@ -74,9 +70,8 @@ def deploy_workflow(base_url: str, headers: dict, filename: str, raw_yaml: str)
 
     # Step 2: Set name, description, and enable via PUT
     enable = name not in DISABLED_WORKFLOWS
-    put_resp = requests.put(
-        f"{api_url}/{wf_id}",
-        headers=headers,
+    put_resp = client.put(
+        f"/api/workflows/{wf_id}",
         json={"name": name, "description": description, "enabled": enable},
     )
     if put_resp.status_code == 200:
@@ -102,14 +97,12 @@ def deploy_workflow(base_url: str, headers: dict, filename: str, raw_yaml: str)
 def main():
     print("Deploying BeanStack workflows...\n")
 
-    base_url = get_kibana_base_url()
-    headers = get_headers()
+    client = get_kibana_client()
 
     # Step 1: Enable workflows setting
     print("Step 1: Enabling workflows feature flag...")
-    settings_resp = requests.post(
-        f"{base_url}/api/kibana/settings",
-        headers=headers,
+    settings_resp = client.post(
+        "/api/kibana/settings",
         json={"changes": {"workflows:ui:enabled": True}},
     )
     if settings_resp.status_code == 200:
@@ -122,7 +115,7 @@ def main():
 
     # Step 2: Delete old workflows
     print("\nStep 2: Deleting old workflows...")
-    delete_old_workflows(base_url, headers)
+    delete_old_workflows(client)
 
     # Step 3: Load workflow definitions
     print("\nStep 3: Loading workflow definitions...")
@@ -135,7 +128,7 @@ def main():
     for filename, raw_yaml in workflows:
         parsed = yaml.safe_load(raw_yaml)
         name = parsed.get("name", filename)
-        wf_id = deploy_workflow(base_url, headers, filename, raw_yaml)
+        wf_id = deploy_workflow(client, filename, raw_yaml)
         results[name] = wf_id
 
     # Summary
@@ -154,7 +147,7 @@ def main():
     if failed:
         print(f"\n  WARNING: {len(failed)} workflow(s) need manual setup in the Kibana Workflows UI.")
         print(f"  YAML files are in: {WORKFLOWS_DIR}")
-        print(f"  Go to: {base_url}/app/workflows")
+        print(f"  Go to: {client.base_url}/app/workflows")
 
 
 if __name__ == "__main__":
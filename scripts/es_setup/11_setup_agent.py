@@ -1,15 +1,18 @@
 """
 Set up the BeanStack Research Agent via the Kibana Agent Builder API.
 Upserts custom tools and the agent — does NOT delete the agent.
+
+ES|QL tools that ENRICH with a policy are pointed at its live version (see
+enrich_policies.py).
 """
 
 import copy
 import json
 from pathlib import Path
 
-import requests
-
-from kibana_client import get_headers, get_kibana_base_url
+from enrich_policies import live_enrich_policies, resolve_enrich_policies
+from es_client import get_es_client
+from kibana_client import KibanaClient, get_kibana_client
 from system_prompt import SYSTEM_PROMPT
 from tools import ALL_TOOLS
 
@@ -23,7 +26,6 @@ BUILTIN_TOOL_IDS = [
     "platform.core.get_document_by_id",
 ]
 
-
 def load_workflow_id_mapping() -> dict:
     """Load the workflow name-to-ID mapping saved by 10_setup_workflows.py."""
     mapping_file = Path(__file__).parent / "workflow_ids.json"
@@ -51,16 +53,16 @@ def resolve_workflow_ids(tools: list[dict], wf_mapping: dict) -> list[dict]:
     return resolved
 
 
-def upsert_tool(base_url: str, headers: dict, tool: dict) -> None:
+def upsert_tool(client: KibanaClient, tool: dict) -> None:
     """Create or update a custom tool via the Agent Builder API."""
     tool_id = tool["id"]
-    url = f"{base_url}/api/agent_builder/tools/{tool_id}"
+    path = f"/api/agent_builder/tools/{tool_id}"
 
     # PUT body: strip immutable fields (id/type are in the URL path or fixed at creation)
     put_body = {k: v for k, v in tool.items() if k not in ("id", "type")}
 
     # Try PUT to update existing tool
-    resp = requests.put(url, headers=headers, json=put_body)
+    resp = client.put(path, json=put_body)
 
     if resp.status_code in (200, 201):
         print(f"    Updated tool '{tool_id}' ({tool['type']})")
@@ -68,8 +70,7 @@ def upsert_tool(base_url: str, headers: dict, tool: dict) -> None:
 
     if resp.status_code == 404:
         # Tool doesn't exist — create it (POST needs the id)
-        create_url = f"{base_url}/api/agent_builder/tools"
-        resp = requests.post(create_url, headers=headers, json=tool)
+        resp = client.post("/api/agent_builder/tools", json=tool)
         if resp.status_code in (200, 201):
             print(f"    Created tool '{tool_id}' ({tool['type']})")
             return
@@ -81,7 +82,7 @@ def upsert_tool(base_url: str, headers: dict, tool: dict) -> None:
     raise SystemExit(1)
 
 
-def upsert_agent(base_url: str, headers: dict) -> None:
+def upsert_agent(client: KibanaClient) -> None:
     """Create or update the BeanStack Research Agent with all tools assigned."""
     custom_tool_ids = [t["id"] for t in ALL_TOOLS]
     all_tool_ids = BUILTIN_TOOL_IDS + custom_tool_ids
@@ -107,13 +108,13 @@ def upsert_agent(base_url: str, headers: dict) -> None:
         },
     }
 
-    url = f"{base_url}/api/agent_builder/agents/{AGENT_ID}"
+    path = f"/api/agent_builder/agents/{AGENT_ID}"
 
     # PUT body must not include 'id' (it's in the URL path)
     put_body = {k: v for k, v in payload.items() if k != "id"}
 
     # Try PUT to update existing agent
-    resp = requests.put(url, headers=headers, json=put_body)
+    resp = client.put(path, json=put_body)
 
     if resp.status_code in (200, 201):
         print(f"  Agent '{AGENT_ID}' updated with {len(all_tool_ids)} tools.")
@@ -121,8 +122,7 @@ def upsert_agent(base_url: str, headers: dict) -> None:
 
     if resp.status_code == 404:
         # Agent doesn't exist — create it
-        create_url = f"{base_url}/api/agent_builder/agents"
-        resp = requests.post(create_url, headers=headers, json=payload)
+        resp = client.post("/api/agent_builder/agents", json=payload)
         if resp.status_code in (200, 201):
             print(f"  Agent '{AGENT_ID}' created with {len(all_tool_ids)} tools.")
             return
@@ -134,24 +134,26 @@ def upsert_agent(base_url: str, headers: dict) -> None:
 def main():
     print("Setting up BeanStack Research Agent...\n")
 
-    base_url = get_kibana_base_url()
-    headers = get_headers()
+    client = get_kibana_client()
 
     print("Step 1: Resolving workflow IDs...")
     wf_mapping = load_workflow_id_mapping()
     print(f"  Found {len(wf_mapping)} workflow ID mappings.")
     tools = resolve_workflow_ids(ALL_TOOLS, wf_mapping)
 
-    print("\nStep 2: Upserting custom tools...")
+    print("\nStep 2: Resolving enrich policy versions...")
+    tools = resolve_enrich_policies(tools, live_enrich_policies(get_es_client()))
+
+    print("\nStep 3: Upserting custom tools...")
     for tool in tools:
-        upsert_tool(base_url, headers, tool)
+        upsert_tool(client, tool)
 
-    print("\nStep 3: Upserting agent...")
-    upsert_agent(base_url, headers)
+    print("\nStep 4: Upserting agent...")
+    upsert_agent(client)
 
     print(f"\nDone! Agent '{AGENT_ID}' is ready.")
     print(f"  Tools: {len(BUILTIN_TOOL_IDS)} built-in + {len(ALL_TOOLS)} custom")
-    print(f"  Chat: {base_url}/app/agent_builder/chat/{AGENT_ID}")
+    print(f"  Chat: {client.base_url}/app/agent_builder/chat/{AGENT_ID}")
 
 
 if __name__ == "__main__":
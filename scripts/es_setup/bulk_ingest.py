@@ -0,0 +1,445 @@
+"""
+Concurrent, adaptive bulk indexing for the BeanStack ingest scripts.
+
+Indexing a report means Elasticsearch calls the Cohere inference endpoint
+for every semantic_text field, so a bulk request takes seconds and sending
+them one after another leaves the cluster mostly idle. BulkIndexer keeps
+several bulk requests in flight at once and sizes them as it goes:
+
+  - At most `concurrency` bulk requests are in flight.
+  - Batch size grows additively while requests finish under
+    `target_latency` and halves when they run slow or Elasticsearch
+    rejects work (429 / es_rejected_execution_exception), like TCP
+    congestion control.
+  - Retryable item errors (rejections, inference timeouts and rate
+    limits, 502-504) go to a retry queue with jittered exponential backoff.
+    Permanent errors, and items that run out of retries, are handed to
+    `on_failure`, e.g. a DeadLetterQueue that can be replayed later.
+  - `on_batch` runs after every finished request, so callers can
+    checkpoint progress and a rerun continues where this one stopped.
+
+The action iterable may be a live stream that blocks while it waits for
+documents: yielding FLUSH sends the partial batch collected so far, so a
+trickle of documents is indexed within the stream's flush interval instead
+of waiting for a full batch. While every request slot is busy the indexer
+stops pulling from the stream, which is what pushes back on its producer.
+
+bulk_load_mode() wraps a large load: no refreshes and no replicas while
+documents stream in, then the original settings come back (even on
+failure), followed by a refresh and an optional force-merge.
+
+Usage:
+    indexer = BulkIndexer(es, concurrency=4, batch_size=50)
+    stats = indexer.run(actions)   # helpers.bulk-style action dicts
+"""
+
+import heapq
+import itertools
+import json
+import re
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Iterable
+
+from elasticsearch import ApiError, ConnectionError as ESConnectionError, ConnectionTimeout, Elasticsearch
+from elasticsearch.helpers import expand_action
+
+from kibana_client import backoff_delay
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_BATCH_SIZE = 50
+MIN_BATCH_SIZE = 10
+MAX_BATCH_SIZE = 500
+
+# Seconds a bulk request may take before batches shrink (inference dominates)
+DEFAULT_TARGET_LATENCY = 10.0
+
+DEFAULT_MAX_RETRIES = 5
+
+# Read timeout for one bulk request; inference on a large batch is slow
+BULK_REQUEST_TIMEOUT = 120
+
+# Yielded by a streaming action source: send what has been collected now
+FLUSH = object()
+
+# Item errors printed in full; the rest are only counted
+MAX_PRINTED_ERRORS = 3
+
+# Index settings bulk_load_mode() changes for the duration of a load
+BULK_LOAD_SETTINGS = {"index.refresh_interval": "-1", "index.number_of_replicas": 0}
+
+# Force-merge can take many minutes on a large index
+FORCE_MERGE_TIMEOUT = 3600
+
+# Item and request failures worth another try
+RETRYABLE_STATUSES = {408, 429, 502, 503, 504}
+RETRYABLE_ERRORS = re.compile(r"rejected_execution|timeout|timed out|rate limit|too many requests", re.IGNORECASE)
+
+
+class AdaptiveBatchSize:
+    """AIMD batch sizing driven by bulk latency and rejections."""
+
+    def __init__(
+        self,
+        initial: int = DEFAULT_BATCH_SIZE,
+        minimum: int = MIN_BATCH_SIZE,
+        maximum: int = MAX_BATCH_SIZE,
+        target_latency: float = DEFAULT_TARGET_LATENCY,
+    ):
+        self.minimum = min(minimum, initial)
+        self.maximum = max(maximum, initial)
+        self.target_latency = target_latency
+        self.step = max(1, initial // 4)
+        self._size = float(initial)
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        return int(self._size)
+
+    def observe(self, docs: int, latency: float, rejected: int = 0) -> None:
+        """Record one finished bulk request of `docs` documents."""
+        with self._lock:
+            if rejected or latency > self.target_latency:
+                self._size = max(self.minimum, self._size / 2)
+            elif docs >= self.size:
+                # Only grow on full batches; a short tail batch says little about capacity
+                self._size = min(self.maximum, self._size + self.step)
+
+
+@dataclass
+class BulkStats:
+    indexed: int = 0
+    failed: int = 0
+    retried: int = 0
+    rejected: int = 0
+    requests: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def docs_per_second(self) -> float:
+        return self.indexed / self.elapsed if self.elapsed else 0.0
+
+
+@dataclass
+class _Batch:
+    number: int
+    items: list          # (action, data, attempt) tuples
+    latency: float = 0.0
+    succeeded: list = field(default_factory=list)  # action metadata
+    failed: list = field(default_factory=list)     # (action, data, error)
+    retry: list = field(default_factory=list)      # items to send again
+    throttled: int = 0                             # of which rejected by ES itself
+
+
+def _is_rejection(status: int, error: dict | None) -> bool:
+    """Elasticsearch pushing back (full write queue), as opposed to a downstream failure."""
+    return status == 429 or "rejected_execution" in str((error or {}).get("type", ""))
+
+
+def _is_retryable(status: int, error: dict | None) -> bool:
+    if status in RETRYABLE_STATUSES:
+        return True
+    # Inference failures (Cohere timeouts and rate limits) surface as 4xx/5xx with a cause
+    return bool(RETRYABLE_ERRORS.search(json.dumps(error or {})))
+
+
+def action_id(meta: dict) -> str | None:
+    """The _id of a bulk action's metadata line, e.g. {"index": {"_id": ...}}."""
+    return next(iter(meta.values())).get("_id")
+
+
+class BulkIndexer:
+    """Send helpers.bulk-style actions with bounded concurrency and adaptive batches.
+
+    Hooks run on the calling thread: `on_success(meta)` with the metadata
+    line of every action Elasticsearch accepted, e.g. {"index": {"_id": ...}};
+    `on_failure(meta, source, error)` for every action given up on; and
+    `on_batch()` after each finished bulk request.
+    """
+
+    def __init__(
+        self,
+        es: Elasticsearch,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        target_latency: float = DEFAULT_TARGET_LATENCY,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        verbose: bool = True,
+        on_success: Callable[[dict], None] | None = None,
+        on_failure: Callable[[dict, dict | None, dict], None] | None = None,
+        on_batch: Callable[[], None] | None = None,
+    ):
+        self.es = es.options(request_timeout=BULK_REQUEST_TIMEOUT)
+        self.concurrency = max(1, concurrency)
+        self.batch_size = AdaptiveBatchSize(batch_size, target_latency=target_latency)
+        self.max_retries = max_retries
+        self.verbose = verbose
+        self.on_success = on_success
+        self.on_failure = on_failure
+        self.on_batch = on_batch
+
+    def _send(self, batch: _Batch) -> _Batch:
+        """Run one bulk request (in a worker thread) and sort its items by outcome."""
+        operations = []
+        for action, data, _ in batch.items:
+            operations.append(action)
+            if data is not None:
+                operations.append(data)
+
+        start = time.monotonic()
+        try:
+            resp = self.es.bulk(operations=operations)
+        except ApiError as e:
+            batch.latency = time.monotonic() - start
+            if e.meta.status not in RETRYABLE_STATUSES:
+                raise
+            batch.retry = list(batch.items)
+            batch.throttled = len(batch.items) if e.meta.status == 429 else 0
+            return batch
+        except (ESConnectionError, ConnectionTimeout):
+            # Unknown outcome; index/create/delete by _id are safe to repeat
+            batch.latency = time.monotonic() - start
+            batch.retry = list(batch.items)
+            return batch
+        batch.latency = time.monotonic() - start
+
+        for item, result in zip(batch.items, resp["items"]):
+            op_result = next(iter(result.values()))
+            status = op_result.get("status", 500)
+            error = op_result.get("error")
+            if 200 <= status < 300 or (status == 404 and "delete" in result):
+                # Deleting a document that is already gone is fine
+                batch.succeeded.append(item[0])
+            elif _is_retryable(status, error):
+                batch.retry.append(item)
+                batch.throttled += _is_rejection(status, error)
+            else:
+                batch.failed.append((item[0], item[1], error or {"status": status}))
+        return batch
+
+    def run(self, actions: Iterable[dict]) -> BulkStats:
+        """Index every action; returns totals once all in-flight requests finish."""
+        stats = BulkStats()
+        source = iter(actions)
+        retry_queue: list = []   # heap of (ready_at, seq, item)
+        seq = itertools.count()
+        in_flight: set[Future] = set()
+        exhausted = False
+        number = 0
+        start = time.monotonic()
+
+        def next_batch() -> list:
+            nonlocal exhausted
+            size = self.batch_size.size
+            items = []
+            now = time.monotonic()
+            while retry_queue and retry_queue[0][0] <= now and len(items) < size:
+                items.append(heapq.heappop(retry_queue)[2])
+            while not exhausted and len(items) < size:
+                try:
+                    action = next(source)
+                except StopIteration:
+                    exhausted = True
+                    break
+                if action is FLUSH:
+                    break
+                meta, data = expand_action(action)
+                items.append((meta, data, 0))
+            return items
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="bulk") as pool:
+            while True:
+                while len(in_flight) < self.concurrency:
+                    items = next_batch()
+                    if not items:
+                        break
+                    number += 1
+                    in_flight.add(pool.submit(self._send, _Batch(number, items)))
+
+                # Wake up for the next finished request or the next retry, whichever is first
+                timeout = max(0.0, retry_queue[0][0] - time.monotonic()) if retry_queue else None
+                if not exhausted and len(in_flight) < self.concurrency:
+                    # A stream paused on FLUSH: collect what's done, then go back to it
+                    timeout = 0.0
+                if not in_flight:
+                    if timeout is None:
+                        break
+                    if not exhausted:
+                        continue
+                    time.sleep(timeout)
+                    continue
+
+                done, in_flight = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self._collect(future.result(), stats, retry_queue, seq)
+
+        stats.elapsed = time.monotonic() - start
+        return stats
+
+    def _collect(self, batch: _Batch, stats: BulkStats, retry_queue: list, seq: itertools.count) -> None:
+        stats.requests += 1
+        stats.indexed += len(batch.succeeded)
+        if self.on_success is not None:
+            for meta in batch.succeeded:
+                self.on_success(meta)
+        stats.rejected += batch.throttled
+        # Slow down for ES pushback and slow requests, not for a flaky inference call
+        self.batch_size.observe(len(batch.items), batch.latency, batch.throttled)
+
+        # One delay per batch, so its items come back together in one request
+        attempts = max((item[2] for item in batch.retry), default=0)
+        ready_at = time.monotonic() + backoff_delay(attempts, base=1.0, cap=30)
+        for action, data, attempt in batch.retry:
+            if attempt >= self.max_retries:
+                batch.failed.append((action, data, {"type": "retries_exhausted",
+                                                    "reason": f"still failing after {attempt} retries"}))
+                continue
+            stats.retried += 1
+            heapq.heappush(retry_queue, (ready_at, next(seq), (action, data, attempt + 1)))
+
+        stats.failed += len(batch.failed)
+        if self.on_failure is not None:
+            for action, data, error in batch.failed:
+                self.on_failure(action, data, error)
+        if self.on_batch is not None:
+            self.on_batch()
+
+        if self.verbose:
+            retrying = f", {len(batch.retry)} to retry" if batch.retry else ""
+            errors = f", {len(batch.failed)} errors" if batch.failed else ""
+            print(
+                f"  Batch {batch.number}: {len(batch.succeeded)}/{len(batch.items)} indexed "
+                f"in {batch.latency:.1f}s{retrying}{errors} (next batch size {self.batch_size.size})"
+            )
+            for action, _, error in batch.failed[:MAX_PRINTED_ERRORS]:
+                print(f"    {action_id(action)}: {error}")
+
+
+class DeadLetterQueue:
+    """NDJSON file of actions that failed for good, with their errors, for later replay.
+
+    Each line holds the action (op, index, id), its source, the error, when it
+    failed, and any `extra` fields the caller attached (e.g. a content hash).
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.written = 0
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+    def __len__(self) -> int:
+        if not self.path.exists():
+            return 0
+        with open(self.path) as f:
+            return sum(1 for line in f if line.strip())
+
+    def write(self, meta: dict, source: dict | None, error: dict, **extra) -> None:
+        op, target = next(iter(meta.items()))
+        record = {
+            "op": op,
+            "index": target.get("_index"),
+            "id": target.get("_id"),
+            "source": source,
+            "error": error,
+            "failed_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            **extra,
+        }
+        with open(self.path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+        self.written += 1
+
+    @property
+    def replay_path(self) -> Path:
+        return self.path.with_name(self.path.name + ".replaying")
+
+    def take(self) -> list[dict]:
+        """Move every record aside for replay; whatever fails again is written back.
+
+        Records stay in the .replaying file until finish_replay(), so an
+        interrupted replay is picked up again by the next one.
+        """
+        records = {}
+        for path in (self.replay_path, self.path):
+            if path.exists():
+                with open(path) as f:
+                    for line in f:
+                        if line.strip():
+                            record = json.loads(line)
+                            # Latest failure of each action wins
+                            records[(record["op"], record["index"], record["id"])] = record
+        with open(self.replay_path, "w") as f:
+            f.writelines(json.dumps(record) + "\n" for record in records.values())
+        self.path.unlink(missing_ok=True)
+        return list(records.values())
+
+    def finish_replay(self) -> None:
+        self.replay_path.unlink(missing_ok=True)
+
+    @staticmethod
+    def to_action(record: dict) -> dict:
+        action = {"_op_type": record["op"], "_index": record["index"], "_id": record["id"]}
+        if record["source"] is not None:
+            action["_source"] = record["source"]
+        return action
+
+
+@contextmanager
+def bulk_load_mode(es: Elasticsearch, index: str, force_merge: bool = False):
+    """Turn off refresh and replicas on `index` for a bulk load, then put them back.
+
+    The original values are restored in all cases. Only after a successful
+    load is the index refreshed and (with `force_merge`) merged down to one
+    segment, before replicas come back so they copy the merged segment.
+    Clusters that don't allow these settings (e.g. Serverless) load normally.
+    """
+    current = es.indices.get_settings(index=index, name=list(BULK_LOAD_SETTINGS), flat_settings=True)
+    # Settings left at their default come back as null, which resets them
+    original = {
+        name: {key: settings["settings"].get(key) for key in BULK_LOAD_SETTINGS}
+        for name, settings in current.items()
+    }
+    try:
+        es.indices.put_settings(index=index, settings=BULK_LOAD_SETTINGS)
+    except ApiError as e:
+        print(f"  Bulk-load mode unavailable on this cluster ({e.meta.status}), loading with current settings.")
+        original = None
+    if original is None:
+        yield
+        return
+    print(f"  Bulk-load mode: refresh off, 0 replicas on {', '.join(original)}")
+
+    def restore() -> None:
+        for name, settings in original.items():
+            es.indices.put_settings(index=name, settings=settings)
+
+    try:
+        yield
+    except BaseException:
+        restore()
+        print("  Bulk-load mode: original settings restored after failure.")
+        raise
+
+    start = time.monotonic()
+    try:
+        es.indices.refresh(index=index)
+        if force_merge:
+            es.options(request_timeout=FORCE_MERGE_TIMEOUT).indices.forcemerge(index=index, max_num_segments=1)
+    finally:
+        restore()
+    merged = " and force-merged" if force_merge else ""
+    print(f"  Bulk-load mode: refreshed{merged} in {time.monotonic() - start:.1f}s, settings restored")
+
+
+def print_stats(stats: BulkStats, label: str = "") -> None:
+    """One-line summary of a bulk run."""
+    mode = f" [{label}]" if label else ""
+    print(
+        f"  {stats.indexed} indexed, {stats.failed} failed in {stats.elapsed:.1f}s "
+        f"({stats.docs_per_second:.1f} docs/s{mode}, {stats.requests} bulk requests, {stats.retried} retries)"
+    )
@@ -0,0 +1,304 @@
+"""
+Local embedding cache and precomputed-vector ingest for BeanStack reports.
+
+By default Elasticsearch embeds every semantic_text field through the
+cohere-embed inference endpoint on each index or reindex. In precomputed
+mode the ingest scripts embed text themselves, once, through an
+EmbeddingProvider and keep the vectors in an on-disk cache:
+
+  - Content-addressed: a vector is keyed by sha256(model, text), so the
+    same text is never embedded twice, whatever document or index it is in.
+  - vectors.f32 (or vectors.i8) is a flat, memory-mapped array of rows;
+    keys.txt lists the key of each row in order (the id index). Both are
+    append-only, so a crash loses at most the rows being written.
+  - int8 rows are scalar-quantized (one float32 scale per row), a quarter
+    of the size of float32 for a negligible loss in recall.
+
+Vectors are sent to Elasticsearch inside the semantic_text field (the
+field's legacy "inference" format), so ES indexes them without calling the
+inference endpoint. That needs indices created with
+01_setup_indices.py --precomputed-embeddings.
+
+Providers:
+  - InferenceProvider: the same ES inference endpoint the index uses, so
+    vectors match what semantic queries embed at search time.
+  - FakeProvider: deterministic hashed bag-of-words vectors, no network,
+    for offline tests (semantic search against them won't match Cohere).
+
+Usage:
+    embedder = CachedEmbedder.open(get_provider("inference", es))
+    vectors = embedder.embed(["text", ...])
+"""
+
+import hashlib
+import json
+import math
+import mmap
+import os
+import re
+import struct
+from array import array
+from pathlib import Path
+from typing import Protocol
+
+from elasticsearch import Elasticsearch
+
+from es_client import INFERENCE_ID, PROJECT_ROOT
+
+CACHE_DIR = PROJECT_ROOT / "data" / "embedding-cache"
+
+DTYPES = ("float32", "int8")
+
+# Texts per provider call (Cohere's embed limit is 96)
+EMBED_BATCH_SIZE = 96
+
+FAKE_DIMS = 256
+
+
+class EmbeddingProvider(Protocol):
+    model_id: str
+    dims: int | None
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        ...
+
+
+class InferenceProvider:
+    """Embeds through an Elasticsearch text_embedding inference endpoint."""
+
+    def __init__(self, es: Elasticsearch, inference_id: str = INFERENCE_ID):
+        self.es = es
+        self.inference_id = inference_id
+        endpoint = es.inference.get(inference_id=inference_id)["endpoints"][0]
+        settings = endpoint.get("service_settings", {})
+        self.model_id = f"{endpoint.get('service', 'unknown')}/{settings.get('model_id', inference_id)}"
+        self.dims = settings.get("dimensions")
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        resp = self.es.inference.inference(
+            inference_id=self.inference_id, task_type="text_embedding", input=texts,
+        )
+        vectors = [item["embedding"] for item in resp["text_embedding"]]
+        self.dims = len(vectors[0]) if vectors else self.dims
+        return vectors
+
+
+class FakeProvider:
+    """Deterministic local stand-in: hashed bag of words, L2-normalized."""
+
+    def __init__(self, dims: int = FAKE_DIMS):
+        self.dims = dims
+        self.model_id = f"fake/hashed-bow-{dims}"
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        return [self._embed_one(text) for text in texts]
+
+    def _embed_one(self, text: str) -> list[float]:
+        vector = [0.0] * self.dims
+        for token in re.findall(r"\w+", text.lower()):
+            h = int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), "big")
+            vector[h % self.dims] += 1.0 if (h >> 32) & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+
+def get_provider(name: str, es: Elasticsearch) -> EmbeddingProvider:
+    if name == "fake":
+        return FakeProvider()
+    if name == "inference":
+        return InferenceProvider(es)
+    raise ValueError(f"Unknown embedding provider: {name!r} (expected inference or fake)")
+
+
+def text_key(model_id: str, text: str) -> str:
+    return hashlib.sha256(f"{model_id}\0{text}".encode()).hexdigest()
+
+
+class EmbeddingCache:
+    """Append-only, memory-mapped store of vectors keyed by content hash."""
+
+    def __init__(self, path: Path, model_id: str, dims: int, dtype: str = "float32"):
+        if dtype not in DTYPES:
+            raise ValueError(f"Unknown cache dtype: {dtype!r}")
+        self.path = path
+        self.model_id = model_id
+        self.dims = dims
+        self.dtype = dtype
+        # int8 rows carry a float32 scale in front of the values
+        self.row_bytes = dims * 4 if dtype == "float32" else 4 + dims
+        self.vectors_file = path / ("vectors.f32" if dtype == "float32" else "vectors.i8")
+        self.keys_file = path / "keys.txt"
+
+        path.mkdir(parents=True, exist_ok=True)
+        self.vectors_file.touch()
+        self.keys_file.touch()
+        self._index = self._load_index()
+        self._vectors = open(self.vectors_file, "ab")
+        self._keys = open(self.keys_file, "a")
+        self._map: mmap.mmap | None = None
+
+    @classmethod
+    def open(cls, root: Path, model_id: str, dims: int, dtype: str = "float32") -> "EmbeddingCache":
+        """Open (or create) the cache for one model under `root`."""
+        path = root / re.sub(r"[^\w.-]+", "_", model_id)
+        meta_file = path / "meta.json"
+        if meta_file.exists():
+            meta = json.loads(meta_file.read_text())
+            if meta["dims"] != dims:
+                raise ValueError(f"Cache at {path} has {meta['dims']} dims, provider returns {dims}")
+            dtype = meta["dtype"]
+        else:
+            path.mkdir(parents=True, exist_ok=True)
+            meta_file.write_text(json.dumps({"model_id": model_id, "dims": dims, "dtype": dtype}))
+        return cls(path, model_id, dims, dtype)
+
+    def _load_index(self) -> dict[str, int]:
+        """Row number per key, after trimming whatever a crash left half-written."""
+        rows = os.path.getsize(self.vectors_file) // self.row_bytes
+        with open(self.keys_file) as f:
+            keys = [line.rstrip("\n") for line in f if line.endswith("\n")]
+        keys = keys[:rows]
+        # Keep both files aligned: drop vectors without a key and keys without a vector
+        with open(self.vectors_file, "r+b") as f:
+            f.truncate(len(keys) * self.row_bytes)
+        with open(self.keys_file, "w") as f:
+            f.writelines(key + "\n" for key in keys)
+        return {key: row for row, key in enumerate(keys)}
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._index
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._vectors.close()
+        self._keys.close()
+
+    def _encode(self, vector: list[float]) -> bytes:
+        if self.dtype == "float32":
+            return array("f", vector).tobytes()
+        scale = max((abs(v) for v in vector), default=0.0) / 127 or 1.0
+        return struct.pack("<f", scale) + bytes(
+            (max(-127, min(127, round(v / scale))) & 0xFF) for v in vector
+        )
+
+    def _decode(self, data: bytes) -> list[float]:
+        if self.dtype == "float32":
+            return array("f", data).tolist()
+        (scale,) = struct.unpack_from("<f", data)
+        return [b * scale for b in struct.unpack_from(f"<{self.dims}b", data, 4)]
+
+    def get(self, key: str) -> list[float] | None:
+        row = self._index.get(key)
+        if row is None:
+            return None
+        end = (row + 1) * self.row_bytes
+        if self._map is None or len(self._map) < end:
+            # Appends since the last map: remap to see them
+            self._vectors.flush()
+            if self._map is not None:
+                self._map.close()
+            with open(self.vectors_file, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._decode(self._map[end - self.row_bytes:end])
+
+    def put(self, key: str, vector: list[float]) -> None:
+        if key in self._index:
+            return
+        if len(vector) != self.dims:
+            raise ValueError(f"Expected {self.dims} dims, got {len(vector)}")
+        # Vector first, then its key: a crash in between leaves an orphan row that _load_index trims
+        self._vectors.write(self._encode(vector))
+        self._vectors.flush()
+        self._keys.write(key + "\n")
+        self._keys.flush()
+        self._index[key] = len(self._index)
+
+
+class CachedEmbedder:
+    """Embeds texts through the cache, calling the provider only for misses."""
+
+    def __init__(self, cache: EmbeddingCache, provider: EmbeddingProvider):
+        self.cache = cache
+        self.provider = provider
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def open(cls, provider: EmbeddingProvider, dtype: str = "float32", root: Path = CACHE_DIR) -> "CachedEmbedder":
+        dims = provider.dims or len(provider.embed(["dimension probe"])[0])
+        return cls(EmbeddingCache.open(root, provider.model_id, dims, dtype), provider)
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        keys = [text_key(self.provider.model_id, text) for text in texts]
+        missing = list(dict.fromkeys(
+            (key, text) for key, text in zip(keys, texts) if key not in self.cache
+        ))
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        for start in range(0, len(missing), EMBED_BATCH_SIZE):
+            chunk = missing[start:start + EMBED_BATCH_SIZE]
+            for (key, _), vector in zip(chunk, self.provider.embed([text for _, text in chunk])):
+                self.cache.put(key, vector)
+        return [self.cache.get(key) for key in keys]
+
+    def close(self) -> None:
+        self.cache.close()
+
+
+def semantic_value(text: str, vector: list[float]) -> dict:
+    """A semantic_text field value carrying its own embedding (legacy format), as one chunk."""
+    return {
+        "text": text,
+        "inference": {
+            "inference_id": INFERENCE_ID,
+            "model_settings": {
+                "task_type": "text_embedding",
+                "dimensions": len(vector),
+                "similarity": "cosine",
+                "element_type": "float",
+            },
+            "chunks": [{"text": text, "embeddings": vector}],
+        },
+    }
+
+
+def add_precomputed_embeddings(docs: list[dict], fields: list[str], embedder: CachedEmbedder) -> None:
+    """Replace the text in each doc's semantic_text `fields` with text + cached vector."""
+    slots = [(doc, field) for doc in docs for field in fields if doc.get(field)]
+    vectors = embedder.embed([doc[field] for doc, field in slots])
+    for (doc, field), vector in zip(slots, vectors):
+        doc[field] = semantic_value(doc[field], vector)
+
+
+def uses_legacy_semantic_text(es: Elasticsearch, index: str) -> bool:
+    """Whether `index` accepts semantic_text values with embeddings (legacy format)."""
+    name = "index.mapping.semantic_text.use_legacy_format"
+    settings = es.indices.get_settings(index=index, name=name, flat_settings=True)
+    return any(str(s["settings"].get(name)).lower() == "true" for s in settings.values())
+
+
+def embedder_from_argv(es: Elasticsearch, argv: list[str], index: str) -> CachedEmbedder | None:
+    """Set up precomputed mode from --precomputed [--provider NAME] [--cache-dtype float32|int8]."""
+    if "--precomputed" not in argv:
+        return None
+    provider_name, dtype = "inference", "float32"
+    for i, arg in enumerate(argv):
+        if arg == "--provider" and i + 1 < len(argv):
+            provider_name = argv[i + 1]
+        elif arg == "--cache-dtype" and i + 1 < len(argv):
+            dtype = argv[i + 1]
+
+    if not uses_legacy_semantic_text(es, index):
+        raise SystemExit(
+            f"{index} can't take precomputed embeddings. "
+            "Recreate it with 01_setup_indices.py --force --precomputed-embeddings."
+        )
+    embedder = CachedEmbedder.open(get_provider(provider_name, es), dtype)
+    print(f"  Precomputed embeddings: {embedder.provider.model_id}, "
+          f"{len(embedder.cache)} cached vectors ({embedder.cache.dtype}) in {embedder.cache.path}")
+    return embedder
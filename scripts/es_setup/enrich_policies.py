@@ -0,0 +1,155 @@
+"""
+Versioned enrich policies behind the agent's ES|QL ENRICH lookups.
+
+An enrich policy can't be changed once created, and deleting it makes
+every ES|QL query that ENRICHes with it fail until it is recreated and
+executed. So a rebuild never touches the policy in use: it creates and
+executes the next version (beanstack-branch-region-v1, -v2, ...), then the
+agent's ES|QL tools are switched over by rewriting their ENRICH clause, one
+tool update each, and only after that are older versions deleted.
+
+Tool definitions (tools/*.py) name a policy by its base name;
+resolve_enrich_policies() rewrites that to the live version when
+11_setup_agent.py upserts them, and point_tools_at_policy() switches the
+already-created tools after a rebuild. The Slack bot's fast path, which
+runs tool queries itself, resolves them the same way.
+
+A policy created before versioning (plain beanstack-branch-region) counts
+as the live one until the first versioned policy replaces it.
+"""
+
+import copy
+import re
+from typing import Iterable
+
+from elasticsearch import Elasticsearch, NotFoundError
+
+from es_client import ENRICH_BRANCH_REGION
+from kibana_client import KibanaClient
+
+# Enrich policies the ES|QL tools may reference by base name
+ENRICH_POLICIES = [ENRICH_BRANCH_REGION]
+
+
+def versioned_policy(base: str, version: int) -> str:
+    return f"{base}-v{version}"
+
+
+def policy_names(response) -> list[str]:
+    """Names of the policies in a GET _enrich/policy response."""
+    # The config is keyed by policy type (match, range, geo_match)
+    return [next(iter(policy["config"].values()))["name"] for policy in response["policies"]]
+
+
+def _versions(names: Iterable[str], base: str) -> list[tuple[int, str]]:
+    pattern = re.compile(rf"^{re.escape(base)}-v(\d+)$")
+    return sorted((int(m.group(1)), name) for name in names if (m := pattern.match(name)))
+
+
+def list_policy_versions(es: Elasticsearch, base: str) -> list[tuple[int, str]]:
+    """(version, policy name) of every version of `base`, oldest first."""
+    return _versions(policy_names(es.enrich.get_policy()), base)
+
+
+def newest_policy(names: Iterable[str], base: str) -> str | None:
+    """Newest version of `base` among `names`, the pre-versioning policy itself, or None."""
+    names = list(names)
+    versions = _versions(names, base)
+    if versions:
+        return versions[-1][1]
+    return base if base in names else None
+
+
+def policy_exists(es: Elasticsearch, name: str) -> bool:
+    try:
+        return bool(es.enrich.get_policy(name=name)["policies"])
+    except NotFoundError:
+        return False
+
+
+def live_policy(es: Elasticsearch, base: str) -> str | None:
+    """Newest version of `base`, the pre-versioning policy itself, or None."""
+    return newest_policy(policy_names(es.enrich.get_policy()), base)
+
+
+def live_enrich_policies(es: Elasticsearch) -> dict[str, str]:
+    """Map each enrich policy base name to its live version in Elasticsearch."""
+    policies = {}
+    for base in ENRICH_POLICIES:
+        live = live_policy(es, base)
+        if live is None:
+            print(f"  WARNING: Enrich policy '{base}' not found. Run 02_ingest_data.py first.")
+        else:
+            policies[base] = live
+            print(f"    {base} -> {live}")
+    return policies
+
+
+def create_policy_version(es: Elasticsearch, base: str, match: dict) -> str:
+    """Create and execute the next version of `base`. Returns its name.
+
+    If executing fails, the new version is deleted again and the live one
+    stays as it was.
+    """
+    versions = list_policy_versions(es, base)
+    name = versioned_policy(base, versions[-1][0] + 1 if versions else 1)
+    es.enrich.put_policy(name=name, match=match)
+    try:
+        es.enrich.execute_policy(name=name)
+    except Exception:
+        es.enrich.delete_policy(name=name)
+        raise
+    return name
+
+
+def gc_policies(es: Elasticsearch, base: str, keep: str) -> list[str]:
+    """Delete every version of `base` (and the pre-versioning policy) except `keep`."""
+    doomed = [name for _, name in list_policy_versions(es, base) if name != keep]
+    if keep != base and policy_exists(es, base):
+        doomed.append(base)
+    for name in doomed:
+        es.enrich.delete_policy(name=name)
+    return doomed
+
+
+def _enrich_pattern(base: str) -> re.Pattern:
+    return re.compile(rf"\bENRICH\s+{re.escape(base)}(?:-v\d+)?(?![\w-])")
+
+
+def uses_policy(tool: dict, base: str) -> bool:
+    """Whether an ES|QL tool ENRICHes with any version of `base`."""
+    query = tool.get("configuration", {}).get("query", "")
+    return tool.get("type") == "esql" and bool(_enrich_pattern(base).search(query))
+
+
+def resolve_enrich_policies(tools: list[dict], policies: dict[str, str]) -> list[dict]:
+    """Point ES|QL tools' ENRICH clauses at the given policies ({base: versioned name})."""
+    resolved = []
+    for tool in tools:
+        for base, name in policies.items():
+            if uses_policy(tool, base):
+                tool = copy.deepcopy(tool)
+                query = tool["configuration"]["query"]
+                tool["configuration"]["query"] = _enrich_pattern(base).sub(f"ENRICH {name}", query)
+        resolved.append(tool)
+    return resolved
+
+
+def point_tools_at_policy(client: KibanaClient, tools: list[dict], base: str, policy: str) -> list[str]:
+    """Switch the existing ES|QL tools among `tools` that ENRICH with `base` over to `policy`.
+
+    Returns the ids of the tools updated. Tools that don't exist yet are
+    skipped; 11_setup_agent.py resolves the live policy when it creates them.
+    """
+    updated = []
+    for tool in resolve_enrich_policies(tools, {base: policy}):
+        if not uses_policy(tool, base):
+            continue
+        put_body = {k: v for k, v in tool.items() if k not in ("id", "type")}
+        resp = client.put(f"/api/agent_builder/tools/{tool['id']}", json=put_body)
+        if resp.status_code == 404:
+            continue
+        if resp.status_code not in (200, 201):
+            raise RuntimeError(f"updating tool '{tool['id']}' failed: {resp.status_code} - {resp.text}")
+        updated.append(tool["id"])
+    return updated
@@ -3,6 +3,7 @@ Shared Elasticsearch client and index constants for BeanStack setup scripts.
 """
 
 import os
+from datetime import datetime, timezone
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -15,6 +16,10 @@ INDEX_BRANCHES = "beanstack-branches"
 INDEX_STAFF = "beanstack-staff"
 INDEX_REPORTS = "beanstack-reports"
 INDEX_FINANCIAL = "beanstack-financial-reports"
+INDEX_META = "beanstack-meta"
+
+# Data-version marker (read by the Slack bot's answer cache)
+DATA_VERSION_DOC = "data-version"
 
 # Paths
 PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
@@ -42,3 +47,31 @@ def print_connection_info(es: Elasticsearch) -> None:
     """Print cluster connection details."""
     info = es.info()
     print(f"  Connected to cluster: {info['cluster_name']} (v{info['version']['number']})")
+
+
+def bump_data_version(es: Elasticsearch, source: str) -> int:
+    """Increment the data-version marker after new data lands. Returns the new version.
+
+    The Slack bot polls this doc and drops every cached answer when it changes.
+    Safe to call concurrently (the ingest scripts, a stream, the intake
+    service): version conflicts are retried, and the version returned is
+    the one this update wrote.
+    """
+    now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    resp = es.update(
+        index=INDEX_META,
+        id=DATA_VERSION_DOC,
+        script={
+            "source": (
+                "ctx._source.version += 1; "
+                "ctx._source.updated_at = params.now; "
+                "ctx._source.source = params.source"
+            ),
+            "params": {"now": now, "source": source},
+        },
+        upsert={"version": 1, "updated_at": now, "source": source},
+        retry_on_conflict=5,
+        source_includes=["version"],
+        refresh=True,
+    )
+    return resp["get"]["_source"]["version"]
@@ -0,0 +1,75 @@
+"""
+Versioned physical indices behind the BeanStack index names.
+
+Each logical name (beanstack-reports, ...) is an alias pointing at one
+physical index, beanstack-reports-v1, -v2, and so on. The agent's ES|QL
+tools, index_search patterns and enrich policy all use the logical name,
+so a rebuild can fill a new version while the old one keeps serving and
+then switch over in a single atomic alias update.
+
+Indices created before versioning (a plain beanstack-reports index) are
+migrated on the first swap: the alias update removes the plain index and
+adds the alias in the same request.
+"""
+
+import re
+
+from elasticsearch import Elasticsearch, NotFoundError
+
+
+def versioned_name(alias: str, version: int) -> str:
+    return f"{alias}-v{version}"
+
+
+def list_versions(es: Elasticsearch, alias: str) -> list[tuple[int, str]]:
+    """(version, index name) of every physical version of `alias`, oldest first."""
+    pattern = re.compile(rf"^{re.escape(alias)}-v(\d+)$")
+    names = es.indices.get(index=f"{alias}-v*", allow_no_indices=True, expand_wildcards="open,closed")
+    return sorted((int(m.group(1)), name) for name in names if (m := pattern.match(name)))
+
+
+def live_index(es: Elasticsearch, alias: str) -> str | None:
+    """Physical index currently behind `alias`; the name itself for a pre-versioning plain index."""
+    try:
+        return next(iter(es.indices.get_alias(name=alias)))
+    except NotFoundError:
+        pass
+    return alias if es.indices.exists(index=alias) else None
+
+
+def create_version(es: Elasticsearch, alias: str, mappings: dict, settings: dict | None = None) -> str:
+    """Create the next physical version of `alias` (not yet aliased). Returns its name."""
+    versions = list_versions(es, alias)
+    name = versioned_name(alias, versions[-1][0] + 1 if versions else 1)
+    es.indices.create(index=name, mappings=mappings, settings=settings)
+    return name
+
+
+def swap_alias(es: Elasticsearch, alias: str, new_index: str) -> str | None:
+    """Point `alias` at `new_index` in one atomic update. Returns the index it pointed at before."""
+    old = live_index(es, alias)
+    actions = [{"add": {"index": new_index, "alias": alias, "is_write_index": True}}]
+    if old == alias:
+        # Plain index with the alias's name: delete it in the same atomic step
+        actions.insert(0, {"remove_index": {"index": alias}})
+    elif old is not None:
+        actions.insert(0, {"remove": {"index": old, "alias": alias}})
+    es.indices.update_aliases(actions=actions)
+    return old
+
+
+def gc_versions(es: Elasticsearch, alias: str, keep: int = 1) -> list[str]:
+    """Delete old versions, keeping the live one and the `keep` before it (for rollback).
+
+    Versions newer than the live one are left over from rebuilds that never
+    swapped, and are deleted too.
+    """
+    live = live_index(es, alias)
+    versions = list_versions(es, alias)
+    live_version = next((v for v, name in versions if name == live), 0)
+    older = [name for v, name in versions if v < live_version]
+    abandoned = [name for v, name in versions if v > live_version]
+    doomed = older[:max(0, len(older) - keep)] + abandoned
+    for name in doomed:
+        es.indices.delete(index=name)
+    return doomed
@@ -0,0 +1,185 @@
+"""
+Content-hash manifest for incremental report ingest.
+
+The manifest records, per document id, the sha256 of the source content
+that was last indexed and when. The ingest scripts compare it with the
+current corpus and only send documents that are new or changed, and
+delete documents whose source disappeared, so re-ingesting an unchanged
+corpus makes no bulk requests (and no embedding calls).
+
+It doubles as the ingest checkpoint: checkpoint() appends the entries
+recorded since the last call to a journal next to the manifest (one NDJSON
+line each), and load() replays the journal. The ingest scripts checkpoint
+after every bulk request, so a run that dies halfway is resumed by simply
+running it again. save() folds the journal into the manifest.
+
+The manifest is tied to the physical index it describes (by index UUID).
+When the index was recreated, e.g. by 01_setup_indices.py --force, the
+manifest no longer matches and everything is sent again.
+"""
+
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+
+from elasticsearch import Elasticsearch, NotFoundError
+
+from bulk_ingest import BulkIndexer, BulkStats, DeadLetterQueue, action_id
+
+
+def content_hash(*parts: bytes | str) -> str:
+    """sha256 over the given parts, separated so ("ab", "c") != ("a", "bc")."""
+    digest = hashlib.sha256()
+    for part in parts:
+        data = part.encode() if isinstance(part, str) else part
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+def index_uuid(es: Elasticsearch, index: str) -> str | None:
+    """UUID of the physical index behind `index`, or None if it doesn't exist."""
+    try:
+        settings = es.indices.get_settings(index=index, name="index.uuid")
+    except NotFoundError:
+        return None
+    return next(iter(settings.values()))["settings"]["index"]["uuid"]
+
+
+class IngestManifest:
+    """Maps document id -> {"sha256", "ingested_at"} for one index."""
+
+    def __init__(self, path: Path, index_uuid: str | None, documents: dict | None = None):
+        self.path = path
+        self.index_uuid = index_uuid
+        self.documents: dict[str, dict] = documents or {}
+        self._pending: list[dict] = []
+
+    @property
+    def journal_path(self) -> Path:
+        return self.path.with_name(self.path.name + ".journal")
+
+    @classmethod
+    def load(cls, path: Path, index_uuid: str | None, full: bool = False) -> "IngestManifest":
+        """Load the manifest and journal, or start empty if they describe another index.
+
+        With `full`, every document is sent again, but the ids indexed so far
+        are kept (with no hash) so documents that left the corpus are still
+        deleted. That state is saved right away, so an interrupted full run
+        is resumed by an ordinary one.
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        manifest = cls(path, index_uuid)
+        if path.exists():
+            with open(path) as f:
+                data = json.load(f)
+            if data.get("index_uuid") != index_uuid:
+                print("  Index was recreated since the last ingest; sending every document.")
+                manifest.journal_path.unlink(missing_ok=True)
+                return manifest
+            manifest.documents = data.get("documents", {})
+        resumed = manifest._replay_journal()
+        if full:
+            manifest.documents = {doc_id: {**entry, "sha256": None} for doc_id, entry in manifest.documents.items()}
+            manifest.save()
+        elif resumed:
+            print(f"  Resuming an interrupted ingest ({resumed} checkpointed changes).")
+        return manifest
+
+    def _replay_journal(self) -> int:
+        if not self.journal_path.exists():
+            return 0
+        count = 0
+        with open(self.journal_path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    break   # torn last line from a crash
+                if entry.get("index_uuid") != self.index_uuid:
+                    continue
+                if entry.get("sha256"):
+                    self.documents[entry["id"]] = {"sha256": entry["sha256"], "ingested_at": entry["ingested_at"]}
+                else:
+                    self.documents.pop(entry["id"], None)
+                count += 1
+        return count
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def is_current(self, doc_id: str, sha256: str) -> bool:
+        entry = self.documents.get(doc_id)
+        return entry is not None and entry["sha256"] == sha256
+
+    def record(self, doc_id: str, sha256: str) -> None:
+        now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        self.documents[doc_id] = {"sha256": sha256, "ingested_at": now}
+        self._pending.append({"id": doc_id, "sha256": sha256, "ingested_at": now})
+
+    def forget(self, doc_id: str) -> None:
+        self.documents.pop(doc_id, None)
+        self._pending.append({"id": doc_id})
+
+    def checkpoint(self) -> None:
+        """Append changes since the last checkpoint to the journal."""
+        if not self._pending:
+            return
+        with open(self.journal_path, "a") as f:
+            for entry in self._pending:
+                f.write(json.dumps({**entry, "index_uuid": self.index_uuid}) + "\n")
+        self._pending.clear()
+
+    def stale_ids(self, current_ids: set[str]) -> list[str]:
+        """Ids indexed earlier whose source is no longer in the corpus."""
+        return sorted(doc_id for doc_id in self.documents if doc_id not in current_ids)
+
+    def save(self) -> None:
+        """Write the full manifest atomically, then drop the journal it now contains."""
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump({"index_uuid": self.index_uuid, "documents": self.documents}, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+        self._pending.clear()
+        self.journal_path.unlink(missing_ok=True)
+
+
+def manifest_hooks(manifest: IngestManifest, digests: dict[str, str], dead_letter: DeadLetterQueue | None = None) -> dict:
+    """BulkIndexer hooks that record results in the manifest, checkpoint after
+    every request and dead-letter what failed for good."""
+
+    def on_success(meta: dict) -> None:
+        doc_id = action_id(meta)
+        if "delete" in meta:
+            manifest.forget(doc_id)
+        elif digests.get(doc_id):
+            manifest.record(doc_id, digests[doc_id])
+
+    def on_failure(meta: dict, source: dict | None, error: dict) -> None:
+        if dead_letter is not None:
+            dead_letter.write(meta, source, error, sha256=digests.get(action_id(meta)))
+
+    return {"on_success": on_success, "on_failure": on_failure, "on_batch": manifest.checkpoint}
+
+
+def replay_dead_letter(
+    es: Elasticsearch, index: str, manifest_file: Path, dead_letter: DeadLetterQueue, **indexer_args,
+) -> BulkStats:
+    """Send every dead-lettered action again; those that fail again go back in the file."""
+    records = dead_letter.take()
+    print(f"  Replaying {len(records)} dead-lettered actions from {dead_letter.path.name}")
+    if not records:
+        dead_letter.finish_replay()
+        return BulkStats()
+
+    manifest = IngestManifest.load(manifest_file, index_uuid(es, index))
+    digests = {record["id"]: record.get("sha256") for record in records}
+    indexer = BulkIndexer(es, **indexer_args, **manifest_hooks(manifest, digests, dead_letter))
+    try:
+        stats = indexer.run(DeadLetterQueue.to_action(record) for record in records)
+    finally:
+        manifest.save()
+    dead_letter.finish_replay()
+    return stats
@@ -1,16 +1,58 @@
 """
-Shared Kibana API helpers for BeanStack setup scripts.
+Shared Kibana API client for the BeanStack setup scripts and the Slack bot.
+
+KibanaClient wraps one requests.Session so every call reuses pooled
+keep-alive connections instead of a fresh TLS handshake, and adds:
+
+  - Retries with jittered exponential backoff on 429 (honouring Retry-After).
+    5xx responses and dropped connections are retried only for idempotent
+    requests, so a POST that may have gone through isn't repeated.
+  - Per-endpoint timeouts (longest matching path prefix in TIMEOUTS).
+  - Optional gzip of request bodies.
+  - Timing hooks called after every request.
+
+Env vars (read by get_kibana_client):
+  KIBANA_ENDPOINT         - Kibana URL
+  ELASTICSEARCH_API_KEY   - API key with Kibana access
+  KIBANA_RETRIES          - retries per request (default: 3)
+  KIBANA_GZIP             - gzip request bodies (default: false)
+  KIBANA_LOG_TIMING       - print method, path, status and time of every request
 """
 
+import gzip
+import json
 import os
+import random
+import time
+from dataclasses import dataclass
 from urllib.parse import urlparse, urlunparse
 
+import requests
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
 
 load_dotenv()
 
 EMAIL_CONNECTOR_ID = "478761f2-04b4-5905-a3bb-3315ace3d780"
 
+# Seconds to wait for a response, by path prefix (longest match wins)
+DEFAULT_TIMEOUT = 30
+TIMEOUTS = {
+    "/api/agent_builder/converse": 120,
+    "/api/agent_builder": 60,
+    "/api/workflows": 60,
+    "/api/kibana/settings": 30,
+    "/api/actions": 30,
+}
+CONNECT_TIMEOUT = 10
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}
+
+# Bodies smaller than this aren't worth compressing
+GZIP_MIN_BYTES = 1024
+
 
 def get_kibana_base_url() -> str:
     """Extract the base Kibana URL (scheme + host) from the configured endpoint."""
@@ -33,3 +75,190 @@ def get_headers() -> dict:
         "elastic-api-version": "2023-10-31",
         "x-elastic-internal-origin": "kibana",
     }
+
+
+def timeout_for(path: str) -> float:
+    """Read timeout for an API path."""
+    matches = [prefix for prefix in TIMEOUTS if path.startswith(prefix)]
+    return TIMEOUTS[max(matches, key=len)] if matches else DEFAULT_TIMEOUT
+
+
+def backoff_delay(attempt: int, retry_after: str | None = None, base: float = 0.5, cap: float = 30) -> float:
+    """Seconds to wait before retry number `attempt` (0-based).
+
+    Uses Retry-After when the server sent one, otherwise full-jitter
+    exponential backoff so concurrent clients don't retry in lockstep.
+    """
+    if retry_after:
+        try:
+            return min(float(retry_after), cap)
+        except ValueError:
+            pass
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def should_retry(method: str, status: int, idempotent: bool | None = None) -> bool:
+    """Whether a response status is worth retrying for this request."""
+    if status == 429:
+        return True
+    if idempotent is None:
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+    return idempotent and status in RETRY_STATUSES
+
+
+def never_sent(error: requests.RequestException) -> bool:
+    """Whether a failed request never reached Kibana, so repeating it is always safe.
+
+    True for connect timeouts and refused or unresolvable connections;
+    requests wraps those in a MaxRetryError whose reason is urllib3's error.
+    """
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+
+
+@dataclass
+class RequestTiming:
+    """What a timing hook receives after each request."""
+
+    method: str
+    path: str
+    status: int | None
+    elapsed: float
+    attempts: int
+
+
+def print_timing(timing: RequestTiming) -> None:
+    """Timing hook that prints one line per request."""
+    retries = f" ({timing.attempts} attempts)" if timing.attempts > 1 else ""
+    print(f"    [{timing.method} {timing.path}] {timing.status} in {timing.elapsed * 1000:.0f} ms{retries}")
+
+
+class KibanaClient:
+    """Pooled, retrying Kibana API client.
+
+    Paths are relative to the Kibana base URL, e.g.
+    client.post("/api/kibana/settings", json={...}). Responses are returned
+    as-is (no raise_for_status) so callers keep checking status codes.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        headers: dict,
+        pool_size: int = 10,
+        retries: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 30,
+        compress: bool = False,
+        hooks: list | None = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.compress = compress
+        self.hooks = list(hooks or [])
+
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def __enter__(self) -> "KibanaClient":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.session.close()
+
+    def url(self, path: str) -> str:
+        return f"{self.base_url}{path}"
+
+    def _encode(self, body: object) -> tuple[bytes | None, dict]:
+        if body is None:
+            return None, {}
+        data = json.dumps(body).encode()
+        if self.compress and len(data) >= GZIP_MIN_BYTES:
+            return gzip.compress(data), {"Content-Encoding": "gzip"}
+        return data, {}
+
+    def emit(self, timing: RequestTiming) -> None:
+        """Pass a request timing to every hook."""
+        for hook in self.hooks:
+            try:
+                hook(timing)
+            except Exception:
+                pass
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        json: object = None,
+        timeout: float | None = None,
+        stream: bool = False,
+        idempotent: bool | None = None,
+    ) -> requests.Response:
+        """Send a request, retrying rate limits, server errors and dropped connections.
+
+        `idempotent` overrides the method-based default for 5xx retries
+        (e.g. True for a POST that is safe to repeat).
+        """
+        method = method.upper()
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        data, headers = self._encode(json)
+        timeout = (CONNECT_TIMEOUT, timeout or timeout_for(path))
+        start = time.monotonic()
+        attempt = 0
+        while True:
+            try:
+                resp = self.session.request(
+                    method, self.url(path), data=data, headers=headers, timeout=timeout, stream=stream,
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                # Unless the request never reached Kibana, only repeat it if that's safe
+                if attempt >= self.retries or not (idempotent or never_sent(e)):
+                    self.emit(RequestTiming(method, path, None, time.monotonic() - start, attempt + 1))
+                    raise
+            else:
+                if attempt >= self.retries or not should_retry(method, resp.status_code, idempotent):
+                    self.emit(RequestTiming(method, path, resp.status_code, time.monotonic() - start, attempt + 1))
+                    return resp
+                retry_after = resp.headers.get("Retry-After")
+                resp.close()
+                time.sleep(backoff_delay(attempt, retry_after, self.backoff, self.max_backoff))
+                attempt += 1
+                continue
+            time.sleep(backoff_delay(attempt, None, self.backoff, self.max_backoff))
+            attempt += 1
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, json: object = None, **kwargs) -> requests.Response:
+        return self.request("POST", path, json=json, **kwargs)
+
+    def put(self, path: str, json: object = None, **kwargs) -> requests.Response:
+        return self.request("PUT", path, json=json, **kwargs)
+
+    def delete(self, path: str, **kwargs) -> requests.Response:
+        return self.request("DELETE", path, **kwargs)
+
+
+def _env_flag(name: str) -> bool:
+    return os.getenv(name, "false").lower() in ("1", "true", "yes")
+
+
+def get_kibana_client(**kwargs) -> KibanaClient:
+    """Create a Kibana client from environment variables."""
+    kwargs.setdefault("retries", int(os.getenv("KIBANA_RETRIES", "3")))
+    kwargs.setdefault("compress", _env_flag("KIBANA_GZIP"))
+    if _env_flag("KIBANA_LOG_TIMING"):
+        kwargs.setdefault("hooks", [print_timing])
+    return KibanaClient(get_kibana_base_url(), get_headers(), **kwargs)
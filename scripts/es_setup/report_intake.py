@@ -0,0 +1,267 @@
+"""
+Live intake of weekly report emails into beanstack-reports.
+
+Watches a maildir spool (data/intake by default, a local stand-in for the
+reports mailbox) and indexes each message within seconds of it arriving,
+instead of waiting for a batch run of 03_ingest_reports.py:
+
+  - Messages are delivered maildir-style: written to tmp/, then renamed
+    into new/. The service polls new/ every --poll seconds.
+  - Each message is parsed like a generated report file (Subject/From/
+    Date/Branch headers, blank line, body; see 03_ingest_reports.py) and
+    its branch_id is resolved through an in-memory index of branches.json
+    and staff.json: by the sender's address first, then by the Branch:
+    header. The index reloads when either file changes.
+  - Documents are micro-batched into Elasticsearch through a
+    StreamingIngest (see stream_ingest.py): a batch goes out 2 seconds
+    after its first message or at 100 messages, whichever comes first.
+  - A message moves to cur/ once Elasticsearch has it, so a crash only
+    re-sends what was in flight. Messages that can't be parsed or matched
+    to a branch, or that Elasticsearch rejects for good, move to failed/.
+
+The document id is derived from (branch_id, report date), so a corrected
+resend of the same week's report replaces the earlier one. Identical
+redeliveries are skipped using the intake's own content-hash manifest.
+
+--deliver FILE... drops files into the spool the way a mail server would,
+e.g. files exported with weekly_reports.py --export-files.
+
+Usage:
+    uv run python scripts/es_setup/report_intake.py [--spool DIR] [--poll SECONDS]
+    uv run python scripts/es_setup/report_intake.py --deliver data/generated/reports/branch-001/2025/*/*.txt
+"""
+
+import email.utils
+import importlib
+import json
+import os
+import signal
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+from elasticsearch import Elasticsearch
+
+from es_client import DATA_DIR, INDEX_REPORTS, PROJECT_ROOT, get_es_client, print_connection_info
+from ingest_manifest import content_hash
+from stream_ingest import StreamingIngest
+
+ingest_reports = importlib.import_module("03_ingest_reports")
+
+DEFAULT_SPOOL = PROJECT_ROOT / "data" / "intake"
+DEFAULT_POLL_INTERVAL = 0.5
+
+# Micro-batch bounds: whichever is reached first sends the batch
+FLUSH_INTERVAL = 2.0
+FLUSH_DOCS = 100
+
+
+class BranchIndex:
+    """branch_id lookups by manager email and branch name, reloaded when the data files change."""
+
+    def __init__(self, branches_file: Path = DATA_DIR / "branches.json", staff_file: Path = DATA_DIR / "staff.json"):
+        self.files = (branches_file, staff_file)
+        self.by_email: dict[str, str] = {}
+        self.by_name: dict[str, str] = {}
+        self.names: dict[str, str] = {}
+        self._mtimes: tuple[float, ...] = ()
+        self.refresh()
+
+    def refresh(self) -> None:
+        mtimes = tuple(f.stat().st_mtime for f in self.files)
+        if mtimes == self._mtimes:
+            return
+        with open(self.files[0]) as f:
+            branches = json.load(f)
+        with open(self.files[1]) as f:
+            staff = json.load(f)
+        self.names = {b["id"]: b["name"] for b in branches}
+        self.by_name = {b["name"].lower(): b["id"] for b in branches}
+        self.by_email = {s["email"].lower(): s["branch_id"] for s in staff if s.get("email")}
+        self._mtimes = mtimes
+        print(f"  Branch index: {len(self.by_name)} branches, {len(self.by_email)} staff addresses")
+
+    def resolve(self, sender: str, branch_name: str) -> str | None:
+        _, address = email.utils.parseaddr(sender)
+        return self.by_email.get(address.lower()) or self.by_name.get(branch_name.strip().lower())
+
+
+def parse_date(value: str, fallback: float) -> tuple[str, str]:
+    """(YYYY-MM-DD, ISO timestamp) from a Date: header, ISO or RFC 2822; else the arrival time."""
+    try:
+        day = datetime.strptime(value.strip(), "%Y-%m-%d")
+        return day.strftime("%Y-%m-%d"), day.strftime("%Y-%m-%dT09:00:00Z")
+    except ValueError:
+        pass
+    try:
+        moment = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        moment = datetime.fromtimestamp(fallback, timezone.utc)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    moment = moment.astimezone(timezone.utc)
+    return moment.strftime("%Y-%m-%d"), moment.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def build_intake_doc(path: Path, branches: BranchIndex) -> tuple[dict, str]:
+    """Parse one message into a report document. Returns (doc, content hash); raises ValueError."""
+    content = path.read_bytes()
+    parsed = ingest_reports.parse_report_text(content.decode("utf-8", errors="replace"))
+    if not parsed["text"]:
+        raise ValueError("no report body")
+    branch_id = branches.resolve(parsed["sender_email"], parsed["branch_name"])
+    if branch_id is None:
+        raise ValueError(f"no branch for sender {parsed['sender_email']!r} / Branch: {parsed['branch_name']!r}")
+    date, timestamp = parse_date(parsed["date"], path.stat().st_mtime)
+    doc = {
+        "id": f"report-{branch_id}-{date}",
+        "branch_id": branch_id,
+        "branch_name": branches.names.get(branch_id, parsed["branch_name"]),
+        "sender_email": email.utils.parseaddr(parsed["sender_email"])[1] or parsed["sender_email"],
+        "subject": parsed["subject"],
+        "text": parsed["text"],
+        "text_embedding": parsed["text"],
+        "date": date,
+        "timestamp": timestamp,
+    }
+    return doc, content_hash(branch_id, content)
+
+
+class Spool:
+    """A maildir: tmp/ (being written), new/ (to process), cur/ (indexed), failed/."""
+
+    def __init__(self, root: Path):
+        self.root = root
+        for name in ("tmp", "new", "cur", "failed"):
+            (root / name).mkdir(parents=True, exist_ok=True)
+
+    def incoming(self) -> list[Path]:
+        """Messages waiting in new/, oldest first."""
+        paths = [p for p in (self.root / "new").iterdir() if p.is_file() and not p.name.startswith(".")]
+        return sorted(paths, key=lambda p: (p.stat().st_mtime, p.name))
+
+    def move(self, path: Path, folder: str) -> None:
+        try:
+            os.replace(path, self.root / folder / path.name)
+        except FileNotFoundError:
+            pass   # already moved, e.g. a duplicate of a message in the same batch
+
+    def deliver(self, content: bytes) -> Path:
+        """Write a message the maildir way: into tmp/, then atomically into new/."""
+        name = f"{time.time():.6f}.{uuid.uuid4().hex[:12]}"
+        tmp = self.root / "tmp" / name
+        tmp.write_bytes(content)
+        target = self.root / "new" / name
+        os.replace(tmp, target)
+        return target
+
+
+class ReportIntake:
+    """Polls the spool and feeds new messages to a micro-batching StreamingIngest."""
+
+    def __init__(self, es: Elasticsearch, spool: Spool, poll_interval: float = DEFAULT_POLL_INTERVAL):
+        self.spool = spool
+        self.poll_interval = poll_interval
+        self.branches = BranchIndex()
+        self.stopping = threading.Event()
+        self.received = self.duplicates = self.rejected = 0
+        # doc id -> messages waiting for Elasticsearch; touched by the stream's thread too
+        self._pending: dict[str, list[Path]] = {}
+        self._lock = threading.Lock()
+        self.stream = StreamingIngest(
+            es, INDEX_REPORTS, lambda doc: doc,
+            spool.root / "ingest-manifest.json", spool.root / "dead-letter.ndjson", "intake",
+            flush_interval=FLUSH_INTERVAL, flush_docs=FLUSH_DOCS, batch_size=FLUSH_DOCS,
+            on_indexed=lambda doc_id: self._settle(doc_id, "cur"),
+            on_failed=lambda doc_id: self._settle(doc_id, "failed"),
+        )
+
+    def _settle(self, doc_id: str, folder: str) -> None:
+        with self._lock:
+            paths = self._pending.pop(doc_id, [])
+        for path in paths:
+            self.spool.move(path, folder)
+        if folder == "failed":
+            self.rejected += len(paths)
+
+    def _queued(self) -> set[Path]:
+        with self._lock:
+            return {path for paths in self._pending.values() for path in paths}
+
+    def poll(self) -> None:
+        """Submit every message in new/ that isn't already on its way."""
+        self.branches.refresh()
+        queued = self._queued()
+        submitted = 0
+        for path in self.spool.incoming():
+            if path in queued:
+                continue
+            self.received += 1
+            try:
+                doc, digest = build_intake_doc(path, self.branches)
+            except (ValueError, UnicodeError) as e:
+                print(f"  Rejected {path.name}: {e}")
+                self.rejected += 1
+                self.spool.move(path, "failed")
+                continue
+            if self.stream.manifest.is_current(doc["id"], digest):
+                self.duplicates += 1
+                self.spool.move(path, "cur")
+                continue
+            with self._lock:
+                self._pending.setdefault(doc["id"], []).append(path)
+            self.stream.submit(doc, digest)
+            submitted += 1
+        if submitted:
+            print(f"  Queued {submitted} new report(s)")
+
+    def run(self) -> None:
+        self.stream.start()
+        print(f"Watching {self.spool.root / 'new'} (Ctrl+C to stop)...")
+        try:
+            while not self.stopping.is_set():
+                self.poll()
+                self.stopping.wait(self.poll_interval)
+        finally:
+            print("\nStopping: indexing what is still queued...")
+            self.stream.close()
+            self.stream.print_stats()
+            print(f"  {self.received} messages received, {self.duplicates} duplicates skipped, "
+                  f"{self.rejected} moved to failed/")
+
+
+def main():
+    spool_dir = DEFAULT_SPOOL
+    poll_interval = DEFAULT_POLL_INTERVAL
+    for i, arg in enumerate(sys.argv):
+        if arg == "--spool" and i + 1 < len(sys.argv):
+            spool_dir = Path(sys.argv[i + 1])
+        elif arg == "--poll" and i + 1 < len(sys.argv):
+            poll_interval = float(sys.argv[i + 1])
+    spool = Spool(spool_dir)
+
+    if "--deliver" in sys.argv:
+        files = sys.argv[sys.argv.index("--deliver") + 1:]
+        for name in files:
+            spool.deliver(Path(name).read_bytes())
+        print(f"Delivered {len(files)} messages to {spool.root / 'new'}")
+        return
+
+    print("Connecting to Elasticsearch...")
+    es = get_es_client()
+    print_connection_info(es)
+    print()
+
+    intake = ReportIntake(es, spool, poll_interval)
+    signal.signal(signal.SIGTERM, lambda *_: intake.stopping.set())
+    try:
+        intake.run()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
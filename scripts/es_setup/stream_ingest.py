@@ -0,0 +1,240 @@
+"""
+Streaming ingest: index reports while they are being generated.
+
+The generators (weekly_reports.py / quarterly_reports.py --stream) hand each
+report to a StreamingIngest as soon as it is generated, from whichever
+worker thread generated it. Reports
+pass through a bounded queue to a BulkIndexer running on a background
+thread, so they become searchable within seconds instead of after the
+whole multi-hour run:
+
+  - The consumer flushes a partial batch `flush_interval` seconds after
+    its first report (or once it holds `flush_docs`), so a slow trickle
+    still gets indexed within seconds.
+  - When Elasticsearch or the inference endpoint slows down, every bulk
+    request slot stays busy, the indexer stops draining the queue, and
+    submit() blocks once `queue_size` reports are waiting: the generator
+    is paused instead of piling up memory.
+  - Successes are recorded in the ingest script's manifest (checkpointed
+    after every bulk request) and failures go to its dead-letter file, so
+    a later 03_/04_ run only sends what the stream missed.
+  - The data version is bumped at most once a minute while documents
+    land, so the Slack bot doesn't serve answers cached before them.
+
+Usage:
+    stream = open_stream("reports")   # or stream_from_argv("reports", sys.argv)
+    stream.submit(report, sha256)   # blocks while the queue is full
+    stats = stream.close()
+"""
+
+import importlib
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Iterator
+
+from elasticsearch import Elasticsearch
+
+from bulk_ingest import (
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_CONCURRENCY,
+    FLUSH,
+    BulkIndexer,
+    BulkStats,
+    DeadLetterQueue,
+    action_id,
+)
+from es_client import INDEX_FINANCIAL, INDEX_REPORTS, bump_data_version, get_es_client
+from ingest_manifest import IngestManifest, index_uuid, manifest_hooks
+
+DEFAULT_QUEUE_SIZE = 200
+
+# Seconds after the first unsent report before a partial batch is sent
+DEFAULT_FLUSH_INTERVAL = 2.0
+
+# While the queue is idle, how often finished requests get collected
+IDLE_TICK = 0.25
+
+# Minimum seconds between data version bumps while streaming
+VERSION_BUMP_INTERVAL = 60.0
+
+# kind -> (ingest script, document builder, index)
+STREAMS = {
+    "reports": ("03_ingest_reports", "build_report_doc", INDEX_REPORTS),
+    "financial": ("04_ingest_financial", "build_financial_doc", INDEX_FINANCIAL),
+}
+
+_DONE = object()
+
+
+class StreamingIngest:
+    """Bulk-indexes submitted records on a background thread, through a bounded queue.
+
+    `on_indexed(doc_id)` and `on_failed(doc_id)` run on that thread once a
+    document is in Elasticsearch or has been given up on (dead-lettered).
+    submit() may be called from several threads at once.
+    """
+
+    def __init__(
+        self,
+        es: Elasticsearch,
+        index: str,
+        build_doc: Callable[[dict], dict],
+        manifest_file: Path,
+        dead_letter_file: Path,
+        source: str,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        flush_docs: int | None = None,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        on_indexed: Callable[[str], None] | None = None,
+        on_failed: Callable[[str], None] | None = None,
+    ):
+        self.es = es
+        self.index = index
+        self.build_doc = build_doc
+        self.source = source
+        self.flush_interval = flush_interval
+        self.flush_docs = flush_docs
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.submitted = 0
+        self.blocked = 0.0   # seconds submit() spent waiting on a full queue
+        self.stats = BulkStats()
+        self._submit_lock = threading.Lock()
+
+        self.manifest = IngestManifest.load(manifest_file, index_uuid(es, index))
+        self._digests: dict[str, str] = {}
+        hooks = manifest_hooks(self.manifest, self._digests, DeadLetterQueue(dead_letter_file))
+        checkpoint = hooks.pop("on_batch")
+        if on_indexed is not None:
+            record_success = hooks["on_success"]
+
+            def on_success(meta: dict) -> None:
+                record_success(meta)
+                on_indexed(action_id(meta))
+
+            hooks["on_success"] = on_success
+        if on_failed is not None:
+            record_failure = hooks["on_failure"]
+
+            def on_failure(meta: dict, source: dict | None, error: dict) -> None:
+                record_failure(meta, source, error)
+                on_failed(action_id(meta))
+
+            hooks["on_failure"] = on_failure
+        self._last_bump = time.monotonic()
+        self._unannounced = 0
+
+        def on_batch() -> None:
+            checkpoint()
+            self._maybe_bump_version()
+
+        self.indexer = BulkIndexer(
+            es, concurrency=concurrency, batch_size=batch_size, verbose=False, on_batch=on_batch, **hooks,
+        )
+        self._error: BaseException | None = None
+        self._thread = threading.Thread(target=self._consume, name=f"stream-{source}", daemon=True)
+
+    def start(self) -> "StreamingIngest":
+        self._thread.start()
+        return self
+
+    def submit(self, record: dict, sha256: str) -> None:
+        """Queue one record for indexing; blocks while the queue is full (backpressure)."""
+        with self._submit_lock:
+            self._digests[record["id"]] = sha256
+        start = time.monotonic()
+        while True:
+            if self._error is not None:
+                raise RuntimeError(f"Streaming ingest into {self.index} failed") from self._error
+            try:
+                self.queue.put(record, timeout=1.0)
+                break
+            except queue.Full:
+                continue
+        with self._submit_lock:
+            self.blocked += time.monotonic() - start
+            self.submitted += 1
+
+    def close(self) -> BulkStats:
+        """Index whatever is still queued, wait for it, and save the manifest."""
+        if self._thread.is_alive():
+            self.queue.put(_DONE)
+            self._thread.join()
+        self.manifest.save()
+        if self._unannounced:
+            bump_data_version(self.es, source=f"stream:{self.source}")
+        if self._error is not None:
+            raise RuntimeError(f"Streaming ingest into {self.index} failed") from self._error
+        return self.stats
+
+    def print_stats(self) -> None:
+        print(f"  Streamed {self.submitted} reports into {self.index}: {self.stats.indexed} indexed, "
+              f"{self.stats.failed} failed, {self.stats.requests} bulk requests")
+        print(f"  Generator waited {self.blocked:.1f}s on a full queue (backpressure)")
+
+    def _actions(self) -> Iterator:
+        last_flush = time.monotonic()
+        pending = 0
+        while True:
+            if pending:
+                timeout = max(0.0, last_flush + self.flush_interval - time.monotonic())
+            else:
+                timeout = IDLE_TICK
+            try:
+                record = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                # Send the partial batch; when idle, this also lets the indexer
+                # collect finished requests (checkpoints, callbacks) meanwhile
+                pending = 0
+                yield FLUSH
+                continue
+            if record is _DONE:
+                return
+            yield {"_index": self.index, "_id": record["id"], "_source": self.build_doc(record)}
+            if not pending:
+                last_flush = time.monotonic()
+            pending += 1
+            if time.monotonic() - last_flush >= self.flush_interval or (
+                self.flush_docs and pending >= self.flush_docs
+            ):
+                # Bounded latency: send the partial batch rather than wait for it to fill
+                pending = 0
+                yield FLUSH
+
+    def _consume(self) -> None:
+        try:
+            self.stats = self.indexer.run(self._actions())
+        except BaseException as e:
+            self._error = e
+
+    def _maybe_bump_version(self) -> None:
+        self._unannounced += 1
+        if time.monotonic() - self._last_bump >= VERSION_BUMP_INTERVAL:
+            bump_data_version(self.es, source=f"stream:{self.source}")
+            self._last_bump = time.monotonic()
+            self._unannounced = 0
+
+
+def open_stream(kind: str, es: Elasticsearch | None = None, **kwargs) -> StreamingIngest:
+    """Start a StreamingIngest that builds documents like the ingest script for `kind`."""
+    script, builder, index = STREAMS[kind]
+    module = importlib.import_module(script)
+    es = es or get_es_client()
+    return StreamingIngest(
+        es, index, getattr(module, builder), module.MANIFEST_FILE, module.DEAD_LETTER_FILE, kind, **kwargs,
+    ).start()
+
+
+def stream_from_argv(kind: str, argv: list[str]) -> StreamingIngest | None:
+    """Start streaming from --stream [--queue-size N], or None without --stream."""
+    if "--stream" not in argv:
+        return None
+    queue_size = DEFAULT_QUEUE_SIZE
+    for i, arg in enumerate(argv):
+        if arg == "--queue-size" and i + 1 < len(argv):
+            queue_size = int(argv[i + 1])
+    print(f"Streaming {kind} into Elasticsearch as they're generated (queue size {queue_size})")
+    return open_stream(kind, queue_size=queue_size)
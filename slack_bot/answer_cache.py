@@ -0,0 +1,210 @@
+"""
+Answer cache for repeated agent questions.
+
+Many HQ users ask the same things every morning ("summarize the last 24 hours",
+"revenue by region this quarter"), and each one costs a full agent loop.
+Answers to first-turn questions are cached by normalized question text plus
+the current data version, with TTL and LRU eviction. Optionally, an embedding
+of the question is kept so near-identical phrasings hit the same entry.
+
+The data version is a counter the ingest scripts bump in Elasticsearch
+(see es_client.bump_data_version). When it changes, every cached answer is
+dropped, so fresh data is never hidden behind a stale answer.
+"""
+
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+import requests
+
+# Index and doc holding the data-version counter (kept in sync with es_client.py)
+INDEX_META = "beanstack-meta"
+DATA_VERSION_DOC = "data-version"
+
+# Tools with side effects: answers that used them are never cached
+SIDE_EFFECT_TOOL_IDS = {
+    "beanstack.send_manager_message",
+    "beanstack.missing_reports_reminder",
+    "beanstack.escalation",
+}
+
+# Questions asking the agent to *do* something are never served from cache
+_ACTION_WORDS = re.compile(r"\b(send|email|message|remind|escalate|notify|create|open a case)\b")
+
+
+def normalize_question(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace."""
+    text = re.sub(r"[^\w\s]", " ", text.lower())
+    return " ".join(text.split())
+
+
+def is_cacheable_question(text: str) -> bool:
+    """Whether a question may be answered from / stored in the cache."""
+    return not _ACTION_WORDS.search(normalize_question(text))
+
+
+def cosine_similarity(a: list[float], b: list[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    answer: str
+    created_at: float = field(default_factory=time.time)
+    embedding: list[float] | None = None
+
+    def render(self) -> str:
+        """Slack text for a cache hit, with a note on how old the answer is."""
+        minutes = int((time.time() - self.created_at) // 60)
+        age = "just now" if minutes < 1 else f"{minutes} min ago"
+        return f"{self.answer}\n\n_:zap: Cached answer from {age}_"
+
+
+class AnswerCache:
+    """Thread-safe LRU + TTL cache of agent answers, scoped to a data version."""
+
+    def __init__(
+        self,
+        max_entries: int = 256,
+        ttl: float = 1800,
+        similarity_threshold: float | None = None,
+        embed=None,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.embed = embed if similarity_threshold else None
+        self._entries: OrderedDict[str, CachedAnswer] = OrderedDict()
+        self._version: object = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_entries > 0
+
+    def _check_version(self, version: object) -> None:
+        # New data landed: every cached answer may be stale
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+
+    def _expired(self, entry: CachedAnswer, now: float) -> bool:
+        return now - entry.created_at > self.ttl
+
+    def _embed(self, question: str) -> list[float] | None:
+        try:
+            return self.embed(question)
+        except Exception:
+            return None
+
+    def lookup(self, question: str, version: object) -> tuple[CachedAnswer | None, list[float] | None]:
+        """Look up an answer by exact normalized text, then by embedding similarity.
+
+        Returns (entry or None, question embedding or None); pass the
+        embedding back to put() so a miss doesn't embed the question twice.
+        """
+        key = normalize_question(question)
+        now = time.time()
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry, now):
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry, None
+
+        # Embedding is a network call: do it outside the lock
+        embedding = self._embed(question) if self.embed is not None else None
+        with self._lock:
+            entry = self._most_similar(embedding, now) if embedding is not None else None
+            if entry is None:
+                self.misses += 1
+                return None, embedding
+            self._entries.move_to_end(normalize_question(entry.question))
+            self.hits += 1
+            return entry, embedding
+
+    def _most_similar(self, embedding: list[float], now: float) -> CachedAnswer | None:
+        best, best_score = None, self.similarity_threshold
+        for entry in self._entries.values():
+            if entry.embedding is None or self._expired(entry, now):
+                continue
+            score = cosine_similarity(embedding, entry.embedding)
+            if score >= best_score:
+                best, best_score = entry, score
+        return best
+
+    def put(self, question: str, version: object, answer: str, embedding: list[float] | None = None) -> None:
+        """Store an answer computed against `version`.
+
+        Only lookup() advances the version: an answer that finished after new
+        data landed is dropped, rather than wiping what was already cached
+        for the new version.
+        """
+        key = normalize_question(question)
+        with self._lock:
+            if version != self._version:
+                return
+            self._entries[key] = CachedAnswer(question, answer, embedding=embedding)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class DataVersion:
+    """Current data version, read from Elasticsearch at most every `poll_interval` seconds.
+
+    Without an Elasticsearch endpoint the version never changes and the
+    cache falls back to TTL expiry only.
+    """
+
+    def __init__(self, es_url: str | None, headers: dict, poll_interval: float = 30):
+        self.url = f"{es_url}/{INDEX_META}/_doc/{DATA_VERSION_DOC}" if es_url else None
+        self.headers = headers
+        self.poll_interval = poll_interval
+        self.value: object = 0
+        self._checked_at = 0.0
+
+    def is_stale(self) -> bool:
+        return self.url is not None and time.time() - self._checked_at > self.poll_interval
+
+    def refresh(self) -> object:
+        """Fetch the version from Elasticsearch (keeps the last value on errors)."""
+        self._checked_at = time.time()
+        try:
+            resp = requests.get(self.url, headers=self.headers, timeout=5)
+            if resp.status_code == 404:
+                self.value = 0
+            else:
+                resp.raise_for_status()
+                self.value = resp.json().get("_source", {}).get("version", 0)
+        except requests.RequestException:
+            pass
+        return self.value
+
+    def current(self) -> object:
+        return self.refresh() if self.is_stale() else self.value
+
+
+def es_embedder(es_url: str, headers: dict, inference_id: str = "cohere-embed"):
+    """Build an embed(text) function backed by an Elasticsearch inference endpoint."""
+    url = f"{es_url}/_inference/text_embedding/{inference_id}"
+
+    def embed(text: str) -> list[float]:
+        resp = requests.post(url, headers=headers, json={"input": text}, timeout=10)
+        resp.raise_for_status()
+        return resp.json()["text_embedding"][0]["embedding"]
+
+    return embed
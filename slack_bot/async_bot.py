@@ -0,0 +1,278 @@
+"""
+BeanStack Slack Bot — asyncio runtime.
+
+Same behaviour as bot.py, but built on Bolt's AsyncApp and aiohttp:
+the converse call, the progress scheduler and every Slack API call are
+coroutines on one event loop. An in-flight conversation costs a task and
+an open socket instead of a blocked worker thread, so a single small VM
+can hold hundreds of them at once. Kibana calls go through aiohttp but
+follow the shared KibanaClient's timeouts, retry policy and timing hooks.
+
+Env vars are the same as bot.py, plus:
+  CONVERSE_MAX_CONNECTIONS - max concurrent connections to Kibana (default: 200)
+
+Usage:
+  uv run python slack_bot/async_bot.py
+"""
+
+import asyncio
+import os
+import time
+
+import aiohttp
+from slack_bolt.adapter.socket_mode.async_handler import AsyncSocketModeHandler
+from slack_bolt.async_app import AsyncApp
+from slack_sdk.web.async_client import AsyncWebClient
+
+from common import (
+    AGENT_ID,
+    CONVERSE_PATH,
+    CONVERSE_STREAM_PATH,
+    CONVERSE_STREAMING,
+    KIBANA_BASE_URL,
+    KIBANA_HEADERS,
+    PROGRESS_MESSAGES,
+    QUEUED_MESSAGE,
+    SLACK_API_URL,
+    SLACK_MAX_CONCURRENT,
+    SLACK_MAX_PER_USER,
+    AgentReply,
+    answer_cache,
+    build_converse_payload,
+    data_version,
+    event_dedup,
+    fast_path,
+    in_flight,
+    is_cacheable,
+    kibana,
+    md_to_slack,
+    parse_converse_response,
+    should_respond,
+    strip_mention,
+    thread_state,
+)
+from kibana_client import CONNECT_TIMEOUT, RequestTiming, backoff_delay, should_retry, timeout_for
+from progress import AsyncProgressScheduler
+from streaming import AnswerStream, SSEParser
+from work_queue import AsyncWorkQueue
+
+CONVERSE_MAX_CONNECTIONS = int(os.getenv("CONVERSE_MAX_CONNECTIONS", "200"))
+
+# Slack setup
+app = AsyncApp(
+    client=AsyncWebClient(token=os.environ["SLACK_BOT_TOKEN"], base_url=SLACK_API_URL),
+)
+
+# One task updates every in-flight status message within Slack's rate limit
+progress = AsyncProgressScheduler(app.client)
+
+# Agent runs: one per thread at a time, fair across users, bounded overall
+work_queue = AsyncWorkQueue(max_concurrent=SLACK_MAX_CONCURRENT, max_per_user=SLACK_MAX_PER_USER)
+
+# Shared HTTP session for Kibana (created lazily inside the running loop)
+_session: aiohttp.ClientSession | None = None
+
+# Cleared if Kibana turns out not to have the streaming endpoint
+_streaming_enabled = CONVERSE_STREAMING
+
+
+def get_session() -> aiohttp.ClientSession:
+    """Return the shared keep-alive session for Kibana requests."""
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            headers=KIBANA_HEADERS,
+            connector=aiohttp.TCPConnector(limit=CONVERSE_MAX_CONNECTIONS),
+        )
+    return _session
+
+
+async def close_session() -> None:
+    """Close the shared Kibana session (call on shutdown)."""
+    if _session is not None and not _session.closed:
+        await _session.close()
+
+
+async def kibana_post(path: str, payload: dict, idempotent: bool = False) -> aiohttp.ClientResponse:
+    """POST to Kibana with the shared KibanaClient's timeouts, retry policy and timing hooks.
+
+    As in KibanaClient.request(), rate limits are retried, and so are
+    connections that failed before the request reached Kibana. Server errors
+    and dropped or timed-out requests are only retried if `idempotent`.
+    """
+    session = get_session()
+    timeout = aiohttp.ClientTimeout(total=timeout_for(path), connect=CONNECT_TIMEOUT)
+    start = time.monotonic()
+    attempt = 0
+    while True:
+        try:
+            resp = await session.post(f"{KIBANA_BASE_URL}{path}", json=payload, timeout=timeout)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            # Unless the request never reached Kibana, only repeat it if that's safe
+            never_sent = isinstance(e, (aiohttp.ClientConnectorError, aiohttp.ConnectionTimeoutError))
+            if attempt >= kibana.retries or not (idempotent or never_sent):
+                kibana.emit(RequestTiming("POST", path, None, time.monotonic() - start, attempt + 1))
+                raise
+        else:
+            if attempt >= kibana.retries or not should_retry("POST", resp.status, idempotent):
+                kibana.emit(RequestTiming("POST", path, resp.status, time.monotonic() - start, attempt + 1))
+                return resp
+            retry_after = resp.headers.get("Retry-After")
+            resp.release()
+            await asyncio.sleep(backoff_delay(attempt, retry_after, kibana.backoff, kibana.max_backoff))
+            attempt += 1
+            continue
+        await asyncio.sleep(backoff_delay(attempt, None, kibana.backoff, kibana.max_backoff))
+        attempt += 1
+
+
+async def converse(text: str, thread_ts: str | None = None) -> AgentReply:
+    """Send a message to the BeanStack agent and return its response."""
+    async with await kibana_post(CONVERSE_PATH, build_converse_payload(text, thread_ts)) as resp:
+        resp.raise_for_status()
+        data = await resp.json()
+    return parse_converse_response(data, thread_ts)
+
+
+async def converse_stream(text: str, thread_ts: str | None = None):
+    """Stream the agent's events for a message. Yields (event, data) tuples."""
+    async with await kibana_post(CONVERSE_STREAM_PATH, build_converse_payload(text, thread_ts)) as resp:
+        resp.raise_for_status()
+        parser = SSEParser()
+        async for chunk in resp.content.iter_any():
+            for event in parser.feed(chunk):
+                yield event
+
+
+async def blocking_reply(text, thread_ts, channel, msg_ts) -> AgentReply:
+    """Wait for the full answer while the scheduler cycles canned progress messages."""
+    progress.track(channel, msg_ts)
+    return await converse(text, thread_ts)
+
+
+async def stream_reply(text, thread_ts, channel, msg_ts) -> AgentReply:
+    """Push the agent's answer into the status message as it streams in."""
+    global _streaming_enabled
+    answer = AnswerStream(thread_ts)
+    try:
+        async for event, data in converse_stream(text, thread_ts):
+            answer.apply(event, data)
+            if not answer.done:
+                progress.update(channel, msg_ts, answer.render())
+    except aiohttp.ClientResponseError as e:
+        if e.status != 404:
+            raise
+        # Older Kibana without the streaming endpoint: fall back for good
+        _streaming_enabled = False
+        return await blocking_reply(text, thread_ts, channel, msg_ts)
+
+    return answer.reply()
+
+
+async def handle_user_message(text, thread_ts, user, say):
+    """Process a user message and reply in the thread."""
+    key = in_flight.claim(thread_ts, text)
+    if key is None:
+        return  # The same question is already being answered in this thread
+    try:
+        await answer_question(text, thread_ts, user, say)
+    finally:
+        in_flight.release(key)
+
+
+async def answer_question(text, thread_ts, user, say):
+    """Answer a question from the cache or the agent, updating the status message."""
+    cacheable = is_cacheable(text, thread_ts)
+    if cacheable:
+        # Version polling and question embedding are blocking HTTP calls
+        if data_version.is_stale():
+            await asyncio.to_thread(data_version.refresh)
+        version = data_version.value
+        if answer_cache.embed is None:
+            cached, embedding = answer_cache.lookup(text, version)
+        else:
+            cached, embedding = await asyncio.to_thread(answer_cache.lookup, text, version)
+        if cached:
+            await say(text=cached.render(), thread_ts=thread_ts)
+            return
+
+    # Structured questions that map onto one ES|QL tool skip the agent
+    if fast_path.enabled and thread_state.get_conversation(thread_ts) is None:
+        fast = await asyncio.to_thread(fast_path.answer, text)
+        if fast:
+            await say(text=fast.text, thread_ts=thread_ts)
+            if cacheable:
+                answer_cache.put(text, version, fast.text, embedding)
+            return
+
+    # Post the initial status message
+    result = await say(text=PROGRESS_MESSAGES[0], thread_ts=thread_ts)
+    channel = result["channel"]
+    msg_ts = result["ts"]
+
+    def show_position(position):
+        progress.update(channel, msg_ts, QUEUED_MESSAGE.format(position=position))
+
+    ticket = await work_queue.acquire(user, thread_ts, on_position=show_position)
+    try:
+        if ticket.queued:
+            progress.update(channel, msg_ts, PROGRESS_MESSAGES[0])
+        if _streaming_enabled:
+            reply = await stream_reply(text, thread_ts, channel, msg_ts)
+        else:
+            reply = await blocking_reply(text, thread_ts, channel, msg_ts)
+        slack_text = md_to_slack(reply.text or "No response from agent.")
+        if cacheable and reply.cacheable:
+            answer_cache.put(text, version, slack_text, embedding)
+    except Exception as e:
+        slack_text = f"Something went wrong: {e}"
+    finally:
+        work_queue.release(ticket)
+
+    await progress.finish(channel, msg_ts, slack_text)
+
+
+@app.event("app_mention")
+async def handle_mention(event, body, say, context):
+    """Respond to @BeanStack mentions in channels."""
+    if event_dedup.is_duplicate(body, event):
+        return
+    text = strip_mention(event.get("text", ""), context.bot_user_id)
+    if not text:
+        return
+
+    thread_ts = event.get("thread_ts") or event.get("ts")
+    thread_state.mark_active(thread_ts)
+    await handle_user_message(text, thread_ts, event.get("user", ""), say)
+
+
+@app.event("message")
+async def handle_message(event, body, say):
+    """Respond to DMs and follow-up messages in active threads."""
+    thread_ts = should_respond(event)
+    if not thread_ts or event_dedup.is_duplicate(body, event):
+        return
+
+    text = event.get("text", "").strip()
+    if not text:
+        return
+
+    await handle_user_message(text, thread_ts, event.get("user", ""), say)
+
+
+async def main():
+    print("Starting BeanStack Slack bot (asyncio)...")
+    print(f"  Agent: {AGENT_ID}")
+    print(f"  Kibana: {KIBANA_BASE_URL}")
+    print(f"  Max Kibana connections: {CONVERSE_MAX_CONNECTIONS}")
+    print("  Modes: @mention in channels, DM for multi-turn")
+    handler = AsyncSocketModeHandler(app, os.environ["SLACK_APP_TOKEN"])
+    try:
+        await handler.start_async()
+    finally:
+        await progress.close()
+        await close_session()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,277 @@
+"""
+Load-test the threaded (bot.py) and asyncio (async_bot.py) runtimes
+against local fake Kibana and Slack services.
+
+Each runtime runs in its own subprocess so memory numbers are not shared.
+traffic.py builds a schedule of mention, DM and thread follow-up events
+(--mix) that is replayed open-loop at --rate requests per second (0 sends
+a single burst) straight into the Bolt app. The run ends when every request
+has received its final answer or an error reply. Latency is end-to-end,
+from dispatch to the final answer landing in Slack; peak RSS is the
+worker's memory high-water mark.
+
+Pass --stream to use the streaming converse endpoint; "first text" then
+measures how long users wait before the answer starts appearing.
+
+The fake Kibana takes the same latency and fault options as
+fake_services.py (--latency-dist, --error-rate, --throttle-rate,
+--drop-rate), and --redeliver re-sends a fraction of events the way Slack
+does, to exercise deduplication.
+
+--slack-rate sets the bot's chat.update budget (SLACK_UPDATE_RATE) and
+--slack-limit makes the fake Slack answer 429 above that many updates/s.
+--max-concurrent / --max-per-user set the bot's agent-run limits (default
+unlimited, so runs measure the runtime rather than the queue).
+
+Usage:
+    uv run python slack_bot/benchmark.py [--conversations 100] [--rate 0] [--mix mention=1]
+        [--latency 2.0] [--latency-dist fixed] [--error-rate 0] [--redeliver 0]
+        [--modes threaded,asyncio] [--stream] [--slack-rate 50] [--slack-limit N]
+        [--max-concurrent 0] [--max-per-user 0]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from pathlib import Path
+
+from fake_services import ServiceThread, add_kibana_args, create_kibana_app, create_slack_app, kibana_config
+from traffic import SyntheticEvent, generate, parse_mix
+
+BOT_DIR = Path(__file__).resolve().parent
+MODES = ("threaded", "asyncio")
+
+
+def fetch_stats(url: str) -> dict:
+    with urllib.request.urlopen(f"{url}/_stats") as resp:
+        return json.load(resp)
+
+
+def reset_stats(url: str) -> None:
+    urllib.request.urlopen(urllib.request.Request(f"{url}/_reset", method="POST")).close()
+
+
+def finished(stats: dict, n: int) -> bool:
+    return len(stats["completed"]) + stats["errors"] >= n
+
+
+def schedule(args) -> list[SyntheticEvent]:
+    return generate(
+        args.conversations, rate=args.rate, mix=parse_mix(args.mix),
+        redeliver=args.redeliver, users=args.users, seed=args.seed or 0,
+    )
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB (Linux reports KB)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# ---------------------------------------------------------------------------
+# Worker side (runs inside the subprocess)
+# ---------------------------------------------------------------------------
+
+def run_threaded(events: list[SyntheticEvent], n: int, slack_url: str, timeout: float) -> dict:
+    from slack_bolt.request import BoltRequest
+
+    import bot
+
+    sent = {}
+    peak_threads = threading.active_count()
+    start = time.time()
+    for ev in events:
+        delay = start + ev.at - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        if ev.request_id is not None:
+            sent[str(ev.request_id)] = time.time()
+        bot.app.dispatch(BoltRequest(body=ev.body, mode="socket_mode"))
+        peak_threads = max(peak_threads, threading.active_count())
+
+    stats = fetch_stats(slack_url)
+    while not finished(stats, n) and time.time() - start < timeout:
+        peak_threads = max(peak_threads, threading.active_count())
+        time.sleep(0.2)
+        stats = fetch_stats(slack_url)
+
+    return summarize(
+        sent, stats, start,
+        peak_threads=peak_threads, peak_queue=bot.work_queue.peak_depth,
+        duplicates=bot.event_dedup.duplicates,
+    )
+
+
+def run_asyncio(events: list[SyntheticEvent], n: int, slack_url: str, timeout: float) -> dict:
+    from slack_bolt.request.async_request import AsyncBoltRequest
+
+    import async_bot
+
+    async def drive() -> dict:
+        sent = {}
+        peak_threads = threading.active_count()
+        peak_tasks = 0
+        start = time.time()
+        for ev in events:
+            delay = start + ev.at - time.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if ev.request_id is not None:
+                sent[str(ev.request_id)] = time.time()
+            await async_bot.app.async_dispatch(AsyncBoltRequest(body=ev.body, mode="socket_mode"))
+            peak_tasks = max(peak_tasks, len(asyncio.all_tasks()))
+
+        stats = await asyncio.to_thread(fetch_stats, slack_url)
+        while not finished(stats, n) and time.time() - start < timeout:
+            peak_threads = max(peak_threads, threading.active_count())
+            peak_tasks = max(peak_tasks, len(asyncio.all_tasks()))
+            await asyncio.sleep(0.2)
+            stats = await asyncio.to_thread(fetch_stats, slack_url)
+
+        await async_bot.close_session()
+        return summarize(
+            sent, stats, start,
+            peak_threads=peak_threads, peak_tasks=peak_tasks, peak_queue=async_bot.work_queue.peak_depth,
+            duplicates=async_bot.event_dedup.duplicates,
+        )
+
+    return asyncio.run(drive())
+
+
+def summarize(sent: dict, stats: dict, start: float, **extra) -> dict:
+    completed = stats["completed"]
+    latencies = sorted(completed[key] - sent[key] for key in sent if key in completed)
+    first_text = sorted(stats["first_text"][key] - sent[key] for key in sent if key in stats["first_text"])
+    end = max(completed.values()) if completed else time.time()
+
+    def pct(p: float, values: list[float] = latencies) -> float:
+        if not values:
+            return 0.0
+        return values[min(len(values) - 1, int(p * len(values)))]
+
+    return {
+        "completed": len(latencies),
+        "errors": stats["errors"],
+        "wall_s": round(end - start, 2),
+        "throughput": round(len(latencies) / max(end - start, 1e-9), 2),
+        "p50_s": round(pct(0.50), 2),
+        "p95_s": round(pct(0.95), 2),
+        "p99_s": round(pct(0.99), 2),
+        "first_text_p50_s": round(pct(0.50, first_text), 2),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        **extra,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Parent side
+# ---------------------------------------------------------------------------
+
+def run_mode(mode: str, args, kibana: ServiceThread, slack: ServiceThread) -> dict:
+    reset_stats(slack.url)
+    reset_stats(kibana.url)
+    env = dict(
+        os.environ,
+        SLACK_BOT_TOKEN="xoxb-benchmark",
+        SLACK_API_URL=f"{slack.url}/api/",
+        KIBANA_ENDPOINT=kibana.url,
+        ELASTICSEARCH_API_KEY="benchmark",
+        CONVERSE_STREAMING="true" if args.stream else "false",
+        FAST_PATH="false",
+        SLACK_UPDATE_RATE=str(args.slack_rate),
+        SLACK_UPDATE_BURST=str(max(1, int(args.slack_rate))),
+        SLACK_MAX_CONCURRENT=str(args.max_concurrent),
+        SLACK_MAX_PER_USER=str(args.max_per_user),
+    )
+    proc = subprocess.run(
+        [sys.executable, __file__, "--worker", mode, "--slack-url", slack.url, *sys.argv[1:]],
+        cwd=BOT_DIR, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        print(proc.stderr)
+        raise SystemExit(f"{mode} worker failed")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["slack_calls"] = fetch_stats(slack.url)["calls"]
+    result["kibana_calls"] = fetch_stats(kibana.url)["calls"]
+    return result
+
+
+def print_results(results: dict[str, dict], conversations: int) -> None:
+    print(f"\n{'':<22}" + "".join(f"{m:>14}" for m in results))
+    rows = [
+        ("completed", "completed"),
+        ("error replies", "errors"),
+        ("wall time (s)", "wall_s"),
+        ("throughput (req/s)", "throughput"),
+        ("p50 latency (s)", "p50_s"),
+        ("p95 latency (s)", "p95_s"),
+        ("p99 latency (s)", "p99_s"),
+        ("p50 first text (s)", "first_text_p50_s"),
+        ("peak RSS (MB)", "peak_rss_mb"),
+        ("peak threads", "peak_threads"),
+        ("peak asyncio tasks", "peak_tasks"),
+        ("peak queue depth", "peak_queue"),
+        ("duplicates dropped", "duplicates"),
+    ]
+    for label, key in rows:
+        print(f"{label:<22}" + "".join(f"{str(r.get(key, '-')):>14}" for r in results.values()))
+    for method in ("chat.postMessage", "chat.update", "rate_limited", "auth.test"):
+        print(f"{method:<22}" + "".join(
+            f"{r['slack_calls'].get(method, 0):>14}" for r in results.values()
+        ))
+    for call in ("converse", "converse_stream", "injected_error", "injected_throttle", "injected_drop"):
+        if any(r["kibana_calls"].get(call) for r in results.values()):
+            print(f"{call:<22}" + "".join(f"{r['kibana_calls'].get(call, 0):>14}" for r in results.values()))
+    incomplete = [m for m, r in results.items() if r["completed"] + r["errors"] < conversations]
+    if incomplete:
+        print(f"\nWARNING: {', '.join(incomplete)} did not answer all {conversations} requests.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the Slack bot runtimes")
+    parser.add_argument("--conversations", type=int, default=100, help="number of requests")
+    parser.add_argument("--rate", type=float, default=0, help="requests per second (0 = one burst)")
+    parser.add_argument("--mix", default="mention=1", help="traffic mix, e.g. mention=0.6,dm=0.2,followup=0.2")
+    parser.add_argument("--redeliver", type=float, default=0.0, help="fraction of events Slack delivers twice")
+    parser.add_argument("--users", type=int, default=12, help="distinct users sending requests")
+    add_kibana_args(parser)
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--stream", action="store_true", help="use the streaming converse endpoint")
+    parser.add_argument("--slack-rate", type=float, default=50, help="bot chat.update budget per second")
+    parser.add_argument("--slack-limit", type=float, help="fake Slack chat.update limit per second")
+    parser.add_argument("--max-concurrent", type=int, default=0, help="SLACK_MAX_CONCURRENT (0 = unlimited)")
+    parser.add_argument("--max-per-user", type=int, default=0, help="SLACK_MAX_PER_USER (0 = unlimited)")
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--worker", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--slack-url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        runner = run_threaded if args.worker == "threaded" else run_asyncio
+        print(json.dumps(runner(schedule(args), args.conversations, args.slack_url, args.timeout)))
+        return
+
+    modes = [m for m in args.modes.split(",") if m in MODES]
+    parse_mix(args.mix)
+    kibana = ServiceThread(create_kibana_app(*kibana_config(args))).start()
+    slack = ServiceThread(create_slack_app(args.slack_limit)).start()
+    pacing = f"{args.rate:g} req/s" if args.rate else "one burst"
+    print(f"Load-testing {args.conversations} requests, {pacing}, mix {args.mix} "
+          f"(converse latency {args.latency}s {args.latency_dist}, {'streaming' if args.stream else 'blocking'})...")
+
+    results = {}
+    for mode in modes:
+        print(f"  Running {mode}...")
+        results[mode] = run_mode(mode, args, kibana, slack)
+
+    print_results(results, args.conversations)
+
+
+if __name__ == "__main__":
+    main()
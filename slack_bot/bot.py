@@ -8,6 +8,11 @@ Supports:
   - @BeanStack mentions in channels (single-turn)
   - DM conversations with multi-turn follow-ups
 
+This is the threaded runtime: Bolt's listener threads answer from the cache
+or the fast path, then hand agent runs to the work queue's own thread pool
+and return, so queued questions never hold up event handling. See async_bot.py for the asyncio runtime, which
+holds many more in-flight conversations on the same VM.
+
 Setup:
   1. Create a Slack app at https://api.slack.com/apps
   2. Enable Socket Mode -> generates an xapp- app-level token
@@ -28,183 +33,191 @@ Usage:
 """
 
 import os
-import re
-import threading
-from urllib.parse import urlparse, urlunparse
 
 import requests
-from dotenv import load_dotenv
 from slack_bolt import App
 from slack_bolt.adapter.socket_mode import SocketModeHandler
+from slack_sdk import WebClient
+
+from common import (
+    AGENT_ID,
+    CONVERSE_PATH,
+    CONVERSE_STREAM_PATH,
+    CONVERSE_STREAMING,
+    KIBANA_BASE_URL,
+    PROGRESS_MESSAGES,
+    QUEUED_MESSAGE,
+    SLACK_API_URL,
+    SLACK_MAX_CONCURRENT,
+    SLACK_MAX_PER_USER,
+    AgentReply,
+    answer_cache,
+    build_converse_payload,
+    data_version,
+    event_dedup,
+    fast_path,
+    in_flight,
+    is_cacheable,
+    kibana,
+    md_to_slack,
+    parse_converse_response,
+    should_respond,
+    strip_mention,
+    thread_state,
+)
+from progress import ThreadedProgressScheduler
+from streaming import AnswerStream, SSEParser
+from work_queue import ThreadedWorkQueue
 
-load_dotenv()
+# Slack setup
+app = App(client=WebClient(token=os.environ["SLACK_BOT_TOKEN"], base_url=SLACK_API_URL))
 
-AGENT_ID = "beanstack-research"
+# One thread updates every in-flight status message within Slack's rate limit
+progress = ThreadedProgressScheduler(app.client)
 
-# Slack setup
-app = App(token=os.environ["SLACK_BOT_TOKEN"])
-
-# Kibana connection (same env vars as the setup scripts)
-_kibana_url = os.getenv("KIBANA_ENDPOINT")
-if not _kibana_url:
-    raise ValueError("KIBANA_ENDPOINT is required")
-_parsed = urlparse(_kibana_url)
-KIBANA_BASE_URL = urlunparse((_parsed.scheme, _parsed.netloc, "", "", "", ""))
-
-_api_key = os.getenv("ELASTICSEARCH_API_KEY")
-if not _api_key:
-    raise ValueError("ELASTICSEARCH_API_KEY is required")
-KIBANA_HEADERS = {
-    "Authorization": f"ApiKey {_api_key}",
-    "Content-Type": "application/json",
-    "kbn-xsrf": "true",
-    "elastic-api-version": "2023-10-31",
-    "x-elastic-internal-origin": "kibana",
-}
-
-# Map Slack thread_ts -> Agent Builder conversation_id for multi-turn
-_thread_conversations: dict[str, str] = {}
-# Track threads where the bot was mentioned (so we respond to follow-ups)
-_active_threads: set[str] = set()
-
-
-def md_to_slack(text: str) -> str:
-    """Convert standard Markdown to Slack mrkdwn format."""
-    # Links: [text](url) -> <url|text>
-    text = re.sub(r"\[([^\]]+)\]\(([^)]+)\)", r"<\2|\1>", text)
-    # Bold: **text** -> *text*
-    text = re.sub(r"\*\*(.+?)\*\*", r"*\1*", text)
-    # Italic: _text_ stays the same in Slack; convert *text* (single) -> _text_
-    # (only when not inside bold — already converted above)
-    # Headers: ### text / ## text / # text -> *text* (bold)
-    text = re.sub(r"^#{1,3}\s+(.+)$", r"*\1*", text, flags=re.MULTILINE)
-    # Strikethrough: ~~text~~ -> ~text~
-    text = re.sub(r"~~(.+?)~~", r"~\1~", text)
-    # Bullet lists: - item or * item -> • item
-    text = re.sub(r"^[\-\*]\s+", "• ", text, flags=re.MULTILINE)
-    return text
-
-
-def converse(text: str, thread_ts: str | None = None) -> str:
+# Agent runs: one per thread at a time, fair across users, bounded overall
+work_queue = ThreadedWorkQueue(max_concurrent=SLACK_MAX_CONCURRENT, max_per_user=SLACK_MAX_PER_USER)
+
+# Cleared if Kibana turns out not to have the streaming endpoint
+_streaming_enabled = CONVERSE_STREAMING
+
+
+def converse(text: str, thread_ts: str | None = None) -> AgentReply:
     """Send a message to the BeanStack agent and return its response."""
-    payload: dict = {
-        "input": text,
-        "agent_id": AGENT_ID,
-    }
-    if thread_ts and thread_ts in _thread_conversations:
-        payload["conversation_id"] = _thread_conversations[thread_ts]
-
-    resp = requests.post(
-        f"{KIBANA_BASE_URL}/api/agent_builder/converse",
-        headers=KIBANA_HEADERS,
-        json=payload,
-        timeout=120,
-    )
+    resp = kibana.post(CONVERSE_PATH, json=build_converse_payload(text, thread_ts))
     resp.raise_for_status()
-    data = resp.json()
+    return parse_converse_response(resp.json(), thread_ts)
+
+
+def converse_stream(text: str, thread_ts: str | None = None):
+    """Stream the agent's events for a message. Yields (event, data) tuples."""
+    with kibana.post(CONVERSE_STREAM_PATH, json=build_converse_payload(text, thread_ts), stream=True) as resp:
+        resp.raise_for_status()
+        parser = SSEParser()
+        for chunk in resp.iter_content(chunk_size=None):
+            yield from parser.feed(chunk)
 
-    # Save conversation_id for follow-up messages in the same thread
-    conv_id = data.get("conversation_id")
-    if conv_id and thread_ts:
-        _thread_conversations[thread_ts] = conv_id
 
-    reply = ""
-    resp_obj = data.get("response")
-    if isinstance(resp_obj, dict):
-        reply = resp_obj.get("message", "")
-    elif isinstance(resp_obj, str):
-        reply = resp_obj
-    return reply or "No response from agent."
+def blocking_reply(text, thread_ts, channel, msg_ts) -> AgentReply:
+    """Wait for the full answer while the scheduler cycles canned progress messages."""
+    progress.track(channel, msg_ts)
+    return converse(text, thread_ts)
 
 
-PROGRESS_MESSAGES = [
-    ":coffee: Thinking...",
-    ":coffee: Working on it...",
-    ":coffee: Processing...",
-    ":coffee: Searching reports...",
-    ":coffee: Crunching numbers...",
-    ":coffee: Almost there...",
-]
+def stream_reply(text, thread_ts, channel, msg_ts) -> AgentReply:
+    """Push the agent's answer into the status message as it streams in."""
+    global _streaming_enabled
+    answer = AnswerStream(thread_ts)
+    try:
+        for event, data in converse_stream(text, thread_ts):
+            answer.apply(event, data)
+            if not answer.done:
+                progress.update(channel, msg_ts, answer.render())
+    except requests.HTTPError as e:
+        if e.response is None or e.response.status_code != 404:
+            raise
+        # Older Kibana without the streaming endpoint: fall back for good
+        _streaming_enabled = False
+        return blocking_reply(text, thread_ts, channel, msg_ts)
+
+    return answer.reply()
 
 
-def handle_user_message(text, thread_ts, say):
+def handle_user_message(text, thread_ts, user, say):
     """Process a user message and reply in the thread."""
+    key = in_flight.claim(thread_ts, text)
+    if key is None:
+        return  # The same question is already being answered in this thread
+    handed_off = False
+    try:
+        handed_off = answer_question(text, thread_ts, user, say, on_done=lambda: in_flight.release(key))
+    finally:
+        if not handed_off:
+            in_flight.release(key)
+
+
+def answer_question(text, thread_ts, user, say, on_done) -> bool:
+    """Answer a question from the cache, or queue an agent run that updates the status message.
+
+    Returns True if an agent run was queued; it calls on_done() when it finishes.
+    """
+    cacheable = is_cacheable(text, thread_ts)
+    if cacheable:
+        version = data_version.current()
+        cached, embedding = answer_cache.lookup(text, version)
+        if cached:
+            say(text=cached.render(), thread_ts=thread_ts)
+            return False
+
+    # Structured questions that map onto one ES|QL tool skip the agent
+    if fast_path.enabled and thread_state.get_conversation(thread_ts) is None:
+        fast = fast_path.answer(text)
+        if fast:
+            say(text=fast.text, thread_ts=thread_ts)
+            if cacheable:
+                answer_cache.put(text, version, fast.text, embedding)
+            return False
+
     # Post the initial status message
     result = say(text=PROGRESS_MESSAGES[0], thread_ts=thread_ts)
     channel = result["channel"]
     msg_ts = result["ts"]
 
-    # Cycle through progress messages in a background thread
-    done = threading.Event()
-    def update_progress():
-        idx = 1
-        while not done.wait(timeout=3):
-            msg = PROGRESS_MESSAGES[idx % len(PROGRESS_MESSAGES)]
-            try:
-                app.client.chat_update(channel=channel, ts=msg_ts, text=msg)
-            except Exception:
-                pass
-            idx += 1
-
-    progress_thread = threading.Thread(target=update_progress, daemon=True)
-    progress_thread.start()
-
-    try:
-        reply = converse(text, thread_ts)
-        done.set()
-        app.client.chat_update(
-            channel=channel, ts=msg_ts, text=md_to_slack(reply),
-        )
-    except Exception as e:
-        done.set()
-        app.client.chat_update(
-            channel=channel, ts=msg_ts, text=f"Something went wrong: {e}",
-        )
+    def show_position(position):
+        progress.update(channel, msg_ts, QUEUED_MESSAGE.format(position=position))
+
+    def run_agent(ticket):
+        try:
+            if ticket.queued:
+                progress.update(channel, msg_ts, PROGRESS_MESSAGES[0])
+            if _streaming_enabled:
+                reply = stream_reply(text, thread_ts, channel, msg_ts)
+            else:
+                reply = blocking_reply(text, thread_ts, channel, msg_ts)
+            slack_text = md_to_slack(reply.text or "No response from agent.")
+            if cacheable and reply.cacheable:
+                answer_cache.put(text, version, slack_text, embedding)
+        except Exception as e:
+            slack_text = f"Something went wrong: {e}"
+        try:
+            progress.finish(channel, msg_ts, slack_text)
+        finally:
+            on_done()
+
+    work_queue.run(user, thread_ts, run_agent, on_position=show_position)
+    return True
 
 
 @app.event("app_mention")
-def handle_mention(event, say):
+def handle_mention(event, body, say, context):
     """Respond to @BeanStack mentions in channels."""
-    text = event.get("text", "")
-    bot_user_id = app.client.auth_test()["user_id"]
-    text = text.replace(f"<@{bot_user_id}>", "").strip()
+    if event_dedup.is_duplicate(body, event):
+        return
+    text = strip_mention(event.get("text", ""), context.bot_user_id)
     if not text:
         return
 
     thread_ts = event.get("thread_ts") or event.get("ts")
-    _active_threads.add(thread_ts)
-    handle_user_message(text, thread_ts, say)
+    thread_state.mark_active(thread_ts)
+    handle_user_message(text, thread_ts, event.get("user", ""), say)
 
 
 @app.event("message")
-def handle_message(event, say):
+def handle_message(event, body, say):
     """Respond to DMs and follow-up messages in active threads."""
-    if event.get("bot_id") or event.get("subtype"):
+    thread_ts = should_respond(event)
+    if not thread_ts or event_dedup.is_duplicate(body, event):
         return
 
     text = event.get("text", "").strip()
     if not text:
         return
 
-    channel_type = event.get("channel_type")
-    thread_ts = event.get("thread_ts")
-
-    # In channels, only respond to follow-ups in threads we started
-    if thread_ts and thread_ts in _active_threads:
-        pass  # Follow-up in a tracked thread
-    elif channel_type == "im":
-        pass  # DM — always respond
-    else:
-        return
-
-    if not thread_ts:
-        thread_ts = event.get("ts")
-
-    handle_user_message(text, thread_ts, say)
+    handle_user_message(text, thread_ts, event.get("user", ""), say)
 
 
 if __name__ == "__main__":
-    print("Starting BeanStack Slack bot...")
+    print("Starting BeanStack Slack bot (threaded)...")
     print(f"  Agent: {AGENT_ID}")
     print(f"  Kibana: {KIBANA_BASE_URL}")
     print("  Modes: @mention in channels, DM for multi-turn")
@@ -0,0 +1,229 @@
+"""
+Shared configuration and helpers for the BeanStack Slack bot runtimes.
+
+Both the threaded runtime (bot.py) and the asyncio runtime (async_bot.py)
+read the same env vars, talk to the same agent, and format replies the same way.
+"""
+
+import os
+import re
+import sys
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+# The Kibana client lives with the setup scripts so both share it
+sys.path.insert(0, str(PROJECT_ROOT / "scripts" / "es_setup"))
+
+from answer_cache import (
+    SIDE_EFFECT_TOOL_IDS,
+    AnswerCache,
+    DataVersion,
+    es_embedder,
+    is_cacheable_question,
+)
+from dedup import EventDeduplicator, InFlightQuestions
+from fast_path import FastPathRouter
+from kibana_client import get_headers, get_kibana_base_url, get_kibana_client
+from state_store import create_state_store
+
+load_dotenv()
+
+AGENT_ID = "beanstack-research"
+
+# Pooled keep-alive connections to Kibana (threaded runtime)
+KIBANA_POOL_SIZE = int(os.getenv("KIBANA_POOL_SIZE", "20"))
+
+# Slack Web API base URL (override to point the bot at a local stand-in)
+SLACK_API_URL = os.getenv("SLACK_API_URL", "https://slack.com/api/")
+
+# Kibana connection: same env vars and pooled client as the setup scripts
+KIBANA_BASE_URL = get_kibana_base_url()
+KIBANA_HEADERS = get_headers()
+kibana = get_kibana_client(pool_size=KIBANA_POOL_SIZE)
+
+# Elasticsearch (optional — lets the answer cache see when new data is ingested)
+_es_url = os.getenv("ELASTICSEARCH_ENDPOINT")
+ES_BASE_URL = _es_url.rstrip("/") if _es_url else None
+ES_HEADERS = {
+    "Authorization": KIBANA_HEADERS["Authorization"],
+    "Content-Type": "application/json",
+}
+
+CONVERSE_PATH = "/api/agent_builder/converse"
+CONVERSE_STREAM_PATH = "/api/agent_builder/converse/async"
+
+# Stream partial answers into Slack (falls back to blocking converse if unsupported)
+CONVERSE_STREAMING = os.getenv("CONVERSE_STREAMING", "true").lower() in ("1", "true", "yes")
+# Minimum seconds between chat_update calls for one streamed message
+STREAM_UPDATE_INTERVAL = float(os.getenv("STREAM_UPDATE_INTERVAL", "1.0"))
+
+# Seconds between progress message rotations
+PROGRESS_INTERVAL = 3
+
+QUEUED_MESSAGE = ":hourglass_flowing_sand: Queued (position {position})..."
+
+# Concurrent agent runs, overall and per Slack user (0 = unlimited)
+SLACK_MAX_CONCURRENT = int(os.getenv("SLACK_MAX_CONCURRENT", "32"))
+SLACK_MAX_PER_USER = int(os.getenv("SLACK_MAX_PER_USER", "3"))
+
+# Global budget for chat_update calls across all in-flight messages
+# (chat.update is a Slack tier-3 method, roughly 50 calls per minute)
+SLACK_UPDATE_RATE = float(os.getenv("SLACK_UPDATE_RATE", "0.8"))
+SLACK_UPDATE_BURST = int(os.getenv("SLACK_UPDATE_BURST", "10"))
+
+PROGRESS_MESSAGES = [
+    ":coffee: Thinking...",
+    ":coffee: Working on it...",
+    ":coffee: Processing...",
+    ":coffee: Searching reports...",
+    ":coffee: Crunching numbers...",
+    ":coffee: Almost there...",
+]
+
+# Answer cache for repeated first-turn questions (ANSWER_CACHE_TTL=0 disables it)
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "1800"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "256"))
+# Cosine similarity for near-identical phrasings (unset = exact matches only)
+_similarity = os.getenv("ANSWER_CACHE_SIMILARITY")
+ANSWER_CACHE_SIMILARITY = float(_similarity) if _similarity else None
+DATA_VERSION_POLL_INTERVAL = 30
+
+answer_cache = AnswerCache(
+    max_entries=ANSWER_CACHE_SIZE,
+    ttl=ANSWER_CACHE_TTL,
+    similarity_threshold=ANSWER_CACHE_SIMILARITY,
+    embed=es_embedder(ES_BASE_URL, ES_HEADERS) if ES_BASE_URL else None,
+)
+data_version = DataVersion(ES_BASE_URL, ES_HEADERS, DATA_VERSION_POLL_INTERVAL)
+
+# Run matching ES|QL tools directly for structured questions (needs ELASTICSEARCH_ENDPOINT)
+FAST_PATH = os.getenv("FAST_PATH", "true").lower() in ("1", "true", "yes")
+FAST_PATH_TIMEOUT = float(os.getenv("FAST_PATH_TIMEOUT", "2.0"))
+
+fast_path = FastPathRouter(
+    ES_BASE_URL if FAST_PATH else None, ES_HEADERS, timeout=FAST_PATH_TIMEOUT, data_version=data_version,
+)
+
+# Per-thread state: Slack thread_ts -> Agent Builder conversation_id for
+# multi-turn, and whether the bot was mentioned there (so we respond to
+# follow-ups). "memory" is lost on restart; "sqlite" persists to SLACK_STATE_DB.
+SLACK_STATE_STORE = os.getenv("SLACK_STATE_STORE", "memory")
+SLACK_STATE_DB = os.getenv("SLACK_STATE_DB", str(PROJECT_ROOT / "data" / "bot-state.db"))
+SLACK_STATE_MAX_THREADS = int(os.getenv("SLACK_STATE_MAX_THREADS", "10000"))
+SLACK_STATE_TTL_DAYS = float(os.getenv("SLACK_STATE_TTL_DAYS", "7"))
+
+thread_state = create_state_store(
+    SLACK_STATE_STORE,
+    path=SLACK_STATE_DB,
+    max_threads=SLACK_STATE_MAX_THREADS,
+    ttl=SLACK_STATE_TTL_DAYS * 86400,
+)
+
+# Redelivered Slack events are dropped if seen within SLACK_DEDUP_TTL seconds
+SLACK_DEDUP_TTL = float(os.getenv("SLACK_DEDUP_TTL", "600"))
+
+event_dedup = EventDeduplicator(ttl=SLACK_DEDUP_TTL)
+in_flight = InFlightQuestions()
+
+
+@dataclass
+class AgentReply:
+    """The agent's Markdown answer plus the tools it used to get there."""
+
+    text: str
+    tool_ids: set[str] = field(default_factory=set)
+
+    @property
+    def cacheable(self) -> bool:
+        return bool(self.text) and not (self.tool_ids & SIDE_EFFECT_TOOL_IDS)
+
+
+def md_to_slack(text: str) -> str:
+    """Convert standard Markdown to Slack mrkdwn format."""
+    # Links: [text](url) -> <url|text>
+    text = re.sub(r"\[([^\]]+)\]\(([^)]+)\)", r"<\2|\1>", text)
+    # Bold: **text** -> *text*
+    text = re.sub(r"\*\*(.+?)\*\*", r"*\1*", text)
+    # Italic: _text_ stays the same in Slack; convert *text* (single) -> _text_
+    # (only when not inside bold — already converted above)
+    # Headers: ### text / ## text / # text -> *text* (bold)
+    text = re.sub(r"^#{1,3}\s+(.+)$", r"*\1*", text, flags=re.MULTILINE)
+    # Strikethrough: ~~text~~ -> ~text~
+    text = re.sub(r"~~(.+?)~~", r"~\1~", text)
+    # Bullet lists: - item or * item -> • item
+    text = re.sub(r"^[\-\*]\s+", "• ", text, flags=re.MULTILINE)
+    return text
+
+
+def build_converse_payload(text: str, thread_ts: str | None = None) -> dict:
+    """Build the converse request body, continuing the thread's conversation if known."""
+    payload: dict = {
+        "input": text,
+        "agent_id": AGENT_ID,
+    }
+    conversation_id = thread_state.get_conversation(thread_ts)
+    if conversation_id:
+        payload["conversation_id"] = conversation_id
+    return payload
+
+
+def parse_converse_response(data: dict, thread_ts: str | None = None) -> AgentReply:
+    """Extract the reply and remember the conversation_id for follow-ups."""
+    # Save conversation_id for follow-up messages in the same thread
+    conv_id = data.get("conversation_id")
+    if conv_id and thread_ts:
+        thread_state.set_conversation(thread_ts, conv_id)
+
+    reply = ""
+    resp_obj = data.get("response")
+    if isinstance(resp_obj, dict):
+        reply = resp_obj.get("message", "")
+    elif isinstance(resp_obj, str):
+        reply = resp_obj
+    tool_ids = {
+        step.get("tool_id") for step in data.get("steps", [])
+        if isinstance(step, dict) and step.get("type") == "tool_call"
+    }
+    return AgentReply(reply, tool_ids)
+
+
+def is_cacheable(text: str, thread_ts: str | None) -> bool:
+    """Only first-turn, read-only questions go through the answer cache."""
+    return (
+        answer_cache.enabled
+        and thread_state.get_conversation(thread_ts) is None
+        and is_cacheable_question(text)
+    )
+
+
+def strip_mention(text: str, bot_user_id: str | None) -> str:
+    """Remove the bot's own @mention from a message."""
+    if bot_user_id:
+        text = text.replace(f"<@{bot_user_id}>", "")
+    return text.strip()
+
+
+def should_respond(event: dict) -> str | None:
+    """Decide whether a plain message event needs a reply.
+
+    Returns the thread_ts to reply in, or None to ignore the message.
+    """
+    if event.get("bot_id") or event.get("subtype"):
+        return None
+
+    channel_type = event.get("channel_type")
+    thread_ts = event.get("thread_ts")
+
+    # In channels, only respond to follow-ups in threads we started
+    if thread_state.is_active(thread_ts):
+        pass  # Follow-up in a tracked thread
+    elif channel_type == "im":
+        pass  # DM — always respond
+    else:
+        return None
+
+    return thread_ts or event.get("ts")
@@ -0,0 +1,96 @@
+"""
+Idempotent event handling for the BeanStack Slack bot.
+
+Slack redelivers events when an ack is slow or the Socket Mode connection
+drops, and a message that @mentions the bot in a thread it is already
+following arrives twice (as app_mention and as message). Without a guard,
+each copy costs a full agent run and posts a duplicate answer.
+
+  - EventDeduplicator remembers recently seen event_id and client_msg_id
+    values (bounded, with TTL) so a redelivered event is dropped on arrival.
+  - InFlightQuestions is a single-flight guard: while a question is being
+    answered in a thread, an identical question in the same thread joins
+    that run (its answer lands in the same thread) instead of starting a
+    second converse call.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from answer_cache import normalize_question
+
+
+def event_keys(body: dict, event: dict) -> list[str]:
+    """Identifiers Slack keeps stable across redeliveries of one message."""
+    keys = []
+    if body.get("event_id"):
+        keys.append(f"event:{body['event_id']}")
+    # client_msg_id is shared by the app_mention and message copies of a message
+    if event.get("client_msg_id"):
+        keys.append(f"msg:{event.get('channel')}:{event['client_msg_id']}")
+    return keys
+
+
+class EventDeduplicator:
+    """Thread-safe LRU + TTL set of recently handled event identifiers."""
+
+    def __init__(self, max_entries: int = 10_000, ttl: float = 600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._seen: OrderedDict[str, float] = OrderedDict()
+        self._lock = threading.Lock()
+        self.duplicates = 0
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def _evict(self, now: float) -> None:
+        """Drop expired and excess entries (oldest first). Caller holds the lock."""
+        while self._seen:
+            key, seen_at = next(iter(self._seen.items()))
+            if now - seen_at <= self.ttl and len(self._seen) <= self.max_entries:
+                break
+            del self._seen[key]
+
+    def is_duplicate(self, body: dict, event: dict) -> bool:
+        """Record an event and return True if any of its identifiers was seen already."""
+        keys = event_keys(body, event)
+        if not keys:
+            return False
+        now = time.time()
+        with self._lock:
+            self._evict(now)
+            duplicate = any(key in self._seen for key in keys)
+            for key in keys:
+                self._seen[key] = now
+                self._seen.move_to_end(key)
+            if duplicate:
+                self.duplicates += 1
+        return duplicate
+
+
+class InFlightQuestions:
+    """Single-flight guard for identical questions in the same thread."""
+
+    def __init__(self):
+        self._keys: set[tuple[str, str]] = set()
+        self._lock = threading.Lock()
+        self.joined = 0
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def claim(self, thread_ts: str, text: str) -> tuple[str, str] | None:
+        """Claim a question. Returns a key to release(), or None if it is already in flight."""
+        key = (thread_ts, normalize_question(text))
+        with self._lock:
+            if key in self._keys:
+                self.joined += 1
+                return None
+            self._keys.add(key)
+        return key
+
+    def release(self, key: tuple[str, str]) -> None:
+        with self._lock:
+            self._keys.discard(key)
@@ -0,0 +1,403 @@
+"""
+Local stand-ins for the services the Slack bot talks to, for offline testing
+and benchmarks:
+
+  - Fake Kibana: POST /api/agent_builder/converse and the streaming
+    POST /api/agent_builder/converse/async (Server-Sent Events: reasoning,
+    tool call/result, message chunks). Latency is drawn from a configurable
+    distribution, and faults can be injected: 500s, 429s with Retry-After,
+    and streams that drop mid-answer.
+  - Fake Slack Web API: auth.test, chat.postMessage, chat.update, with call
+    counters, first-text/completion times and error counts exposed on
+    GET /_stats, and an optional chat.update rate limit answered with 429 +
+    Retry-After
+
+Every fake answer starts with ANSWER_START and ends with ANSWER_MARKER, so a
+driver can tell the first streamed text and the final reply apart from
+progress updates. Answers echo the question, so a question tagged with
+"[q<N>]" (see traffic.py) is tracked per request, even when several share a
+thread.
+
+Usage:
+    uv run python slack_bot/fake_services.py [--kibana-port 5601] [--slack-port 5602] [--latency 2.0]
+        [--latency-dist fixed|uniform|exponential|lognormal] [--error-rate 0.01] [--throttle-rate 0.01]
+        [--drop-rate 0.01]
+
+Then point the bot at them:
+    KIBANA_ENDPOINT=http://127.0.0.1:5601 SLACK_API_URL=http://127.0.0.1:5602/api/ ...
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass
+
+from aiohttp import web
+
+ANSWER_START = "Here is what I found"
+ANSWER_MARKER = "[end of answer]"
+
+BOT_USER_ID = "UBEANSTACK"
+BOT_ID = "BBEANSTACK"
+TEAM_ID = "T0BEANSTACK"
+
+# Prefix of the bot's reply when converse fails
+ERROR_PREFIX = "Something went wrong"
+
+# Request tag added to questions by traffic.py
+REQUEST_TAG = re.compile(r"\[q(\d+)\]")
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "exponential", "lognormal")
+
+
+# ---------------------------------------------------------------------------
+# Fake Kibana (Agent Builder converse API)
+# ---------------------------------------------------------------------------
+
+def fake_answer(question: str) -> str:
+    """Build a deterministic Markdown answer for a question."""
+    return (
+        f"## Summary\n"
+        f"{ANSWER_START} for **{question}**:\n"
+        f"- Revenue is up 4% quarter over quarter\n"
+        f"- Two branches reported espresso machine failures\n\n"
+        f"{ANSWER_MARKER}"
+    )
+
+
+@dataclass
+class LatencyModel:
+    """Converse latency distribution with the given mean (seconds).
+
+    uniform spreads ±`spread` × mean; lognormal uses `spread` as sigma,
+    which gives the long tail real agent runs have.
+    """
+
+    mean: float = 2.0
+    dist: str = "fixed"
+    spread: float = 0.5
+    seed: int | None = None
+
+    def __post_init__(self):
+        if self.dist not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution: {self.dist!r}")
+        self._rng = random.Random(self.seed)
+
+    def sample(self) -> float:
+        if self.dist == "uniform":
+            return self._rng.uniform(self.mean * (1 - self.spread), self.mean * (1 + self.spread))
+        if self.dist == "exponential":
+            return self._rng.expovariate(1 / self.mean) if self.mean > 0 else 0.0
+        if self.dist == "lognormal":
+            if self.mean <= 0:
+                return 0.0
+            mu = math.log(self.mean) - self.spread ** 2 / 2
+            return self._rng.lognormvariate(mu, self.spread)
+        return self.mean
+
+
+@dataclass
+class Faults:
+    """Fractions of converse calls that fail, by kind."""
+
+    error_rate: float = 0.0      # HTTP 500
+    throttle_rate: float = 0.0   # HTTP 429 with Retry-After
+    drop_rate: float = 0.0       # stream cut off before the answer completes
+    retry_after: float = 1.0
+    seed: int | None = None
+
+    def __post_init__(self):
+        self._rng = random.Random(self.seed)
+
+    def pick(self) -> str | None:
+        """Return the fault to inject for one call, if any."""
+        roll = self._rng.random()
+        for kind, rate in (("error", self.error_rate), ("throttle", self.throttle_rate), ("drop", self.drop_rate)):
+            if roll < rate:
+                return kind
+            roll -= rate
+        return None
+
+
+def create_kibana_app(latency: float | LatencyModel = 2.0, faults: Faults | None = None) -> web.Application:
+    """Build the fake Kibana app.
+
+    `latency` is the converse delay in seconds, or a LatencyModel.
+    """
+    app = web.Application()
+    app["latency"] = latency if isinstance(latency, LatencyModel) else LatencyModel(latency)
+    app["faults"] = faults or Faults()
+    app["calls"] = Counter()
+
+    def inject(kind: str | None) -> web.Response | None:
+        if kind == "error":
+            app["calls"]["injected_error"] += 1
+            return web.json_response({"statusCode": 500, "error": "Internal Server Error"}, status=500)
+        if kind == "throttle":
+            app["calls"]["injected_throttle"] += 1
+            return web.json_response(
+                {"statusCode": 429, "error": "Too Many Requests"},
+                status=429, headers={"Retry-After": str(app["faults"].retry_after)},
+            )
+        return None
+
+    async def converse(request: web.Request) -> web.Response:
+        app["calls"]["converse"] += 1
+        body = await request.json()
+        fault = app["faults"].pick()
+        failed = inject(fault)
+        if failed is not None:
+            return failed
+        await asyncio.sleep(app["latency"].sample())
+        return web.json_response({
+            "conversation_id": body.get("conversation_id") or str(uuid.uuid4()),
+            "response": {"message": fake_answer(body.get("input", ""))},
+        })
+
+    async def converse_stream(request: web.Request) -> web.StreamResponse:
+        app["calls"]["converse_stream"] += 1
+        body = await request.json()
+        fault = app["faults"].pick()
+        failed = inject(fault)
+        if failed is not None:
+            return failed
+        latency = app["latency"].sample()
+        tool_id = "beanstack.revenue_by_region"
+
+        resp = web.StreamResponse(headers={
+            "Content-Type": "text/event-stream",
+            "Cache-Control": "no-cache",
+        })
+        await resp.prepare(request)
+
+        async def send(event: str, data: dict) -> None:
+            await resp.write(f"event: {event}\ndata: {json.dumps({'data': data})}\n\n".encode())
+
+        await send("conversation_id_set", {
+            "conversation_id": body.get("conversation_id") or str(uuid.uuid4()),
+        })
+        await send("reasoning", {"reasoning": "Looking for the right tool"})
+        await asyncio.sleep(latency * 0.2)
+        await send("tool_call", {"tool_call_id": "call-1", "tool_id": tool_id, "params": {}})
+        await asyncio.sleep(latency * 0.3)
+        await send("tool_result", {"tool_call_id": "call-1", "tool_id": tool_id, "results": []})
+
+        answer = fake_answer(body.get("input", ""))
+        words = answer.split(" ")
+        if fault == "drop":
+            # Cut the stream off halfway through the answer
+            app["calls"]["injected_drop"] += 1
+            words = words[: len(words) // 2]
+        for i, word in enumerate(words):
+            await asyncio.sleep(latency * 0.5 / len(words))
+            await send("message_chunk", {
+                "message_id": "msg-1",
+                "text_chunk": word if i == len(words) - 1 else word + " ",
+            })
+        if fault == "drop":
+            request.transport.close()
+            return resp
+        await send("message_complete", {"message_id": "msg-1", "message_content": answer})
+        await send("round_complete", {})
+        await resp.write_eof()
+        return resp
+
+    async def stats(request: web.Request) -> web.Response:
+        return web.json_response({"calls": dict(app["calls"])})
+
+    async def reset(request: web.Request) -> web.Response:
+        # Restart the seeded sequences so every benchmark run sees the same draws
+        app["calls"].clear()
+        app["latency"]._rng.seed(app["latency"].seed)
+        app["faults"]._rng.seed(app["faults"].seed)
+        return web.json_response({"ok": True})
+
+    app.router.add_post("/api/agent_builder/converse", converse)
+    app.router.add_post("/api/agent_builder/converse/async", converse_stream)
+    app.router.add_get("/_stats", stats)
+    app.router.add_post("/_reset", reset)
+    return app
+
+
+# ---------------------------------------------------------------------------
+# Fake Slack Web API
+# ---------------------------------------------------------------------------
+
+def create_slack_app(update_rate: float | None = None) -> web.Application:
+    """Build the fake Slack Web API app.
+
+    With `update_rate`, chat.update calls beyond that many per second (in
+    one-second windows) get a 429 with Retry-After, like the real API.
+    """
+    app = web.Application()
+    app["calls"] = Counter()
+    app["update_window"] = [0, 0]  # [window second, calls in it]
+    app["message_threads"] = {}  # message ts -> thread_ts it was posted in
+    # Keyed by request tag ("[q<N>]" in the answer), or thread_ts for untagged questions
+    app["first_text"] = {}       # key -> time the first answer text landed
+    app["completed"] = {}        # key -> time the final answer landed
+    app["errors"] = {}           # message ts -> time an error reply landed
+    ts_counter = itertools.count(1)
+
+    def record(ts: str, text: str) -> None:
+        """Note first answer text, final answers and error replies in a message."""
+        tag = REQUEST_TAG.search(text)
+        key = tag.group(1) if tag else app["message_threads"].get(ts, ts)
+        if ANSWER_START in text:
+            app["first_text"].setdefault(key, time.time())
+        if ANSWER_MARKER in text:
+            app["completed"].setdefault(key, time.time())
+        elif text.startswith(ERROR_PREFIX):
+            app["errors"].setdefault(ts, time.time())
+
+    async def read_args(request: web.Request) -> dict:
+        if request.content_type == "application/json":
+            return await request.json()
+        return dict(await request.post())
+
+    async def auth_test(request: web.Request) -> web.Response:
+        app["calls"]["auth.test"] += 1
+        return web.json_response({
+            "ok": True, "user_id": BOT_USER_ID, "bot_id": BOT_ID,
+            "team_id": TEAM_ID, "user": "beanstack", "team": "BeanStack",
+        })
+
+    async def post_message(request: web.Request) -> web.Response:
+        app["calls"]["chat.postMessage"] += 1
+        args = await read_args(request)
+        ts = f"{int(time.time())}.{next(ts_counter):06d}"
+        app["message_threads"][ts] = args.get("thread_ts") or ts
+        record(ts, args.get("text") or "")
+        return web.json_response({"ok": True, "channel": args.get("channel"), "ts": ts})
+
+    async def chat_update(request: web.Request) -> web.Response:
+        if update_rate:
+            window = app["update_window"]
+            second = int(time.time())
+            if window[0] != second:
+                window[:] = [second, 0]
+            window[1] += 1
+            if window[1] > update_rate:
+                app["calls"]["rate_limited"] += 1
+                return web.json_response(
+                    {"ok": False, "error": "ratelimited"}, status=429, headers={"Retry-After": "1"},
+                )
+        app["calls"]["chat.update"] += 1
+        args = await read_args(request)
+        ts = args.get("ts")
+        record(ts, args.get("text") or "")
+        return web.json_response({"ok": True, "channel": args.get("channel"), "ts": ts})
+
+    async def stats(request: web.Request) -> web.Response:
+        return web.json_response({
+            "calls": dict(app["calls"]),
+            "first_text": app["first_text"],
+            "completed": app["completed"],
+            "errors": len(app["errors"]),
+        })
+
+    async def reset(request: web.Request) -> web.Response:
+        app["calls"].clear()
+        app["message_threads"].clear()
+        app["first_text"].clear()
+        app["completed"].clear()
+        app["errors"].clear()
+        return web.json_response({"ok": True})
+
+    app.router.add_post("/api/auth.test", auth_test)
+    app.router.add_post("/api/chat.postMessage", post_message)
+    app.router.add_post("/api/chat.update", chat_update)
+    app.router.add_get("/_stats", stats)
+    app.router.add_post("/_reset", reset)
+    return app
+
+
+# ---------------------------------------------------------------------------
+# Background runner
+# ---------------------------------------------------------------------------
+
+class ServiceThread:
+    """Run an aiohttp app on its own event loop in a daemon thread."""
+
+    def __init__(self, app: web.Application, host: str = "127.0.0.1", port: int = 0):
+        self.app = app
+        self.host = host
+        self.port = port
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        runner = web.AppRunner(self.app, access_log=None)
+        self._loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, self.host, self.port, backlog=1024)
+        self._loop.run_until_complete(site.start())
+        self.port = runner.addresses[0][1]
+        self._ready.set()
+        self._loop.run_forever()
+        self._loop.run_until_complete(runner.cleanup())
+
+    def start(self) -> "ServiceThread":
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def stop(self) -> None:
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+
+
+def add_kibana_args(parser: argparse.ArgumentParser) -> None:
+    """Fake Kibana latency and fault options (shared with benchmark.py)."""
+    parser.add_argument("--latency", type=float, default=2.0, help="mean converse latency in seconds")
+    parser.add_argument("--latency-dist", choices=LATENCY_DISTRIBUTIONS, default="fixed")
+    parser.add_argument("--latency-spread", type=float, default=0.5,
+                        help="uniform: ±fraction of the mean; lognormal: sigma")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of converse calls answering 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction answering 429")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="fraction of streams cut off mid-answer")
+    parser.add_argument("--seed", type=int, help="seed for latency and fault sampling")
+
+
+def kibana_config(args: argparse.Namespace) -> tuple[LatencyModel, Faults]:
+    return (
+        LatencyModel(args.latency, args.latency_dist, args.latency_spread, seed=args.seed),
+        Faults(args.error_rate, args.throttle_rate, args.drop_rate, seed=args.seed),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run fake Kibana and Slack services")
+    parser.add_argument("--kibana-port", type=int, default=5601)
+    parser.add_argument("--slack-port", type=int, default=5602)
+    add_kibana_args(parser)
+    parser.add_argument("--update-rate", type=float, help="chat.update calls/s before Slack answers 429")
+    args = parser.parse_args()
+
+    kibana = ServiceThread(create_kibana_app(*kibana_config(args)), port=args.kibana_port).start()
+    slack = ServiceThread(create_slack_app(args.update_rate), port=args.slack_port).start()
+    print("Fake services running:")
+    print(f"  KIBANA_ENDPOINT={kibana.url}")
+    print(f"  SLACK_API_URL={slack.url}/api/")
+    print("Press Ctrl+C to stop.")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,408 @@
+"""
+Deterministic fast path for structured questions.
+
+Many questions map one-to-one onto an ES|QL tool the agent already has
+("revenue by region in Q4 2025", "which branches had the most turnover
+this year", "financial history for branch-042"). Sending those through a
+multi-step agent conversation takes tens of seconds; running the tool's
+query directly takes well under one.
+
+FastPathRouter recognizes a handful of these intents, fills the tool's
+declared params (date range, region, branchId) from the question, runs the
+tool's own ES|QL against Elasticsearch, and renders the table for Slack.
+Whenever it isn't confident (no match, more than one match, questions that
+need reasoning, comparisons or more than one date range, a missing param,
+an error or an empty result) it returns None and the bot falls back to
+converse().
+
+Tool definitions come from scripts/es_setup/tools/, so the fast path always
+runs exactly the query the agent would. Their ENRICH clauses name a policy
+by base name; they are pointed at its live version (see
+es_setup/enrich_policies.py), looked up once per data version, since a
+policy rebuild bumps it.
+"""
+
+import calendar
+import re
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Callable
+
+import requests
+
+from answer_cache import DataVersion, is_cacheable_question, normalize_question
+from enrich_policies import ENRICH_POLICIES, newest_policy, policy_names, resolve_enrich_policies
+from tools import (
+    branch_financial_summary,
+    report_count_by_branch,
+    revenue_by_region,
+    turnover_by_branch,
+)
+
+REGIONS = ("Northeast", "Southeast", "Midwest", "Southwest", "West")
+
+# Questions that need the agent's reasoning, not just a table
+_NEEDS_REASONING = re.compile(
+    r"\b(why|explain|reason|cause[sd]?|recommend|suggest|should|advice|improve|plan|predict|forecast)\b"
+)
+MAX_WORDS = 30
+
+# Comparisons need two queries (or reasoning); one tool call would answer half
+_COMPARISON = re.compile(r"\b(vs|versus|compare[sd]?|comparing|comparison|than)\b")
+
+MAX_ROWS = 25
+
+_MONTHS = {name.lower(): i for i, name in enumerate(calendar.month_name) if name}
+_MONTHS.update({name.lower(): i for i, name in enumerate(calendar.month_abbr) if name})
+
+_BRANCH_ID = re.compile(r"\bbranch[- ]?#?(\d{1,3})\b")
+
+
+# ---------------------------------------------------------------------------
+# Param extraction
+# ---------------------------------------------------------------------------
+
+def _quarter_range(year: int, quarter: int) -> tuple[date, date]:
+    start = date(year, 3 * quarter - 2, 1)
+    end_month = 3 * quarter
+    return start, date(year, end_month, calendar.monthrange(year, end_month)[1])
+
+
+def _match_date_range(text: str, today: date) -> tuple[tuple[date, date], tuple[int, int]] | None:
+    """The first date expression in a normalized question: (range, span in the text)."""
+    m = re.search(r"\b(\d{4}) (\d{2}) (\d{2}) (?:to|through|until|and) (\d{4}) (\d{2}) (\d{2})\b", text)
+    if m:
+        y1, m1, d1, y2, m2, d2 = map(int, m.groups())
+        return (date(y1, m1, d1), date(y2, m2, d2)), m.span()
+
+    m = re.search(r"\bq([1-4])(?: of)? (\d{4})\b", text) or re.search(r"\b(\d{4}) q([1-4])\b", text)
+    if m:
+        a, b = m.groups()
+        quarter, year = (int(a), int(b)) if len(a) == 1 else (int(b), int(a))
+        return _quarter_range(year, quarter), m.span()
+
+    m = re.search(r"\bh([12]) (\d{4})\b", text)
+    if m:
+        half, year = int(m.group(1)), int(m.group(2))
+        halves = {1: (date(year, 1, 1), date(year, 6, 30)), 2: (date(year, 7, 1), date(year, 12, 31))}
+        return halves[half], m.span()
+
+    m = re.search(r"\b(" + "|".join(_MONTHS) + r") (\d{4})\b", text)
+    if m:
+        month, year = _MONTHS[m.group(1)], int(m.group(2))
+        return (date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])), m.span()
+
+    m = re.search(r"\b(?:last|past) (\d+) (day|week|month|year)s?\b", text)
+    if m:
+        n, unit = int(m.group(1)), m.group(2)
+        days = {"day": 1, "week": 7, "month": 30, "year": 365}[unit] * n
+        return (today - timedelta(days=days), today), m.span()
+
+    current_q = (today.month - 1) // 3 + 1
+    if m := re.search(r"\bthis quarter\b", text):
+        return _quarter_range(today.year, current_q), m.span()
+    if m := re.search(r"\b(last|previous) quarter\b", text):
+        year, quarter = (today.year, current_q - 1) if current_q > 1 else (today.year - 1, 4)
+        return _quarter_range(year, quarter), m.span()
+    if m := re.search(r"\b(this year|ytd|year to date)\b", text):
+        return (date(today.year, 1, 1), today), m.span()
+    if m := re.search(r"\blast year\b", text):
+        return (date(today.year - 1, 1, 1), date(today.year - 1, 12, 31)), m.span()
+    if m := re.search(r"\bthis month\b", text):
+        return (today.replace(day=1), today), m.span()
+    if m := re.search(r"\blast month\b", text):
+        end = today.replace(day=1) - timedelta(days=1)
+        return (end.replace(day=1), end), m.span()
+    if m := re.search(r"\b(last|past) week\b", text):
+        return (today - timedelta(days=7), today), m.span()
+
+    m = re.search(r"\b(?:in|for|during) (20\d{2})\b", text) or re.search(r"\b(20\d{2})\b", text)
+    if m:
+        year = int(m.group(1))
+        return (date(year, 1, 1), date(year, 12, 31)), m.span()
+    return None
+
+
+def parse_date_range(text: str, today: date) -> tuple[date, date] | None:
+    """Find a date range in a normalized question, or None if there isn't one."""
+    found = _match_date_range(text, today)
+    return found[0] if found else None
+
+
+def count_date_ranges(text: str, today: date) -> int:
+    """How many separate date expressions a normalized question contains."""
+    count = 0
+    while found := _match_date_range(text, today):
+        start, end = found[1]
+        text = f"{text[:start]} # {text[end:]}"
+        count += 1
+    return count
+
+
+def parse_region(text: str) -> str | None:
+    """Return the single region a normalized question names, or None."""
+    found = [r for r in REGIONS if re.search(rf"\b{r.lower()}\b", text)]
+    return found[0] if len(found) == 1 else None
+
+
+# ---------------------------------------------------------------------------
+# Routes
+# ---------------------------------------------------------------------------
+
+@dataclass
+class Route:
+    """One intent: when it matches, and how to fill its tool's params."""
+
+    tool: dict
+    title: str
+    matches: Callable[[str, "Question"], bool]
+    params: Callable[["Question"], dict | None]
+
+
+@dataclass
+class Question:
+    """A normalized question plus the params found in it."""
+
+    text: str
+    today: date
+    branch_id: str | None = None
+    region: str | None = None
+    regions_named: int = 0
+    date_range: tuple[date, date] | None = None
+
+
+def _has(text: str, *words: str) -> bool:
+    return any(re.search(rf"\b{w}\b", text) for w in words)
+
+
+def _dates(q: Question, default_days: int) -> dict:
+    start, end = q.date_range or (q.today - timedelta(days=default_days), q.today)
+    return {"startDate": start.isoformat(), "endDate": end.isoformat()}
+
+
+ROUTES = [
+    Route(
+        tool=revenue_by_region,
+        title="Revenue by region",
+        matches=lambda t, q: _has(t, "revenue", "sales") and (_has(t, "regions?", "regional") or q.region is not None)
+        and q.branch_id is None,
+        params=lambda q: {**_dates(q, 365), "region": q.region or "*"},
+    ),
+    Route(
+        tool=branch_financial_summary,
+        title="Financial history for {branchId}",
+        matches=lambda t, q: q.branch_id is not None
+        and _has(t, "financials?", "revenue", "perform(ance|ing)?", "doing", "history", "trend", "numbers", "quarterly", "p l"),
+        params=lambda q: {"branchId": q.branch_id},
+    ),
+    Route(
+        tool=turnover_by_branch,
+        title="Staff turnover by branch",
+        matches=lambda t, q: q.branch_id is None and q.regions_named == 0 and (
+            _has(t, "turnover") or re.search(r"\b(lost|losing) (the most )?(staff|employees|people)\b", t) is not None
+        ),
+        params=lambda q: _dates(q, 365),
+    ),
+    Route(
+        tool=report_count_by_branch,
+        title="Weekly reports per branch",
+        matches=lambda t, q: q.branch_id is None and q.regions_named == 0 and (
+            re.search(r"\b(how many|number of|count of) (weekly )?reports\b", t) is not None
+            or _has(t, "report counts?", "reports per branch", "reporting frequency")
+        ),
+        params=lambda q: _dates(q, 30),
+    ),
+]
+
+
+# ---------------------------------------------------------------------------
+# Rendering
+# ---------------------------------------------------------------------------
+
+def format_value(name: str, value: object) -> str:
+    if value is None:
+        return "-"
+    if isinstance(value, float) or isinstance(value, int) and not isinstance(value, bool):
+        if "revenue" in name or name == "avg_ticket":
+            return f"${value:,.0f}"
+        if name.endswith("_pct"):
+            return f"{value:.1f}%"
+        if isinstance(value, float):
+            return f"{value:,.2f}" if abs(value) < 100 else f"{value:,.0f}"
+        return f"{value:,}"
+    text = str(value)
+    # Dates come back as full timestamps
+    return text[:10] if re.match(r"\d{4}-\d{2}-\d{2}T", text) else text
+
+
+def render_table(columns: list[str], rows: list[list], max_rows: int = MAX_ROWS) -> str:
+    """Render rows as a fixed-width table in a Slack code block."""
+    cells = [[format_value(c, v) for c, v in zip(columns, row)] for row in rows[:max_rows]]
+    widths = [max(len(c), *(len(r[i]) for r in cells)) for i, c in enumerate(columns)]
+    numeric = [all(re.match(r"^[-$\d.,%]+$", r[i]) for r in cells) for i in range(len(columns))]
+
+    def line(values: list[str]) -> str:
+        return "  ".join(v.rjust(w) if num else v.ljust(w) for v, w, num in zip(values, widths, numeric)).rstrip()
+
+    out = [line(columns), line(["-" * w for w in widths]), *(line(r) for r in cells)]
+    more = f"\n_…and {len(rows) - max_rows} more rows_" if len(rows) > max_rows else ""
+    return "```\n" + "\n".join(out) + "\n```" + more
+
+
+@dataclass
+class FastAnswer:
+    tool_id: str
+    text: str
+    elapsed: float
+
+
+# ---------------------------------------------------------------------------
+# Router
+# ---------------------------------------------------------------------------
+
+class FastPathRouter:
+    """Answer structured questions by running one ES|QL tool directly."""
+
+    def __init__(
+        self,
+        es_url: str | None,
+        headers: dict,
+        timeout: float = 2.0,
+        branch_ttl: float = 3600,
+        data_version: DataVersion | None = None,
+    ):
+        self.url = f"{es_url}/_query" if es_url else None
+        self.policy_url = f"{es_url}/_enrich/policy" if es_url else None
+        self.timeout = timeout
+        self.branch_ttl = branch_ttl
+        self.data_version = data_version
+        self._policies: dict[str, str] | None = None  # enrich policy base name -> live version
+        self._policies_version: object = None
+        self._session = requests.Session()
+        self._session.headers.update(headers)
+        self._branches: dict[str, str] = {}  # normalized name -> branch id
+        self._branches_at = 0.0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.fallbacks = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.url is not None
+
+    def _esql(self, query: str, params: dict | None = None) -> tuple[list[str], list[list]]:
+        body: dict = {"query": query}
+        if params:
+            body["params"] = [{name: value} for name, value in params.items()]
+        resp = self._session.post(self.url, json=body, timeout=self.timeout)
+        resp.raise_for_status()
+        data = resp.json()
+        return [c["name"] for c in data.get("columns", [])], data.get("values", [])
+
+    def _branch_names(self) -> dict[str, str]:
+        """Branch names for name lookups, refreshed every branch_ttl seconds."""
+        with self._lock:
+            if self._branches and time.time() - self._branches_at < self.branch_ttl:
+                return self._branches
+        try:
+            _, rows = self._esql("FROM beanstack-branches | KEEP id, name | LIMIT 1000")
+        except requests.RequestException:
+            return self._branches
+        names = {}
+        for branch_id, name in rows:
+            key = normalize_question(name or "")
+            names[key] = branch_id
+            names[key.removeprefix("beanstack ")] = branch_id
+        with self._lock:
+            self._branches, self._branches_at = names, time.time()
+        return names
+
+    def _enrich_policies(self) -> dict[str, str]:
+        """Live enrich policy versions, looked up again whenever the data version changes."""
+        version = self.data_version.value if self.data_version is not None else None
+        with self._lock:
+            if self._policies is not None and self._policies_version == version:
+                return self._policies
+        try:
+            resp = self._session.get(self.policy_url, timeout=self.timeout)
+            resp.raise_for_status()
+            names = policy_names(resp.json())
+        except (requests.RequestException, ValueError, KeyError):
+            return self._policies or {}
+        policies = {base: live for base in ENRICH_POLICIES if (live := newest_policy(names, base))}
+        with self._lock:
+            self._policies, self._policies_version = policies, version
+        return policies
+
+    def _query(self, tool: dict) -> str:
+        """The tool's ES|QL, with its ENRICH clauses pointed at the live policies."""
+        return resolve_enrich_policies([tool], self._enrich_policies())[0]["configuration"]["query"]
+
+    def _find_branch(self, text: str) -> str | None:
+        m = _BRANCH_ID.search(text)
+        if m:
+            return f"branch-{int(m.group(1)):03d}"
+        names = self._branch_names()
+        matches = [name for name in names if name and re.search(rf"\b{re.escape(name)}\b", text)]
+        return names[max(matches, key=len)] if matches else None
+
+    def route(self, question: str, today: date | None = None) -> tuple[Route, dict] | None:
+        """Pick a route and its params for a question, or None if not confident."""
+        text = normalize_question(question)
+        if len(text.split()) > MAX_WORDS or _NEEDS_REASONING.search(text) or not is_cacheable_question(text):
+            return None
+        q = Question(text, today or date.today())
+        if _COMPARISON.search(text) or count_date_ranges(text, q.today) > 1:
+            return None
+        q.regions_named = sum(1 for r in REGIONS if re.search(rf"\b{r.lower()}\b", text))
+        q.region = parse_region(text)
+        q.date_range = parse_date_range(text, q.today)
+        if _has(text, "branch", "store", "location", "shop") or q.region is None:
+            q.branch_id = self._find_branch(text)
+
+        candidates = [r for r in ROUTES if r.matches(text, q)]
+        if len(candidates) != 1:
+            return None
+        route = candidates[0]
+        params = route.params(q)
+        declared = set(route.tool["configuration"].get("params", {}))
+        if params is None or set(params) != declared:
+            return None
+        return route, params
+
+    def answer(self, question: str, today: date | None = None) -> FastAnswer | None:
+        """Answer a question directly, or return None to fall back to the agent."""
+        if not self.enabled:
+            return None
+        start = time.monotonic()
+        routed = self.route(question, today)
+        if routed is None:
+            self.fallbacks += 1
+            return None
+        route, params = routed
+        try:
+            columns, rows = self._esql(self._query(route.tool), params)
+        except (requests.RequestException, ValueError, KeyError):
+            # The policy may have been swapped before the data version caught up
+            with self._lock:
+                self._policies = None
+            self.fallbacks += 1
+            return None
+        if not rows:
+            # Let the agent explain an empty result
+            self.fallbacks += 1
+            return None
+
+        title = route.title.format(**params)
+        period = f" ({params['startDate']} to {params['endDate']})" if "startDate" in params else ""
+        if params.get("region", "*") != "*":
+            period = f" — {params['region']}{period}"
+        self.hits += 1
+        text = (
+            f"*{title}*{period}\n"
+            f"{render_table(columns, rows)}\n"
+            f"_:zap: Straight from `{route.tool['id']}`_"
+        )
+        return FastAnswer(route.tool["id"], text, time.monotonic() - start)
@@ -0,0 +1,376 @@
+"""
+Central scheduler for in-flight Slack status messages.
+
+Every question the bot is working on owns one status message in its thread
+that gets rewritten with chat_update: canned progress lines while the agent
+thinks, partial text while an answer streams in, and finally the answer.
+Instead of each request running its own update loop, one scheduler owns all
+of them:
+
+  - A heap of status messages ordered by when each is next due. Only the
+    newest text of a message is kept, so bursts of streamed chunks collapse
+    into one update.
+  - A global token bucket (SLACK_UPDATE_RATE/s, SLACK_UPDATE_BURST) shared by
+    every message, so the bot stays under Slack's chat.update rate limit no
+    matter how many questions are in flight.
+  - On a 429, every update pauses for Retry-After and the message is retried.
+  - Final answers skip the heap: they go out before any progress update that
+    is due, and are retried through rate limits.
+
+ProgressScheduler holds the bookkeeping; ThreadedProgressScheduler (bot.py)
+drives it from one thread and AsyncProgressScheduler (async_bot.py) from one
+task.
+"""
+
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+
+from slack_sdk.errors import SlackApiError
+
+from common import (
+    PROGRESS_INTERVAL,
+    PROGRESS_MESSAGES,
+    SLACK_UPDATE_BURST,
+    SLACK_UPDATE_RATE,
+    STREAM_UPDATE_INTERVAL,
+)
+
+
+def retry_after_seconds(error: Exception, default: float = 1.0) -> float | None:
+    """Return Retry-After for a Slack 429 error, or None if it isn't a rate limit."""
+    response = getattr(error, "response", None)
+    if response is None or getattr(response, "status_code", None) != 429:
+        return None
+    headers = getattr(response, "headers", {}) or {}
+    value = headers.get("Retry-After") or headers.get("retry-after")
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+@dataclass
+class StatusMessage:
+    """One in-flight status message and what should be shown in it next."""
+
+    channel: str
+    ts: str
+    text: str | None = None        # newest text not yet sent
+    sent_text: str | None = None
+    next_at: float = 0.0           # when the message is next due (0 = not scheduled)
+    sent_at: float = 0.0
+    canned: bool = True            # rotate PROGRESS_MESSAGES until real text arrives
+    progress_idx: int = 1
+    final: bool = False
+    attempts: int = 0
+    done: object = None            # threading.Event / asyncio.Future for the final update
+    error: Exception | None = None
+
+    @property
+    def key(self) -> tuple[str, str]:
+        return self.channel, self.ts
+
+
+class ProgressScheduler:
+    """Shared state for all status messages. Not tied to a runtime.
+
+    Producers call track() / update() / the runtime's finish(); the runtime's
+    worker loop calls take() to get the next (message, text) to send and
+    reports back with sent() / rate_limited() / failed().
+    """
+
+    def __init__(
+        self,
+        rate: float = SLACK_UPDATE_RATE,
+        burst: int = SLACK_UPDATE_BURST,
+        progress_interval: float = PROGRESS_INTERVAL,
+        stream_interval: float = STREAM_UPDATE_INTERVAL,
+        final_attempts: int = 5,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.progress_interval = progress_interval
+        self.stream_interval = stream_interval
+        self.final_attempts = final_attempts
+
+        self._messages: dict[tuple[str, str], StatusMessage] = {}
+        self._heap: list[tuple[float, int, tuple[str, str]]] = []
+        self._finals: deque[StatusMessage] = deque()
+        self._seq = itertools.count()
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+        self.sent_updates = 0
+        self.rate_limited_count = 0
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    # -- producers ---------------------------------------------------------
+
+    def _wake(self) -> None:
+        """Tell the worker loop there is new work (runtime-specific)."""
+
+    def _schedule(self, msg: StatusMessage, at: float) -> None:
+        """Put a message on the heap unless it is already due sooner. Caller holds the lock."""
+        if msg.next_at and msg.next_at <= at:
+            return
+        msg.next_at = at
+        heapq.heappush(self._heap, (at, next(self._seq), msg.key))
+
+    def track(self, channel: str, ts: str) -> None:
+        """Start rotating canned progress lines in a status message."""
+        with self._lock:
+            msg = self._messages.get((channel, ts))
+            if msg is None:
+                msg = self._messages[(channel, ts)] = StatusMessage(channel, ts)
+            msg.canned = True
+            self._schedule(msg, time.monotonic() + self.progress_interval)
+        self._wake()
+
+    def update(self, channel: str, ts: str, text: str | None) -> None:
+        """Show new (partial answer) text; sent at most every stream_interval seconds."""
+        if text is None:
+            return
+        with self._lock:
+            msg = self._messages.get((channel, ts))
+            if msg is None:
+                msg = self._messages[(channel, ts)] = StatusMessage(channel, ts)
+            if msg.final or text == msg.sent_text:
+                return
+            msg.canned = False
+            msg.text = text
+            self._schedule(msg, max(time.monotonic(), msg.sent_at + self.stream_interval))
+        self._wake()
+
+    def _enqueue_final(self, channel: str, ts: str, text: str, done: object) -> StatusMessage:
+        with self._lock:
+            msg = self._messages.get((channel, ts))
+            if msg is None:
+                msg = self._messages[(channel, ts)] = StatusMessage(channel, ts)
+            msg.final = True
+            msg.text = text
+            msg.done = done
+            self._finals.append(msg)
+        self._wake()
+        return msg
+
+    # -- worker loop -------------------------------------------------------
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def take(self, now: float | None = None) -> tuple[StatusMessage | None, str | None, float]:
+        """Pick the next update to send.
+
+        Returns (message, text, 0) when one should be sent now, or
+        (None, None, seconds) with how long the worker may sleep.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if now < self._paused_until:
+                return None, None, self._paused_until - now
+            self._refill(now)
+            if self._tokens < 1:
+                return None, None, (1 - self._tokens) / self.rate
+
+            if self._finals:
+                msg = self._finals.popleft()
+                self._tokens -= 1
+                return msg, msg.text, 0.0
+
+            while self._heap:
+                due, _, key = self._heap[0]
+                msg = self._messages.get(key)
+                if msg is None or msg.final or msg.next_at != due:
+                    heapq.heappop(self._heap)  # finished or rescheduled since
+                    continue
+                if due > now:
+                    return None, None, due - now
+                heapq.heappop(self._heap)
+                msg.next_at = 0.0
+                if msg.canned:
+                    msg.text = PROGRESS_MESSAGES[msg.progress_idx % len(PROGRESS_MESSAGES)]
+                    msg.progress_idx += 1
+                    self._schedule(msg, now + self.progress_interval)
+                if msg.text is None or msg.text == msg.sent_text:
+                    continue
+                self._tokens -= 1
+                return msg, msg.text, 0.0
+            return None, None, self.progress_interval
+
+    def sent(self, msg: StatusMessage, text: str) -> bool:
+        """Record a successful update. Returns True if it completed a final answer."""
+        with self._lock:
+            self.sent_updates += 1
+            msg.sent_text = text
+            msg.sent_at = time.monotonic()
+            if msg.text == text and not msg.canned:
+                msg.text = None
+            if msg.final:
+                self._messages.pop(msg.key, None)
+        return msg.final
+
+    def rate_limited(self, msg: StatusMessage, retry_after: float) -> bool:
+        """Pause all updates for Retry-After and retry the message.
+
+        Returns False if a final answer ran out of attempts.
+        """
+        with self._lock:
+            self.rate_limited_count += 1
+            now = time.monotonic()
+            self._paused_until = max(self._paused_until, now + retry_after)
+            if msg.final:
+                msg.attempts += 1
+                if msg.attempts >= self.final_attempts:
+                    self._messages.pop(msg.key, None)
+                    return False
+                self._finals.appendleft(msg)
+            elif msg.key in self._messages:
+                self._schedule(msg, self._paused_until)
+        return True
+
+    def failed(self, msg: StatusMessage, error: Exception) -> None:
+        """Stop updating a message after a non-rate-limit error."""
+        with self._lock:
+            msg.error = error
+            self._messages.pop(msg.key, None)
+
+    def untrack(self, channel: str, ts: str) -> None:
+        """Stop updating a status message without a final answer."""
+        with self._lock:
+            self._messages.pop((channel, ts), None)
+
+
+class ThreadedProgressScheduler(ProgressScheduler):
+    """Scheduler driven by one daemon thread with a sync WebClient."""
+
+    def __init__(self, client, **kwargs):
+        super().__init__(**kwargs)
+        self.client = client
+        self._wakeup = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._start_lock = threading.Lock()
+
+    def _wake(self) -> None:
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="slack-progress", daemon=True)
+                    self._thread.start()
+        self._wakeup.set()
+
+    def _run(self) -> None:
+        while True:
+            msg, text, wait = self.take()
+            if msg is None:
+                self._wakeup.wait(timeout=wait)
+                self._wakeup.clear()
+                continue
+            try:
+                self.client.chat_update(channel=msg.channel, ts=msg.ts, text=text)
+            except SlackApiError as e:
+                retry_after = retry_after_seconds(e)
+                if retry_after is None:
+                    self.failed(msg, e)
+                elif self.rate_limited(msg, retry_after):
+                    continue
+                else:
+                    msg.error = e
+                if msg.final:
+                    msg.done.set()
+                continue
+            except Exception as e:
+                self.failed(msg, e)
+                if msg.final:
+                    msg.done.set()
+                continue
+            if self.sent(msg, text):
+                msg.done.set()
+
+    def finish(self, channel: str, ts: str, text: str, timeout: float = 300) -> None:
+        """Send the final answer ahead of any progress update and wait for it."""
+        msg = self._enqueue_final(channel, ts, text, threading.Event())
+        if not msg.done.wait(timeout=timeout):
+            raise TimeoutError("Timed out waiting to post the final answer")
+        if msg.error is not None:
+            raise msg.error
+
+
+class AsyncProgressScheduler(ProgressScheduler):
+    """Scheduler driven by one asyncio task with an AsyncWebClient.
+
+    All methods must be called from the event loop the task runs on.
+    """
+
+    def __init__(self, client, **kwargs):
+        super().__init__(**kwargs)
+        self.client = client
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+
+    def _wake(self) -> None:
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            msg, text, wait = self.take()
+            if msg is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+            try:
+                await self.client.chat_update(channel=msg.channel, ts=msg.ts, text=text)
+            except SlackApiError as e:
+                retry_after = retry_after_seconds(e)
+                if retry_after is None:
+                    self.failed(msg, e)
+                elif self.rate_limited(msg, retry_after):
+                    continue
+                else:
+                    msg.error = e
+                self._resolve(msg)
+                continue
+            except Exception as e:
+                self.failed(msg, e)
+                self._resolve(msg)
+                continue
+            if self.sent(msg, text):
+                self._resolve(msg)
+
+    @staticmethod
+    def _resolve(msg: StatusMessage) -> None:
+        if msg.final and not msg.done.done():
+            if msg.error is not None:
+                msg.done.set_exception(msg.error)
+            else:
+                msg.done.set_result(None)
+
+    async def finish(self, channel: str, ts: str, text: str) -> None:
+        """Send the final answer ahead of any progress update and wait for it."""
+        done = asyncio.get_running_loop().create_future()
+        self._enqueue_final(channel, ts, text, done)
+        await done
+
+    async def close(self) -> None:
+        """Stop the worker task (call on shutdown)."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
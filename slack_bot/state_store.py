@@ -0,0 +1,251 @@
+"""
+Thread/conversation state for the BeanStack Slack bot.
+
+The bot needs two facts per Slack thread: the Agent Builder conversation_id
+(for multi-turn follow-ups) and whether the bot is active in the thread (so it
+answers follow-ups without a fresh @mention). Both stores below keep those
+facts bounded in memory, with O(1) lookups on the event hot path:
+
+  - MemoryStateStore: LRU with TTL. Lost on restart.
+  - SQLiteStateStore: the same LRU in front of a SQLite (WAL) file. Writes are
+    buffered and flushed in batches by a background thread, which also sweeps
+    expired threads, so state survives restarts and deploys.
+
+Use create_state_store() to pick one from env vars (see common.py).
+"""
+
+import atexit
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from pathlib import Path
+
+
+@dataclass(frozen=True)
+class ThreadState:
+    conversation_id: str | None = None
+    active: bool = False
+    updated_at: float = 0.0
+
+
+# Cached "we looked, there's nothing" marker so misses stay O(1) too
+_ABSENT = ThreadState()
+
+
+class MemoryStateStore:
+    """Bounded in-memory thread state: LRU eviction plus TTL since last update."""
+
+    def __init__(self, max_threads: int = 10_000, ttl: float = 7 * 86400):
+        self.max_threads = max_threads
+        self.ttl = ttl
+        self._threads: OrderedDict[str, ThreadState] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._threads)
+
+    def _expired(self, state: ThreadState, now: float) -> bool:
+        return state is not _ABSENT and now - state.updated_at > self.ttl
+
+    def _get(self, thread_ts: str) -> ThreadState | None:
+        """Return cached state (possibly _ABSENT), or None if not cached. Caller holds the lock."""
+        state = self._threads.get(thread_ts)
+        if state is None:
+            return None
+        if self._expired(state, time.time()):
+            del self._threads[thread_ts]
+            return None
+        self._threads.move_to_end(thread_ts)
+        return state
+
+    def _put(self, thread_ts: str, state: ThreadState) -> None:
+        """Cache state and evict the least recently used threads. Caller holds the lock."""
+        self._threads[thread_ts] = state
+        self._threads.move_to_end(thread_ts)
+        while len(self._threads) > self.max_threads:
+            self._threads.popitem(last=False)
+
+    def _load(self, thread_ts: str) -> ThreadState:
+        with self._lock:
+            return self._get(thread_ts) or _ABSENT
+
+    def _update(self, thread_ts: str, **changes) -> None:
+        with self._lock:
+            state = self._get(thread_ts) or _ABSENT
+            self._put(thread_ts, replace(state, updated_at=time.time(), **changes))
+
+    def get_conversation(self, thread_ts: str | None) -> str | None:
+        if not thread_ts:
+            return None
+        return self._load(thread_ts).conversation_id
+
+    def set_conversation(self, thread_ts: str, conversation_id: str) -> None:
+        self._update(thread_ts, conversation_id=conversation_id)
+
+    def is_active(self, thread_ts: str | None) -> bool:
+        if not thread_ts:
+            return False
+        return self._load(thread_ts).active
+
+    def mark_active(self, thread_ts: str) -> None:
+        self._update(thread_ts, active=True)
+
+    def close(self) -> None:
+        pass
+
+
+class SQLiteStateStore(MemoryStateStore):
+    """Thread state persisted to SQLite, with the in-memory LRU as a front cache.
+
+    Lookups hit the LRU first (including cached misses); only a thread that
+    isn't cached falls through to a primary-key read. Writes land in the LRU
+    immediately and are flushed to disk every `flush_interval` seconds, or as
+    soon as `batch_size` writes are pending.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS threads (
+            thread_ts TEXT PRIMARY KEY,
+            conversation_id TEXT,
+            active INTEGER NOT NULL DEFAULT 0,
+            updated_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS threads_updated_at ON threads (updated_at);
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        max_threads: int = 10_000,
+        ttl: float = 7 * 86400,
+        flush_interval: float = 1.0,
+        batch_size: int = 200,
+        sweep_interval: float = 600,
+    ):
+        super().__init__(max_threads=max_threads, ttl=ttl)
+        self.path = Path(path)
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.sweep_interval = sweep_interval
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(self.SCHEMA)
+        self._db_lock = threading.Lock()
+
+        self._pending: dict[str, ThreadState] = {}
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._last_sweep = 0.0
+        self._flusher = threading.Thread(target=self._flush_loop, name="state-flusher", daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    def _read(self, thread_ts: str) -> ThreadState:
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT conversation_id, active, updated_at FROM threads WHERE thread_ts = ?",
+                (thread_ts,),
+            ).fetchone()
+        if row is None:
+            return _ABSENT
+        state = ThreadState(row[0], bool(row[1]), row[2])
+        return _ABSENT if self._expired(state, time.time()) else state
+
+    def _load(self, thread_ts: str) -> ThreadState:
+        with self._lock:
+            state = self._get(thread_ts) or self._pending.get(thread_ts)
+        if state is not None:
+            return state
+        state = self._read(thread_ts)
+        with self._lock:
+            # A write may have raced the read; it wins
+            if self._get(thread_ts) is None:
+                self._put(thread_ts, state)
+            return self._get(thread_ts) or state
+
+    def _update(self, thread_ts: str, **changes) -> None:
+        state = self._load(thread_ts)
+        with self._lock:
+            state = replace(self._get(thread_ts) or state, updated_at=time.time(), **changes)
+            self._put(thread_ts, state)
+            self._pending[thread_ts] = state
+            if len(self._pending) >= self.batch_size:
+                self._wakeup.set()
+
+    def flush(self) -> int:
+        """Write pending updates in one transaction. Returns the number written."""
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        if not batch:
+            return 0
+        try:
+            self._write(batch)
+        except sqlite3.Error:
+            # Keep the batch for the next flush unless newer writes superseded it
+            with self._lock:
+                self._pending = {**batch, **self._pending}
+            raise
+        return len(batch)
+
+    def _write(self, batch: dict[str, ThreadState]) -> None:
+        with self._db_lock, self._db:
+            self._db.executemany(
+                "INSERT INTO threads (thread_ts, conversation_id, active, updated_at) "
+                "VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (thread_ts) DO UPDATE SET "
+                "conversation_id = excluded.conversation_id, "
+                "active = excluded.active, "
+                "updated_at = excluded.updated_at",
+                [(ts, s.conversation_id, int(s.active), s.updated_at) for ts, s in batch.items()],
+            )
+
+    def sweep(self) -> int:
+        """Delete threads idle for longer than the TTL. Returns the number deleted."""
+        self._last_sweep = time.time()
+        with self._db_lock, self._db:
+            cur = self._db.execute(
+                "DELETE FROM threads WHERE updated_at < ?", (time.time() - self.ttl,),
+            )
+        return cur.rowcount
+
+    def _flush_loop(self) -> None:
+        while not self._stopped.is_set():
+            self._wakeup.wait(timeout=self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+                if time.time() - self._last_sweep > self.sweep_interval:
+                    self.sweep()
+            except sqlite3.Error as e:
+                print(f"  WARNING: state store flush failed: {e}")
+
+    def close(self) -> None:
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        self._wakeup.set()
+        self._flusher.join(timeout=5)
+        self.flush()
+        with self._db_lock:
+            self._db.close()
+
+
+def create_state_store(
+    kind: str = "memory",
+    path: str | Path | None = None,
+    max_threads: int = 10_000,
+    ttl: float = 7 * 86400,
+) -> MemoryStateStore:
+    """Build the configured state store ("memory" or "sqlite")."""
+    if kind == "sqlite":
+        if path is None:
+            raise ValueError("SQLite state store needs a database path")
+        return SQLiteStateStore(path, max_threads=max_threads, ttl=ttl)
+    if kind != "memory":
+        raise ValueError(f"Unknown state store: {kind!r} (expected 'memory' or 'sqlite')")
+    return MemoryStateStore(max_threads=max_threads, ttl=ttl)
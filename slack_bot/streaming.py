@@ -0,0 +1,128 @@
+"""
+Streaming converse support for the BeanStack Slack bot.
+
+The Agent Builder streaming endpoint (POST /api/agent_builder/converse/async)
+answers with Server-Sent Events: tool-call steps, reasoning, and the reply
+text in chunks. This module parses that stream and folds the events into
+the text the Slack message should show. The runtimes hand that text to the
+progress scheduler (progress.py), which decides when it actually goes out.
+"""
+
+import codecs
+import json
+
+from common import AgentReply, md_to_slack, thread_state
+
+# Human-readable status lines for agent steps
+STEP_LABELS = {
+    "reasoning": ":thought_balloon: Thinking it through...",
+    "tool_call": ":mag: Running `{tool}`...",
+    "tool_result": ":white_check_mark: Got results from `{tool}`",
+}
+
+
+class SSEParser:
+    """Incremental Server-Sent Events parser.
+
+    Feed raw bytes as they arrive; complete events come back as
+    (event_name, data) tuples. `data` is decoded JSON when possible.
+    """
+
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._event = "message"
+        self._data: list[str] = []
+
+    def feed(self, chunk: bytes) -> list[tuple[str, object]]:
+        self._buffer += self._decoder.decode(chunk)
+        events = []
+        while True:
+            newline = self._buffer.find("\n")
+            if newline < 0:
+                break
+            line = self._buffer[:newline].rstrip("\r")
+            self._buffer = self._buffer[newline + 1:]
+            event = self._process_line(line)
+            if event is not None:
+                events.append(event)
+        return events
+
+    def _process_line(self, line: str) -> tuple[str, object] | None:
+        if line == "":
+            if not self._data:
+                self._event = "message"
+                return None
+            raw = "\n".join(self._data)
+            event = self._event
+            self._event, self._data = "message", []
+            try:
+                return event, json.loads(raw)
+            except json.JSONDecodeError:
+                return event, raw
+        if line.startswith(":"):
+            return None  # comment / keep-alive
+        field, _, value = line.partition(":")
+        value = value[1:] if value.startswith(" ") else value
+        if field == "event":
+            self._event = value
+        elif field == "data":
+            self._data.append(value)
+        return None
+
+
+class AnswerStream:
+    """Fold streamed agent events into the text shown in Slack."""
+
+    def __init__(self, thread_ts: str | None = None):
+        self.thread_ts = thread_ts
+        self.conversation_id: str | None = None
+        self.chunks: list[str] = []
+        self.final: str | None = None
+        self.status: str | None = None
+        self.tool_ids: set[str] = set()
+
+    @property
+    def done(self) -> bool:
+        return self.final is not None
+
+    def apply(self, event: str, data: object) -> None:
+        """Update state from one SSE event."""
+        if isinstance(data, dict) and isinstance(data.get("data"), dict):
+            data = data["data"]
+        if not isinstance(data, dict):
+            return
+
+        if event in ("conversation_id_set", "conversation_created", "conversation_updated"):
+            conv_id = data.get("conversation_id")
+            if conv_id:
+                self.conversation_id = conv_id
+                # Save conversation_id for follow-up messages in the same thread
+                if self.thread_ts:
+                    thread_state.set_conversation(self.thread_ts, conv_id)
+        elif event == "message_chunk":
+            self.chunks.append(data.get("text_chunk", ""))
+        elif event == "message_complete":
+            self.final = data.get("message_content") or "".join(self.chunks)
+        elif event in STEP_LABELS:
+            tool = data.get("tool_id", "tool")
+            if event == "tool_call":
+                self.tool_ids.add(tool)
+            self.status = STEP_LABELS[event].format(tool=tool)
+
+    def finish(self) -> None:
+        """Mark the stream complete even if no message_complete event arrived."""
+        if self.final is None:
+            self.final = "".join(self.chunks)
+
+    def reply(self) -> AgentReply:
+        """The finished answer (call after the stream ends)."""
+        self.finish()
+        return AgentReply(self.final, self.tool_ids)
+
+    def render(self) -> str | None:
+        """Slack text for the partial answer so far, or the current agent step."""
+        text = "".join(self.chunks)
+        if text:
+            return md_to_slack(text) + " :writing_hand:"
+        return self.status
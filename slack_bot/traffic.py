@@ -0,0 +1,143 @@
+"""
+Synthetic Slack traffic for load-testing the bot.
+
+generate() builds a schedule of Socket Mode event payloads, the same shape
+Slack delivers, mixing three kinds of traffic:
+
+  - mention:  an @BeanStack mention that starts a new thread in a channel
+  - dm:       a direct message
+  - followup: a plain reply in a thread the bot was mentioned in earlier
+
+Events are spaced at a fixed rate (or all at once for a burst). Each
+question carries a "[q<N>]" tag that the fake services echo back, so the
+driver can match every answer to its request. A fraction of events can be
+redelivered with the same event_id and client_msg_id, as Slack does after a
+slow ack or a reconnect; redeliveries don't count as requests.
+
+The schedule is deterministic for a given seed.
+"""
+
+import random
+from dataclasses import dataclass
+
+from fake_services import BOT_USER_ID, TEAM_ID
+
+KINDS = ("mention", "dm", "followup")
+
+CHANNEL = "C0LOADTEST"
+
+QUESTIONS = [
+    "revenue by region this quarter",
+    "summarize the last 24 hours of reports",
+    "which branches have recurring equipment problems",
+    "compare the New York and Boston branches",
+    "which branches are behind on weekly reports",
+    "what are customers complaining about in the West",
+    "staff turnover in the Midwest this year",
+    "how is branch-042 doing",
+]
+
+FOLLOWUPS = [
+    "can you break that down by month",
+    "what about last quarter",
+    "which of those needs attention first",
+    "show me the top 3 only",
+]
+
+# Follow-ups only target threads started at least this long before, so the
+# bot has seen the mention (and marked the thread active) by then
+FOLLOWUP_MIN_GAP = 0.5
+
+
+@dataclass
+class SyntheticEvent:
+    at: float                 # seconds after the start of the run
+    kind: str
+    body: dict
+    request_id: int | None    # None for redeliveries
+
+
+def parse_mix(spec: str) -> dict[str, float]:
+    """Parse "mention=0.6,dm=0.2,followup=0.2" into normalized weights."""
+    weights = {}
+    for part in spec.split(","):
+        kind, _, weight = part.partition("=")
+        kind = kind.strip()
+        if kind not in KINDS:
+            raise ValueError(f"Unknown traffic kind {kind!r} (expected one of {', '.join(KINDS)})")
+        weights[kind] = float(weight) if weight else 1.0
+    total = sum(weights.values())
+    if total <= 0:
+        raise ValueError("Traffic mix needs at least one positive weight")
+    return {kind: w / total for kind, w in weights.items()}
+
+
+def _envelope(n: int, event: dict) -> dict:
+    return {
+        "token": "loadtest",
+        "team_id": TEAM_ID,
+        "api_app_id": "A0LOADTEST",
+        "type": "event_callback",
+        "event_id": f"Ev{n:08d}",
+        "event_time": int(float(event["ts"])),
+        "event": event,
+    }
+
+
+def generate(
+    n: int,
+    rate: float = 0.0,
+    mix: dict[str, float] | None = None,
+    redeliver: float = 0.0,
+    users: int = 12,
+    seed: int = 0,
+) -> list[SyntheticEvent]:
+    """Build a schedule of `n` requests (plus redeliveries), sorted by time.
+
+    `rate` is requests per second; 0 sends everything at once, which leaves
+    no room for follow-ups (they become mentions).
+    """
+    rng = random.Random(seed)
+    mix = mix or {"mention": 1.0}
+    kinds, weights = zip(*mix.items())
+    threads: list[tuple[float, str, str]] = []   # (at, thread_ts, user) of earlier mentions
+    events: list[SyntheticEvent] = []
+
+    for i in range(n):
+        at = i / rate if rate > 0 else 0.0
+        ts = f"{1700000000 + i}.000100"
+        user = f"U{rng.randrange(users):04d}"
+        kind = rng.choices(kinds, weights)[0]
+        tag = f"[q{i}]"
+
+        eligible = [t for t in threads if at - t[0] >= FOLLOWUP_MIN_GAP]
+        if kind == "followup" and not eligible:
+            kind = "mention"
+
+        if kind == "mention":
+            question = rng.choice(QUESTIONS)
+            event = {
+                "type": "app_mention", "user": user, "channel": CHANNEL,
+                "text": f"<@{BOT_USER_ID}> {question} {tag}", "ts": ts, "event_ts": ts,
+            }
+            threads.append((at, ts, user))
+        elif kind == "dm":
+            event = {
+                "type": "message", "channel_type": "im", "user": user, "channel": f"D{user[1:]}",
+                "text": f"{rng.choice(QUESTIONS)} {tag}", "ts": ts, "event_ts": ts,
+            }
+        else:
+            _, thread_ts, user = rng.choice(eligible)
+            event = {
+                "type": "message", "channel_type": "channel", "user": user, "channel": CHANNEL,
+                "thread_ts": thread_ts, "text": f"{rng.choice(FOLLOWUPS)} {tag}", "ts": ts, "event_ts": ts,
+            }
+        event["client_msg_id"] = f"cm-{i:08d}"
+
+        body = _envelope(i, event)
+        events.append(SyntheticEvent(at, kind, body, i))
+        if rng.random() < redeliver:
+            events.append(SyntheticEvent(at + rng.uniform(0.5, 2.0), kind, body, None))
+
+    events.sort(key=lambda e: e.at)
+    return events
@@ -0,0 +1,240 @@
+"""
+Fair scheduling of agent runs for the BeanStack Slack bot.
+
+Every question that needs the agent takes a slot from the work queue
+before calling converse:
+
+  - Per thread: one run at a time, in arrival order. A follow-up waits
+    for the previous answer, so it continues the right conversation_id
+    instead of racing it and forking the conversation.
+  - Per user: at most `max_per_user` runs at once, so one chatty user
+    can't take every slot.
+  - Global: at most `max_concurrent` runs at once.
+
+When a slot frees up, waiting users are served round-robin, and each
+waiting question learns its queue position so the bot can show
+"Queued (position N)" instead of letting everything time out together.
+A limit of 0 means unlimited.
+
+WorkQueue holds the bookkeeping; ThreadedWorkQueue (bot.py) runs admitted
+jobs on its own thread pool and AsyncWorkQueue (async_bot.py) adds an
+awaitable acquire().
+"""
+
+import asyncio
+import itertools
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable
+
+
+@dataclass(eq=False)
+class Ticket:
+    """One question waiting for, or holding, a slot."""
+
+    user: str
+    thread_ts: str
+    seq: int
+    on_position: Callable[[int], None] | None = None
+    position: int = 0             # 0 = running
+    queued: bool = False          # had to wait for a slot
+    waiter: object = field(default=None, repr=False)   # what the runtime waits on, or the job to run
+
+
+class WorkQueue:
+    """Per-thread serialization, per-user and global limits, round-robin across users."""
+
+    def __init__(self, max_concurrent: int = 0, max_per_user: int = 0):
+        self.max_concurrent = max_concurrent
+        self.max_per_user = max_per_user
+        # user -> their waiting tickets in arrival order; dict order is the round-robin order
+        self._waiting: OrderedDict[str, deque[Ticket]] = OrderedDict()
+        self._running_users: dict[str, int] = {}
+        self._busy_threads: set[str] = set()
+        # thread_ts -> its waiting tickets in arrival order, whoever asked them
+        self._thread_waiting: dict[str, deque[Ticket]] = {}
+        self._running = 0
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self.peak_depth = 0
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    @property
+    def depth(self) -> int:
+        """Number of questions waiting for a slot."""
+        return sum(len(q) for q in self._waiting.values())
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "running": self._running,
+                "waiting": self.depth,
+                "waiting_users": len(self._waiting),
+                "peak_depth": self.peak_depth,
+            }
+
+    def _can_start(self, ticket: Ticket) -> bool:
+        """Caller holds the lock."""
+        if self.max_concurrent and self._running >= self.max_concurrent:
+            return False
+        if self.max_per_user and self._running_users.get(ticket.user, 0) >= self.max_per_user:
+            return False
+        if ticket.thread_ts in self._busy_threads:
+            return False
+        waiting = self._thread_waiting.get(ticket.thread_ts)
+        return not waiting or waiting[0] is ticket
+
+    def _start(self, ticket: Ticket) -> None:
+        """Caller holds the lock."""
+        self._running += 1
+        self._running_users[ticket.user] = self._running_users.get(ticket.user, 0) + 1
+        self._busy_threads.add(ticket.thread_ts)
+        ticket.position = 0
+
+    def submit(self, user: str, thread_ts: str, on_position=None, waiter=None) -> Ticket:
+        """Take a slot now if one is free, otherwise queue. Check ticket.position (0 = running)."""
+        ticket = Ticket(user, thread_ts, next(self._seq), on_position, waiter=waiter)
+        with self._lock:
+            if not self._waiting.get(user) and self._can_start(ticket):
+                self._start(ticket)
+                return ticket
+            ticket.queued = True
+            self._waiting.setdefault(user, deque()).append(ticket)
+            self._thread_waiting.setdefault(thread_ts, deque()).append(ticket)
+            self.peak_depth = max(self.peak_depth, self.depth)
+            self._update_positions()
+        return ticket
+
+    def release(self, ticket: Ticket) -> list[Ticket]:
+        """Free a ticket's slot. Returns the tickets that start running as a result."""
+        with self._lock:
+            if ticket.position:
+                # Gave up while still waiting
+                queue = self._waiting.get(ticket.user)
+                if queue is not None and ticket in queue:
+                    queue.remove(ticket)
+                    if not queue:
+                        del self._waiting[ticket.user]
+                    self._unqueue_thread(ticket)
+                started = []
+            else:
+                self._running -= 1
+                self._running_users[ticket.user] -= 1
+                if not self._running_users[ticket.user]:
+                    del self._running_users[ticket.user]
+                self._busy_threads.discard(ticket.thread_ts)
+                started = self._dispatch()
+            self._update_positions()
+        return started
+
+    def _unqueue_thread(self, ticket: Ticket) -> None:
+        """Caller holds the lock."""
+        waiting = self._thread_waiting[ticket.thread_ts]
+        waiting.remove(ticket)
+        if not waiting:
+            del self._thread_waiting[ticket.thread_ts]
+
+    def _dispatch(self) -> list[Ticket]:
+        """Start waiting tickets round-robin across users. Caller holds the lock."""
+        started = []
+        progress = True
+        while progress and self._waiting:
+            progress = False
+            for user in list(self._waiting):
+                queue = self._waiting[user]
+                ticket = next((t for t in queue if self._can_start(t)), None)
+                if ticket is None:
+                    continue
+                queue.remove(ticket)
+                # Served: this user goes to the back of the rotation
+                del self._waiting[user]
+                if queue:
+                    self._waiting[user] = queue
+                self._unqueue_thread(ticket)
+                self._start(ticket)
+                started.append(ticket)
+                progress = True
+                if self.max_concurrent and self._running >= self.max_concurrent:
+                    return started
+        return started
+
+    def _update_positions(self) -> None:
+        """Recompute round-robin queue positions and notify changes. Caller holds the lock."""
+        queues = [list(q) for q in self._waiting.values()]
+        position = 0
+        for rank in itertools.count():
+            remaining = False
+            for queue in queues:
+                if rank < len(queue):
+                    remaining = True
+                    position += 1
+                    ticket = queue[rank]
+                    if ticket.position != position:
+                        ticket.position = position
+                        if ticket.on_position is not None:
+                            ticket.on_position(position)
+            if not remaining:
+                break
+
+
+class ThreadedWorkQueue(WorkQueue):
+    """WorkQueue that runs each job on its own thread pool once it has a slot.
+
+    run() returns right away, so the caller (one of Bolt's few listener
+    threads) is never parked behind a waiting question. The pool has
+    `max_concurrent` threads, one per slot; with no global limit it gets
+    ThreadPoolExecutor's default size and extra jobs wait in its queue.
+    """
+
+    def __init__(self, max_concurrent: int = 0, max_per_user: int = 0):
+        super().__init__(max_concurrent, max_per_user)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent or None, thread_name_prefix="agent-run")
+
+    def run(self, user: str, thread_ts: str, job: Callable[[Ticket], None], on_position=None) -> Ticket:
+        """Queue job(ticket) and return; the slot is released when the job returns."""
+        ticket = self.submit(user, thread_ts, on_position, waiter=job)
+        if not ticket.position:
+            self._executor.submit(self._run_job, ticket)
+        return ticket
+
+    def _run_job(self, ticket: Ticket) -> None:
+        try:
+            ticket.waiter(ticket)
+        except Exception as e:
+            print(f"  WARNING: agent run for thread {ticket.thread_ts} failed: {e}")
+        finally:
+            self.release(ticket)
+
+    def release(self, ticket: Ticket) -> list[Ticket]:
+        started = super().release(ticket)
+        for t in started:
+            self._executor.submit(self._run_job, t)
+        return started
+
+
+class AsyncWorkQueue(WorkQueue):
+    """WorkQueue whose acquire() waits on the event loop until a slot is free."""
+
+    async def acquire(self, user: str, thread_ts: str, on_position=None) -> Ticket:
+        ticket = self.submit(
+            user, thread_ts, on_position, waiter=asyncio.get_running_loop().create_future(),
+        )
+        if ticket.position:
+            try:
+                await ticket.waiter
+            except asyncio.CancelledError:
+                self.release(ticket)
+                raise
+        return ticket
+
+    def release(self, ticket: Ticket) -> list[Ticket]:
+        started = super().release(ticket)
+        for t in started:
+            if not t.waiter.done():
+                t.waiter.set_result(None)
+        return started
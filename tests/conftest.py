@@ -0,0 +1,20 @@
+"""
+Shared setup for the BeanStack tests.
+
+The scripts and the bot import their siblings flat (as `uv run python
+scripts/...` puts the script's directory on sys.path), so the tests do the same.
+"""
+
+import os
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+for directory in ("scripts/data_generation", "scripts/es_setup", "slack_bot"):
+    sys.path.insert(0, str(PROJECT_ROOT / directory))
+
+# slack_bot/common.py and the runtimes read their settings at import time
+os.environ.setdefault("KIBANA_ENDPOINT", "http://localhost:5601")
+os.environ.setdefault("ELASTICSEARCH_API_KEY", "test")
+os.environ.setdefault("SLACK_BOT_TOKEN", "xoxb-test")
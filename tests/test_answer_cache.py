@@ -0,0 +1,74 @@
+import time
+
+from answer_cache import AnswerCache, is_cacheable_question, normalize_question
+
+
+def test_hit_by_normalized_question():
+    cache = AnswerCache()
+    assert cache.lookup("Revenue by region?", 1) == (None, None)
+    cache.put("Revenue by region?", 1, "EMEA leads.")
+
+    entry, _ = cache.lookup("  revenue BY region ", 1)
+    assert entry.answer == "EMEA leads."
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_new_data_version_drops_answers():
+    cache = AnswerCache()
+    cache.lookup("q", 1)
+    cache.put("q", 1, "old answer")
+
+    assert cache.lookup("q", 2) == (None, None)
+    assert cache.lookup("q", 1) == (None, None)
+
+
+def test_late_put_from_previous_version_is_dropped():
+    cache = AnswerCache()
+    cache.lookup("slow question", 1)       # agent starts answering under version 1
+    cache.lookup("fast question", 2)       # meanwhile an ingest bumped the version
+    cache.put("fast question", 2, "fresh")
+
+    cache.put("slow question", 1, "stale")
+
+    assert cache.lookup("fast question", 2)[0].answer == "fresh"
+    assert cache.lookup("slow question", 2) == (None, None)
+
+
+def test_ttl_expiry(monkeypatch):
+    cache = AnswerCache(ttl=60)
+    cache.lookup("q", 1)
+    cache.put("q", 1, "answer")
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert cache.lookup("q", 1) == (None, None)
+
+
+def test_lru_eviction():
+    cache = AnswerCache(max_entries=2)
+    cache.lookup("a", 1)
+    cache.put("a", 1, "A")
+    cache.put("b", 1, "B")
+    cache.lookup("a", 1)                   # a is now the most recently used
+    cache.put("c", 1, "C")
+
+    assert cache.lookup("b", 1) == (None, None)
+    assert cache.lookup("a", 1)[0].answer == "A"
+    assert cache.lookup("c", 1)[0].answer == "C"
+
+
+def test_similar_question_hits_by_embedding():
+    vectors = {"revenue per region": [1.0, 0.0], "revenue by each region": [0.99, 0.05], "staff": [0.0, 1.0]}
+    cache = AnswerCache(similarity_threshold=0.95, embed=vectors.__getitem__)
+
+    entry, embedding = cache.lookup("revenue per region", 1)
+    assert entry is None
+    cache.put("revenue per region", 1, "EMEA leads.", embedding)
+
+    assert cache.lookup("revenue by each region", 1)[0].answer == "EMEA leads."
+    assert cache.lookup("staff", 1)[0] is None
+
+
+def test_action_questions_are_not_cacheable():
+    assert normalize_question("Send Maria a reminder!") == "send maria a reminder"
+    assert not is_cacheable_question("Send Maria a reminder!")
+    assert is_cacheable_question("What was revenue last week?")
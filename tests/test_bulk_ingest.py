@@ -0,0 +1,244 @@
+import threading
+import time
+
+import pytest
+from elastic_transport import ApiResponseMeta, HttpHeaders
+from elasticsearch import ApiError
+
+import bulk_ingest
+from bulk_ingest import BULK_LOAD_SETTINGS, AdaptiveBatchSize, BulkIndexer, DeadLetterQueue, bulk_load_mode
+
+
+class FakeES:
+    """Elasticsearch stand-in for es.bulk().
+
+    `outcome(op, doc_id, attempt)` gives each item's (status, error);
+    by default everything is indexed.
+    """
+
+    def __init__(self, outcome=None, latency=0.0):
+        self.outcome = outcome or (lambda op, doc_id, attempt: (201, None))
+        self.latency = latency
+        self.batches: list[list[str]] = []
+        self.attempts: dict[str, int] = {}
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._lock = threading.Lock()
+
+    def options(self, **kwargs):
+        return self
+
+    def bulk(self, operations):
+        with self._lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        time.sleep(self.latency)
+        items, ids = [], []
+        ops = iter(operations)
+        for meta in ops:
+            op, target = next(iter(meta.items()))
+            if op != "delete":
+                next(ops)
+            doc_id = target["_id"]
+            with self._lock:
+                attempt = self.attempts[doc_id] = self.attempts.get(doc_id, -1) + 1
+            status, error = self.outcome(op, doc_id, attempt)
+            result = {"_id": doc_id, "status": status}
+            if error:
+                result["error"] = error
+            items.append({op: result})
+            ids.append(doc_id)
+        with self._lock:
+            self.batches.append(ids)
+            self.in_flight -= 1
+        return {"errors": any("error" in next(iter(i.values())) for i in items), "items": items}
+
+
+def actions(count, index="beanstack-reports"):
+    return [{"_index": index, "_id": f"doc-{i:03d}", "_source": {"n": i}} for i in range(count)]
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(bulk_ingest, "backoff_delay", lambda *args, **kwargs: 0.0)
+
+
+def test_batch_size_grows_on_full_fast_batches():
+    size = AdaptiveBatchSize(initial=40, target_latency=1.0)
+    size.observe(docs=40, latency=0.2)
+    assert size.size == 50
+    size.observe(docs=12, latency=0.2)   # short tail batch
+    assert size.size == 50
+
+
+def test_batch_size_halves_on_rejections_and_slow_requests():
+    size = AdaptiveBatchSize(initial=80, minimum=10, target_latency=1.0)
+    size.observe(docs=80, latency=0.2, rejected=3)
+    assert size.size == 40
+    size.observe(docs=40, latency=5.0)
+    assert size.size == 20
+    for _ in range(5):
+        size.observe(docs=20, latency=5.0)
+    assert size.size == 10
+
+
+def test_batch_size_stays_under_maximum():
+    size = AdaptiveBatchSize(initial=40, maximum=60)
+    for _ in range(10):
+        size.observe(docs=size.size, latency=0.1)
+    assert size.size == 60
+
+
+def test_indexes_everything_with_bounded_concurrency():
+    es = FakeES(latency=0.02)
+    succeeded = []
+    indexer = BulkIndexer(es, concurrency=3, batch_size=10, verbose=False, on_success=succeeded.append)
+    stats = indexer.run(actions(120))
+
+    assert stats.indexed == 120 and stats.failed == 0
+    assert sorted(meta["index"]["_id"] for meta in succeeded) == [f"doc-{i:03d}" for i in range(120)]
+    assert 1 < es.peak_in_flight <= 3
+    assert stats.requests == len(es.batches)
+
+
+def test_rejected_items_are_retried_and_shrink_batches():
+    def outcome(op, doc_id, attempt):
+        if attempt == 0 and doc_id < "doc-020":
+            return 429, {"type": "es_rejected_execution_exception"}
+        return 201, None
+
+    es = FakeES(outcome)
+    indexer = BulkIndexer(es, concurrency=1, batch_size=40, verbose=False)
+    stats = indexer.run(actions(40))
+
+    assert stats.indexed == 40
+    assert (stats.rejected, stats.retried) == (20, 20)
+    assert es.batches[1] == [f"doc-{i:03d}" for i in range(20)]
+    # Halved to 20 by the rejections, then one step back up for the full retry batch
+    assert indexer.batch_size.size == 30
+
+
+def test_inference_timeouts_are_retried_and_permanent_errors_fail():
+    def outcome(op, doc_id, attempt):
+        if doc_id == "doc-001" and attempt == 0:
+            return 500, {"type": "inference_exception", "reason": "Cohere request timed out"}
+        if doc_id == "doc-002":
+            return 400, {"type": "document_parsing_exception", "reason": "failed to parse field [date]"}
+        return 201, None
+
+    failures = []
+    batches = []
+    indexer = BulkIndexer(
+        FakeES(outcome), batch_size=10, verbose=False,
+        on_failure=lambda meta, source, error: failures.append((meta["index"]["_id"], source, error["type"])),
+        on_batch=lambda: batches.append(1),
+    )
+    stats = indexer.run(actions(5))
+
+    assert (stats.indexed, stats.failed, stats.retried) == (4, 1, 1)
+    assert failures == [("doc-002", {"n": 2}, "document_parsing_exception")]
+    assert len(batches) == stats.requests == 2
+
+
+def test_items_give_up_after_max_retries():
+    es = FakeES(lambda op, doc_id, attempt: (503, None))
+    failures = []
+    indexer = BulkIndexer(es, max_retries=2, verbose=False,
+                          on_failure=lambda meta, source, error: failures.append(error["type"]))
+    stats = indexer.run(actions(1))
+
+    assert stats.failed == 1 and stats.retried == 2
+    assert es.attempts["doc-000"] == 2
+    assert failures == ["retries_exhausted"]
+
+
+def test_deleting_a_missing_document_succeeds():
+    es = FakeES(lambda op, doc_id, attempt: (404, None) if op == "delete" else (201, None))
+    stats = BulkIndexer(es, verbose=False).run([{"_op_type": "delete", "_index": "beanstack-reports", "_id": "gone"}])
+    assert (stats.indexed, stats.failed) == (1, 0)
+
+
+def test_dead_letter_replay(tmp_path):
+    dead_letter = DeadLetterQueue(tmp_path / "missing" / "reports.dead-letter.ndjson")
+    meta = {"index": {"_index": "beanstack-reports", "_id": "doc-1"}}
+    dead_letter.write(meta, {"text": "v1"}, {"type": "timeout"}, sha256="aaa")
+    dead_letter.write(meta, {"text": "v2"}, {"type": "timeout"}, sha256="bbb")
+    dead_letter.write({"delete": {"_index": "beanstack-reports", "_id": "doc-2"}}, None, {"type": "timeout"})
+    assert len(dead_letter) == 3
+
+    records = dead_letter.take()
+    # The latest failure of each action wins
+    assert [(r["id"], r.get("sha256")) for r in records] == [("doc-1", "bbb"), ("doc-2", None)]
+    assert [DeadLetterQueue.to_action(r) for r in records] == [
+        {"_op_type": "index", "_index": "beanstack-reports", "_id": "doc-1", "_source": {"text": "v2"}},
+        {"_op_type": "delete", "_index": "beanstack-reports", "_id": "doc-2"},
+    ]
+
+    # Interrupted before finish_replay(): the next replay picks them up again
+    dead_letter.write(meta, {"text": "v3"}, {"type": "timeout"})
+    assert [r["source"] for r in dead_letter.take()] == [{"text": "v3"}, None]
+    dead_letter.finish_replay()
+    assert dead_letter.take() == []
+
+
+class FakeIndices:
+    """es.indices stand-in that records settings changes."""
+
+    def __init__(self, settings, refuse=False):
+        self.settings = settings
+        self.refuse = refuse
+        self.calls: list[tuple] = []
+
+    def get_settings(self, index, name, flat_settings):
+        return {index: {"settings": dict(self.settings)}}
+
+    def put_settings(self, index, settings):
+        if self.refuse:
+            meta = ApiResponseMeta(400, "HTTP/1.1", HttpHeaders(), 0.0, None)
+            raise ApiError("illegal_argument_exception", meta, {})
+        self.calls.append(("settings", settings))
+
+    def refresh(self, index):
+        self.calls.append(("refresh",))
+
+    def forcemerge(self, index, max_num_segments):
+        self.calls.append(("forcemerge", max_num_segments))
+
+
+def fake_cluster(indices):
+    es = FakeES()
+    es.indices = indices
+    return es
+
+
+def test_bulk_load_mode_restores_settings_after_load():
+    # refresh_interval was never set, so it comes back as null and is reset
+    indices = FakeIndices({"index.number_of_replicas": "1"})
+    with bulk_load_mode(fake_cluster(indices), "beanstack-reports", force_merge=True):
+        assert indices.calls == [("settings", BULK_LOAD_SETTINGS)]
+
+    assert indices.calls[1:] == [
+        ("refresh",),
+        ("forcemerge", 1),
+        ("settings", {"index.refresh_interval": None, "index.number_of_replicas": "1"}),
+    ]
+
+
+def test_bulk_load_mode_restores_settings_after_failure():
+    indices = FakeIndices({"index.refresh_interval": "5s", "index.number_of_replicas": "2"})
+    with pytest.raises(RuntimeError):
+        with bulk_load_mode(fake_cluster(indices), "beanstack-reports", force_merge=True):
+            raise RuntimeError("bulk request failed")
+
+    # No refresh or merge of a half-loaded index
+    assert indices.calls == [
+        ("settings", BULK_LOAD_SETTINGS),
+        ("settings", {"index.refresh_interval": "5s", "index.number_of_replicas": "2"}),
+    ]
+
+
+def test_bulk_load_mode_falls_back_when_settings_are_refused():
+    indices = FakeIndices({}, refuse=True)
+    with bulk_load_mode(fake_cluster(indices), "beanstack-reports"):
+        pass
+    assert indices.calls == []
@@ -0,0 +1,121 @@
+import json
+
+from corpus import CorpusReader, CorpusWriter, GenerationJournal, journal_path, record_sha256
+
+
+def make_records(count):
+    return [
+        {"id": f"report-{i:04d}", "branch_id": f"BR{i % 7:03d}", "date": f"2025-01-{i % 28 + 1:02d}",
+         "body": f"Week {i}: grinder fine, oat milk late. Café ☕"}
+        for i in range(count)
+    ]
+
+
+def test_round_trip_across_frames_and_shards(tmp_path):
+    root = tmp_path / "corpus" / "reports"
+    records = make_records(50)
+    with CorpusWriter(root, key_fields=["date"], shard_records=16, frame_records=5) as corpus:
+        entries = [corpus.write(record) for record in records]
+
+    assert len(corpus.shards) == 4
+    assert CorpusReader.exists(root)
+    assert not root.with_name("reports.tmp").exists()
+
+    reader = CorpusReader(root)
+    assert list(reader.iter_records()) == records
+    assert [entry["sha256"] for entry in reader.records] == [record_sha256(r) for r in records]
+    assert reader.records == entries
+    assert reader.records[3]["date"] == records[3]["date"]
+    assert reader.get("report-0037") == records[37]
+    assert list(reader.iter_records({"report-0002", "report-0041"})) == [records[2], records[41]]
+
+
+def test_close_replaces_previous_corpus(tmp_path):
+    root = tmp_path / "reports"
+    with CorpusWriter(root) as corpus:
+        for record in make_records(10):
+            corpus.write(record)
+    with CorpusWriter(root) as corpus:
+        corpus.write(make_records(1)[0])
+
+    assert len(CorpusReader(root)) == 1
+    assert not root.with_name("reports.old").exists()
+
+
+def test_failed_write_leaves_published_corpus(tmp_path):
+    root = tmp_path / "reports"
+    records = make_records(3)
+    with CorpusWriter(root) as corpus:
+        for record in records:
+            corpus.write(record)
+
+    try:
+        with CorpusWriter(root) as corpus:
+            corpus.write(records[0])
+            raise RuntimeError("generator crashed")
+    except RuntimeError:
+        pass
+
+    assert list(CorpusReader(root).iter_records()) == records
+    assert not root.with_name("reports.tmp").exists()
+
+
+def test_journal_drops_torn_last_line(tmp_path):
+    path = journal_path(tmp_path / "missing" / "reports")
+    records = make_records(3)
+    journal = GenerationJournal(path)
+    for record in records[:2]:
+        journal.record(record)
+    journal.close()
+
+    # A crash mid-write leaves half a line behind
+    with open(path, "ab") as f:
+        f.write(json.dumps(records[2]).encode()[:20])
+
+    journal = GenerationJournal(path)
+    assert len(journal) == 2
+    assert journal.get("report-0001") == records[1]
+    assert journal.get("report-0002") is None
+
+    # The next record starts on a fresh line
+    journal.record(records[2])
+    journal.close()
+    assert GenerationJournal(path).records == {r["id"]: r for r in records}
+
+
+def test_journal_drops_complete_json_without_newline(tmp_path):
+    path = tmp_path / "reports.journal.ndjson"
+    records = make_records(2)
+    path.write_bytes(json.dumps(records[0]).encode() + b"\n" + json.dumps(records[1]).encode())
+
+    journal = GenerationJournal(path)
+    journal.close()
+    assert list(journal.records) == ["report-0000"]
+    assert path.read_bytes().endswith(b"\n")
+
+
+def test_journal_finish_keeps_records_not_written(tmp_path):
+    path = tmp_path / "reports.journal.ndjson"
+    records = make_records(3)
+    journal = GenerationJournal(path)
+    for record in records:
+        journal.record(record)
+
+    journal.finish({"report-0000", "report-0001"})
+    assert GenerationJournal(path).records == {"report-0002": records[2]}
+
+    journal = GenerationJournal(path)
+    journal.finish({"report-0002"})
+    assert not path.exists()
+
+
+def test_fresh_journal_discards_previous_run(tmp_path):
+    path = tmp_path / "reports.journal.ndjson"
+    journal = GenerationJournal(path)
+    journal.record(make_records(1)[0])
+    journal.close()
+
+    journal = GenerationJournal(path, fresh=True)
+    journal.close()
+    assert len(journal) == 0
+    assert path.read_bytes() == b""
@@ -0,0 +1,60 @@
+import time
+
+from dedup import EventDeduplicator, InFlightQuestions, event_keys
+
+MENTION = ({"event_id": "Ev1"}, {"type": "app_mention", "channel": "C1", "client_msg_id": "m-1"})
+MESSAGE = ({"event_id": "Ev2"}, {"type": "message", "channel": "C1", "client_msg_id": "m-1"})
+
+
+def test_event_keys():
+    assert event_keys(*MENTION) == ["event:Ev1", "msg:C1:m-1"]
+    assert event_keys({}, {"channel": "C1"}) == []
+
+
+def test_redelivery_is_a_duplicate():
+    dedup = EventDeduplicator()
+    assert not dedup.is_duplicate(*MENTION)
+    assert dedup.is_duplicate(*MENTION)
+    assert dedup.duplicates == 1
+
+
+def test_mention_and_message_copies_are_one_event():
+    dedup = EventDeduplicator()
+    assert not dedup.is_duplicate(*MENTION)
+    assert dedup.is_duplicate(*MESSAGE)
+
+
+def test_events_without_ids_are_never_duplicates():
+    dedup = EventDeduplicator()
+    assert not dedup.is_duplicate({}, {"channel": "C1"})
+    assert not dedup.is_duplicate({}, {"channel": "C1"})
+
+
+def test_seen_ids_expire(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    dedup = EventDeduplicator(ttl=600)
+    dedup.is_duplicate(*MENTION)
+    now[0] += 601
+    assert not dedup.is_duplicate(*MENTION)
+
+
+def test_bounded_size():
+    dedup = EventDeduplicator(max_entries=3)
+    for i in range(10):
+        dedup.is_duplicate({"event_id": f"Ev{i}"}, {})
+    dedup.is_duplicate({"event_id": "Ev10"}, {})
+    assert len(dedup) <= 4
+    assert not dedup.is_duplicate({"event_id": "Ev0"}, {})
+
+
+def test_identical_question_in_same_thread_joins():
+    in_flight = InFlightQuestions()
+    key = in_flight.claim("t1", "Revenue by region?")
+    assert key is not None
+    assert in_flight.claim("t1", "revenue  by REGION") is None
+    assert in_flight.claim("t2", "Revenue by region?") is not None
+    assert in_flight.joined == 1
+
+    in_flight.release(key)
+    assert in_flight.claim("t1", "Revenue by region?") is not None
@@ -0,0 +1,140 @@
+from types import SimpleNamespace
+
+import pytest
+
+from enrich_policies import (
+    create_policy_version,
+    gc_policies,
+    newest_policy,
+    point_tools_at_policy,
+    policy_names,
+    resolve_enrich_policies,
+)
+from fast_path import FastPathRouter
+
+BASE = "beanstack-branch-region"
+
+
+def esql_tool(tool_id, query):
+    return {"id": tool_id, "type": "esql", "description": tool_id, "configuration": {"query": query, "params": {}}}
+
+
+TOOLS = [
+    esql_tool("revenue_by_region", f"FROM beanstack-financial | ENRICH {BASE} ON branch_id WITH region"),
+    esql_tool("region_staff", f"FROM beanstack-staff | ENRICH {BASE}-v3 ON branch_id | ENRICH {BASE}-extra ON x"),
+    esql_tool("branch_totals", "FROM beanstack-financial | STATS total = SUM(revenue) BY branch_id"),
+    {"id": "report_search", "type": "index_search", "configuration": {"pattern": f"ENRICH {BASE}"}},
+]
+
+
+def policies_response(*names):
+    return {"policies": [{"config": {"match": {"name": name, "indices": ["beanstack-branches"]}}} for name in names]}
+
+
+class FakeEnrich:
+    """es.enrich stand-in keeping the set of policy names."""
+
+    def __init__(self, *names, fail_execute=False):
+        self.names = list(names)
+        self.fail_execute = fail_execute
+
+    def get_policy(self, name=None):
+        return policies_response(*(n for n in self.names if name is None or n == name))
+
+    def put_policy(self, name, match):
+        self.names.append(name)
+
+    def execute_policy(self, name):
+        if self.fail_execute:
+            raise RuntimeError("enrich index build failed")
+
+    def delete_policy(self, name):
+        self.names.remove(name)
+
+
+def test_newest_policy():
+    names = policy_names(policies_response(BASE, f"{BASE}-v9", f"{BASE}-v10", f"{BASE}-extra-v11"))
+    assert newest_policy(names, BASE) == f"{BASE}-v10"
+    assert newest_policy([BASE], BASE) == BASE
+    assert newest_policy([f"{BASE}-extra"], BASE) is None
+
+
+def test_resolve_rewrites_only_enrich_clauses_for_the_base():
+    resolved = resolve_enrich_policies(TOOLS, {BASE: f"{BASE}-v4"})
+
+    assert resolved[0]["configuration"]["query"].endswith(f"ENRICH {BASE}-v4 ON branch_id WITH region")
+    assert resolved[1]["configuration"]["query"] == (
+        f"FROM beanstack-staff | ENRICH {BASE}-v4 ON branch_id | ENRICH {BASE}-extra ON x"
+    )
+    assert resolved[2:] == TOOLS[2:]
+    # The definitions themselves are left alone
+    assert f"ENRICH {BASE} ON" in TOOLS[0]["configuration"]["query"]
+
+
+def test_new_version_replaces_live_one():
+    es = SimpleNamespace(enrich=FakeEnrich(BASE, f"{BASE}-v1"))
+    assert create_policy_version(es, BASE, match={}) == f"{BASE}-v2"
+    # The pre-versioning policy goes too
+    assert gc_policies(es, BASE, keep=f"{BASE}-v2") == [f"{BASE}-v1", BASE]
+    assert es.enrich.names == [f"{BASE}-v2"]
+
+
+def test_failed_execute_leaves_live_policy():
+    es = SimpleNamespace(enrich=FakeEnrich(f"{BASE}-v1", fail_execute=True))
+    with pytest.raises(RuntimeError):
+        create_policy_version(es, BASE, match={})
+    assert es.enrich.names == [f"{BASE}-v1"]
+
+
+class FakeKibana:
+    def __init__(self, missing=()):
+        self.missing = set(missing)
+        self.puts = {}
+
+    def put(self, path, json):
+        tool_id = path.rsplit("/", 1)[1]
+        if tool_id in self.missing:
+            return SimpleNamespace(status_code=404, text="not found")
+        self.puts[tool_id] = json
+        return SimpleNamespace(status_code=200, text="{}")
+
+
+def test_point_tools_updates_existing_tools_that_enrich():
+    client = FakeKibana(missing={"region_staff"})
+    assert point_tools_at_policy(client, TOOLS, BASE, f"{BASE}-v2") == ["revenue_by_region"]
+    body = client.puts["revenue_by_region"]
+    assert "id" not in body and "type" not in body
+    assert f"ENRICH {BASE}-v2 ON" in body["configuration"]["query"]
+
+
+class FakeVersion:
+    value = 1
+
+
+class PolicyRouter(FastPathRouter):
+    """FastPathRouter whose _enrich/policy lookups come from a list of policy names."""
+
+    def __init__(self, names, data_version):
+        super().__init__("http://es.invalid", {}, data_version=data_version)
+        self.names = names
+        self.lookups = 0
+        self._session = SimpleNamespace(get=self._get)
+
+    def _get(self, url, timeout):
+        self.lookups += 1
+        return SimpleNamespace(raise_for_status=lambda: None, json=lambda: policies_response(*self.names))
+
+
+def test_fast_path_follows_policy_rebuilds():
+    version = FakeVersion()
+    router = PolicyRouter([f"{BASE}-v1"], version)
+    assert router._query(TOOLS[0]).endswith(f"ENRICH {BASE}-v1 ON branch_id WITH region")
+
+    # A rebuild without a data version change isn't looked up again
+    router.names = [f"{BASE}-v2"]
+    router._query(TOOLS[0])
+    assert router.lookups == 1
+
+    version.value = 2
+    assert router._query(TOOLS[0]).endswith(f"ENRICH {BASE}-v2 ON branch_id WITH region")
+    assert router.lookups == 2
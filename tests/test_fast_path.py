@@ -0,0 +1,112 @@
+from datetime import date
+
+import pytest
+
+from answer_cache import normalize_question
+from fast_path import FastPathRouter, count_date_ranges, parse_date_range, render_table
+
+TODAY = date(2025, 11, 14)
+
+
+class FakeRouter(FastPathRouter):
+    """FastPathRouter whose ES|QL calls return canned rows."""
+
+    def __init__(self, rows=None):
+        super().__init__("http://es.invalid", {})
+        self.rows = rows if rows is not None else [["Northeast", 125000.0]]
+        self.queries = []
+
+    def _esql(self, query, params=None):
+        self.queries.append((query, params))
+        if query.startswith("FROM beanstack-branches"):
+            return ["id", "name"], [["branch-007", "BeanStack Back Bay"]]
+        return ["region", "total_revenue"], self.rows
+
+    def _enrich_policies(self):
+        return {}
+
+
+def routed_tool(question):
+    routed = FakeRouter().route(question, TODAY)
+    return routed and (routed[0].tool["id"], routed[1])
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("revenue in Q4 2025", (date(2025, 10, 1), date(2025, 12, 31))),
+    ("revenue in march 2025", (date(2025, 3, 1), date(2025, 3, 31))),
+    ("revenue for H1 2024", (date(2024, 1, 1), date(2024, 6, 30))),
+    ("revenue last quarter", (date(2025, 7, 1), date(2025, 9, 30))),
+    ("revenue last 30 days", (date(2025, 10, 15), TODAY)),
+    ("revenue 2025-01-01 to 2025-02-15", (date(2025, 1, 1), date(2025, 2, 15))),
+    ("revenue in 2024", (date(2024, 1, 1), date(2024, 12, 31))),
+    ("revenue by region", None),
+])
+def test_parse_date_range(question, expected):
+    assert parse_date_range(normalize_question(question), TODAY) == expected
+
+
+@pytest.mark.parametrize("question, count", [
+    ("revenue by region in 2025", 1),
+    ("revenue in q4 2025", 1),
+    ("revenue 2025-01-01 to 2025-02-15", 1),
+    ("revenue by region in 2025 and 2024", 2),
+    ("revenue in q4 2025 and q4 2024", 2),
+    ("revenue this quarter and last quarter", 2),
+])
+def test_count_date_ranges(question, count):
+    assert count_date_ranges(normalize_question(question), TODAY) == count
+
+
+def test_routes_structured_question():
+    tool, params = routed_tool("Revenue by region in Q4 2025")
+    assert tool == "beanstack.revenue_by_region"
+    assert params == {"startDate": "2025-10-01", "endDate": "2025-12-31", "region": "*"}
+
+
+@pytest.mark.parametrize("question", [
+    "revenue by region in 2025 vs 2024",
+    "revenue by region in 2025 versus 2024",
+    "revenue by region 2025 and 2024",
+    "compare revenue by region this quarter",
+    "revenue by region this quarter compared to last quarter",
+    "was Northeast revenue higher than West revenue in 2025",
+    "revenue by region in q1 2025 and q2 2025",
+])
+def test_comparisons_fall_back_to_the_agent(question):
+    assert FakeRouter().route(question, TODAY) is None
+
+
+@pytest.mark.parametrize("question", [
+    "why did revenue by region drop in 2025",
+    "send the regional revenue to every manager",
+    "revenue in the Northeast and the West",
+])
+def test_unsure_questions_fall_back(question):
+    assert FakeRouter().route(question, TODAY) is None
+
+
+def test_branch_by_id_and_by_name():
+    assert routed_tool("How is branch-42 doing?") == ("beanstack.branch_financial_summary", {"branchId": "branch-042"})
+    assert routed_tool("financial history for the Back Bay store")[1] == {"branchId": "branch-007"}
+
+
+def test_answer_renders_table_without_follow_up_promise():
+    router = FakeRouter()
+    fast = router.answer("Revenue by region in Q4 2025", TODAY)
+    assert fast.tool_id == "beanstack.revenue_by_region"
+    assert "$125,000" in fast.text
+    assert "follow-up" not in fast.text
+    assert router.hits == 1
+
+
+def test_empty_result_falls_back():
+    router = FakeRouter(rows=[])
+    assert router.answer("Revenue by region in Q4 2025", TODAY) is None
+    assert router.fallbacks == 1
+
+
+def test_render_table_truncates():
+    table = render_table(["branch_id", "total_revenue"], [[f"branch-{i:03d}", 1000.0 * i] for i in range(30)], max_rows=3)
+    assert "branch-002" in table and "branch-003" not in table
+    assert "$2,000" in table
+    assert "27 more rows" in table
@@ -0,0 +1,102 @@
+import fnmatch
+
+import pytest
+from elastic_transport import ApiResponseMeta, HttpHeaders
+from elasticsearch import NotFoundError
+
+from index_versions import create_version, gc_versions, list_versions, live_index, swap_alias
+
+
+def not_found(message):
+    return NotFoundError(message, ApiResponseMeta(404, "HTTP/1.1", HttpHeaders(), 0.0, None), {})
+
+
+class FakeIndices:
+    """es.indices stand-in: physical indices and the aliases on them."""
+
+    def __init__(self, *names):
+        self.aliases: dict[str, set[str]] = {name: set() for name in names}
+
+    def get(self, index, allow_no_indices, expand_wildcards):
+        return {name: {} for name in self.aliases if fnmatch.fnmatchcase(name, index)}
+
+    def get_alias(self, name):
+        found = {index: {"aliases": {name: {}}} for index, aliases in self.aliases.items() if name in aliases}
+        if not found:
+            raise not_found(f"alias [{name}] missing")
+        return found
+
+    def exists(self, index):
+        return index in self.aliases
+
+    def create(self, index, mappings, settings):
+        assert index not in self.aliases
+        self.aliases[index] = set()
+
+    def delete(self, index):
+        del self.aliases[index]
+
+    def update_aliases(self, actions):
+        # Applied all at once, as Elasticsearch does
+        aliases = {name: set(a) for name, a in self.aliases.items()}
+        for action in actions:
+            (kind, args), = action.items()
+            if kind == "remove_index":
+                del aliases[args["index"]]
+            elif kind == "remove":
+                aliases[args["index"]].remove(args["alias"])
+            else:
+                aliases[args["index"]].add(args["alias"])
+        self.aliases = aliases
+
+
+class FakeES:
+    def __init__(self, *names):
+        self.indices = FakeIndices(*names)
+
+
+ALIAS = "beanstack-reports"
+
+
+def test_rebuild_swaps_alias_and_keeps_one_for_rollback():
+    es = FakeES()
+    assert live_index(es, ALIAS) is None
+
+    for expected in ("beanstack-reports-v1", "beanstack-reports-v2", "beanstack-reports-v3"):
+        name = create_version(es, ALIAS, mappings={})
+        assert name == expected
+        # Still serving the old version until the swap
+        assert live_index(es, ALIAS) != name
+        swap_alias(es, ALIAS, name)
+        assert live_index(es, ALIAS) == name
+
+    assert gc_versions(es, ALIAS, keep=1) == ["beanstack-reports-v1"]
+    assert [name for _, name in list_versions(es, ALIAS)] == ["beanstack-reports-v2", "beanstack-reports-v3"]
+
+
+def test_first_swap_migrates_plain_index():
+    es = FakeES(ALIAS)
+    assert live_index(es, ALIAS) == ALIAS
+
+    name = create_version(es, ALIAS, mappings={})
+    assert swap_alias(es, ALIAS, name) == ALIAS
+    assert es.indices.aliases == {"beanstack-reports-v1": {ALIAS}}
+
+
+def test_versions_sort_numerically():
+    es = FakeES("beanstack-reports-v9", "beanstack-reports-v10", "beanstack-reports-v2-old", "beanstack-reports-vx")
+    assert list_versions(es, ALIAS) == [(9, "beanstack-reports-v9"), (10, "beanstack-reports-v10")]
+    assert create_version(es, ALIAS, mappings={}) == "beanstack-reports-v11"
+
+
+@pytest.mark.parametrize("keep, expected", [
+    (0, ["beanstack-reports-v1", "beanstack-reports-v2", "beanstack-reports-v4"]),
+    (1, ["beanstack-reports-v1", "beanstack-reports-v4"]),
+    (5, ["beanstack-reports-v4"]),
+])
+def test_gc_deletes_old_and_abandoned_versions(keep, expected):
+    # v4 is a rebuild that failed before its swap
+    es = FakeES(*(f"beanstack-reports-v{v}" for v in range(1, 5)))
+    swap_alias(es, ALIAS, "beanstack-reports-v3")
+    assert gc_versions(es, ALIAS, keep=keep) == expected
+    assert live_index(es, ALIAS) == "beanstack-reports-v3"
@@ -0,0 +1,137 @@
+import importlib
+import json
+
+from corpus import CorpusReader, CorpusWriter
+from ingest_manifest import IngestManifest, content_hash
+
+ingest_reports = importlib.import_module("03_ingest_reports")
+
+UUID = "index-uuid-1"
+
+
+def indexed_manifest(path, docs):
+    manifest = IngestManifest.load(path, UUID)
+    for doc_id, text in docs.items():
+        manifest.record(doc_id, content_hash(text))
+    manifest.save()
+    return manifest
+
+
+def test_content_hash_separates_parts():
+    assert content_hash("ab", "c") != content_hash("a", "bc")
+    assert content_hash("text") == content_hash(b"text")
+
+
+def test_only_changed_and_removed_documents(tmp_path):
+    path = tmp_path / "reports.manifest.json"
+    indexed_manifest(path, {"doc-1": "one", "doc-2": "two", "doc-3": "three"})
+
+    manifest = IngestManifest.load(path, UUID)
+    assert manifest.is_current("doc-1", content_hash("one"))
+    assert not manifest.is_current("doc-2", content_hash("two, edited"))
+    assert not manifest.is_current("doc-4", content_hash("four"))
+    assert manifest.stale_ids({"doc-1", "doc-2", "doc-4"}) == ["doc-3"]
+
+
+def test_recreated_index_starts_over(tmp_path):
+    path = tmp_path / "reports.manifest.json"
+    indexed_manifest(path, {"doc-1": "one"})
+    assert len(IngestManifest.load(path, "index-uuid-2")) == 0
+
+
+def test_full_resends_everything_and_still_deletes_removed(tmp_path):
+    path = tmp_path / "reports.manifest.json"
+    indexed_manifest(path, {"doc-1": "one", "doc-2": "two"})
+
+    manifest = IngestManifest.load(path, UUID, full=True)
+    assert not manifest.is_current("doc-1", content_hash("one"))
+    assert manifest.stale_ids({"doc-1"}) == ["doc-2"]
+
+    # Interrupted after re-sending nothing: an ordinary run still re-sends and deletes
+    resumed = IngestManifest.load(path, UUID)
+    assert not resumed.is_current("doc-1", content_hash("one"))
+    assert resumed.stale_ids({"doc-1"}) == ["doc-2"]
+
+    resumed.record("doc-1", content_hash("one"))
+    resumed.forget("doc-2")
+    resumed.save()
+    assert json.loads(path.read_text())["documents"].keys() == {"doc-1"}
+
+
+def reports(branch_id, count, edited=""):
+    return [
+        {"id": f"{branch_id}-{i}", "branch_id": branch_id, "date": f"2025-01-{i + 1:02d}", "text": f"week {i}{edited}"}
+        for i in range(count)
+    ]
+
+
+def test_branch_subset_run_deletes_nothing_of_other_branches(tmp_path):
+    root = tmp_path / "corpus" / "reports"
+    with CorpusWriter(root, key_fields=["date"]) as corpus:
+        for record in reports("branch-001", 3) + reports("branch-002", 3):
+            corpus.write(record)
+    manifest = IngestManifest.load(tmp_path / "reports.manifest.json", UUID)
+    for entry in CorpusReader(root).records:
+        manifest.record(entry["id"], entry["sha256"])
+
+    # weekly_reports.py branch-001: one report edited, one no longer generated
+    with CorpusWriter(root, key_fields=["date"]) as corpus:
+        for record in reports("branch-001", 2, edited=" (edited)"):
+            corpus.write(record)
+        assert corpus.keep_other_branches({"branch-001"}) == 3
+
+    changed, removed = ingest_reports.plan_reports(CorpusReader(root).records, manifest)
+    assert sorted(entry["id"] for entry, _ in changed) == ["branch-001-0", "branch-001-1"]
+    assert removed == ["branch-001-2"]
+
+
+def test_journal_replay_resumes_interrupted_ingest(tmp_path):
+    path = tmp_path / "reports.manifest.json"
+    indexed_manifest(path, {"doc-1": "one", "doc-2": "two"})
+
+    # The next run checkpoints a few bulk requests, then dies before save()
+    manifest = IngestManifest.load(path, UUID)
+    manifest.record("doc-3", content_hash("three"))
+    manifest.checkpoint()
+    manifest.forget("doc-1")
+    manifest.record("doc-2", content_hash("two, edited"))
+    manifest.checkpoint()
+    manifest.record("doc-4", content_hash("never checkpointed"))
+
+    resumed = IngestManifest.load(path, UUID)
+    assert sorted(resumed.documents) == ["doc-2", "doc-3"]
+    assert resumed.is_current("doc-2", content_hash("two, edited"))
+
+    resumed.save()
+    assert not resumed.journal_path.exists()
+    assert sorted(json.loads(path.read_text())["documents"]) == ["doc-2", "doc-3"]
+
+
+def test_journal_replay_stops_at_torn_line(tmp_path):
+    path = tmp_path / "reports.manifest.json"
+    manifest = IngestManifest.load(path, UUID)
+    manifest.record("doc-1", content_hash("one"))
+    manifest.checkpoint()
+    with open(manifest.journal_path, "a") as f:
+        f.write('{"id": "doc-2", "sha2')
+
+    assert list(IngestManifest.load(path, UUID).documents) == ["doc-1"]
+
+
+def test_journal_entries_for_another_index_are_skipped(tmp_path):
+    path = tmp_path / "reports.manifest.json"
+    other = IngestManifest.load(path, "index-uuid-2")
+    other.record("doc-1", content_hash("one"))
+    other.checkpoint()
+
+    assert len(IngestManifest.load(path, UUID)) == 0
+
+
+def test_manifest_beside_a_corpus_not_generated_yet(tmp_path):
+    path = tmp_path / "data" / "generated" / "corpus" / "reports.manifest.json"
+    manifest = IngestManifest.load(path, UUID)
+    manifest.record("doc-1", content_hash("a"))
+    manifest.checkpoint()
+    manifest.save()
+
+    assert IngestManifest.load(path, UUID).is_current("doc-1", content_hash("a"))
@@ -0,0 +1,165 @@
+import asyncio
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import aiohttp
+import pytest
+import requests
+
+import async_bot
+from kibana_client import KibanaClient, backoff_delay, never_sent, should_retry
+
+
+class FakeKibana(ThreadingHTTPServer):
+    """Answers each request with the next (status, headers) in `script`; "drop" closes the connection."""
+
+    def __init__(self, script):
+        super().__init__(("127.0.0.1", 0), Handler)
+        self.script = list(script)
+        self.requests = 0
+
+
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def handle_request(self):
+        self.server.requests += 1
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        step = self.server.script.pop(0) if self.server.script else (200, {})
+        if step == "drop":
+            self.close_connection = True
+            self.connection.shutdown(socket.SHUT_RDWR)
+            return
+        status, headers = step
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    do_GET = do_POST = handle_request
+
+
+@pytest.fixture
+def kibana_server():
+    servers = []
+
+    def start(*script):
+        server = FakeKibana(script)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def closed_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def client(url, timings):
+    return KibanaClient(url, {}, retries=2, backoff=0, hooks=[timings.append])
+
+
+def test_rate_limit_is_retried_for_posts(kibana_server):
+    server = kibana_server((429, {"Retry-After": "0"}), (200, {}))
+    timings = []
+    resp = client(f"http://127.0.0.1:{server.server_port}", timings).post("/api/agent_builder/converse", json={})
+    assert resp.status_code == 200
+    assert timings[-1].attempts == 2
+
+
+def test_server_errors_are_retried_only_when_idempotent(kibana_server):
+    server = kibana_server((503, {}), (503, {}), (200, {}))
+    timings = []
+    kibana = client(f"http://127.0.0.1:{server.server_port}", timings)
+    assert kibana.post("/api/actions", json={}).status_code == 503
+    assert kibana.get("/api/actions").status_code == 200
+    assert [t.attempts for t in timings] == [1, 2]
+
+
+def test_refused_connection_is_retried_for_posts():
+    timings = []
+    kibana = client(f"http://127.0.0.1:{closed_port()}", timings)
+    with pytest.raises(requests.ConnectionError) as e:
+        kibana.post("/api/agent_builder/converse", json={})
+    assert never_sent(e.value)
+    assert timings[-1].attempts == 3
+
+
+def test_dropped_post_is_not_repeated(kibana_server):
+    server = kibana_server("drop", (200, {}))
+    timings = []
+    kibana = client(f"http://127.0.0.1:{server.server_port}", timings)
+    with pytest.raises(requests.ConnectionError) as e:
+        kibana.post("/api/agent_builder/converse", json={})
+    assert not never_sent(e.value)
+    assert server.requests == 1
+    assert timings[-1].attempts == 1
+
+
+def test_dropped_get_is_repeated(kibana_server):
+    server = kibana_server("drop", (200, {}))
+    kibana = client(f"http://127.0.0.1:{server.server_port}", [])
+    assert kibana.get("/api/actions").status_code == 200
+    assert server.requests == 2
+
+
+def test_should_retry():
+    assert should_retry("POST", 429)
+    assert not should_retry("POST", 503)
+    assert should_retry("POST", 503, idempotent=True)
+    assert should_retry("GET", 503)
+    assert not should_retry("GET", 404)
+
+
+def test_backoff_delay():
+    assert backoff_delay(0, "7") == 7
+    assert backoff_delay(0, "120", cap=30) == 30
+    assert 0 <= backoff_delay(3, None, base=0.5, cap=30) <= 4
+    assert 0 <= backoff_delay(3, "soon", base=0.5, cap=30) <= 4
+
+
+def run_async_post(monkeypatch, base_url, timings):
+    monkeypatch.setattr(async_bot, "KIBANA_BASE_URL", base_url)
+    monkeypatch.setattr(async_bot.kibana, "backoff", 0)
+    monkeypatch.setattr(async_bot.kibana, "retries", 2)
+    monkeypatch.setattr(async_bot.kibana, "hooks", [timings.append])
+
+    async def post():
+        try:
+            async with await async_bot.kibana_post("/api/agent_builder/converse", {}) as resp:
+                return resp.status
+        finally:
+            await async_bot.close_session()
+
+    return asyncio.run(post())
+
+
+def test_async_refused_connection_is_retried(monkeypatch):
+    timings = []
+    with pytest.raises(aiohttp.ClientConnectorError):
+        run_async_post(monkeypatch, f"http://127.0.0.1:{closed_port()}", timings)
+    assert timings[-1].attempts == 3
+
+
+def test_async_rate_limit_is_retried(monkeypatch, kibana_server):
+    server = kibana_server((429, {"Retry-After": "0"}), (200, {}))
+    timings = []
+    assert run_async_post(monkeypatch, f"http://127.0.0.1:{server.server_port}", timings) == 200
+    assert timings[-1].attempts == 2
+
+
+def test_async_dropped_post_is_not_repeated(monkeypatch, kibana_server):
+    server = kibana_server("drop", (200, {}))
+    with pytest.raises(aiohttp.ClientConnectionError):
+        run_async_post(monkeypatch, f"http://127.0.0.1:{server.server_port}", [])
+    assert server.requests == 1
@@ -0,0 +1,127 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import anthropic
+import pytest
+
+import llm
+from llm import LLMClient, RateLimiter, TokenBucket, map_ordered
+
+
+def test_bucket_is_unlimited_until_synced():
+    bucket = TokenBucket()
+    assert bucket.wait_time(1_000_000, time.monotonic()) == 0
+
+    bucket.sync(limit=60, remaining=0)
+    assert bucket.wait_time(1, bucket.updated) == pytest.approx(1.0)
+    # Never more than the capacity, however large the request
+    assert bucket.wait_time(600, bucket.updated) == pytest.approx(60.0)
+    assert bucket.wait_time(1, bucket.updated + 1.0) == 0
+
+
+def test_bucket_sync_never_raises_the_level():
+    bucket = TokenBucket()
+    bucket.sync(limit=100, remaining=50)
+    bucket.take(40)
+    # A response that left before our last take reports more than there is
+    bucket.sync(limit=100, remaining=50)
+    assert bucket.level == 10
+
+
+def test_acquire_waits_for_the_scarcest_bucket():
+    limiter = RateLimiter()
+    limiter.update({
+        "anthropic-ratelimit-requests-limit": "6000", "anthropic-ratelimit-requests-remaining": "6000",
+        # 10 output tokens a second, none left
+        "anthropic-ratelimit-output-tokens-limit": "600", "anthropic-ratelimit-output-tokens-remaining": "0",
+    })
+    start = time.monotonic()
+    limiter.acquire({"requests": 1, "output-tokens": 2})
+    assert 0.15 <= time.monotonic() - start < 1.0
+
+
+def test_pause_holds_back_every_worker():
+    limiter = RateLimiter()
+    limiter.pause(0.2)
+    start = time.monotonic()
+    threads = [threading.Thread(target=limiter.acquire, args=({"requests": 1},)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert time.monotonic() - start >= 0.2
+
+
+def test_map_ordered_yields_in_input_order():
+    def slow_first(i):
+        time.sleep(0.1 if i == 0 else 0.0)
+        return i * i
+
+    assert list(map_ordered(slow_first, range(10), workers=4)) == [i * i for i in range(10)]
+
+
+def test_closing_map_ordered_cancels_calls_not_started():
+    started = []
+
+    def call(i):
+        started.append(i)
+        time.sleep(0.05)
+        return i
+
+    results = map_ordered(call, range(100), workers=2)
+    assert next(results) == 0
+    results.close()
+    assert len(started) < 10
+
+
+def rate_limited(retry_after="0"):
+    response = SimpleNamespace(status_code=429, headers={"retry-after": retry_after}, request=None)
+    return anthropic.RateLimitError("rate limited", response=response, body=None)
+
+
+class FakeAnthropic:
+    """anthropic.Anthropic stand-in: messages.with_raw_response.create returns `text`."""
+
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.requests = 0
+        self._lock = threading.Lock()
+        self.messages = SimpleNamespace(with_raw_response=SimpleNamespace(create=self.create))
+
+    def create(self, model, max_tokens, messages):
+        with self._lock:
+            self.requests += 1
+            error = self.errors.pop(0) if self.errors else None
+        if error is not None:
+            raise error
+        content = [SimpleNamespace(text=f"answer to {messages[0]['content']}")]
+        return SimpleNamespace(headers={}, parse=lambda: SimpleNamespace(content=content))
+
+
+def test_rate_limit_pauses_and_retries():
+    client = LLMClient(FakeAnthropic([rate_limited("0.2")]))
+    start = time.monotonic()
+    assert client.complete("hello", max_tokens=10) == "answer to hello"
+    assert time.monotonic() - start >= 0.2
+    assert (client.calls, client.retries) == (1, 1)
+    assert client.stats() == "1 API calls (1 retried)"
+
+
+def test_gives_up_after_max_retries(monkeypatch):
+    monkeypatch.setattr(llm, "MAX_RETRIES", 2)
+    fake = FakeAnthropic([rate_limited() for _ in range(3)])
+    with pytest.raises(anthropic.RateLimitError):
+        LLMClient(fake).complete("hello", max_tokens=10)
+    assert fake.requests == 3
+
+
+def test_counters_from_many_workers(monkeypatch):
+    # Any worker may draw any of the errors, several in a row
+    monkeypatch.setattr(llm, "MAX_RETRIES", 100)
+    fake = FakeAnthropic([rate_limited() for _ in range(20)])
+    client = LLMClient(fake)
+    results = list(map_ordered(lambda i: client.complete(f"prompt {i}", max_tokens=10), range(200), workers=16))
+
+    assert results == [f"answer to prompt {i}" for i in range(200)]
+    assert (client.calls, client.retries) == (200, 20)
@@ -0,0 +1,110 @@
+import asyncio
+import threading
+
+import anthropic
+import pytest
+from aiohttp import web
+
+import llm
+from fake_batch_api import create_app, fake_completion
+from llm import MODEL, BatchRequestFailed, LLMClient
+from response_cache import ResponseCache
+from test_weekly_reports import make_generator
+
+
+@pytest.fixture(autouse=True)
+def fast_polls(monkeypatch):
+    monkeypatch.setattr(llm, "BATCH_POLL_INTERVAL", (0.01, 0.05))
+
+
+@pytest.fixture
+def fake_api():
+    """start(**create_app kwargs) runs a fake API on a background loop; returns a client for it."""
+    servers = []
+
+    def start(**kwargs):
+        loop = asyncio.new_event_loop()
+        runner = web.AppRunner(create_app(**kwargs))
+        loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        loop.run_until_complete(site.start())
+        port = runner.addresses[0][1]
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+        servers.append((loop, runner, thread))
+        return anthropic.Anthropic(base_url=f"http://127.0.0.1:{port}", api_key="fake", max_retries=0)
+
+    yield start
+    for loop, runner, thread in servers:
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+
+
+def test_results_in_input_order_with_cached_prompts_skipped(fake_api, tmp_path, monkeypatch):
+    monkeypatch.setattr(llm, "MAX_BATCH_REQUESTS", 2)
+    cache = ResponseCache(tmp_path / "responses.log", "record")
+    cache.put(MODEL, 100, "prompt 2", "cached answer")
+    client = LLMClient(fake_api(processing_time=0.1), cache=cache)
+
+    prompts = [f"prompt {i}" for i in range(6)]
+    results = client.complete_batch([(prompt, 100) for prompt in prompts])
+
+    expected = [fake_completion(prompt) for prompt in prompts]
+    expected[2] = "cached answer"
+    assert results == expected
+    # 5 uncached prompts, at most 2 per batch
+    assert (client.batches, client.batched) == (3, 5)
+    assert cache.get(MODEL, 100, "prompt 5") == expected[5]
+
+
+def test_nothing_submitted_when_everything_is_cached(tmp_path):
+    cache = ResponseCache(tmp_path / "responses.log", "record")
+    cache.put(MODEL, 100, "prompt", "cached answer")
+    # No API behind this client: a request would fail to connect
+    client = LLMClient(anthropic.Anthropic(base_url="http://127.0.0.1:9", api_key="fake", max_retries=0), cache=cache)
+    assert client.complete_batch([("prompt", 100)]) == ["cached answer"]
+    assert client.batches == 0
+
+
+@pytest.mark.parametrize("rates, error", [
+    ({"error_rate": 1.0}, "api_error: Internal server error"),
+    ({"expire_rate": 1.0}, "expired"),
+])
+def test_failed_requests_come_back_as_batch_request_failed(fake_api, tmp_path, rates, error):
+    cache = ResponseCache(tmp_path / "responses.log", "record")
+    client = LLMClient(fake_api(processing_time=0, **rates), cache=cache)
+    results = client.complete_batch([("prompt 0", 100), ("prompt 1", 100)])
+
+    assert all(isinstance(r, BatchRequestFailed) for r in results)
+    assert [str(r) for r in results] == [error, error]
+    assert len(cache) == 0
+
+
+def test_interrupted_wait_cancels_running_batches(fake_api, monkeypatch, capsys):
+    api = fake_api(processing_time=60)
+    client = LLMClient(api)
+
+    def interrupt(seconds):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(llm.time, "sleep", interrupt)
+    with pytest.raises(KeyboardInterrupt):
+        client.complete_batch([("prompt 0", 100), ("prompt 1", 100)])
+    monkeypatch.undo()
+
+    batch_id = capsys.readouterr().out.split("Submitted batch ")[1].split()[0]
+    batch = api.messages.batches.retrieve(batch_id)
+    assert batch.processing_status == "ended"
+    assert batch.request_counts.canceled == 2
+
+
+def test_batch_waves_match_a_parallel_run(fake_api):
+    api = fake_api(processing_time=0)
+    branch_ids = ["branch-001", "branch-002"]
+
+    waves = make_generator(branch_ids, LLMClient(api))
+    waved = waves.generate_reports_in_waves(waves.plan_reports())
+
+    parallel = make_generator(branch_ids, LLMClient(api))
+    assert waved == [parallel.generate_branch_reports(*plan) for plan in parallel.plan_reports()]
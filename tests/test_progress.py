@@ -0,0 +1,106 @@
+import time
+
+import pytest
+
+from common import PROGRESS_MESSAGES
+from progress import ProgressScheduler, retry_after_seconds
+
+
+def make_scheduler(**kwargs):
+    kwargs = {"rate": 1.0, "burst": 2, "progress_interval": 3.0, "stream_interval": 0.0, **kwargs}
+    return ProgressScheduler(**kwargs), time.monotonic()
+
+
+def test_token_bucket_limits_updates():
+    scheduler, t0 = make_scheduler()
+    for ts in ("1", "2", "3"):
+        scheduler.update("C1", ts, f"text {ts}")
+
+    sent = [scheduler.take(t0 + 0.01)[:2] for _ in range(2)]
+    assert [msg.ts for msg, _ in sent] == ["1", "2"]
+
+    msg, text, wait = scheduler.take(t0 + 0.01)
+    assert msg is None
+    assert wait == pytest.approx(1.0, abs=0.05)
+
+    msg, text, _ = scheduler.take(t0 + 1.1)
+    assert (msg.ts, text) == ("3", "text 3")
+
+
+def test_bursts_of_chunks_collapse_into_one_update():
+    scheduler, t0 = make_scheduler()
+    for text in ("Rev", "Revenue", "Revenue is up"):
+        scheduler.update("C1", "1", text)
+
+    msg, text, _ = scheduler.take(t0 + 0.01)
+    assert text == "Revenue is up"
+    scheduler.sent(msg, text)
+    assert scheduler.take(t0 + 0.02)[0] is None
+
+
+def test_final_answer_goes_before_due_progress():
+    scheduler, t0 = make_scheduler()
+    scheduler.update("C1", "1", "partial")
+    scheduler._enqueue_final("C1", "2", "The answer.", done=None)
+
+    msg, text, _ = scheduler.take(t0 + 0.01)
+    assert (msg.ts, text) == ("2", "The answer.")
+    assert scheduler.sent(msg, text)
+    assert scheduler.take(t0 + 0.01)[1] == "partial"
+
+
+def test_canned_progress_rotates():
+    scheduler, t0 = make_scheduler(burst=5)
+    scheduler.track("C1", "1")
+    assert scheduler.take(t0 + 1)[0] is None
+
+    msg, text, _ = scheduler.take(t0 + 3.1)
+    assert text == PROGRESS_MESSAGES[1 % len(PROGRESS_MESSAGES)]
+    scheduler.sent(msg, text)
+    assert scheduler.take(t0 + 6.2)[1] == PROGRESS_MESSAGES[2 % len(PROGRESS_MESSAGES)]
+
+
+def test_429_pauses_every_update_and_retries():
+    scheduler, t0 = make_scheduler(burst=5)
+    scheduler.update("C1", "1", "one")
+    scheduler.update("C1", "2", "two")
+    msg, text, _ = scheduler.take(t0 + 0.01)
+
+    assert scheduler.rate_limited(msg, retry_after=5)
+    now = time.monotonic()
+    paused, _, wait = scheduler.take(now)
+    assert paused is None
+    assert wait == pytest.approx(5, abs=0.1)
+
+    # After the pause the other message and the retried one both go out
+    texts = {scheduler.take(now + 5.1)[1], scheduler.take(now + 5.1)[1]}
+    assert texts == {"one", "two"}
+    assert scheduler.rate_limited_count == 1
+
+
+def test_final_answer_gives_up_after_attempts():
+    scheduler, t0 = make_scheduler(final_attempts=2)
+    scheduler._enqueue_final("C1", "1", "The answer.", done=None)
+    msg, _, _ = scheduler.take(t0 + 0.01)
+    assert scheduler.rate_limited(msg, retry_after=0)
+    msg, _, _ = scheduler.take(time.monotonic() + 1)
+    assert not scheduler.rate_limited(msg, retry_after=0)
+    assert len(scheduler) == 0
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers):
+        self.status_code = status_code
+        self.headers = headers
+
+
+class FakeError(Exception):
+    def __init__(self, status_code, headers=None):
+        self.response = FakeResponse(status_code, headers or {})
+
+
+def test_retry_after_seconds():
+    assert retry_after_seconds(FakeError(429, {"Retry-After": "7"})) == 7
+    assert retry_after_seconds(FakeError(429), default=2) == 2
+    assert retry_after_seconds(FakeError(500)) is None
+    assert retry_after_seconds(ValueError()) is None
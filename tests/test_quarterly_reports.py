@@ -0,0 +1,91 @@
+import json
+import threading
+
+from corpus import CorpusReader, CorpusWriter, GenerationJournal, record_sha256
+from quarterly_reports import generate_quarterly_reports
+
+NARRATIVES = json.dumps({"labor_manager_narrative": "Staffed well.", "inventory_manager_narrative": "Low waste.",
+                         "notes": "Quiet quarter."})
+
+
+class SlowFirstLLM:
+    """Answers every prompt at once except the first, which waits until `release` is set."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.first = True
+        self._lock = threading.Lock()
+
+    def complete(self, prompt, max_tokens):
+        with self._lock:
+            first, self.first = self.first, False
+        if first:
+            self.release.wait(timeout=10)
+        return NARRATIVES
+
+    def stats(self):
+        return "fake"
+
+
+class RecordingStream:
+    def __init__(self, llm, expected):
+        self.llm = llm
+        self.expected = expected
+        self.submitted = []
+        self._lock = threading.Lock()
+
+    def submit(self, report, sha256):
+        with self._lock:
+            self.submitted.append((report["id"], sha256))
+            if len(self.submitted) == self.expected - 1:
+                self.llm.release.set()
+
+
+def test_stream_gets_reports_as_calls_finish(tmp_path):
+    llm = SlowFirstLLM()
+    root = tmp_path / "financial"
+    with CorpusWriter(root) as corpus:
+        # A stream that only sees reports in job order would wait out the slow call
+        stream = RecordingStream(llm, expected=12)
+        reports = generate_quarterly_reports(corpus, ["branch-001"], stream=stream, workers=4, llm=llm)
+
+    assert len(reports) == 12
+    assert stream.submitted[-1][0] == reports[0]["id"]
+    # The corpus still follows quarter order, with the hashes the stream sent
+    written = list(CorpusReader(root).iter_records())
+    assert [r["id"] for r in written] == [r["id"] for r in reports]
+    assert sorted(stream.submitted) == sorted((r["id"], record_sha256(r)) for r in written)
+
+
+class GarbledLLM:
+    """Valid narratives except for the `garbled`-th call (counting from 0)."""
+
+    def __init__(self, garbled=None):
+        self.garbled = garbled
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def complete(self, prompt, max_tokens):
+        with self._lock:
+            n, self.calls = self.calls, self.calls + 1
+        return "Sorry, I can't help with that." if n == self.garbled else NARRATIVES
+
+    def stats(self):
+        return f"{self.calls} calls"
+
+
+def test_resume_regenerates_template_reports(tmp_path):
+    path = tmp_path / "financial.journal.ndjson"
+    journal = GenerationJournal(path)
+    with CorpusWriter(tmp_path / "financial") as corpus:
+        first = generate_quarterly_reports(corpus, ["branch-001"], workers=1, journal=journal, llm=GarbledLLM(5))
+    journal.close()
+
+    assert first[5]["notes"] != "Quiet quarter."
+    assert sorted(GenerationJournal(path).records) == sorted(r["id"] for r in first if r is not first[5])
+
+    llm = GarbledLLM()
+    with CorpusWriter(tmp_path / "financial") as corpus:
+        resumed = generate_quarterly_reports(corpus, ["branch-001"], workers=1, journal=GenerationJournal(path), llm=llm)
+    assert llm.calls == 1
+    assert resumed[5]["notes"] == "Quiet quarter."
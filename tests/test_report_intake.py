@@ -0,0 +1,115 @@
+import json
+import os
+
+import pytest
+
+import report_intake
+from report_intake import BranchIndex, ReportIntake, Spool, build_intake_doc, parse_date
+from test_stream_ingest import StreamES
+
+
+@pytest.fixture
+def branches(tmp_path):
+    branches_file = tmp_path / "branches.json"
+    staff_file = tmp_path / "staff.json"
+    branches_file.write_text(json.dumps([
+        {"id": "branch-001", "name": "BeanStack Back Bay"},
+        {"id": "branch-002", "name": "BeanStack Pearl District"},
+    ]))
+    staff_file.write_text(json.dumps([
+        {"email": "Maya.Chen@beanstack.example", "branch_id": "branch-002"},
+        {"email": None, "branch_id": "branch-001"},
+    ]))
+    return BranchIndex(branches_file, staff_file)
+
+
+def message(sender="Maya Chen <maya.chen@beanstack.example>", branch="BeanStack Back Bay",
+            date="2025-03-10", body="Foot traffic up 8%."):
+    return f"Subject: Weekly report\nFrom: {sender}\nDate: {date}\nBranch: {branch}\n\n{body}\n".encode()
+
+
+def test_branch_resolves_by_sender_then_name(branches):
+    # The sender's address wins over the Branch: header
+    assert branches.resolve("Maya Chen <MAYA.CHEN@beanstack.example>", "BeanStack Back Bay") == "branch-002"
+    assert branches.resolve("someone@else.example", " beanstack back bay ") == "branch-001"
+    assert branches.resolve("someone@else.example", "BeanStack Nowhere") is None
+
+
+def test_branch_index_reloads_changed_files(branches):
+    branches_file = branches.files[0]
+    branches_file.write_text(json.dumps([{"id": "branch-003", "name": "BeanStack Wicker Park"}]))
+    stat = branches_file.stat()
+    os.utime(branches_file, (stat.st_atime, stat.st_mtime + 10))
+
+    branches.refresh()
+    assert branches.resolve("", "BeanStack Wicker Park") == "branch-003"
+    assert branches.resolve("", "BeanStack Back Bay") is None
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("2025-03-10", ("2025-03-10", "2025-03-10T09:00:00Z")),
+    ("Mon, 10 Mar 2025 23:30:00 -0500", ("2025-03-11", "2025-03-11T04:30:00Z")),
+    ("Mon, 10 Mar 2025 08:15:00", ("2025-03-10", "2025-03-10T08:15:00Z")),
+    ("last Monday", ("1970-01-02", "1970-01-02T00:00:00Z")),
+])
+def test_parse_date(value, expected):
+    assert parse_date(value, fallback=86400) == expected
+
+
+def test_resend_of_a_week_replaces_the_report(tmp_path, branches):
+    spool = Spool(tmp_path / "spool")
+    first, first_hash = build_intake_doc(spool.deliver(message()), branches)
+    resent, resent_hash = build_intake_doc(spool.deliver(message(body="Foot traffic up 9%.")), branches)
+
+    assert first["id"] == resent["id"] == "report-branch-002-2025-03-10"
+    assert first["branch_name"] == "BeanStack Pearl District"
+    assert first["sender_email"] == "maya.chen@beanstack.example"
+    assert first_hash != resent_hash
+
+
+@pytest.mark.parametrize("content, error", [
+    (message(body=""), "no report body"),
+    (message(sender="someone@else.example", branch="BeanStack Nowhere"), "no branch"),
+])
+def test_unusable_messages_are_rejected(tmp_path, branches, content, error):
+    spool = Spool(tmp_path / "spool")
+    with pytest.raises(ValueError, match=error):
+        build_intake_doc(spool.deliver(content), branches)
+
+
+def test_spool_delivers_through_tmp(tmp_path):
+    spool = Spool(tmp_path / "spool")
+    paths = [spool.deliver(message(body=f"week {i}")) for i in range(3)]
+
+    assert spool.incoming() == paths
+    assert list((spool.root / "tmp").iterdir()) == []
+    spool.move(paths[0], "cur")
+    spool.move(paths[0], "cur")   # already moved: no error
+    assert spool.incoming() == paths[1:]
+
+
+def test_intake_indexes_skips_duplicates_and_rejects(tmp_path, branches, monkeypatch):
+    monkeypatch.setattr(report_intake, "BranchIndex", lambda: branches)
+    es = StreamES()
+    spool = Spool(tmp_path / "spool")
+    intake = ReportIntake(es, spool)
+    intake.stream.start()
+
+    spool.deliver(message())
+    spool.deliver(message(sender="someone@else.example", branch="BeanStack Nowhere"))
+    intake.poll()
+    intake.poll()   # still in flight: not submitted twice
+    intake.stream.close()
+
+    assert [name for batch in es.batches for name in batch] == ["report-branch-002-2025-03-10"]
+    assert len(list((spool.root / "cur").iterdir())) == 1
+    assert len(list((spool.root / "failed").iterdir())) == 1
+    assert (intake.received, intake.rejected) == (2, 1)
+
+    # An identical redelivery is recognised from the intake's manifest
+    intake = ReportIntake(es, spool)
+    spool.deliver(message())
+    intake.poll()
+    assert intake.duplicates == 1
+    assert spool.incoming() == []
+    assert len(es.batches) == 1
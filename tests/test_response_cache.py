@@ -0,0 +1,111 @@
+import pytest
+
+from llm import LLMClient
+from response_cache import MAGIC, CacheMiss, ResponseCache, cache_from_argv, response_key
+from test_llm import FakeAnthropic
+
+MODEL = "claude-haiku-4-5-20251001"
+
+
+def recorded(path, responses):
+    cache = ResponseCache(path, "record")
+    for prompt, text in responses.items():
+        cache.put(MODEL, 100, prompt, text)
+    cache.close()
+
+
+def test_key_separates_its_parts():
+    assert response_key(MODEL, 100, "prompt") != response_key(MODEL, 1000, "prompt")
+    assert response_key("ab", 1, "c") != response_key("a", 1, "bc")
+
+
+def test_record_then_replay(tmp_path):
+    path = tmp_path / "llm-cache" / "responses.log"
+    recorded(path, {"one": "first ☕", "two": "second" * 1000})
+
+    cache = ResponseCache(path, "replay")
+    assert len(cache) == 2
+    assert cache.get(MODEL, 100, "two") == "second" * 1000
+    assert cache.get(MODEL, 100, "one") == "first ☕"
+    assert cache.hits == 2
+    with pytest.raises(CacheMiss):
+        cache.get(MODEL, 200, "one")
+
+
+def test_replay_never_writes(tmp_path):
+    path = tmp_path / "responses.log"
+    recorded(path, {"one": "first"})
+    before = path.read_bytes()
+
+    cache = ResponseCache(path, "replay")
+    cache.put(MODEL, 100, "two", "second")
+    cache.close()
+    assert path.read_bytes() == before
+
+    with pytest.raises(CacheMiss):
+        ResponseCache(tmp_path / "missing.log", "replay").get(MODEL, 100, "one")
+    assert not (tmp_path / "missing.log").exists()
+
+
+def test_off_bypasses_the_cache(tmp_path):
+    path = tmp_path / "responses.log"
+    recorded(path, {"one": "first"})
+    cache = ResponseCache(path, "off")
+    assert cache.get(MODEL, 100, "one") is None
+    cache.put(MODEL, 100, "two", "second")
+    assert len(ResponseCache(path, "replay")) == 1
+
+
+def test_record_keeps_the_first_response(tmp_path):
+    path = tmp_path / "responses.log"
+    cache = ResponseCache(path, "record")
+    cache.put(MODEL, 100, "one", "first")
+    cache.put(MODEL, 100, "one", "again")
+    assert (cache.get(MODEL, 100, "one"), cache.stored) == ("first", 1)
+
+
+def test_torn_tail(tmp_path):
+    path = tmp_path / "responses.log"
+    recorded(path, {"one": "first", "two": "second"})
+    intact = path.stat().st_size
+    with open(path, "ab") as f:
+        # A crash partway through appending a record
+        f.write(response_key(MODEL, 100, "three") + b"\x00\x00\x01")
+
+    replay = ResponseCache(path, "replay")
+    assert len(replay) == 2
+    replay.close()
+    assert path.stat().st_size > intact
+
+    cache = ResponseCache(path, "record")
+    assert path.stat().st_size == intact
+    cache.put(MODEL, 100, "three", "third")
+    cache.close()
+    assert ResponseCache(path, "replay").get(MODEL, 100, "three") == "third"
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "responses.log"
+    path.write_bytes(b"not a cache\n")
+    with pytest.raises(ValueError, match="not an LLM response cache"):
+        ResponseCache(path, "record")
+
+    ResponseCache(tmp_path / "new.log", "record").close()
+    assert (tmp_path / "new.log").read_bytes() == MAGIC
+
+
+def test_cached_prompts_skip_the_api(tmp_path):
+    cache = ResponseCache(tmp_path / "responses.log", "record")
+    fake = FakeAnthropic()
+    client = LLMClient(fake, cache=cache)
+    assert client.complete("hello", max_tokens=10) == client.complete("hello", max_tokens=10) == "answer to hello"
+    assert (fake.requests, client.calls) == (1, 1)
+    assert client.stats() == "1 API calls (0 retried), 1 from cache, 1 newly cached"
+
+
+def test_mode_from_argv(tmp_path, monkeypatch):
+    monkeypatch.setattr(ResponseCache, "open", classmethod(lambda cls, mode: cls(tmp_path / "responses.log", mode)))
+    assert cache_from_argv(["weekly_reports.py"]).mode == "record"
+    assert cache_from_argv(["weekly_reports.py", "--llm-cache", "off"]).mode == "off"
+    with pytest.raises(ValueError, match="Unknown LLM cache mode"):
+        cache_from_argv(["weekly_reports.py", "--llm-cache", "replay-only"])
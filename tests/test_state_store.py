@@ -0,0 +1,96 @@
+import time
+
+import pytest
+
+from state_store import MemoryStateStore, SQLiteStateStore, create_state_store
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    return now
+
+
+def test_conversation_and_active_flag():
+    store = MemoryStateStore()
+    assert store.get_conversation("t1") is None
+    assert not store.is_active("t1")
+    assert store.get_conversation(None) is None
+
+    store.set_conversation("t1", "conv-1")
+    store.mark_active("t1")
+    assert store.get_conversation("t1") == "conv-1"
+    assert store.is_active("t1")
+
+
+def test_ttl_counts_from_last_update(clock):
+    store = MemoryStateStore(ttl=60)
+    store.set_conversation("t1", "conv-1")
+    clock[0] += 50
+    store.mark_active("t1")
+    clock[0] += 50
+    assert store.get_conversation("t1") == "conv-1"
+    clock[0] += 11
+    assert store.get_conversation("t1") is None
+    assert not store.is_active("t1")
+
+
+def test_lru_eviction():
+    store = MemoryStateStore(max_threads=2)
+    store.set_conversation("t1", "conv-1")
+    store.set_conversation("t2", "conv-2")
+    store.get_conversation("t1")           # t1 is now the most recently used
+    store.set_conversation("t3", "conv-3")
+
+    assert len(store) == 2
+    assert store.get_conversation("t2") is None
+    assert store.get_conversation("t1") == "conv-1"
+
+
+def test_sqlite_state_survives_restart(tmp_path):
+    path = tmp_path / "state" / "bot-state.db"
+    store = SQLiteStateStore(path, flush_interval=60)
+    store.set_conversation("t1", "conv-1")
+    store.mark_active("t1")
+    store.close()
+
+    store = SQLiteStateStore(path, flush_interval=60)
+    try:
+        assert store.get_conversation("t1") == "conv-1"
+        assert store.is_active("t1")
+        assert store.get_conversation("t2") is None
+    finally:
+        store.close()
+
+
+def test_sqlite_reads_through_evicted_threads(tmp_path):
+    store = SQLiteStateStore(tmp_path / "bot-state.db", max_threads=1, flush_interval=60)
+    try:
+        store.set_conversation("t1", "conv-1")
+        store.set_conversation("t2", "conv-2")
+        assert store.flush() == 2
+        assert store.get_conversation("t1") == "conv-1"
+    finally:
+        store.close()
+
+
+def test_sqlite_sweep_deletes_idle_threads(tmp_path, clock):
+    store = SQLiteStateStore(tmp_path / "bot-state.db", ttl=60, flush_interval=60)
+    try:
+        store.set_conversation("old", "conv-1")
+        clock[0] += 50
+        store.set_conversation("new", "conv-2")
+        store.flush()
+        clock[0] += 20
+        assert store.sweep() == 1
+    finally:
+        store.close()
+
+
+def test_create_state_store():
+    assert type(create_state_store("memory")) is MemoryStateStore
+    with pytest.raises(ValueError):
+        create_state_store("sqlite")
+    with pytest.raises(ValueError):
+        create_state_store("redis")
@@ -0,0 +1,103 @@
+import threading
+import time
+
+import pytest
+
+from bulk_ingest import FLUSH, BulkIndexer
+from ingest_manifest import IngestManifest, content_hash
+from stream_ingest import StreamingIngest
+from test_bulk_ingest import FakeES, actions
+
+
+class FakeIndices:
+    def get_settings(self, index, name):
+        return {f"{index}-v1": {"settings": {"index": {"uuid": "index-uuid-1"}}}}
+
+
+class StreamES(FakeES):
+    """FakeES with the index UUID and data version calls a stream makes."""
+
+    def __init__(self, outcome=None, latency=0.0):
+        super().__init__(outcome, latency)
+        self.indices = FakeIndices()
+        self.version_bumps = 0
+
+    def update(self, **kwargs):
+        self.version_bumps += 1
+        return {"get": {"_source": {"version": self.version_bumps}}}
+
+
+def open_test_stream(tmp_path, es, **kwargs):
+    return StreamingIngest(
+        es, "beanstack-reports", lambda record: {"text": record["text"]},
+        tmp_path / "reports.manifest.json", tmp_path / "reports.dead-letter.ndjson", "reports", **kwargs,
+    ).start()
+
+
+def report(i):
+    return {"id": f"report-{i:03d}", "text": f"week {i}"}
+
+
+def test_flush_sends_partial_batch():
+    es = FakeES()
+    source = actions(5)
+    stream = source[:2] + [FLUSH] + source[2:]
+    stats = BulkIndexer(es, batch_size=10, concurrency=1, verbose=False).run(iter(stream))
+
+    assert stats.indexed == 5
+    assert es.batches == [["doc-000", "doc-001"], ["doc-002", "doc-003", "doc-004"]]
+
+
+def test_stream_records_results_in_manifest_and_dead_letters(tmp_path):
+    es = StreamES(lambda op, doc_id, attempt: (400, {"type": "mapper_parsing_exception"})
+                  if doc_id == "report-003" else (201, None))
+    indexed, failed = [], []
+    stream = open_test_stream(tmp_path, es, on_indexed=indexed.append, on_failed=failed.append)
+    for i in range(5):
+        stream.submit(report(i), content_hash(f"week {i}"))
+    stats = stream.close()
+
+    assert (stats.indexed, stats.failed, stream.submitted) == (4, 1, 5)
+    assert sorted(indexed) == ["report-000", "report-001", "report-002", "report-004"]
+    assert failed == ["report-003"]
+    # The next batch ingest skips what the stream already indexed
+    manifest = IngestManifest.load(tmp_path / "reports.manifest.json", "index-uuid-1")
+    assert manifest.is_current("report-001", content_hash("week 1"))
+    assert "report-003" not in manifest.documents
+    assert (tmp_path / "reports.dead-letter.ndjson").exists()
+    assert es.version_bumps == 1
+
+
+def test_trickle_is_indexed_before_close(tmp_path):
+    es = StreamES()
+    indexed = threading.Event()
+    stream = open_test_stream(tmp_path, es, flush_interval=0.05, on_indexed=lambda doc_id: indexed.set())
+    stream.submit(report(0), content_hash("week 0"))
+
+    assert indexed.wait(timeout=5)
+    stream.close()
+
+
+def test_full_queue_blocks_submit(tmp_path):
+    # One slow request slot, one-document batches, room for two queued reports
+    es = StreamES(latency=0.2)
+    stream = open_test_stream(tmp_path, es, queue_size=2, concurrency=1, batch_size=1)
+    start = time.monotonic()
+    for i in range(6):
+        stream.submit(report(i), content_hash(f"week {i}"))
+    submitting = time.monotonic() - start
+    stats = stream.close()
+
+    assert stats.indexed == 6
+    assert es.peak_in_flight == 1
+    assert submitting >= 0.4 and stream.blocked >= 0.4
+
+
+def test_indexer_failure_surfaces_in_submit(tmp_path):
+    es = StreamES()
+    stream = open_test_stream(tmp_path, es, flush_interval=0.01)
+    es.bulk = lambda operations: (_ for _ in ()).throw(MemoryError("out of memory"))
+    with pytest.raises(RuntimeError, match="Streaming ingest into beanstack-reports failed"):
+        for i in range(1000):
+            stream.submit(report(i), content_hash(f"week {i}"))
+            time.sleep(0.01)
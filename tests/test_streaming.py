@@ -0,0 +1,89 @@
+import json
+
+from streaming import AnswerStream, SSEParser
+
+STREAM = (
+    ": keep-alive\n"
+    "event: conversation_id_set\n"
+    'data: {"conversation_id": "conv-1"}\n'
+    "\n"
+    "event: message_chunk\n"
+    'data: {"text_chunk": "Büro ☕ sales"}\n'
+    "\n"
+    "event: reasoning\r\n"
+    "data: line one\r\n"
+    "data: line two\r\n"
+    "\r\n"
+    "data: no event name\n"
+    "\n"
+).encode()
+
+EXPECTED = [
+    ("conversation_id_set", {"conversation_id": "conv-1"}),
+    ("message_chunk", {"text_chunk": "Büro ☕ sales"}),
+    ("reasoning", "line one\nline two"),
+    ("message", "no event name"),
+]
+
+
+def feed_in_chunks(size):
+    parser = SSEParser()
+    events = []
+    for start in range(0, len(STREAM), size):
+        events.extend(parser.feed(STREAM[start:start + size]))
+    return events
+
+
+def test_whole_stream():
+    assert SSEParser().feed(STREAM) == EXPECTED
+
+
+def test_every_chunk_size():
+    # Chunks split lines, CRLF pairs and multi-byte UTF-8 characters
+    for size in range(1, len(STREAM) + 1):
+        assert feed_in_chunks(size) == EXPECTED, f"chunk size {size}"
+
+
+def test_every_split_point():
+    for split in range(len(STREAM) + 1):
+        parser = SSEParser()
+        events = parser.feed(STREAM[:split]) + parser.feed(STREAM[split:])
+        assert events == EXPECTED, f"split at byte {split}"
+
+
+def test_incomplete_event_waits_for_blank_line():
+    parser = SSEParser()
+    assert parser.feed(b'event: message_chunk\ndata: {"text_chunk": "hi"}\n') == []
+    assert parser.feed(b"\n") == [("message_chunk", json.loads('{"text_chunk": "hi"}'))]
+
+
+def test_event_name_resets_after_empty_event():
+    parser = SSEParser()
+    assert parser.feed(b"event: ignored\n\ndata: plain\n\n") == [("message", "plain")]
+
+
+def test_answer_stream_folds_events():
+    stream = AnswerStream()
+    assert stream.render() is None
+
+    stream.apply("conversation_id_set", {"data": {"conversation_id": "conv-1"}})
+    stream.apply("tool_call", {"tool_id": "revenue_by_region"})
+    assert stream.render() == ":mag: Running `revenue_by_region`..."
+
+    stream.apply("message_chunk", {"text_chunk": "Revenue is "})
+    stream.apply("message_chunk", {"text_chunk": "up."})
+    assert stream.render() == "Revenue is up. :writing_hand:"
+    assert not stream.done
+
+    reply = stream.reply()
+    assert stream.conversation_id == "conv-1"
+    assert reply.text == "Revenue is up."
+    assert reply.tool_ids == {"revenue_by_region"}
+
+
+def test_message_complete_wins_over_chunks():
+    stream = AnswerStream()
+    stream.apply("message_chunk", {"text_chunk": "partial"})
+    stream.apply("message_complete", {"message_content": "The full answer."})
+    assert stream.done
+    assert stream.reply().text == "The full answer."
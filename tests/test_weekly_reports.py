@@ -0,0 +1,115 @@
+import hashlib
+import json
+from pathlib import Path
+
+import anthropic
+import pytest
+
+from corpus import CorpusWriter, GenerationJournal
+from llm import BatchRequestFailed
+from weekly_reports import ReportGenerator, branch_rng
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data" / "generated"
+BRANCH_IDS = ["branch-001", "branch-002", "branch-003"]
+
+
+class EchoLLM:
+    """Answers each prompt with text derived from it, so equal prompts give equal reports."""
+
+    def __init__(self):
+        self.prompts = []
+
+    def complete(self, prompt, max_tokens):
+        self.prompts.append(prompt)
+        digest = hashlib.sha256(prompt.encode()).hexdigest()[:12]
+        return f"Subject: Week {digest}\nFrom: manager\n\nAll good this week ({digest})."
+
+    def stats(self):
+        return f"{len(self.prompts)} prompts"
+
+
+def make_generator(branch_ids=BRANCH_IDS, llm=None, journal=None):
+    branches = [b for b in json.loads((DATA_DIR / "branches.json").read_text()) if b["id"] in branch_ids]
+    staff = json.loads((DATA_DIR / "staff.json").read_text())
+    narratives = json.loads((DATA_DIR / "branch_narratives.json").read_text())
+    return ReportGenerator(branches, staff, narratives, journal=journal, llm=llm or EchoLLM())
+
+
+def generate(tmp_path, branch_ids=BRANCH_IDS, workers=1):
+    with CorpusWriter(tmp_path / f"reports-{workers}-{len(branch_ids)}") as corpus:
+        return make_generator(branch_ids).generate_all_reports(corpus, workers=workers)
+
+
+def test_branch_rng_depends_only_on_branch_and_purpose():
+    draws = [branch_rng("branch-001", "dates").random() for _ in range(2)]
+    assert draws[0] == draws[1]
+    assert branch_rng("branch-001", "timestamp").random() != draws[0]
+    assert branch_rng("branch-002", "dates").random() != draws[0]
+
+
+def test_branch_plans_dont_depend_on_other_branches():
+    everything = dict(make_generator().plan_reports())
+    alone = dict(make_generator(["branch-002"]).plan_reports())
+
+    assert alone["branch-002"] == everything["branch-002"]
+    ids = [plan["id"] for plan in everything["branch-002"]]
+    assert len(set(ids)) == len(ids)
+    assert all(report_id.startswith("report-branch-002-") for report_id in ids)
+
+
+@pytest.mark.parametrize("workers", [4, 16])
+def test_parallel_run_matches_serial_run(tmp_path, workers):
+    assert generate(tmp_path, workers=workers) == generate(tmp_path, workers=1)
+
+
+def test_branch_alone_matches_full_run(tmp_path):
+    full = [r for r in generate(tmp_path) if r["branch_id"] == "branch-003"]
+    assert generate(tmp_path, ["branch-003"]) == full
+
+
+class FlakyLLM(EchoLLM):
+    """EchoLLM whose `fail_at`-th call (counting from 0) fails, in either API."""
+
+    def __init__(self, fail_at):
+        super().__init__()
+        self.fail_at = fail_at
+
+    def complete(self, prompt, max_tokens):
+        if len(self.prompts) == self.fail_at:
+            self.prompts.append(prompt)
+            raise anthropic.APIConnectionError(request=None)
+        return super().complete(prompt, max_tokens)
+
+    def complete_batch(self, requests):
+        results = []
+        for prompt, max_tokens in requests:
+            try:
+                results.append(self.complete(prompt, max_tokens))
+            except anthropic.APIConnectionError:
+                results.append(BatchRequestFailed("errored"))
+        return results
+
+
+@pytest.mark.parametrize("batch", [False, True])
+def test_resume_regenerates_placeholder_reports(tmp_path, batch):
+    path = tmp_path / "reports.journal.ndjson"
+    journal = GenerationJournal(path)
+    flaky = make_generator(["branch-001", "branch-002"], FlakyLLM(fail_at=3), journal)
+    plans = flaky.plan_reports()
+    if batch:
+        first = [r for branch in flaky.generate_reports_in_waves(plans) for r in branch]
+    else:
+        first = [r for plan in plans for r in flaky.generate_branch_reports(*plan)]
+    journal.close()
+
+    failed = next(r for r in first if r["text"].startswith("Weekly update from"))
+    assert failed["id"] not in GenerationJournal(path).records
+    assert len(GenerationJournal(path)) == len(first) - 1
+
+    # The rerun asks the LLM for the placeholder report only
+    llm = EchoLLM()
+    resumed = make_generator(["branch-001", "branch-002"], llm, GenerationJournal(path))
+    regenerated = [r for plan in resumed.plan_reports() for r in resumed.generate_branch_reports(*plan)]
+    assert len(llm.prompts) == 1
+    assert [r for r in regenerated if r["id"] != failed["id"]] == [r for r in first if r["id"] != failed["id"]]
+    assert not next(r for r in regenerated if r["id"] == failed["id"])["text"].startswith("Weekly update from")
@@ -0,0 +1,159 @@
+import asyncio
+import threading
+import time
+
+from work_queue import AsyncWorkQueue, ThreadedWorkQueue, WorkQueue
+
+
+def test_one_run_per_thread():
+    queue = WorkQueue()
+    first = queue.submit("U1", "thread-1")
+    second = queue.submit("U2", "thread-1")
+    other = queue.submit("U3", "thread-2")
+
+    assert first.position == 0
+    assert second.position == 1
+    assert other.position == 0
+
+    assert queue.release(first) == [second]
+    assert second.position == 0
+
+
+def test_follow_ups_run_in_order():
+    queue = WorkQueue()
+    tickets = [queue.submit("U1", "thread-1") for _ in range(3)]
+    order = [tickets[0]]
+    while len(order) < len(tickets):
+        order.extend(queue.release(order[-1]))
+    assert order == tickets
+
+
+def test_busy_thread_does_not_block_other_threads():
+    queue = WorkQueue(max_per_user=1)
+    running = queue.submit("U1", "thread-1")
+    follow_up = queue.submit("U1", "thread-1")
+    new_thread = queue.submit("U1", "thread-2")
+    other_user = queue.submit("U2", "thread-3")
+    assert (follow_up.position, new_thread.position, other_user.position) == (1, 2, 0)
+
+    # One slot for U1: the follow-up goes first, and runs alone in thread-1
+    assert queue.release(running) == [follow_up]
+    # A user's waiting questions start in arrival order
+    again = queue.submit("U1", "thread-1")
+    assert queue.release(follow_up) == [new_thread]
+    assert queue.release(new_thread) == [again]
+    queue.release(again)
+    queue.release(other_user)
+    assert queue.stats()["running"] == 0
+
+
+def test_thread_keeps_arrival_order_across_users():
+    queue = WorkQueue()
+    first = queue.submit("U1", "thread-1")
+    u2_other = queue.submit("U2", "thread-2")
+    u2_follow_up = queue.submit("U2", "thread-1")
+    u3_follow_up = queue.submit("U3", "thread-1")
+
+    # U2 was just served in thread-2, but U2 asked in thread-1 before U3 did
+    assert u2_other.position == 0
+    assert queue.release(first) == [u2_follow_up]
+    assert queue.release(u2_follow_up) == [u3_follow_up]
+
+
+def test_position_updates_and_round_robin():
+    queue = WorkQueue(max_concurrent=1)
+    positions = []
+    running = queue.submit("U1", "t1")
+    a2 = queue.submit("U1", "t2")
+    a3 = queue.submit("U1", "t3")
+    b = queue.submit("U2", "t4", on_position=positions.append)
+    assert (a2.position, b.position, a3.position) == (1, 2, 3)
+
+    # U1 was served, so U2 is next even though U1 queued first
+    assert queue.release(running) == [a2]
+    assert (b.position, a3.position) == (1, 2)
+    assert queue.release(a2) == [b]
+    assert queue.release(b) == [a3]
+    assert positions == [2, 1]
+
+
+def test_threaded_queue_serializes_a_thread():
+    queue = ThreadedWorkQueue(max_concurrent=4)
+    active = {"thread-1": 0, "thread-2": 0}
+    peak = {"thread-1": 0, "thread-2": 0}
+    order = []
+    lock = threading.Lock()
+    finished = threading.Semaphore(0)
+
+    def job(thread_ts, n):
+        def run(ticket):
+            with lock:
+                active[thread_ts] += 1
+                peak[thread_ts] = max(peak[thread_ts], active[thread_ts])
+                order.append((thread_ts, n))
+            time.sleep(0.01)
+            with lock:
+                active[thread_ts] -= 1
+            finished.release()
+        return run
+
+    for n in range(5):
+        for thread_ts in ("thread-1", "thread-2"):
+            queue.run(f"U{n}", thread_ts, job(thread_ts, n))
+    for _ in range(10):
+        assert finished.acquire(timeout=5)
+
+    assert peak == {"thread-1": 1, "thread-2": 1}
+    assert [n for ts, n in order if ts == "thread-1"] == list(range(5))
+    assert [n for ts, n in order if ts == "thread-2"] == list(range(5))
+
+
+def test_threaded_queue_never_blocks_the_caller():
+    queue = ThreadedWorkQueue(max_concurrent=1)
+    gate = threading.Event()
+    done = threading.Event()
+    queue.run("U1", "thread-1", lambda ticket: gate.wait(5))
+
+    started = time.monotonic()
+    positions = []
+    waiting = queue.run("U2", "thread-2", lambda ticket: done.set(), on_position=positions.append)
+    assert time.monotonic() - started < 0.5
+    assert waiting.position == 1 and positions == [1]
+
+    gate.set()
+    assert done.wait(5)
+    assert waiting.queued
+
+
+def test_threaded_queue_releases_slot_when_job_fails():
+    queue = ThreadedWorkQueue(max_concurrent=1)
+    done = threading.Event()
+
+    def fail(ticket):
+        raise RuntimeError("converse failed")
+
+    queue.run("U1", "thread-1", fail)
+    queue.run("U1", "thread-1", lambda ticket: done.set())
+    assert done.wait(5)
+
+
+def test_async_queue_serializes_a_thread_and_releases_cancelled():
+    async def scenario():
+        queue = AsyncWorkQueue()
+        first = await queue.acquire("U1", "thread-1")
+        follow_up = asyncio.create_task(queue.acquire("U2", "thread-1"))
+        given_up = asyncio.create_task(queue.acquire("U3", "thread-1"))
+        await asyncio.sleep(0)
+        assert not follow_up.done()
+
+        given_up.cancel()
+        await asyncio.sleep(0)
+        assert queue.depth == 1
+
+        queue.release(first)
+        second = await asyncio.wait_for(follow_up, 1)
+        assert second.user == "U2"
+        queue.release(second)
+        assert queue.stats() == {"running": 0, "waiting": 0, "waiting_users": 0, "peak_depth": 2}
+
+    asyncio.run(scenario())